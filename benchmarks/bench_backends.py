@@ -0,0 +1,124 @@
+"""
+Compares the storage backends (see vids_db/backend.py): bulk insert,
+recent window, channel window, trending and facet latency.
+
+Usage:
+    pip install -e .
+    python benchmarks/bench_backends.py [--videos N] [--repeat N]
+"""
+
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List
+
+from vids_db.backend import VideoStore
+from vids_db.db_memory_video import DbMemoryVideo
+from vids_db.db_sqlite_partitioned import DbSqlitePartitionedVideo
+from vids_db.db_sqlite_video import DbSqliteVideo
+from vids_db.models import Video
+
+NOW = datetime.now(timezone.utc)
+
+
+def make_videos(count: int) -> List[Video]:
+    rand = random.Random(0)
+    out = []
+    for i in range(count):
+        # Spread over a year, newest first.
+        date = NOW - timedelta(minutes=i * 525600 // count)
+        out.append(
+            Video(
+                channel_name=f"Channel {i % 500}",
+                title=f"Video title number {i}",
+                date_published=date,
+                date_lastupdated=date,
+                channel_url="https://example.com/channel",
+                source=rand.choice(["youtube.com", "rumble.com"]),
+                url=f"https://example.com/{i}",
+                duration=rand.randint(0, 3600),
+                description="Description " * 20,
+                img_src="https://example.com/img.jpg",
+                iframe_src="https://example.com/embed",
+                views=rand.randint(0, 1000000),
+            )
+        )
+    return out
+
+
+def time_query(fn: Callable[[], object], repeat: int) -> float:
+    """Median latency in ms."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return sorted(times)[len(times) // 2] * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--videos", type=int, default=50000)
+    parser.add_argument("--batch", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    vids = make_videos(args.videos)
+    week = (NOW - timedelta(days=7), NOW)
+    queries: Dict[str, Callable[[VideoStore], object]] = {
+        "week": lambda db: db.find_videos(*week, limit_count=100),
+        "week summary": lambda db: db.find_videos(
+            *week, limit_count=100, summary=True
+        ),
+        "channel": lambda db: db.find_videos(
+            NOW - timedelta(days=365), NOW, channel_name="Channel 7"
+        ),
+        "trending": lambda db: db.find_trending(50),
+        "facets": lambda db: db.get_facets(*week),
+    }
+    print(f"{args.videos} videos")
+    tmp = tempfile.mkdtemp()
+    try:
+        stores: Dict[str, Callable[[], VideoStore]] = {
+            "sqlite": lambda: DbSqliteVideo(os.path.join(tmp, "v.sqlite")),
+            "partitioned": lambda: DbSqlitePartitionedVideo(
+                os.path.join(tmp, "partitions")
+            ),
+            "memory": DbMemoryVideo,
+        }
+        for name, make_store in stores.items():
+            db = make_store()
+            start = time.perf_counter()
+            for i in range(0, len(vids), args.batch):
+                db.insert_or_update(vids[i : i + args.batch])
+            insert = time.perf_counter() - start
+            print(f"{name}: insert {args.videos / insert:9.0f} videos/s")
+            for query_name, query in queries.items():
+                hits = query(db)
+                latency = time_query(lambda: query(db), args.repeat)
+                count = len(hits) if isinstance(hits, list) else ""
+                print(f"  {query_name:>12}: {latency:8.2f}ms {count}")
+            db.close()
+        memory = DbMemoryVideo()
+        memory.insert_or_update(vids)
+        path = os.path.join(tmp, "videos.vdb")
+        start = time.perf_counter()
+        memory.save(path)
+        saved = time.perf_counter() - start
+        start = time.perf_counter()
+        DbMemoryVideo(path)
+        loaded = time.perf_counter() - start
+        size = os.path.getsize(path) / (1024 * 1024)
+        print(
+            f"memory snapshot: save {saved:6.2f}s load {loaded:6.2f}s"
+            f" ({size:.1f} MiB)"
+        )
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Compares duration parsing throughput over the durations of the scraped
+test data: the original parser against the cached regex parser.
+
+Usage:
+    pip install -e .
+    python benchmarks/bench_duration.py [--copies N]
+"""
+
+import argparse
+import json
+import os
+import time
+from typing import Callable, List
+
+from vids_db.duration import (
+    _parse_general,
+    _parse_str,
+    parse_duration,
+    parse_durations,
+)
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+TEST_DATA = os.path.join(HERE, "..", "tests", "test_data.json")
+
+
+def load_durations(copies: int) -> List[str]:
+    with open(TEST_DATA, encoding="utf-8", mode="r") as f:
+        content = json.loads(f.read())["content"]
+    return [datum["duration"] for datum in content] * copies
+
+
+def run(label: str, func: Callable[[], object], count: int) -> None:
+    timings = []
+    for _ in range(5):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    best = min(timings)
+    print(f"{label:>18} {best * 1000:>10.1f} {count / best:>16.0f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--copies", type=int, default=200)
+    args = parser.parse_args()
+    durations = load_durations(args.copies)
+    print(f"{len(durations)} durations, {len(set(durations))} distinct")
+    print(f"{'parser':>18} {'time (ms)':>10} {'durations / sec':>16}")
+    n = len(durations)
+    run("general path", lambda: [_parse_general(d) for d in durations], n)
+
+    def uncached() -> None:
+        for d in durations:
+            _parse_str.__wrapped__(d)  # type: ignore
+
+    run("regex, no cache", uncached, n)
+    run("parse_duration", lambda: [parse_duration(d) for d in durations], n)
+    run("parse_durations", lambda: parse_durations(durations), n)
+
+
+if __name__ == "__main__":
+    main()
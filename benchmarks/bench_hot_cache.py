@@ -0,0 +1,98 @@
+"""
+Measures get_video_list() over recent windows with and without the hot
+cache (see vids_db/hot_cache.py), and how long the cache takes to fill.
+
+Usage:
+    pip install -e .
+    python benchmarks/bench_hot_cache.py [--videos N] [--repeat N]
+"""
+
+import argparse
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, List
+
+from vids_db.database import Database
+from vids_db.models import Video
+
+NOW = datetime.now(timezone.utc)
+WINDOW = timedelta(hours=72)
+
+
+def make_videos(count: int, days: int) -> List[Video]:
+    out = []
+    for i in range(count):
+        date = NOW - timedelta(seconds=i * days * 86400 // count)
+        out.append(
+            Video(
+                channel_name=f"Channel {i % 300}",
+                title=f"Video title number {i}",
+                date_published=date,
+                date_lastupdated=date,
+                channel_url="https://example.com/channel",
+                source="youtube.com",
+                url=f"https://example.com/{i}",
+                duration="12:34",  # type: ignore
+                description="Description " * 20,
+                img_src="https://example.com/img.jpg",
+                iframe_src="https://example.com/embed",
+                views=i,
+            )
+        )
+    return out
+
+
+def time_query(fn: Callable[[], object], repeat: int) -> float:
+    """Median latency in ms."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return sorted(times)[len(times) // 2] * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--videos", type=int, default=50000)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    tmp = tempfile.mkdtemp()
+    try:
+        with Database(tmp) as db:
+            vids = make_videos(args.videos, args.days)
+            for i in range(0, len(vids), 1000):
+                db.update_many(vids[i : i + 1000])
+        start = time.perf_counter()
+        cached = Database(tmp, hot_cache_window=WINDOW)
+        load = time.perf_counter() - start
+        metrics = cached.hot_cache_metrics()
+        assert metrics is not None
+        print(
+            f"{args.videos} videos over {args.days} days,"
+            f" {metrics.size} cached in {load:.2f}s"
+        )
+        uncached = Database(tmp)
+        for hours in (24, 72):
+            window = (NOW - timedelta(hours=hours), NOW)
+            for summary in (False, True):
+                name = f"{hours}h{' summary' if summary else ''}"
+                for label, db in (("sqlite", uncached), ("cached", cached)):
+                    latency = time_query(
+                        lambda: db.get_video_list(
+                            *window, limit=100, summary=summary
+                        ),
+                        args.repeat,
+                    )
+                    print(f"  {name:>12} {label}: {latency:8.2f}ms")
+        cached.close()
+        uncached.close()
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""
+Load test of the http server on localhost: requests per second and
+latency percentiles for uncached, cached and 304 Not Modified responses.
+
+Usage:
+    pip install -e .
+    python benchmarks/bench_http_server.py [--videos N] [--clients N]
+    python benchmarks/bench_http_server.py --url http://host:port
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from http.client import HTTPConnection
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from vids_db.database import Database
+from vids_db.http_server import DEFAULT_CACHE_SIZE, serve_in_background
+from vids_db.models import Video
+
+DATE = datetime(2022, 5, 4, tzinfo=timezone.utc)
+DATES = "date_start=2022-05-01&date_end=2022-05-10"
+
+
+def make_videos(count: int) -> List[Video]:
+    out = []
+    for i in range(count):
+        date = DATE + timedelta(seconds=i)
+        out.append(
+            Video(
+                channel_name=f"channel{i % 50}",
+                title=f"Video {i}",
+                date_published=date,
+                date_lastupdated=date,
+                channel_url="https://example.com/channel",
+                source="youtube",
+                url=f"https://example.com/{i}",
+                duration="12:34",  # type: ignore
+                description="x" * 200,
+                img_src="https://example.com/img.jpg",
+                iframe_src="https://example.com/embed",
+                views=i,
+            )
+        )
+    return out
+
+
+def run_client(
+    host: str,
+    port: int,
+    targets: List[str],
+    headers: Dict[str, str],
+    requests: int,
+) -> List[float]:
+    """One keep-alive connection, returns the latency of every request."""
+    conn = HTTPConnection(host, port)
+    latencies = []
+    try:
+        for i in range(requests):
+            start = time.perf_counter()
+            conn.request("GET", targets[i % len(targets)], headers=headers)
+            resp = conn.getresponse()
+            resp.read()
+            if resp.status not in (200, 304):
+                raise RuntimeError(f"Got {resp.status} for {targets[i]}")
+            latencies.append(time.perf_counter() - start)
+    finally:
+        conn.close()
+    return latencies
+
+
+def load(
+    host: str,
+    port: int,
+    targets: List[str],
+    headers: Dict[str, str],
+    clients: int,
+    requests: int,
+) -> Tuple[float, float, float]:
+    """Returns requests per second, p50 and p99 latency in ms."""
+    start = time.perf_counter()
+    with ThreadPoolExecutor(clients) as pool:
+        futures = [
+            pool.submit(run_client, host, port, targets, headers, requests)
+            for _ in range(clients)
+        ]
+        latencies = sorted(x for f in futures for x in f.result())
+    elapsed = time.perf_counter() - start
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    return (
+        len(latencies) / elapsed,
+        statistics.median(latencies) * 1000,
+        p99 * 1000,
+    )
+
+
+def report(name: str, result: Tuple[float, float, float]) -> None:
+    rps, p50, p99 = result
+    print(f"{name:>10}: {rps:8.0f} req/s p50 {p50:6.2f}ms p99 {p99:6.2f}ms")
+
+
+def etag_of(host: str, port: int, target: str) -> Optional[str]:
+    conn = HTTPConnection(host, port)
+    conn.request("GET", target)
+    resp = conn.getresponse()
+    resp.read()
+    conn.close()
+    return resp.getheader("ETag")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--videos", type=int, default=5000)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--url", help="Server to test, default starts one")
+    args = parser.parse_args()
+    tmp = None
+    server = None
+    db = None
+    if args.url:
+        split = urlsplit(args.url)
+        host, port = split.hostname or "127.0.0.1", split.port or 80
+    else:
+        tmp = tempfile.mkdtemp()
+        db = Database(os.path.join(tmp, "db"))
+        db.update_many(make_videos(args.videos))
+        # cache_size=0 for the uncached run, re-enabled below.
+        server = serve_in_background(db, cache_size=0)
+        host, port = "127.0.0.1", server.server.port
+    try:
+        # Distinct targets so the cached run is not one hot entry.
+        targets = [
+            f"/videos?{DATES}&limit={args.limit}&channel_name=channel{i}"
+            for i in range(50)
+        ]
+        target = targets[0]
+        print(
+            f"{args.clients} clients x {args.requests} keep-alive requests, "
+            f"limit={args.limit}"
+        )
+        uncached = server is not None
+        report(
+            "uncached" if uncached else "cold",
+            load(host, port, targets, {}, args.clients, args.requests),
+        )
+        gzip_headers = {"Accept-Encoding": "gzip"}
+        report(
+            "gzip",
+            load(
+                host, port, targets, gzip_headers, args.clients, args.requests
+            ),
+        )
+        if server is not None:
+            server.server.cache_size = DEFAULT_CACHE_SIZE
+        report(
+            "cached", load(host, port, targets, {}, args.clients, args.requests)
+        )
+        etag = etag_of(host, port, target)
+        if etag is not None:
+            headers = {"If-None-Match": etag}
+            report(
+                "304",
+                load(
+                    host, port, [target], headers, args.clients, args.requests
+                ),
+            )
+        conn = HTTPConnection(host, port)
+        conn.request("GET", "/health")
+        print("health:", json.loads(conn.getresponse().read()))
+        conn.close()
+    finally:
+        if server is not None:
+            server.close()
+        if db is not None:
+            db.close()
+        if tmp is not None:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
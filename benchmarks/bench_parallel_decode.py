@@ -0,0 +1,75 @@
+"""
+Measures how decoding a large get_video_list result scales with the number
+of decode worker processes.
+
+Usage:
+    pip install -e .
+    python benchmarks/bench_parallel_decode.py [--copies N] [--workers 1,2,4]
+"""
+
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import List
+
+from vids_db.db_sqlite_video import DbSqliteVideo
+from vids_db.models import Video
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+TEST_DATA = os.path.join(HERE, "..", "tests", "test_data.json")
+
+
+def load_videos(copies: int) -> List[Video]:
+    with open(TEST_DATA, encoding="utf-8", mode="r") as f:
+        content = json.loads(f.read())["content"]
+    out: List[Video] = []
+    for i in range(copies):
+        for datum in content:
+            datum = dict(datum, url=f"{datum['url']}?copy={i}")
+            if datum["views"] in ["?", ""]:
+                datum["views"] = 0
+            try:
+                out.append(Video(**datum))
+            except ValueError:
+                pass
+    return out
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--copies", type=int, default=60)
+    parser.add_argument("--workers", default="1,2,4,8")
+    args = parser.parse_args()
+    vids = load_videos(args.copies)
+    tempdir = tempfile.mkdtemp()
+    try:
+        db_path = os.path.join(tempdir, "videos.sqlite")
+        DbSqliteVideo(db_path).insert_or_update(vids)
+        start_date = datetime(1970, 1, 2, tzinfo=timezone.utc)
+        end_date = datetime(2100, 1, 1, tzinfo=timezone.utc)
+        print(f"{len(vids)} videos, {os.cpu_count()} cpus")
+        print(f"{'workers':>8} {'time (ms)':>10} {'speedup':>8}")
+        baseline = None
+        for workers in [int(w) for w in args.workers.split(",")]:
+            db = DbSqliteVideo(db_path, decode_workers=workers)
+            db.find_videos(start_date, end_date)  # Starts the pool.
+            timings = []
+            for _ in range(3):
+                start = time.perf_counter()
+                found = db.find_videos(start_date, end_date)
+                timings.append(time.perf_counter() - start)
+            db.close()
+            assert len(found) == len(vids)
+            best = min(timings)
+            baseline = baseline or best
+            print(f"{workers:>8} {best * 1000:>10.0f} {baseline / best:>8.2f}")
+    finally:
+        shutil.rmtree(tempdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Compares database size and read latency for each payload format.
+
+Usage:
+    pip install -e .
+    python benchmarks/bench_payload_compression.py [--copies N]
+"""
+
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from vids_db.db_sqlite_video import DbSqliteVideo
+from vids_db.models import Video
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+TEST_DATA = os.path.join(HERE, "..", "tests", "test_data.json")
+
+
+def load_videos(copies: int) -> List[Video]:
+    with open(TEST_DATA, encoding="utf-8", mode="r") as f:
+        content = json.loads(f.read())["content"]
+    out: List[Video] = []
+    for i in range(copies):
+        for datum in content:
+            datum = dict(datum, url=f"{datum['url']}?copy={i}")
+            if datum["views"] in ["?", ""]:
+                datum["views"] = 0
+            try:
+                out.append(Video(**datum))
+            except ValueError:
+                pass
+    return out
+
+
+def run(vids: List[Video], compression: Optional[str], train: bool) -> None:
+    tempdir = tempfile.mkdtemp()
+    try:
+        db_path = os.path.join(tempdir, "videos.sqlite")
+        db = DbSqliteVideo(db_path, compression=compression)
+        db.insert_or_update(vids)
+        db.compact(train=train)
+        size = os.path.getsize(db_path)
+        start_date = datetime(1970, 1, 2, tzinfo=timezone.utc)
+        end_date = datetime(2100, 1, 1, tzinfo=timezone.utc)
+        timings = []
+        for _ in range(5):
+            start = time.perf_counter()
+            found = db.find_videos(start_date, end_date)
+            timings.append(time.perf_counter() - start)
+        assert len(found) == len(vids)
+        label = (
+            f"{compression or 'json'}{'+dict' if train and compression else ''}"
+        )
+        print(f"{label:>10} {size / 1024:>10.0f} {min(timings) * 1000:>12.1f}")
+    finally:
+        shutil.rmtree(tempdir, ignore_errors=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--copies", type=int, default=20)
+    args = parser.parse_args()
+    vids = load_videos(args.copies)
+    print(f"{len(vids)} videos")
+    print(f"{'format':>10} {'size (kb)':>10} {'read (ms)':>12}")
+    run(vids, None, train=False)
+    run(vids, "zlib", train=False)
+    run(vids, "zlib", train=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Compares the full text index schema versions: build time, index size on
+disk and query latency (word, prefix, phrase, filtered and sorted).
+
+Usage:
+    pip install -e .
+    python benchmarks/bench_search_schema.py [--videos N] [--repeat N]
+"""
+
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, List
+
+from whoosh.query import QueryError  # type: ignore
+
+from vids_db.db_full_text_search import (
+    SCHEMAS,
+    SORT_NEWEST,
+    DbFullTextSearch,
+    SearchFilter,
+)
+from vids_db.models import Video
+
+DATE = datetime(2022, 5, 4, tzinfo=timezone.utc)
+WORDS = (
+    "news update live breaking report weekly interview podcast review "
+    "music official trailer gameplay tutorial history science election "
+    "market crypto health travel cooking sports highlights analysis"
+).split()
+
+
+def make_videos(count: int) -> List[Video]:
+    rand = random.Random(0)
+    out = []
+    for i in range(count):
+        date = DATE + timedelta(minutes=i)
+        title = " ".join(rand.choice(WORDS) for _ in range(rand.randint(3, 9)))
+        out.append(
+            Video(
+                channel_name=f"Channel {rand.choice(WORDS)} {i % 300}",
+                title=f"{title} {i}",
+                date_published=date,
+                date_lastupdated=date,
+                channel_url="https://example.com/channel",
+                source="youtube",
+                url=f"https://example.com/{i}",
+                duration="12:34",  # type: ignore
+                description="",
+                img_src="https://example.com/img.jpg",
+                iframe_src="https://example.com/embed",
+                views=rand.randint(0, 1000000),
+            )
+        )
+    return out
+
+
+def dir_size(path: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(path)
+        for name in names
+    )
+
+
+def time_query(fn: Callable[[], object], repeat: int) -> float:
+    """Median latency in ms."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return sorted(times)[len(times) // 2] * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--videos", type=int, default=20000)
+    parser.add_argument("--batch", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    vids = make_videos(args.videos)
+    recent = SearchFilter(
+        date_start=DATE + timedelta(minutes=args.videos // 2), min_views=1000
+    )
+    queries = {
+        "word": lambda db: db.search("report", limit=40),
+        "prefix": lambda db: db.search("interv*", limit=40),
+        "phrase": lambda db: db.search('"breaking news"', limit=40),
+        "filtered": lambda db: db.search(
+            "market", limit=40, search_filter=recent, sort=SORT_NEWEST
+        ),
+    }
+    print(f"{args.videos} videos")
+    for version in sorted(SCHEMAS):
+        tmp = tempfile.mkdtemp()
+        try:
+            db = DbFullTextSearch(tmp, schema_version=version)
+            start = time.perf_counter()
+            for i in range(0, len(vids), args.batch):
+                db.add_videos(vids[i : i + args.batch])
+            build = time.perf_counter() - start
+            size = dir_size(tmp) / (1024 * 1024)
+            print(
+                f"schema v{version}: build {build:6.2f}s"
+                f" index {size:7.2f} MiB"
+            )
+            for name, query in queries.items():
+                try:
+                    hits = len(query(db))
+                except QueryError as err:
+                    # Phrases need positions, which ngram titles lack.
+                    print(f"  {name:>8}: unsupported, {err}")
+                    continue
+                latency = time_query(lambda: query(db), args.repeat)
+                print(f"  {name:>8}: {latency:7.2f}ms ({hits} hits)")
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Compares Video serialization throughput: the original model_dump() loop,
+json.dumps() of to_json(), and to_json_str(), to_json_bytes() and
+dump_many_json(), which write the fields straight into the same bytes.
+
+Usage:
+    pip install -e .
+    python benchmarks/bench_serialization.py [--copies N]
+"""
+
+import argparse
+import json
+import os
+import time
+from datetime import datetime
+from typing import Callable, List
+
+from vids_db.models import Video
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+TEST_DATA = os.path.join(HERE, "..", "tests", "test_data.json")
+
+
+def load_videos(copies: int) -> List[Video]:
+    with open(TEST_DATA, encoding="utf-8", mode="r") as f:
+        content = json.loads(f.read())["content"]
+    out: List[Video] = []
+    for i in range(copies):
+        for datum in content:
+            datum = dict(datum, url=f"{datum['url']}?copy={i}")
+            if datum["views"] in ["?", ""]:
+                datum["views"] = 0
+            try:
+                out.append(Video(**datum))
+            except ValueError:
+                pass
+    return out
+
+
+def legacy_to_json_str(vid: Video) -> str:
+    """The serialization that Video.to_json_str() used to do."""
+    data = {}
+    for key, val in vid.model_dump().items():
+        if isinstance(val, datetime):
+            data[key] = val.isoformat()
+        else:
+            data[key] = val
+    return json.dumps(data, ensure_ascii=False)
+
+
+def dumps(vid: Video) -> str:
+    """The serialization of to_json_str() before it wrote fields directly."""
+    return json.dumps(vid.to_json(), ensure_ascii=False)
+
+
+def run(label: str, func: Callable[[], object], count: int) -> None:
+    timings = []
+    for _ in range(5):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    best = min(timings)
+    print(f"{label:>22} {best * 1000:>10.1f} {count / best:>14.0f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--copies", type=int, default=50)
+    args = parser.parse_args()
+    vids = load_videos(args.copies)
+    for vid in vids:
+        assert json.loads(legacy_to_json_str(vid)) == vid.to_json()
+        assert vid.to_json_str() == legacy_to_json_str(vid)
+        assert vid.to_json_bytes() == legacy_to_json_str(vid).encode()
+    all_json = json.dumps([v.to_json() for v in vids], ensure_ascii=False)
+    assert Video.dump_many_json(vids) == all_json.encode()
+    print(f"{len(vids)} videos")
+    print(f"{'path':>22} {'time (ms)':>10} {'videos / sec':>14}")
+    run("legacy loop", lambda: [legacy_to_json_str(v) for v in vids], len(vids))
+    run("json.dumps(to_json())", lambda: [dumps(v) for v in vids], len(vids))
+    run("to_json_str", lambda: [v.to_json_str() for v in vids], len(vids))
+    run("to_json_bytes", lambda: [v.to_json_bytes() for v in vids], len(vids))
+    run("dump_many_json", lambda: Video.dump_many_json(vids), len(vids))
+
+
+if __name__ == "__main__":
+    main()
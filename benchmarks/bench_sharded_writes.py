@@ -0,0 +1,85 @@
+"""
+Benchmarks concurrent write throughput of ShardedDatabase by shard count,
+and the time writers spent waiting on the shard locks.
+
+Usage:
+    pip install -e .
+    python benchmarks/bench_sharded_writes.py [--videos N] [--workers N]
+"""
+
+import argparse
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import List, Tuple
+
+from vids_db.models import Video
+from vids_db.sharded_database import ShardedDatabase
+
+DATE = datetime(2022, 5, 4, tzinfo=timezone.utc)
+
+
+def make_videos(worker: int, count: int) -> List[Video]:
+    # Scrapers write one channel per batch, so each batch maps to one shard.
+    out = []
+    for i in range(count):
+        date = DATE + timedelta(seconds=i)
+        out.append(
+            Video(
+                channel_name=f"channel{worker}_{i // 50}",
+                title=f"Video {worker} {i}",
+                date_published=date,
+                date_lastupdated=date,
+                channel_url="https://example.com/channel",
+                source="youtube",
+                url=f"https://example.com/{worker}/{i}",
+                duration="12:34",  # type: ignore
+                description="x" * 200,
+                img_src="https://example.com/img.jpg",
+                iframe_src="https://example.com/embed",
+                views=i,
+            )
+        )
+    return out
+
+
+def run(
+    num_shards: int, workers: int, videos: int, batch: int
+) -> Tuple[float, float]:
+    tempdir = tempfile.mkdtemp()
+    try:
+        db = ShardedDatabase(tempdir, num_shards=num_shards)
+        per_worker = [make_videos(w, videos // workers) for w in range(workers)]
+
+        def work(vids: List[Video]) -> None:
+            for i in range(0, len(vids), batch):
+                db.update_many(vids[i : i + batch])
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(work, per_worker))
+        elapsed = time.perf_counter() - start
+        wait = sum(lock.metrics().total_wait_seconds for lock in db.shard_locks)
+        db.close()
+        return videos / elapsed, wait / elapsed
+    finally:
+        shutil.rmtree(tempdir, ignore_errors=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--videos", type=int, default=20000)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--batch", type=int, default=50)
+    args = parser.parse_args()
+    # Lock wait is summed over the writers, per second of the run.
+    print(f"{'shards':>6} {'videos/s':>10} {'lock wait':>10}")
+    for num_shards in (1, 2, 4, 8):
+        rate, wait = run(num_shards, args.workers, args.videos, args.batch)
+        print(f"{num_shards:>6} {rate:>10.0f} {wait:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+Tests the autocomplete index
+"""
+
+# pylint: disable=invalid-name,R0801
+
+import os
+import random
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from video_factory import make_video
+
+from vids_db.autocomplete import (
+    KIND_CHANNEL,
+    KIND_TITLE,
+    AutocompleteIndex,
+    build_index,
+    title_terms,
+)
+from vids_db.database import Database
+
+
+class AutocompleteTester(unittest.TestCase):
+    """Tests autocomplete.py and Database.suggest()"""
+
+    def test_title_terms(self) -> None:
+        """Tests that short words and numbers are not suggested."""
+        self.assertEqual(
+            ["python", "tips"], title_terms("10 Python TIPS in 5 mn")
+        )
+
+    def test_suggest(self) -> None:
+        """Tests ranking, ties and removal."""
+        index = AutocompleteIndex()
+        index.add_channels({"Python Weekly": 3, "PyCon": 5})
+        index.add_titles(["python tricks", "python tips", "pytest"])
+        self.assertEqual(
+            ["PyCon", "Python Weekly", "python", "pytest"],
+            [s.text for s in index.suggest("Py")],
+        )
+        self.assertEqual(
+            [(KIND_CHANNEL, 3), (KIND_TITLE, 2)],
+            [(s.kind, s.frequency) for s in index.suggest("pyth")],
+        )
+        self.assertEqual(1, len(index.suggest("py", limit=1)))
+        index.remove_channel("pycon")
+        self.assertEqual("Python Weekly", index.suggest("py")[0].text)
+        self.assertEqual([], index.suggest("zz"))
+        self.assertEqual([], index.suggest(" "))
+
+    def test_many_keys_are_fast(self) -> None:
+        """Tests that a lookup in a large index stays sub millisecond."""
+        rand = random.Random(0)
+        letters = "abcdefghijklmnopqrstuvwxyz"
+        words = [
+            "".join(rand.choice(letters) for _ in range(rand.randint(3, 10)))
+            for _ in range(100000)
+        ]
+        index = AutocompleteIndex()
+        index.add_titles(
+            " ".join(words[i : i + 10]) for i in range(0, 100000, 10)
+        )
+        index.add_titles(["zzzq"] * 1000)  # Incremental update.
+        prefixes = [
+            word[:size] for word in words[:200] for size in (1, 2, 4, 6)
+        ]
+        start = time.perf_counter()
+        for prefix in prefixes:
+            self.assertTrue(index.suggest(prefix))
+        self.assertLess((time.perf_counter() - start) / len(prefixes), 0.001)
+        self.assertEqual(("zzzq", 1000), index.suggest("z")[0][::2])
+
+    def test_build_index(self) -> None:
+        """Tests that a bulk build matches incremental adds."""
+        rand = random.Random(0)
+        letters = "abcdef"
+        titles = [
+            " ".join(
+                "".join(rand.choice(letters) for _ in range(rand.randint(3, 5)))
+                for _ in range(5)
+            )
+            for _ in range(3000)
+        ]
+        channels = {"Abc News": 7, "Dead Beef": 2}
+        batches = [titles[i : i + 500] for i in range(0, len(titles), 500)]
+        incremental = AutocompleteIndex()
+        incremental.add_channels(channels)
+        for batch in batches:
+            incremental.add_titles(batch)
+        # pylint: disable=protected-access
+        with mock.patch.object(
+            AutocompleteIndex,
+            "_rebuild_top",
+            autospec=True,
+            side_effect=AutocompleteIndex._rebuild_top,
+        ) as rebuild:
+            bulk = build_index(channels, batches)
+        self.assertEqual(1, rebuild.call_count)
+        self.assertEqual(incremental.keys, bulk.keys)
+        self.assertEqual(incremental.counts, bulk.counts)
+        for prefix in ("a", "ab", "abc", "dea", "abcd", "fed"):
+            self.assertEqual(
+                incremental.suggest(prefix, 20), bulk.suggest(prefix, 20)
+            )
+        # Adds after a bulk build are incremental.
+        bulk.add_titles(["zzzq"])
+        self.assertEqual(("zzzq", 1), bulk.suggest("zz")[0][::2])
+
+    def test_database_suggest(self) -> None:
+        """Tests that suggestions follow update_many and removals."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db = Database(os.path.join(tmp_dir, "db"))
+            db.update_many(
+                [
+                    make_video(
+                        "http://a",
+                        channel_name="Gardening Today",
+                        title="Garden tour",
+                    ),
+                    make_video(
+                        "http://b",
+                        channel_name="Gardening Today",
+                        title="Garlic tips",
+                    ),
+                ]
+            )
+            self.assertEqual(
+                [("Gardening Today", 2), ("garden", 1), ("garlic", 1)],
+                [(s.text, s.frequency) for s in db.suggest("gar")],
+            )
+            # A re-scraped video is not counted twice.
+            db.update_many(
+                [
+                    make_video(
+                        "http://b",
+                        channel_name="Gardening Today",
+                        title="Garlic tips",
+                    ),
+                    make_video(
+                        "http://c",
+                        channel_name="Garage Builds",
+                        title="Garage tour",
+                    ),
+                ]
+            )
+            self.assertEqual(
+                [("Gardening Today", 2), ("Garage Builds", 1), ("garage", 1)],
+                [(s.text, s.frequency) for s in db.suggest("gar", limit=3)],
+            )
+            db.remove_by_channel_name("Garage Builds")
+            self.assertNotIn(
+                "Garage Builds", [s.text for s in db.suggest("gar")]
+            )
+            db.clear()
+            self.assertEqual([], db.suggest("gar"))
+
+
+if __name__ == "__main__":
+    unittest.main()
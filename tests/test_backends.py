@@ -0,0 +1,255 @@
+"""
+Tests that every storage backend honours the VideoStore contract
+"""
+
+# pylint: disable=invalid-name,R0801
+
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+from unittest import mock
+
+import video_factory
+
+from vids_db.backend import VideoStore
+from vids_db.database import Database
+from vids_db.date import now_local
+from vids_db.db_memory_video import DbMemoryVideo
+from vids_db.db_sqlite_partitioned import DbSqlitePartitionedVideo
+from vids_db.db_sqlite_video import DbSqliteVideo
+from vids_db.models import Video, VideoSummary
+from vids_db.trending import TRENDING_MAX_WINDOW
+
+DATE = datetime(2022, 3, 15, tzinfo=timezone.utc)
+
+
+def make_video(
+    i: int,
+    date_published: Optional[datetime] = None,
+    channel_name: str = "",
+    title: str = "",
+) -> Video:
+    """Construct a default video object, i days before DATE by default."""
+    return video_factory.make_video(
+        f"http://example.com/{i}",
+        date_published or DATE - timedelta(days=i),
+        channel_name=channel_name or f"channel{i % 2}",
+        title=title or f"Vid title {i}",
+        source="youtube.com" if i % 3 else "rumble.com",
+        views=i * 10,
+    )
+
+
+def urls_of(vids: List) -> List[str]:
+    """The urls of videos, in order."""
+    return [vid.url for vid in vids]
+
+
+def url(i: int) -> str:
+    """The url of make_video(i)."""
+    return f"http://example.com/{i}"
+
+
+class StoreContract(unittest.TestCase):
+    """Runs against the store of make_store(), see the subclasses."""
+
+    def setUp(self) -> None:
+        # pylint: disable=consider-using-with
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.store = self.make_store()
+        # Two and a half months, one video every 5 days.
+        self.store.insert_or_update([make_video(i * 5) for i in range(16)])
+
+    def tearDown(self) -> None:
+        self.store.close()
+        self.tmp_dir.cleanup()
+
+    def make_store(self) -> VideoStore:
+        """The store under test."""
+        raise NotImplementedError
+
+    def test_find_videos(self) -> None:
+        """Tests the inclusive window, newest first, limit and channel."""
+        store = self.store
+        vids = store.find_videos(DATE - timedelta(days=20), DATE)
+        self.assertEqual([url(i) for i in (0, 5, 10, 15, 20)], urls_of(vids))
+        vids = store.find_videos(DATE - timedelta(days=60), DATE, limit_count=2)
+        self.assertEqual([url(0), url(5)], urls_of(vids))
+        vids = store.find_videos(
+            DATE - timedelta(days=40), DATE, channel_name="channel1"
+        )
+        self.assertEqual([url(i) for i in (5, 15, 25, 35)], urls_of(vids))
+        summaries = store.find_videos(
+            DATE - timedelta(days=1), DATE, summary=True
+        )
+        self.assertIsInstance(summaries[0], VideoSummary)
+        found = store.find_videos_by_urls([url(5), url(10), "nope"])
+        self.assertEqual({url(5), url(10)}, set(urls_of(found)))
+        self.assertEqual([url(5)], store.existing_urls([url(5), "nope"]))
+
+    def test_update(self) -> None:
+        """Tests that a rewrite moves the video in time and channel."""
+        store = self.store
+        moved = make_video(1, channel_name="channel9")
+        store.insert_or_update(
+            [Video(**{**moved.model_dump(), "url": url(75)})]
+        )
+        vids = store.find_videos(DATE - timedelta(days=2), DATE)
+        self.assertEqual([url(0), url(75)], urls_of(vids))
+        self.assertEqual(
+            [],
+            store.find_videos(
+                DATE - timedelta(days=76), DATE - timedelta(days=74)
+            ),
+        )
+        counts = store.get_channel_counts()
+        self.assertEqual({"channel0": 8, "channel1": 7, "channel9": 1}, counts)
+        self.assertEqual(
+            {"channel0", "channel1", "channel9"},
+            set(store.get_channel_names()),
+        )
+        patched = store.update_fields({url(0): {"views": 7}, "nope": {}})
+        self.assertEqual([7], [vid.views for vid in patched])
+        self.assertEqual(7, store.find_videos_by_urls([url(0)])[0].views)
+
+    def test_remove(self) -> None:
+        """Tests the half open window of remove_where and the counts."""
+        store = self.store
+        removed = store.remove_where(date_end=DATE - timedelta(days=65))
+        self.assertEqual({url(70), url(75)}, set(removed))
+        removed = store.remove_where(
+            DATE - timedelta(days=20), DATE - timedelta(days=10), max_views=150
+        )
+        self.assertEqual([url(15)], removed)
+        self.assertEqual([url(5)], store.remove_by_urls([url(5), url(5)]))
+        removed = store.remove_by_channel_name("channel1")
+        self.assertEqual(5, len(removed))
+        with self.assertRaises(ValueError):
+            store.remove_where()
+        left = [vid.url for vids in store.iter_videos(2) for vid in vids]
+        self.assertEqual(
+            {url(i) for i in (0, 10, 20, 30, 40, 50, 60)}, set(left)
+        )
+        store.clear()
+        self.assertEqual([], list(store.iter_videos()))
+
+    def test_columns_and_facets(self) -> None:
+        """Tests the analytics reads over the same window."""
+        start = DATE - timedelta(days=10)
+        columns = self.store.get_columns(["url", "views"], start, DATE)
+        self.assertEqual([url(0), url(5), url(10)], columns.columns["url"])
+        self.assertEqual([0, 50, 100], list(columns.columns["views"]))
+        facets = self.store.get_facets(start, DATE)
+        self.assertEqual({"rumble.com": 1, "youtube.com": 2}, facets["source"])
+        self.assertEqual({"short": 3}, facets["duration"])
+        self.assertEqual({"channel0": 2, "channel1": 1}, facets["channel_name"])
+        facets = self.store.get_facets(start, DATE, ["source"], urls=[url(0)])
+        self.assertEqual({"source": {"rumble.com": 1}}, facets)
+        titles = [
+            title for batch in self.store.iter_titles() for title in batch
+        ]
+        self.assertEqual(16, len(titles))
+
+    def test_trending_and_near_duplicates(self) -> None:
+        """Tests the score order and the re-upload lookup."""
+        store = self.store
+        now = now_local()
+        store.insert_or_update(
+            [
+                make_video(100, now - timedelta(hours=1), "aa", "Moon landing"),
+                make_video(200, now - timedelta(hours=30), "aa", "The moon"),
+                make_video(
+                    300, now - timedelta(hours=2), "bb", "Moon landing!"
+                ),
+            ]
+        )
+        trending = store.find_trending(10)
+        self.assertEqual([url(300), url(100), url(200)], urls_of(trending))
+        trending = store.find_trending(1, channel_name="aa")
+        self.assertEqual([url(100)], urls_of(trending))
+        # Older videos have no score to rank by.
+        with self.assertRaises(ValueError):
+            store.find_trending(10, window=TRENDING_MAX_WINDOW * 2)
+        self.assertEqual(3, store.refresh_trending())
+        dups = store.find_near_duplicates(make_video(100, title="Moon landing"))
+        self.assertEqual([url(300)], urls_of(dups))
+
+
+class SqliteStoreTester(StoreContract):
+    """The single file sqlite store."""
+
+    def make_store(self) -> VideoStore:
+        return DbSqliteVideo(os.path.join(self.tmp_dir.name, "videos.sqlite"))
+
+
+class PartitionedStoreTester(StoreContract):
+    """The month partitioned sqlite store."""
+
+    def make_store(self) -> VideoStore:
+        return DbSqlitePartitionedVideo(self.tmp_dir.name)
+
+
+class MemoryStoreTester(StoreContract):
+    """The in memory store."""
+
+    def make_store(self) -> VideoStore:
+        return DbMemoryVideo()
+
+    def test_snapshot(self) -> None:
+        """Tests that a snapshot survives a reopen."""
+        path = os.path.join(self.tmp_dir.name, "videos.vdb.gz")
+        store = DbMemoryVideo(path)
+        store.insert_or_update([make_video(i) for i in range(3)])
+        store.close()
+        self.assertFalse(os.path.exists(path + ".tmp"))
+        store = DbMemoryVideo(path)
+        vids = store.find_videos(DATE - timedelta(days=5), DATE)
+        self.assertEqual([url(0), url(1), url(2)], urls_of(vids))
+        self.assertEqual(3, store.save())
+
+
+@mock.patch.dict(os.environ, {"FULL_TEXT_SEARCH_ENABLED": "1"})
+class MemoryDatabaseTester(unittest.TestCase):
+    """Tests Database(store=DbMemoryVideo())"""
+
+    def setUp(self) -> None:
+        # pylint: disable=consider-using-with
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_dir = os.path.join(self.tmp_dir.name, "db")
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def test_database(self) -> None:
+        """Tests reads, search, facets caching and the single file apis."""
+        db = Database(self.db_dir, store=DbMemoryVideo())
+        db.update_many([make_video(i) for i in range(4)])
+        self.assertFalse(
+            os.path.exists(os.path.join(self.db_dir, "videos.sqlite"))
+        )
+        vids = db.get_video_list(DATE - timedelta(days=1), DATE)
+        self.assertEqual([url(0), url(1)], urls_of(vids))
+        found = db.query_video_list("title", sort="newest")
+        self.assertEqual([url(i) for i in range(4)], urls_of(found))
+        window = (DATE - timedelta(days=5), DATE)
+        self.assertEqual(db.get_facets(*window), db.get_facets(*window))
+        self.assertEqual(1, db.facet_cache.hits)
+        self.assertEqual(2, db.remove_by_channel_name("channel1"))
+        self.assertEqual(
+            [url(0), url(2)],
+            urls_of(db.query_video_list("title", sort="newest")),
+        )
+        with self.assertRaises(ValueError):
+            db.changes_since(0)
+        with self.assertRaises(ValueError):
+            Database(self.db_dir, partitioned=True, store=DbMemoryVideo())
+        db.close()
+
+
+# Only the subclasses run the contract.
+del StoreContract
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+"""
+Tests the bulk delete and update apis
+"""
+
+# pylint: disable=invalid-name,R0801
+
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from typing import Any, Dict
+from unittest import mock
+
+import video_factory
+
+from vids_db.database import Database
+from vids_db.models import Video
+
+START = datetime(2021, 2, 9).astimezone()
+
+
+def make_video(i: int) -> Video:
+    """Construct a default video object, one day apart."""
+    return video_factory.make_video(
+        f"http://example.com/{i}",
+        START + timedelta(days=i),
+        channel_name=f"channel{i % 2}",
+        title=f"Vid title {i}",
+        description="x" * 1000,
+        views=i,
+    )
+
+
+@mock.patch.dict(os.environ, {"FULL_TEXT_SEARCH_ENABLED": "1"})
+class BulkDeleteTester(unittest.TestCase):
+    """Tests remove_by_urls, remove_where and update_fields"""
+
+    def setUp(self) -> None:
+        # pylint: disable=consider-using-with
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_dir = os.path.join(self.tmp_dir.name, "db")
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def test_removes(self) -> None:
+        """Tests the counts and that the index follows."""
+        db = Database(self.db_dir)
+        db.update_many([make_video(i) for i in range(10)])
+        urls = ["http://example.com/0", "http://example.com/1", "nope"]
+        self.assertEqual(2, db.remove_by_urls(urls))
+        self.assertEqual(0, db.remove_by_urls(urls))
+        # Days 2, 3 and 4.
+        self.assertEqual(3, db.remove_older_than(START + timedelta(days=5)))
+        self.assertEqual(
+            2, db.remove_where(max_views=7, channel_name="channel1")
+        )
+        self.assertEqual(1, db.remove_by_channel_name("channel1"))
+        left = [vid.url for vid in db.query_video_list("title")]
+        self.assertEqual(
+            {"http://example.com/6", "http://example.com/8"}, set(left)
+        )
+        with self.assertRaises(ValueError):
+            db.remove_where()
+        self.assertTrue(db.verify().ok)
+        db.close()
+
+    def test_update_fields(self) -> None:
+        """Tests that patched videos are stored and indexed."""
+        db = Database(self.db_dir)
+        db.update_many([make_video(i) for i in range(3)])
+        patches: Dict[str, Dict[str, Any]] = {
+            "http://example.com/0": {"views": 1000},
+            "http://example.com/1": {"title": "Renamed"},
+            "http://example.com/9": {"views": 1},
+        }
+        self.assertEqual(2, db.update_fields(patches))
+        vids = {vid.url: vid for vid in db.get_by_urls(list(patches))}
+        self.assertEqual(1000, vids["http://example.com/0"].views)
+        found = db.query_video_list("renamed")
+        self.assertEqual(["http://example.com/1"], [vid.url for vid in found])
+        self.assertTrue(db.verify().ok)
+        db.close()
+
+    def test_chunks_and_vacuum(self) -> None:
+        """Tests deletes over several chunks and the incremental vacuum."""
+        db = Database(self.db_dir)
+        db.update_many([make_video(i) for i in range(1200)])
+        path = os.path.join(self.db_dir, "videos.sqlite")
+        size = os.path.getsize(path)
+        count = db.remove_older_than(START + timedelta(days=1100), vacuum=False)
+        self.assertEqual(1100, count)
+        self.assertGreater(db.incremental_vacuum(), 0)
+        self.assertLess(os.path.getsize(path), size)
+        self.assertEqual(0, db.incremental_vacuum())
+        db.close()
+
+    def test_partitioned(self) -> None:
+        """Tests the partitioned store."""
+        db = Database(self.db_dir, partitioned=True)
+        db.update_many([make_video(i) for i in range(60)])
+        self.assertEqual(1, db.remove_by_urls(["http://example.com/0"]))
+        self.assertEqual(30, db.remove_older_than(START + timedelta(days=31)))
+        self.assertEqual(1, db.update_fields({"http://example.com/59": {}}))
+        now = datetime.now()
+        vids = db.get_video_list(now - timedelta(days=365 * 20), now)
+        self.assertEqual(29, len(vids))
+        db.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,125 @@
+"""
+Tests streaming bulk export and import
+"""
+
+# pylint: disable=invalid-name,R0801
+
+import os
+import tempfile
+import unittest
+from typing import List
+from unittest import mock
+
+from video_factory import make_video
+
+from vids_db.bulk_io import detect_format, export_videos, import_videos
+from vids_db.database import Database
+from vids_db.models import Video
+
+
+class BulkIoTester(unittest.TestCase):
+    """Tests bulk_io.py"""
+
+    def setUp(self) -> None:
+        # pylint: disable=consider-using-with
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.vids = [
+            make_video(f"http://example.com/{i}", title="Vid0 ü")
+            for i in range(25)
+        ]
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def path(self, name: str) -> str:
+        """Path inside the temp dir."""
+        return os.path.join(self.tmp_dir.name, name)
+
+    def test_detect_format(self) -> None:
+        """Tests format and compression from the file extension."""
+        self.assertEqual(("ndjson", None), detect_format("a.ndjson"))
+        self.assertEqual(("ndjson", "gzip"), detect_format("a.jsonl.gz"))
+        self.assertEqual(("binary", "xz"), detect_format("a.vdb.xz"))
+
+    def test_round_trip(self) -> None:
+        """Tests that every format and compression round trips."""
+        for name in (
+            "v.ndjson",
+            "v.ndjson.gz",
+            "v.vdb",
+            "v.vdb.bz2",
+            "v.vdb.xz",
+        ):
+            path = self.path(name)
+            self.assertEqual(
+                25, export_videos([self.vids[:10], self.vids[10:]], path)
+            )
+            out: List[Video] = []
+            self.assertEqual(25, import_videos(out.extend, path, batch_size=7))
+            self.assertEqual(self.vids, out, name)
+
+    def test_resume_from_checkpoint(self) -> None:
+        """Tests that a failed import resumes after the last batch."""
+        for name in ("v.ndjson.gz", "v.vdb"):
+            path = self.path(name)
+            checkpoint = self.path(name + ".checkpoint")
+            export_videos([self.vids], path)
+            out: List[Video] = []
+
+            def failing_insert(vids: List[Video]) -> None:
+                if len(out) >= 20:  # pylint: disable=cell-var-from-loop
+                    raise OSError("disk full")
+                out.extend(vids)  # pylint: disable=cell-var-from-loop
+
+            with self.assertRaises(OSError):
+                import_videos(
+                    failing_insert,
+                    path,
+                    batch_size=10,
+                    checkpoint_path=checkpoint,
+                )
+            self.assertTrue(os.path.exists(checkpoint))
+            count = import_videos(
+                out.extend, path, batch_size=10, checkpoint_path=checkpoint
+            )
+            self.assertEqual(5, count)
+            self.assertEqual(self.vids, out)
+            self.assertFalse(os.path.exists(checkpoint))
+
+    def test_database_export_import(self) -> None:
+        """Tests moving a corpus between two databases."""
+        src = Database(self.path("src"))
+        src.update_many(self.vids)
+        path = self.path("videos.vdb.gz")
+        self.assertEqual(25, src.export_videos(path))
+        dst = Database(self.path("dst"))
+        self.assertEqual(25, dst.import_videos(path, batch_size=10))
+        urls = [str(vid.url) for vid in self.vids]
+        self.assertCountEqual(self.vids, dst.get_by_urls(urls))
+
+    def test_import_write_buffer(self) -> None:
+        """Tests that checkpoints follow stored batches with write-behind."""
+        src = Database(self.path("src"))
+        src.update_many(self.vids)
+        path = self.path("videos.vdb.gz")
+        src.export_videos(path)
+        dst = Database(
+            self.path("dst"), write_buffer_size=1000, write_buffer_delay=60
+        )
+        urls = [str(vid.url) for vid in self.vids]
+        stored: List[int] = []
+
+        def checkpoint(*_) -> None:
+            stored.append(len(dst.db_sqlite.existing_urls(urls)))
+
+        with mock.patch("vids_db.bulk_io._write_checkpoint", checkpoint):
+            dst.import_videos(
+                path, batch_size=10, checkpoint_path=self.path("checkpoint")
+            )
+        self.assertEqual([10, 20], stored)
+        self.assertEqual(25, len(dst.db_sqlite.existing_urls(urls)))
+        dst.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+"""
+Tests the change feed
+"""
+
+# pylint: disable=invalid-name,R0801
+
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from video_factory import make_video
+
+from vids_db.db_sqlite_video import DbSqliteVideo
+
+
+class ChangeFeedTester(unittest.TestCase):
+    """Tests changes_since and the tombstones"""
+
+    def setUp(self) -> None:
+        tmp_file = (
+            tempfile.NamedTemporaryFile(  # pylint: disable=consider-using-with
+                suffix=".sqlite3", delete=False
+            )
+        )
+        tmp_file.close()
+        self.db_path = tmp_file.name
+
+    def tearDown(self) -> None:
+        os.remove(self.db_path)
+
+    def test_changes_since(self) -> None:
+        """Tests updates, deletes and clear in sequence order."""
+        db = DbSqliteVideo(self.db_path)
+        start = db.current_change_seq()
+        db.insert_or_update([make_video("http://a"), make_video("http://b")])
+        db.insert_or_update([make_video("http://a")])
+        db.insert_or_update(
+            [make_video("http://c", channel_name="other_channel")]
+        )
+        db.remove_by_channel_name("other_channel")
+        changes = db.changes_since(start)
+        self.assertEqual(
+            ["http://b", "http://a", "http://c"], [c.url for c in changes]
+        )
+        self.assertIsNotNone(changes[0].video)
+        self.assertIsNone(changes[2].video)
+        seqs = [c.seq for c in changes]
+        self.assertEqual(sorted(seqs), seqs)
+        # A replica that is up to date only sees the new changes.
+        cursor = db.current_change_seq()
+        db.clear()
+        changes = db.changes_since(cursor)
+        self.assertCountEqual(
+            ["http://a", "http://b"], [c.url for c in changes]
+        )
+        self.assertTrue(all(c.video is None for c in changes))
+        batches = list(db.iter_changes_since(start, batch_size=2))
+        self.assertEqual([2, 1], [len(b) for b in batches])
+        self.assertEqual(3, db.prune_tombstones(db.current_change_seq()))
+
+    def test_existing_rows_are_sequenced(self) -> None:
+        """Tests that rows from before the change feed get a sequence."""
+        conn = sqlite3.connect(self.db_path)
+        conn.executescript(
+            "CREATE TABLE videos (url TEXT PRIMARY KEY UNIQUE NOT NULL,"
+            " channel_name TEXT, timestamp_published INT, data TEXT);"
+        )
+        for url in ("http://a", "http://b"):
+            vid = make_video(url)
+            conn.execute(
+                "INSERT INTO videos VALUES (?, ?, ?, ?)",
+                (url, vid.channel_name, 0, vid.to_json_str()),
+            )
+        conn.commit()
+        conn.close()
+        db = DbSqliteVideo(self.db_path)
+        self.assertEqual(2, db.current_change_seq())
+        self.assertEqual(
+            ["http://a", "http://b"], [c.url for c in db.changes_since(0)]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+"""
+Tests the columnar export of videos
+"""
+
+# pylint: disable=invalid-name,R0801
+
+import shutil
+import tempfile
+import unittest
+from array import array
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+import video_factory
+
+from vids_db import columnar
+from vids_db.database import Database
+from vids_db.models import Video
+
+NOW = datetime(2022, 5, 4, 12, tzinfo=timezone.utc)
+
+
+def make_video(url: str, hours_ago: int, views: int) -> Video:
+    """Construct a default video object."""
+    return video_factory.make_video(
+        url, NOW - timedelta(hours=hours_ago), duration="1:00", views=views
+    )
+
+
+class ColumnarTester(unittest.TestCase):
+    """Tests get_columns and the vectorized computations"""
+
+    def setUp(self) -> None:
+        self.tempdir = tempfile.mkdtemp()
+        self.db = Database(db_path=self.tempdir)
+        self.db.update_many(
+            [
+                make_video("http://example.com/a", 2, 100),
+                make_video("http://example.com/b", 4, 100),
+                make_video("http://example.com/old", 48, 5),
+            ]
+        )
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tempdir, ignore_errors=True)
+
+    def test_get_columns(self) -> None:
+        """Tests that the columns are typed and filtered by date."""
+        cols = self.db.get_columns(
+            date_start=NOW - timedelta(hours=5), date_end=NOW
+        )
+        self.assertEqual(2, len(cols))
+        self.assertIsInstance(cols["views"], array)
+        self.assertEqual("q", cols.numeric("views").typecode)
+        self.assertEqual([60.0, 60.0], list(cols["duration"]))
+        self.assertEqual(
+            ["http://example.com/a", "http://example.com/b"], cols["url"]
+        )
+        self.assertIs(cols["channel_name"][0], cols["channel_name"][1])
+
+    def test_view_rate(self) -> None:
+        """Tests the view rate with and without numpy."""
+        cols = self.db.get_columns(["timestamp_published", "views"])
+        expected = [50.0, 25.0, 5 / 48]
+        self.assertEqual(
+            [7200.0, 14400.0, 172800.0], list(cols.age_seconds(NOW))
+        )
+        for rate, exp in zip(cols.view_rate(NOW), expected):
+            self.assertAlmostEqual(exp, rate)
+        with mock.patch.object(columnar, "np", None):
+            for rate, exp in zip(cols.view_rate(NOW), expected):
+                self.assertAlmostEqual(exp, rate)
+
+    def test_unknown_column(self) -> None:
+        """Tests that only the column store fields can be requested."""
+        with self.assertRaises(ValueError):
+            self.db.get_columns(["description"])
+
+
+if __name__ == "__main__":
+    unittest.main()
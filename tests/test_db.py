@@ -48,6 +48,12 @@ class DatabaseTester(unittest.TestCase):
         result = db.query_video_list("RedPill78")
         self.assertEqual(1, len(result))
         print(result)
+        result = db.query_video_list("RedPill78", min_views=2)
+        self.assertEqual(0, len(result))
+        result = db.query_video_list(
+            "RedPill78", channel_name="RedPill78", sort="most_viewed"
+        )
+        self.assertEqual(1, len(result))
 
     def test_search_by_channel_name(self) -> None:
         """Test the full text search database."""
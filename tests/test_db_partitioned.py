@@ -0,0 +1,226 @@
+"""
+Tests the month partitioned sqlite video database
+"""
+
+# pylint: disable=invalid-name,R0801
+
+import os
+import shutil
+import sqlite3
+import stat
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from video_factory import make_video
+
+from vids_db.database import Database
+from vids_db.db_sqlite_partitioned import (
+    DbSqlitePartitionedVideo,
+    partition_names_between,
+)
+
+JAN = datetime(2022, 1, 15, tzinfo=timezone.utc)
+FEB = datetime(2022, 2, 15, tzinfo=timezone.utc)
+MAR = datetime(2022, 3, 15, tzinfo=timezone.utc)
+
+
+class DbSqlitePartitionedVideoTester(unittest.TestCase):
+    """Tests the functionality of the partitioned sqlite database"""
+
+    def setUp(self) -> None:
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tempdir, ignore_errors=True)
+
+    def test_partition_names_between(self) -> None:
+        """Tests that month ranges are enumerated newest first."""
+        names = partition_names_between(
+            datetime(2021, 11, 3, tzinfo=timezone.utc), MAR
+        )
+        self.assertEqual(
+            ["2022_03", "2022_02", "2022_01", "2021_12", "2021_11"], names
+        )
+
+    def test_find_videos_across_partitions(self) -> None:
+        """Tests that the output is ordered and limited across months."""
+        db = DbSqlitePartitionedVideo(self.tempdir)
+        db.insert_or_update(
+            [
+                make_video("http://example.com/jan", JAN),
+                make_video("http://example.com/feb", FEB),
+                make_video("http://example.com/mar", MAR),
+            ]
+        )
+        self.assertEqual(["2022_03", "2022_02", "2022_01"], db.partitions())
+        vids = db.find_videos(JAN, MAR)
+        self.assertEqual(
+            [
+                "http://example.com/mar",
+                "http://example.com/feb",
+                "http://example.com/jan",
+            ],
+            [v.url for v in vids],
+        )
+        vids = db.find_videos(JAN, MAR, limit_count=2)
+        self.assertEqual(2, len(vids))
+        vids = db.find_videos(FEB - timedelta(days=1), FEB + timedelta(days=1))
+        self.assertEqual(["http://example.com/feb"], [v.url for v in vids])
+
+    def test_moved_video(self) -> None:
+        """Tests that a rescrape with a new date moves the video."""
+        db = DbSqlitePartitionedVideo(self.tempdir)
+        db.insert_or_update([make_video("http://example.com/a", JAN)])
+        db.insert_or_update([make_video("http://example.com/a", FEB)])
+        self.assertEqual(1, len(db.get_all_videos()))
+        vid = db.find_video_by_url("http://example.com/a")
+        assert vid is not None
+        self.assertEqual(FEB, vid.date_published)
+
+    def test_retention_archive_and_drop(self) -> None:
+        """Tests that old partitions are archived read-only or dropped."""
+        db = DbSqlitePartitionedVideo(self.tempdir)
+        db.insert_or_update(
+            [
+                make_video("http://example.com/jan", JAN),
+                make_video("http://example.com/feb", FEB),
+                make_video("http://example.com/mar", MAR),
+            ]
+        )
+        retired = db.apply_retention(keep_months=2, archive=True, now=MAR)
+        self.assertEqual(["2022_01"], retired)
+        self.assertEqual(["2022_01"], db.archived_partitions())
+        self.assertEqual(3, len(db.find_videos(JAN, MAR)))
+        self.assertIsNotNone(db.find_video_by_url("http://example.com/jan"))
+        archived = db._get_partition(  # pylint: disable=protected-access
+            "2022_01", archived=True
+        )
+        assert archived is not None
+        self.assertTrue(archived.read_only)
+        retired = db.apply_retention(keep_months=1, archive=False, now=MAR)
+        self.assertEqual(["2022_02"], retired)
+        self.assertFalse(
+            os.path.exists(os.path.join(self.tempdir, "videos_2022_02.sqlite"))
+        )
+        self.assertIsNone(db.find_video_by_url("http://example.com/feb"))
+
+    def rewrite_archive(self) -> DbSqlitePartitionedVideo:
+        """Archives January, then rewrites two of its three videos."""
+        db = DbSqlitePartitionedVideo(self.tempdir)
+        db.insert_or_update(
+            [
+                make_video("http://example.com/a", JAN),
+                make_video("http://example.com/b", JAN + timedelta(days=1)),
+                make_video("http://example.com/c", JAN + timedelta(days=2)),
+            ]
+        )
+        db.apply_retention(keep_months=1, archive=True, now=MAR)
+        # A rescrape in the same month and one that moves to February.
+        rescraped = make_video("http://example.com/a", JAN)
+        rescraped.views = 1000
+        db.insert_or_update(
+            [rescraped, make_video("http://example.com/b", FEB)]
+        )
+        self.assertEqual(["2022_01"], db.archived_partitions())
+        return db
+
+    def test_rewritten_archive(self) -> None:
+        """Tests that archived copies of rewritten videos are skipped."""
+        db = self.rewrite_archive()
+        vids = db.find_videos(JAN - timedelta(days=1), MAR)
+        self.assertEqual(
+            [
+                "http://example.com/b",
+                "http://example.com/c",
+                "http://example.com/a",
+            ],
+            [v.url for v in vids],
+        )
+        self.assertEqual(1000, vids[-1].views)
+        vids = db.find_videos(JAN - timedelta(days=1), MAR, limit_count=2)
+        self.assertEqual(
+            ["http://example.com/b", "http://example.com/c"],
+            [v.url for v in vids],
+        )
+        vids = db.find_videos_by_channel_name("XXchannel_name")
+        self.assertEqual(3, len(vids))
+        self.assertEqual(3, len(db.get_all_videos()))
+        found = db.find_videos_by_urls(
+            ["http://example.com/a", "http://example.com/b"]
+        )
+        found.sort(key=lambda v: v.url)
+        self.assertEqual(
+            [(1000, JAN), (913, FEB)],
+            [(v.views, v.date_published) for v in found],
+        )
+        db.close()
+
+    def test_rewritten_archive_counts(self) -> None:
+        """Tests that counts skip archived copies of rewritten videos."""
+        db = self.rewrite_archive()
+        urls = ["http://example.com/a", "http://example.com/b"]
+        window = (JAN - timedelta(days=1), MAR)
+        self.assertEqual(
+            {"XXchannel_name": 3}, db.get_facets(*window)["channel_name"]
+        )
+        self.assertEqual(
+            {"rumble.com": 2}, db.get_facets(*window, urls=urls)["source"]
+        )
+        self.assertEqual({"XXchannel_name": 3}, db.get_channel_counts())
+        columns = db.get_columns(["url", "views"])
+        self.assertEqual(
+            [
+                ("http://example.com/a", 1000),
+                ("http://example.com/b", 913),
+                ("http://example.com/c", 913),
+            ],
+            sorted(zip(columns["url"], columns["views"])),
+        )
+        self.assertEqual(3, len(db.get_columns(["views"], *window)))
+        self.assertEqual(3, sum(len(titles) for titles in db.iter_titles()))
+        self.assertEqual(3, len(db.to_data()))
+        near = db.find_near_duplicates(make_video("http://example.com/x"))
+        self.assertEqual(
+            ["http://example.com/a", "http://example.com/b"],
+            sorted(vid.url for vid in near)[:2],
+        )
+        self.assertEqual(3, len(near))
+        db.close()
+
+    def test_old_archive(self) -> None:
+        """Tests that an archive from before a schema change is migrated."""
+        db = DbSqlitePartitionedVideo(self.tempdir)
+        db.insert_or_update([make_video("http://example.com/jan", JAN)])
+        db.apply_retention(keep_months=1, archive=True, now=MAR)
+        db.close()
+        path = os.path.join(self.tempdir, "archive", "videos_2022_01.sqlite")
+        os.chmod(path, stat.S_IREAD | stat.S_IWRITE)
+        with sqlite3.connect(path) as conn:
+            conn.execute("DROP INDEX idx_facets;")
+            conn.execute("ALTER TABLE videos DROP COLUMN source;")
+        conn.close()
+        os.chmod(path, stat.S_IREAD)
+        db = DbSqlitePartitionedVideo(self.tempdir)
+        self.assertEqual(1, len(db.find_videos(JAN, MAR)))
+        self.assertEqual(stat.S_IREAD, stat.S_IMODE(os.stat(path).st_mode))
+        db.close()
+
+    def test_database_partitioned(self) -> None:
+        """Tests that the Database api is transparent over partitions."""
+        db = Database(db_path=self.tempdir, partitioned=True)
+        db.update_many(
+            [
+                make_video("http://example.com/jan", JAN),
+                make_video("http://example.com/mar", MAR),
+            ]
+        )
+        vids = db.get_video_list(JAN, MAR)
+        self.assertEqual(2, len(vids))
+        self.assertEqual(["XXchannel_name"], db.get_channel_names())
+        db.remove_by_channel_name("XXchannel_name")
+        self.assertEqual(0, len(db.get_video_list(JAN, MAR)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,41 @@
+"""
+Tests the duration parser
+"""
+
+# pylint: disable=invalid-name,R0801
+
+import unittest
+
+from vids_db.duration import _parse_str, parse_duration, parse_durations
+
+
+class DurationTester(unittest.TestCase):
+    """Tests duration.py"""
+
+    def test_formats(self) -> None:
+        """Tests the fast and general paths agree on the documented rules."""
+        self.assertEqual(0, parse_duration("?"))
+        self.assertEqual(0, parse_duration("Live"))
+        self.assertEqual(61, parse_duration("61"))
+        self.assertEqual(6.5, parse_duration("6.5"))
+        self.assertEqual(57, parse_duration("0:57"))
+        self.assertEqual(754, parse_duration("12:34"))
+        self.assertEqual(3723, parse_duration("1:02:03"))
+        self.assertAlmostEqual(84241.34, parse_duration("23:24:01.34"))
+        self.assertEqual(90, parse_duration(90))  # type: ignore
+        for bad in ["-7", "59:60", "61:01", "25:24:01.34", "1:2:3:4", "a:b"]:
+            with self.assertRaises(ValueError, msg=bad):
+                parse_duration(bad)
+
+    def test_parse_durations(self) -> None:
+        """Tests the batch api and the cache."""
+        _parse_str.cache_clear()
+        durations = ["0:57", "12:34", "0:57", "?", "0:57"]
+        self.assertEqual([57, 754, 57, 0, 57], parse_durations(durations))
+        self.assertEqual(3, _parse_str.cache_info().currsize)
+        with self.assertRaises(ValueError):
+            parse_durations(["0:57", "0:61"])
+
+
+if __name__ == "__main__":
+    unittest.main()
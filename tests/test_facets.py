@@ -0,0 +1,157 @@
+"""
+Tests the faceted counts of Database.get_facets
+"""
+
+# pylint: disable=invalid-name,R0801
+
+import os
+import sqlite3
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+from typing import List
+from unittest import mock
+
+import video_factory
+
+from vids_db.database import Database
+from vids_db.facets import duration_bucket
+from vids_db.models import Video
+
+DATE = datetime(2022, 5, 4, tzinfo=timezone.utc)
+
+
+def make_video(
+    i: int,
+    source: str = "rumble.com",
+    duration: str = "60",
+    channel_name: str = "XXchannel_name",
+    days: int = 0,
+) -> Video:
+    """Construct a default video object."""
+    return video_factory.make_video(
+        f"http://example.com/{i}",
+        DATE - timedelta(days=days, seconds=i),
+        channel_name=channel_name,
+        title=f"Vid title {i}",
+        source=source,
+        duration=duration,
+        views=i,
+    )
+
+
+def make_videos() -> List[Video]:
+    """Videos of the day before DATE and two older ones."""
+    return [
+        make_video(0, "youtube.com", "30", "aa"),
+        make_video(1, "youtube.com", "10:00", "aa"),
+        make_video(2, "youtube.com", "1:00:00", "bb"),
+        make_video(3, "rumble.com", "0", "bb"),
+        make_video(4, "rumble.com", "3:59", "cc"),
+        make_video(5, "bitchute.com", "30", "aa", days=10),
+        make_video(6, "bitchute.com", "30", "aa", days=10),
+    ]
+
+
+@mock.patch.dict(os.environ, {"FULL_TEXT_SEARCH_ENABLED": "1"})
+class FacetsTester(unittest.TestCase):
+    """Tests facets.py and Database.get_facets"""
+
+    def setUp(self) -> None:
+        # pylint: disable=consider-using-with
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_dir = os.path.join(self.tmp_dir.name, "db")
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def check_counts(self, db: Database) -> None:
+        """Tests the counts of make_videos() in the last day."""
+        db.update_many(make_videos())
+        counts = db.get_facets(DATE - timedelta(days=1), DATE)
+        self.assertEqual({"youtube.com": 3, "rumble.com": 2}, counts["source"])
+        self.assertEqual(
+            {"short": 2, "long": 1, "medium": 1, "unknown": 1},
+            counts["duration"],
+        )
+        self.assertEqual(
+            ["short", "long", "medium", "unknown"], list(counts["duration"])
+        )
+        self.assertEqual({"aa": 2, "bb": 2, "cc": 1}, counts["channel_name"])
+        top = db.get_facets(
+            DATE - timedelta(days=30), DATE, ["channel_name"], limit=1
+        )
+        self.assertEqual({"channel_name": {"aa": 4}}, top)
+
+    def test_counts(self) -> None:
+        """Tests grouped counts, order and limit."""
+        db = Database(self.db_dir)
+        self.check_counts(db)
+        with self.assertRaises(ValueError):
+            db.get_facets(DATE - timedelta(days=1), DATE, ["country"])
+        db.close()
+
+    def test_counts_partitioned(self) -> None:
+        """Tests that partitions sum up to the same counts."""
+        db = Database(self.db_dir, partitioned=True)
+        self.check_counts(db)
+        db.close()
+
+    def test_cache(self) -> None:
+        """Tests that a write drops the cached counts."""
+        db = Database(self.db_dir)
+        db.update_many(make_videos())
+        window = (DATE - timedelta(days=1), DATE)
+        first = db.get_facets(*window)
+        self.assertEqual(first, db.get_facets(*window))
+        self.assertEqual(1, db.facet_cache.hits)
+        db.update_many([make_video(7, "odysee.com")])
+        counts = db.get_facets(*window)
+        self.assertEqual(1, db.facet_cache.hits)
+        self.assertEqual(1, counts["source"]["odysee.com"])
+        db.close()
+
+    def test_search_facets(self) -> None:
+        """Tests counts over the full text search results."""
+        db = Database(self.db_dir)
+        db.update_many(
+            make_videos()
+            + [
+                Video(**{**make_video(8).model_dump(), "title": "Other"}),
+            ]
+        )
+        counts = db.get_facets(
+            DATE - timedelta(days=1), DATE, ["source"], query_string="vid"
+        )
+        self.assertEqual(
+            {"source": {"youtube.com": 3, "rumble.com": 2}}, counts
+        )
+        db.close()
+
+    def test_backfill(self) -> None:
+        """Tests that databases from before the source column get it."""
+        db = Database(self.db_dir)
+        db.update_many(make_videos())
+        db.close()
+        path = os.path.join(self.db_dir, "videos.sqlite")
+        with sqlite3.connect(path) as conn:
+            conn.execute("DROP INDEX idx_facets;")
+            conn.execute("ALTER TABLE videos DROP COLUMN source;")
+        conn.close()
+        db = Database(self.db_dir)
+        counts = db.get_facets(DATE - timedelta(days=1), DATE, ["source"])
+        self.assertEqual(
+            {"source": {"youtube.com": 3, "rumble.com": 2}}, counts
+        )
+        db.close()
+
+    def test_duration_bucket(self) -> None:
+        """Tests the python buckets match the sql ones."""
+        self.assertEqual("unknown", duration_bucket(0))
+        self.assertEqual("short", duration_bucket(239))
+        self.assertEqual("medium", duration_bucket(240))
+        self.assertEqual("long", duration_bucket(1200))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -5,12 +5,18 @@
 # pylint: disable=invalid-name,R0801,line-too-long
 import atexit
 import os
+from datetime import datetime, timezone
 import shutil
 import tempfile
 import unittest
 
 from vids_db.date import now_local
-from vids_db.db_full_text_search import DbFullTextSearch
+from vids_db.db_full_text_search import (
+    SORT_MOST_VIEWED,
+    SORT_NEWEST,
+    DbFullTextSearch,
+    SearchFilter,
+)
 from vids_db.models import Video
 
 
@@ -149,6 +155,123 @@ class DbFullTextSearchTester(unittest.TestCase):
         out = db.title_search("RedPill")
         self.assertEqual(1, len(out))
 
+    def test_filters_and_sort(self) -> None:
+        """Tests index level filters and the sortable columns."""
+        self.check_filters_and_sort(DbFullTextSearch(index_path=self.tempdir))
+
+    def test_lean_schema_filters_and_sort(self) -> None:
+        """Tests the same searches against the lean schema."""
+        self.check_filters_and_sort(
+            DbFullTextSearch(index_path=self.tempdir, schema_version=2)
+        )
+
+    def check_filters_and_sort(self, db: DbFullTextSearch) -> None:
+        """Runs filtered and sorted searches against db."""
+        vids = [
+            Video(
+                channel_name=channel_name,
+                title=f"Pill report {i}",
+                date_published=datetime(2022, 5, 1 + i, tzinfo=timezone.utc),
+                date_lastupdated=datetime(2022, 5, 1 + i, tzinfo=timezone.utc),
+                channel_url="https://www.youtube.com/channel/UC-9-kyTW8ZkZNDHQJ6FgpwQ",
+                source="youtube",
+                url=f"https://www.youtube.com/watch?v={i}",
+                duration="60",  # type: ignore
+                description="A cool video",
+                img_src="https://i.ytimg.com/vi/dQw4w9WgXcQ/hqdefault.jpg",
+                iframe_src="https://www.youtube.com/embed/dQw4w9WgXcQ",
+                views=views,
+            )
+            for i, (channel_name, views) in enumerate(
+                [
+                    ("Red Pill News", 50),
+                    ("Red Pill", 10),
+                    ("Red Pill", 30),
+                    ("Blue Pill", 20),
+                ]
+            )
+        ]
+        db.add_videos(vids)
+
+        def urls(out: list) -> list:
+            return [int(vid["url"][-1]) for vid in out]
+
+        self.assertEqual([3, 2, 1, 0], urls(db.search("pill", sort=SORT_NEWEST)))
+        self.assertEqual(
+            [0, 2, 3, 1], urls(db.search("pill", sort=SORT_MOST_VIEWED))
+        )
+        recent = SearchFilter(
+            date_start=datetime(2022, 5, 2, tzinfo=timezone.utc),
+            date_end=datetime(2022, 5, 3, tzinfo=timezone.utc),
+        )
+        self.assertEqual(
+            [2, 1], urls(db.search("pill", search_filter=recent, sort=SORT_NEWEST))
+        )
+        popular = SearchFilter(min_views=25)
+        self.assertEqual(
+            [0, 2], urls(db.search("pill", search_filter=popular, sort=SORT_MOST_VIEWED))
+        )
+        # The exact channel, not every channel with the same words.
+        channel = SearchFilter(channel_name="Red Pill")
+        self.assertEqual(
+            [2],
+            urls(
+                db.search(
+                    "pill",
+                    limit=1,
+                    search_filter=channel,
+                    sort=SORT_MOST_VIEWED,
+                )
+            ),
+        )
+        with self.assertRaises(ValueError):
+            db.search("pill", sort="oldest")
+
+    def test_lean_schema(self) -> None:
+        """Tests prefix and phrase matching, and that only urls are stored."""
+        db = DbFullTextSearch(index_path=self.tempdir, schema_version=2)
+        vids = [
+            Video(
+                channel_name="RedPill78",
+                title=title,
+                date_published=now_local(),
+                date_lastupdated=now_local(),
+                channel_url="https://www.youtube.com/channel/UC-9-kyTW8ZkZNDHQJ6FgpwQ",
+                source="youtube",
+                url=f"https://www.youtube.com/watch?v={i}",
+                duration="60",  # type: ignore
+                description="A cool video",
+                img_src="https://i.ytimg.com/vi/dQw4w9WgXcQ/hqdefault.jpg",
+                iframe_src="https://www.youtube.com/embed/dQw4w9WgXcQ",
+                views=1,
+            )
+            for i, title in enumerate(["Weekly pill report", "Report on the pill"])
+        ]
+        db.add_videos(vids)
+        self.assertEqual(2, len(db.title_search("repo")))
+        self.assertEqual(1, len(db.title_search('"pill report"')))
+        self.assertEqual(2, len(db.channel_search("red")))
+        self.assertEqual(0, len(db.title_search("eport")))
+        docs = list(db.iter_documents())
+        self.assertEqual([{"url"}, {"url"}], [set(doc) for doc in docs])
+        self.assertFalse(db.stores_fields)
+
+    def test_schema_migration(self) -> None:
+        """Tests that opening with another schema version recreates the index."""
+        db = DbFullTextSearch(index_path=self.tempdir)
+        self.assertEqual(1, db.schema_version)
+        db.set_generation(5)
+        db = DbFullTextSearch(index_path=self.tempdir, schema_version=2)
+        self.assertTrue(db.migrated)
+        self.assertEqual(2, db.schema_version)
+        self.assertEqual(0, db.generation())
+        # The version is kept by later opens.
+        db = DbFullTextSearch(index_path=self.tempdir)
+        self.assertFalse(db.migrated)
+        self.assertEqual(2, db.schema_version)
+        with self.assertRaises(ValueError):
+            DbFullTextSearch(index_path=self.tempdir, schema_version=9)
+
 
 if __name__ == "__main__":
     unittest.main()
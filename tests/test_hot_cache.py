@@ -0,0 +1,207 @@
+"""
+Tests the hot cache of recent videos in front of sqlite
+"""
+
+# pylint: disable=invalid-name,R0801
+
+import os
+import sqlite3
+import tempfile
+import unittest
+from datetime import timedelta
+from typing import List
+from unittest import mock
+
+import video_factory
+
+from vids_db.database import Database
+from vids_db.date import now_local
+from vids_db.models import Video
+
+NOW = now_local()
+WINDOW = timedelta(hours=72)
+
+
+def make_video(i: int, hours_ago: float, channel_name: str = "") -> Video:
+    """Construct a default video object published hours_ago."""
+    return video_factory.make_video(
+        f"http://example.com/{i}",
+        NOW - timedelta(hours=hours_ago),
+        channel_name=channel_name or f"channel{i % 2}",
+        title=f"Vid title {i}",
+        views=i,
+    )
+
+
+def urls_of(vids: List) -> List[str]:
+    """The urls of videos, in order."""
+    return [vid.url for vid in vids]
+
+
+class HotCacheTester(unittest.TestCase):
+    """Tests Database(hot_cache_window=...)"""
+
+    def setUp(self) -> None:
+        # pylint: disable=consider-using-with
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_dir = os.path.join(self.tmp_dir.name, "db")
+        # Every 10 hours over 5 days, 0 is the newest.
+        db = Database(self.db_dir)
+        db.update_many([make_video(i, i * 10 + 1) for i in range(12)])
+        db.close()
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def check_same(self, db: Database, days: float, **kwargs) -> List[str]:
+        """Tests a window against the database without a cache."""
+        window = (NOW - timedelta(days=days), NOW)
+        with Database(self.db_dir) as uncached:
+            expected = urls_of(uncached.get_video_list(*window, **kwargs))
+        self.assertEqual(
+            expected, urls_of(db.get_video_list(*window, **kwargs))
+        )
+        return expected
+
+    def test_load_and_hits(self) -> None:
+        """Tests that windows inside the cache never query sqlite."""
+        db = Database(self.db_dir, hot_cache_window=WINDOW)
+        metrics = db.hot_cache_metrics()
+        assert metrics is not None
+        self.assertEqual(8, metrics.size)
+        window = (NOW - timedelta(hours=48), NOW)
+        with mock.patch.object(
+            db.db_sqlite, "find_videos", side_effect=AssertionError
+        ):
+            vids = db.get_video_list(*window, channel_name="channel1", limit=2)
+            self.assertEqual(
+                ["http://example.com/1", "http://example.com/3"], urls_of(vids)
+            )
+            summaries = db.get_video_list(*window, summary=True)
+            self.assertEqual(5, len(summaries))
+        self.check_same(db, days=2)
+        self.check_same(db, days=5, channel_name="channel0")
+        metrics = db.hot_cache_metrics()
+        assert metrics is not None
+        self.assertEqual((3, 1), (metrics.hits, metrics.misses))
+        with Database(self.db_dir) as uncached:
+            self.assertIsNone(uncached.hot_cache_metrics())
+        db.close()
+
+    def test_writes(self) -> None:
+        """Tests that the writes of this process are applied."""
+        db = Database(self.db_dir, hot_cache_window=WINDOW)
+        db.update_many(
+            [
+                make_video(20, 0.5),
+                # Rewritten too old for the cache.
+                make_video(2, 100),
+            ]
+        )
+        self.assertEqual(
+            ["http://example.com/20", "http://example.com/0"],
+            self.check_same(db, days=1)[:2],
+        )
+        self.assertNotIn("http://example.com/2", self.check_same(db, days=2))
+        db.update_fields({"http://example.com/0": {"channel_name": "renamed"}})
+        self.assertEqual(1, len(self.check_same(db, 1, channel_name="renamed")))
+        self.assertEqual(6, db.remove_by_channel_name("channel1"))
+        self.assertEqual(
+            [
+                "http://example.com/20",
+                "http://example.com/0",
+                "http://example.com/4",
+            ],
+            self.check_same(db, days=2),
+        )
+        db.remove_by_urls(["http://example.com/4"])
+        self.check_same(db, days=2)
+        db.clear()
+        self.assertEqual([], self.check_same(db, days=2))
+        db.close()
+
+    def test_no_connections(self) -> None:
+        """Tests that a hit opens no sqlite connection."""
+        db = Database(self.db_dir, hot_cache_window=WINDOW)
+        assert db.hot_cache is not None
+        window = (NOW - timedelta(hours=48), NOW)
+        with mock.patch("sqlite3.connect", wraps=sqlite3.connect) as connect:
+            db.get_video_list(*window)
+            # The data version is polled on the long-lived connection.
+            db.hot_cache.poll_interval = 0
+            db.get_video_list(*window)
+            self.assertEqual(0, connect.call_count)
+            db.update_many([make_video(50, 1)])
+            connect.reset_mock()
+            db.get_video_list(*window)
+            self.assertEqual(0, connect.call_count)
+        metrics = db.hot_cache_metrics()
+        assert metrics is not None
+        self.assertEqual((3, 0), (metrics.hits, metrics.misses))
+        db.close()
+
+    def test_other_process(self) -> None:
+        """Tests that writes of another instance are caught up."""
+        db = Database(self.db_dir, hot_cache_window=WINDOW)
+        assert db.hot_cache is not None
+        db.hot_cache.poll_interval = 0
+
+        with Database(self.db_dir) as other:
+            other.update_many([make_video(30, 2)])
+            other.remove_by_urls(["http://example.com/0"])
+        self.assertEqual(
+            [
+                "http://example.com/30",
+                "http://example.com/1",
+                "http://example.com/2",
+            ],
+            self.check_same(db, days=1),
+        )
+        db.close()
+
+    def test_write_generation(self) -> None:
+        """Tests that a new generation is never served stale cached rows."""
+        db = Database(self.db_dir, hot_cache_window=WINDOW)
+        assert db.hot_cache is not None
+        db.hot_cache.poll_interval = 60
+        generation = db.write_generation()
+        with Database(self.db_dir) as other:
+            other.update_many([make_video(30, 2)])
+        self.assertNotEqual(generation, db.write_generation())
+        window = (NOW - timedelta(hours=3), NOW)
+        self.assertEqual(
+            ["http://example.com/0", "http://example.com/30"],
+            sorted(urls_of(db.get_video_list(*window))),
+        )
+        db.close()
+
+    def test_budget(self) -> None:
+        """Tests that the oldest videos are evicted past hot_cache_size."""
+        db = Database(self.db_dir, hot_cache_window=WINDOW, hot_cache_size=3)
+        metrics = db.hot_cache_metrics()
+        assert metrics is not None and metrics.cutoff is not None
+        self.assertEqual(3, metrics.size)
+        # Video 3 and older are left out.
+        self.assertLess(NOW - timedelta(hours=32), metrics.cutoff)
+        self.assertLess(metrics.cutoff, NOW - timedelta(hours=21))
+        db.update_many([make_video(40, 0.1), make_video(41, 0.2)])
+        metrics = db.hot_cache_metrics()
+        assert metrics is not None
+        self.assertEqual((3, 2), (metrics.size, metrics.evicted))
+        self.check_same(db, days=1)
+        self.assertEqual(
+            [
+                "http://example.com/40",
+                "http://example.com/41",
+                "http://example.com/0",
+            ],
+            self.check_same(db, days=0.25),
+        )
+        metrics = db.hot_cache_metrics()
+        assert metrics is not None
+        self.assertEqual((1, 1), (metrics.hits, metrics.misses))
+        db.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,188 @@
+"""
+Tests the asyncio http server
+"""
+
+# pylint: disable=invalid-name,R0801
+
+import gzip
+import json
+import os
+import socket
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+from http.client import HTTPConnection, HTTPResponse
+from typing import Any, Dict, Optional
+from unittest import mock
+from urllib.parse import quote
+
+from video_factory import make_video
+
+from vids_db.database import Database
+from vids_db.http_server import json_array_parts, serve_in_background
+from vids_db.models import Video
+
+DATES = "date_start=2021-02-01&date_end=2021-03-01"
+
+
+class HttpServerTester(unittest.TestCase):
+    """Tests http_server.py against a server on a free localhost port."""
+
+    def setUp(self) -> None:
+        # pylint: disable=consider-using-with
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        # The database is opened here, outside of the test method.
+        env = mock.patch.dict(os.environ, {"FULL_TEXT_SEARCH_ENABLED": "1"})
+        env.start()
+        self.addCleanup(env.stop)
+        self.db = Database(os.path.join(self.tmp_dir.name, "db"))
+        self.server = serve_in_background(self.db, chunk_size=2)
+        self.conn = HTTPConnection("127.0.0.1", self.server.server.port)
+
+    def tearDown(self) -> None:
+        self.conn.close()
+        self.server.close()
+        self.db.close()
+        self.tmp_dir.cleanup()
+
+    def request(
+        self,
+        method: str,
+        target: str,
+        body: Any = None,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> HTTPResponse:
+        """Sends a request on the kept-alive connection."""
+        data = None if body is None else json.dumps(body).encode("utf-8")
+        self.conn.request(method, target, body=data, headers=headers or {})
+        return self.conn.getresponse()
+
+    def post_videos(self, count: int) -> None:
+        """Posts count videos to update_many."""
+        vids = [
+            make_video(f"http://example.com/{i}", title=f"Video number {i}")
+            for i in range(count)
+        ]
+        resp = self.request("POST", "/videos", [v.to_json() for v in vids])
+        self.assertEqual(200, resp.status)
+        self.assertEqual({"updated": count}, json.loads(resp.read()))
+
+    def test_post_and_get_video_list(self) -> None:
+        """Tests update_many and a streamed get_video_list over one socket."""
+        self.post_videos(5)
+        resp = self.request("GET", f"/videos?{DATES}&limit=4")
+        self.assertEqual(200, resp.status)
+        self.assertEqual("chunked", resp.getheader("Transfer-Encoding"))
+        vids = json.loads(resp.read())
+        self.assertEqual(4, len(vids))
+        self.assertEqual(Video(**vids[0]).channel_name, "XXchannel_name")
+        resp = self.request("GET", f"/videos?{DATES}&summary=1")
+        summaries = json.loads(resp.read())
+        self.assertEqual(5, len(summaries))
+        self.assertNotIn("description", summaries[0])
+
+    def test_by_urls_and_search(self) -> None:
+        """Tests get_by_urls (GET and POST) and query_video_list."""
+        self.post_videos(3)
+        url = quote("http://example.com/1", safe="")
+        resp = self.request("GET", f"/videos/by_urls?url={url}")
+        self.assertEqual(
+            ["http://example.com/1"],
+            [v["url"] for v in json.loads(resp.read())],
+        )
+        resp = self.request(
+            "POST", "/videos/by_urls", ["http://example.com/2", "missing"]
+        )
+        self.assertEqual(1, len(json.loads(resp.read())))
+        resp = self.request("GET", "/search?q=number&limit=10")
+        self.assertEqual(3, len(json.loads(resp.read())))
+
+    def test_etag_and_cache(self) -> None:
+        """Tests 304 for a matching ETag, and a new ETag after a write."""
+        self.post_videos(2)
+        resp = self.request("GET", f"/videos?{DATES}")
+        etag = resp.getheader("ETag")
+        body = resp.read()
+        assert etag is not None
+        resp = self.request("GET", f"/videos?{DATES}")
+        self.assertEqual(body, resp.read())
+        self.assertEqual(1, self.server.server.cache_hits)
+        resp = self.request(
+            "GET", f"/videos?{DATES}", None, {"If-None-Match": etag}
+        )
+        self.assertEqual(304, resp.status)
+        self.assertEqual(b"", resp.read())
+        self.post_videos(3)
+        resp = self.request(
+            "GET", f"/videos?{DATES}", None, {"If-None-Match": etag}
+        )
+        self.assertEqual(200, resp.status)
+        self.assertNotEqual(etag, resp.getheader("ETag"))
+        self.assertEqual(3, len(json.loads(resp.read())))
+
+    def test_default_window(self) -> None:
+        """Tests that a window ending now is neither cached nor 304'd."""
+        self.post_videos(1)
+        now = datetime(2021, 2, 9, 12, tzinfo=timezone.utc)
+        with mock.patch("vids_db.http_server.now_local", return_value=now):
+            resp = self.request("GET", "/videos")
+            self.assertIsNone(resp.getheader("ETag"))
+            self.assertEqual([], json.loads(resp.read()))
+        now += timedelta(days=1)
+        with mock.patch("vids_db.http_server.now_local", return_value=now):
+            resp = self.request("GET", "/videos")
+            self.assertEqual(200, resp.status)
+            self.assertEqual(1, len(json.loads(resp.read())))
+        self.assertEqual(0, self.server.server.cache_hits)
+
+    def test_gzip(self) -> None:
+        """Tests the gzip content encoding of a streamed response."""
+        self.post_videos(5)
+        resp = self.request(
+            "GET", f"/videos?{DATES}", None, {"Accept-Encoding": "gzip"}
+        )
+        self.assertEqual("gzip", resp.getheader("Content-Encoding"))
+        vids = json.loads(gzip.decompress(resp.read()))
+        self.assertEqual(5, len(vids))
+
+    def test_errors(self) -> None:
+        """Tests 400, 404 and 405 keep the connection usable."""
+        resp = self.request("GET", "/videos?limit=ten")
+        self.assertEqual(400, resp.status)
+        self.assertIn("limit", json.loads(resp.read())["error"])
+        resp = self.request("POST", "/videos", {"content": [{"url": 1}]})
+        self.assertEqual(400, resp.status)
+        resp.read()
+        resp = self.request("GET", "/nope")
+        self.assertEqual(404, resp.status)
+        resp.read()
+        resp = self.request("DELETE", "/videos")
+        self.assertEqual(405, resp.status)
+        resp.read()
+        resp = self.request("GET", "/health")
+        self.assertTrue(json.loads(resp.read())["ok"])
+
+    def test_invalid_content_length(self) -> None:
+        """Tests that a bad Content-Length is answered with 400."""
+        for length in ("-1", "+2", "1_0", " "):
+            with socket.create_connection(
+                ("127.0.0.1", self.server.server.port), timeout=10
+            ) as sock:
+                sock.sendall(
+                    b"POST /videos HTTP/1.1\r\nHost: x\r\n"
+                    b"Content-Length: " + length.encode() + b"\r\n\r\n[]"
+                )
+                status_line = sock.makefile("rb").readline()
+            self.assertEqual(b"HTTP/1.1 400", status_line[:12], length)
+
+    def test_json_array_parts(self) -> None:
+        """Tests the chunks join to the same json as one dump."""
+        vids = [make_video(f"http://example.com/{i}") for i in range(5)]
+        self.assertEqual(
+            Video.dump_many_json(vids), b"".join(json_array_parts(vids, 2))
+        )
+        self.assertEqual(b"[]", b"".join(json_array_parts([], 2)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,127 @@
+"""
+Tests the consistency checks between sqlite and the full text index
+"""
+
+# pylint: disable=invalid-name,R0801
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import video_factory
+
+from vids_db.database import Database
+from vids_db.db_sqlite_video import DbSqliteVideo
+from vids_db.models import Video
+
+
+def make_video(i: int, title: str = "Vid title") -> Video:
+    """Construct a default video object."""
+    return video_factory.make_video(
+        f"http://example.com/{i}", title=f"{title} {i}", views=i
+    )
+
+
+@mock.patch.dict(os.environ, {"FULL_TEXT_SEARCH_ENABLED": "1"})
+class IntegrityTester(unittest.TestCase):
+    """Tests integrity.py"""
+
+    def setUp(self) -> None:
+        # pylint: disable=consider-using-with
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_dir = os.path.join(self.tmp_dir.name, "db")
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def diverge(self) -> None:
+        """Writes sqlite only, like a crash before the index write."""
+        db = Database(self.db_dir)
+        db.update_many([make_video(i) for i in range(3)])
+        status = db.check_integrity()
+        assert status is not None
+        self.assertTrue(status.in_sync)
+        db_sqlite = db.db_sqlite
+        assert isinstance(db_sqlite, DbSqliteVideo)
+        db_sqlite.insert_or_update([make_video(1, title="Renamed")])
+        db_sqlite.remove_by_urls(["http://example.com/2"])
+        db_sqlite.insert_or_update([make_video(3)])
+        status = db.check_integrity()
+        assert status is not None
+        self.assertFalse(status.in_sync)
+        db.close()
+
+    def test_repair_on_open(self) -> None:
+        """Tests that opening a diverged database repairs the index."""
+        self.diverge()
+        db = Database(self.db_dir)
+        status = db.check_integrity()
+        assert status is not None
+        self.assertTrue(status.in_sync)
+        self.assertTrue(db.verify().ok)
+        urls = {vid.url for vid in db.query_video_list("renamed")}
+        self.assertEqual({"http://example.com/1"}, urls)
+        db.close()
+
+    def test_schema_migration_on_open(self) -> None:
+        """Tests that the index is rebuilt in the lean schema on open."""
+        db = Database(self.db_dir)
+        db.update_many([make_video(i) for i in range(3)])
+        db.close()
+        db = Database(self.db_dir, search_schema_version=2)
+        assert db.db_full_text_search is not None
+        self.assertEqual(2, db.db_full_text_search.schema_version)
+        status = db.check_integrity()
+        assert status is not None
+        self.assertTrue(status.in_sync)
+        self.assertTrue(db.verify().ok)
+        self.assertEqual(3, len(db.query_video_list("vid")))
+        db.close()
+
+    def test_verify_and_full_repair(self) -> None:
+        """Tests that verify reports every difference."""
+        self.diverge()
+        db = Database(self.db_dir, repair_index=False)
+        report = db.verify()
+        self.assertEqual(["http://example.com/3"], report.missing)
+        self.assertEqual(["http://example.com/2"], report.extra)
+        self.assertEqual(["http://example.com/1"], report.stale)
+        self.assertEqual(3, db.repair(full=True))
+        self.assertTrue(db.verify().ok)
+        db.close()
+
+    def test_pruned_tombstones(self) -> None:
+        """Tests the fallback when the deletions are no longer known."""
+        self.diverge()
+        db = Database(self.db_dir, repair_index=False)
+        db_sqlite = db.db_sqlite
+        assert isinstance(db_sqlite, DbSqliteVideo)
+        db_sqlite.prune_tombstones(db.current_change_seq())
+        self.assertEqual(["http://example.com/2"], db.verify().extra)
+        db.repair()
+        self.assertTrue(db.verify().ok)
+        db.close()
+
+    def test_clear(self) -> None:
+        """Tests that clear() empties the index and keeps it in sync."""
+        db = Database(self.db_dir, search_schema_version=2)
+        db.update_many([make_video(i) for i in range(3)])
+        db.clear()
+        status = db.check_integrity()
+        assert status is not None
+        self.assertTrue(status.in_sync)
+        self.assertEqual([], db.query_video_list("title"))
+        db.update_many([make_video(3)])
+        self.assertTrue(db.verify().ok)
+        db.close()
+        # Still cleared when opened again.
+        db = Database(self.db_dir)
+        assert db.db_full_text_search is not None
+        urls = [doc["url"] for doc in db.db_full_text_search.iter_documents()]
+        self.assertEqual(["http://example.com/3"], urls)
+        db.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,15 +1,17 @@
 """
-    Tests models
+Tests models
 """
 
 # pylint: disable=invalid-name,R0801
 
 
+import json
 import unittest
+from datetime import datetime, timezone
 from typing import Any, Dict
 
 from vids_db.date import iso_fmt, now_local
-from vids_db.models import Video, parse_duration
+from vids_db.models import Video, VideoSummary, parse_duration
 
 
 def valid_duration(duration: str) -> bool:
@@ -102,6 +104,109 @@ class ModelsTester(unittest.TestCase):
         with self.assertRaises(ValueError):
             Video(**bad_vid)
 
+    def test_summary_validation(self) -> None:
+        """Tests that VideoSummary validates like Video."""
+        data: Dict[str, Any] = {
+            "channel_name": "channel_name",
+            "title": "title",
+            "date_published": "2021-02-09 15:22:46.162038-08:00",
+            "date_lastupdated": "2021-02-09 15:22:46.162038-08:00",
+            "channel_url": "https://example/channel",
+            "source": "rumble",
+            "url": "https://example/video",
+            "duration": "1:02",
+            "img_src": "https://example/image.jpg",
+            "views": "1,024",
+        }
+        summary = VideoSummary(**data)
+        vid = Video(**data, description="", iframe_src="")
+        self.assertEqual((62, 1024), (summary.duration, summary.views))
+        self.assertEqual(VideoSummary.from_videos([vid])[0], summary)
+        with self.assertRaises(ValueError):
+            VideoSummary(**{**data, "date_published": "2021-02-09 15:22:46"})
+
+    def test_serialization(self) -> None:
+        """Tests that the json paths all match the original format."""
+        vids = [
+            Video(
+                channel_name="channel_name",
+                title=title,
+                date_published=date,  # type: ignore
+                date_lastupdated=date,  # type: ignore
+                channel_url="https://example/channel",
+                source="rumble",
+                url="https://example/video",
+                duration=duration,  # type: ignore
+                description='{"views":1},{"url":"x"}',
+                img_src="https://example/image.jpg",
+                iframe_src="iframe_src",
+                views=24,
+            )
+            for date, title, duration in (
+                (
+                    datetime(2021, 2, 9, 15, 22, 46, tzinfo=timezone.utc),
+                    "tïtle \u2603",
+                    "1:02",
+                ),
+                (
+                    "2021-02-09 15:22:46.162038-08:00",
+                    'a,"title":"b\\"},{"channel_name":\n',
+                    "0",
+                ),
+                # Written with an exponent by json.dumps().
+                ("2021-02-09 15:22:46.162038-08:00", "tiny", 0.00002),
+            )
+        ]
+        for vid in vids:
+            expected = {
+                key: val.isoformat() if isinstance(val, datetime) else val
+                for key, val in vid.model_dump().items()
+            }
+            self.assertEqual(expected, vid.to_json())
+            self.assertEqual(
+                json.dumps(expected, ensure_ascii=False), vid.to_json_str()
+            )
+            self.assertEqual(vid.to_json_str().encode(), vid.to_json_bytes())
+        for chunk in (vids[:1], vids[:2], vids):
+            self.assertEqual(
+                json.dumps(
+                    [vid.to_json() for vid in chunk], ensure_ascii=False
+                ).encode(),
+                Video.dump_many_json(chunk),
+            )
+        summaries = VideoSummary.from_videos(vids[:2])
+        self.assertEqual(
+            json.dumps(
+                [s.to_json() for s in summaries], ensure_ascii=False
+            ).encode(),
+            VideoSummary.dump_many_json(summaries),
+        )
+
+    def test_serialization_fallback(self) -> None:
+        """Tests that unusual field values keep the json.dumps() format."""
+        vid = Video(
+            channel_name="channel_name",
+            title="title",
+            date_published="2021-02-09 15:22:46.162038-08:00",  # type: ignore
+            date_lastupdated="2021-02-09 15:22:46.162038-08:00",  # type: ignore
+            channel_url="https://example/channel",
+            source="rumble",
+            url="https://example/video",
+            duration=float("inf"),
+            description="",
+            img_src="https://example/image.jpg",
+            iframe_src="",
+            views=0,
+        )
+        odd = Video.model_construct(
+            **{**dict(vid), "duration": 3, "views": True}
+        )
+        for item in (vid, odd, VideoSummary.from_videos([vid, odd])[1]):
+            self.assertEqual(
+                json.dumps(item.to_json(), ensure_ascii=False),
+                item.to_json_str(),
+            )
+
 
 if __name__ == "__main__":
     unittest.main()
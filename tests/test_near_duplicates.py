@@ -0,0 +1,184 @@
+"""
+Tests near duplicate detection
+"""
+
+# pylint: disable=invalid-name,R0801
+
+import json
+import os
+import sqlite3
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from typing import List
+from unittest import mock
+
+import video_factory
+
+from vids_db.database import Database
+from vids_db.models import Video
+from vids_db.near_duplicates import (
+    MAX_DISTANCE,
+    collapse,
+    distance,
+    normalize_title,
+    title_signature,
+)
+
+
+def make_video(
+    url: str,
+    title: str,
+    duration: str = "600",
+    date_published: str = video_factory.DATE_PUBLISHED,
+) -> Video:
+    """Construct a default video object."""
+    return video_factory.make_video(
+        url,
+        date_published,
+        date_lastupdated=video_factory.DATE_PUBLISHED,
+        channel_name=f"channel {url[-1]}",
+        title=title,
+        duration=duration,
+    )
+
+
+TITLE = "President gives speech on the economy in Ohio"
+TEST_DATA = os.path.join(os.path.dirname(__file__), "test_data.json")
+
+
+def load_series() -> List[Video]:
+    """The 54s Pt5 and 52s Pt6 episodes of a series in test_data.json."""
+    with open(TEST_DATA, encoding="utf-8", mode="r") as f:
+        content = json.load(f)["content"]
+    fields = set(Video.model_fields)
+    vids = [
+        Video(**{k: v for k, v in entry.items() if k in fields})
+        for entry in content
+        if entry["title"].endswith(("Naomi Wolf Pt5", "Naomi Wolf Pt6"))
+    ]
+    vids.sort(key=lambda vid: vid.title)
+    return vids
+
+
+@mock.patch.dict(os.environ, {"FULL_TEXT_SEARCH_ENABLED": "0"})
+class NearDuplicatesTester(unittest.TestCase):
+    """Tests near_duplicates.py and Database.find_near_duplicates"""
+
+    def setUp(self) -> None:
+        # pylint: disable=consider-using-with
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_dir = os.path.join(self.tmp_dir.name, "db")
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def test_signature(self) -> None:
+        """Tests that re-upload titles sign alike and others do not."""
+        self.assertEqual(
+            "president gives speech", normalize_title("PRESIDENT gives speech!")
+        )
+        sig = title_signature(TITLE)
+        reupload = title_signature(f"{TITLE.upper()}!!! (re-upload)")
+        self.assertEqual(0, distance(sig, reupload))
+        other = title_signature("Cat does a backflip off the couch")
+        self.assertGreater(distance(sig, other), 10)
+
+    def test_collapse(self) -> None:
+        """Tests that the first of every group is kept."""
+        vids = [
+            make_video("http://example.com/0", TITLE),
+            make_video("http://example.com/1", f"{TITLE} [Mirror]"),
+            # Same title, different video.
+            make_video("http://example.com/2", TITLE, duration="60"),
+            make_video("http://example.com/3", "Cat does a backflip"),
+        ]
+        kept = collapse(vids)
+        self.assertEqual(
+            ["http://example.com/0", "http://example.com/2"],
+            [vid.url for vid in kept[:2]],
+        )
+        self.assertEqual(3, len(kept))
+
+    def test_series(self) -> None:
+        """Tests that the parts of a series are not duplicates."""
+        pt5, pt6 = load_series()
+        self.assertEqual((54, 52), (pt5.duration, pt6.duration))
+        sig5, sig6 = title_signature(pt5.title), title_signature(pt6.title)
+        self.assertLessEqual(distance(sig5, sig6), MAX_DISTANCE)
+        self.assertEqual(2, len(collapse([pt5, pt6])))
+        db = Database(self.db_dir)
+        db.update_many([pt5, pt6])
+        self.assertEqual([], db.find_near_duplicates(pt5))
+        db.close()
+
+    def test_unknown(self) -> None:
+        """Tests that unknown durations and empty titles never match."""
+        vids = [
+            make_video("http://example.com/0", TITLE, duration="0"),
+            make_video("http://example.com/1", TITLE, duration="0"),
+            make_video("http://example.com/2", TITLE),
+            make_video("http://example.com/3", "!!!"),
+            make_video("http://example.com/4", "(Reupload)"),
+        ]
+        self.assertEqual(5, len(collapse(vids)))
+        db = Database(self.db_dir)
+        db.update_many(vids)
+        self.assertEqual([], db.find_near_duplicates(vids[0]))
+        self.assertEqual([], db.find_near_duplicates(vids[3]))
+        db.close()
+
+    def test_database(self) -> None:
+        """Tests find_near_duplicates and collapse_duplicates."""
+        db = Database(self.db_dir)
+        db.update_many(
+            [
+                make_video(
+                    "http://example.com/0",
+                    TITLE,
+                    date_published="2021-02-10 15:22:46.162038-08:00",
+                ),
+                make_video("http://example.com/1", f"{TITLE} (reupload)"),
+                make_video("http://example.com/2", "Cat does a backflip"),
+            ]
+        )
+        query = make_video("http://example.com/9", f"{TITLE}!", duration="601")
+        found = db.find_near_duplicates(query)
+        self.assertEqual(
+            ["http://example.com/0", "http://example.com/1"],
+            sorted(vid.url for vid in found),
+        )
+        # Not itself.
+        self.assertEqual(1, len(db.find_near_duplicates(found[0])))
+        now = datetime.now()
+        start = now - timedelta(days=365 * 20)
+        self.assertEqual(3, len(db.get_video_list(start, now)))
+        collapsed = db.get_video_list(
+            start, now, limit=2, collapse_duplicates=True, summary=True
+        )
+        self.assertEqual(
+            ["http://example.com/0", "http://example.com/2"],
+            [vid.url for vid in collapsed],
+        )
+        # A changed title leaves the old buckets.
+        db.update(make_video("http://example.com/1", "Something else"))
+        self.assertEqual(1, len(db.find_near_duplicates(query)))
+        db.close()
+
+    def test_backfill(self) -> None:
+        """Tests that databases from before the signatures get them."""
+        db = Database(self.db_dir)
+        db.update(make_video("http://example.com/0", TITLE))
+        db.close()
+        path = os.path.join(self.db_dir, "videos.sqlite")
+        with sqlite3.connect(path) as conn:
+            conn.execute("DROP TABLE near_dup_buckets;")
+        conn.close()
+        db = Database(self.db_dir)
+        query = make_video("http://example.com/1", TITLE)
+        self.assertEqual(1, len(db.find_near_duplicates(query)))
+        db.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
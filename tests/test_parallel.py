@@ -0,0 +1,84 @@
+"""
+Tests parallel decoding of query results
+"""
+
+# pylint: disable=invalid-name,R0801
+
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from typing import List, Sequence
+
+import video_factory
+
+from vids_db.db_sqlite_video import DbSqliteVideo
+from vids_db.models import Video
+from vids_db.parallel import ParallelMap
+
+
+def square(items: Sequence[int], offset: int) -> List[int]:
+    """Worker function, must be importable by the worker processes."""
+    return [item * item + offset for item in items]
+
+
+def make_video(i: int) -> Video:
+    """Construct a default video object."""
+    return video_factory.make_video(
+        f"http://example.com/{i}",
+        datetime(2021, 2, 9).astimezone() + timedelta(minutes=i),
+        title=f"Vid{i}",
+        description="A cool video",
+        views=i,
+    )
+
+
+class ParallelTester(unittest.TestCase):
+    """Tests parallel.py and DbSqliteVideo(decode_workers=N)"""
+
+    def test_map_chunks_keeps_order(self) -> None:
+        """Tests that results come back in input order."""
+        parallel = ParallelMap(workers=2, threshold=10)
+        inline = ParallelMap(workers=2, threshold=10)
+        try:
+            items = list(range(2000))
+            expected = [i * i + 1 for i in items]
+            self.assertEqual(expected, parallel.map_chunks(square, items, 1))
+            # Below the threshold nothing is started.
+            self.assertEqual([1, 2], inline.map_chunks(square, [0, 1], 1))
+            # pylint: disable=protected-access
+            self.assertIsNone(inline._executor)
+        finally:
+            parallel.close()
+            inline.close()
+
+    def test_parallel_decode(self) -> None:
+        """Tests that parallel and serial decode return the same videos."""
+        # pylint: disable=consider-using-with
+        tmp_dir = tempfile.TemporaryDirectory()
+        try:
+            db_path = os.path.join(tmp_dir.name, "videos.sqlite")
+            serial = DbSqliteVideo(db_path, compression="zlib")
+            serial.insert_or_update([make_video(i) for i in range(1200)])
+            serial.compact(train=True)
+            db = DbSqliteVideo(
+                db_path, decode_workers=2, parallel_threshold=100
+            )
+            start = datetime(2021, 2, 8).astimezone()
+            end = datetime(2021, 2, 11).astimezone()
+            try:
+                for summary in (False, True):
+                    self.assertEqual(
+                        serial.find_videos(start, end, summary=summary),
+                        db.find_videos(start, end, summary=summary),
+                    )
+                # pylint: disable=protected-access
+                self.assertIsNotNone(db.parallel._executor)  # type: ignore
+            finally:
+                db.close()
+        finally:
+            tmp_dir.cleanup()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+"""
+Tests the compressed payload format
+"""
+
+# pylint: disable=invalid-name,R0801
+
+import os
+import sqlite3
+import tempfile
+import unittest
+
+import video_factory
+
+from vids_db.db_sqlite_video import DbSqliteVideo
+from vids_db.models import Video
+from vids_db.payload import (
+    PAYLOAD_ZLIB,
+    PAYLOAD_ZLIB_DICT,
+    PayloadCodec,
+    train_dictionary,
+)
+
+
+def make_video(url: str) -> Video:
+    """Construct a default video object."""
+    return video_factory.make_video(
+        url,
+        channel_url="https://www.youtube.com/channel/UC-9-kyTW8ZkZNDHQJ6FgpwQ",
+        source="youtube",
+        description="A cool video " * 20,
+        img_src="https://i.ytimg.com/vi/dQw4w9WgXcQ/hqdefault.jpg",
+        iframe_src="https://www.youtube.com/embed/dQw4w9WgXcQ",
+    )
+
+
+def payload_versions(db_path: str) -> list:
+    """Returns the payload version byte (or 'text') of every row."""
+    conn = sqlite3.connect(db_path)
+    try:
+        rows = conn.execute("SELECT data FROM videos").fetchall()
+    finally:
+        conn.close()
+    return [row[0][0] if isinstance(row[0], bytes) else "text" for row in rows]
+
+
+class PayloadTester(unittest.TestCase):
+    """Tests the payload codec and compaction"""
+
+    def setUp(self) -> None:
+        tmp_file = (
+            tempfile.NamedTemporaryFile(  # pylint: disable=consider-using-with
+                suffix=".sqlite3", delete=False
+            )
+        )
+        tmp_file.close()
+        self.db_path = tmp_file.name
+
+    def tearDown(self) -> None:
+        os.remove(self.db_path)
+
+    def test_codec_roundtrip(self) -> None:
+        """Tests that every payload version decodes back to the json."""
+        json_str = make_video("http://example.com/a").to_json_str()
+        codec = PayloadCodec("zlib")
+        self.assertEqual(json_str, codec.decode_str(json_str))
+        payload = codec.encode(json_str)
+        self.assertEqual(PAYLOAD_ZLIB, payload[0])
+        self.assertEqual(json_str, codec.decode_str(payload))
+        samples = [
+            make_video(f"http://example.com/{i}").to_json() for i in range(4)
+        ]
+        codec.set_dictionary(7, train_dictionary(samples))
+        payload_dict = codec.encode(json_str)
+        self.assertEqual(PAYLOAD_ZLIB_DICT, payload_dict[0])
+        self.assertLess(len(payload_dict), len(payload))
+        self.assertEqual(json_str, codec.decode_str(payload_dict))
+
+    def test_mixed_rows_and_compact(self) -> None:
+        """Tests that old text rows still read and compact rewrites them."""
+        DbSqliteVideo(self.db_path).insert_or_update(
+            [make_video("http://example.com/a")]
+        )
+        db = DbSqliteVideo(self.db_path, compression="zlib")
+        db.insert_or_update([make_video("http://example.com/b")])
+        self.assertCountEqual(
+            ["text", PAYLOAD_ZLIB], payload_versions(self.db_path)
+        )
+        self.assertEqual(2, len(db.get_all_videos()))
+        self.assertEqual(2, db.compact())
+        self.assertEqual(
+            [PAYLOAD_ZLIB_DICT] * 2, payload_versions(self.db_path)
+        )
+        # A fresh instance finds the stored dictionary.
+        db = DbSqliteVideo(self.db_path)
+        self.assertEqual(
+            make_video("http://example.com/a"),
+            db.find_video_by_url("http://example.com/a"),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
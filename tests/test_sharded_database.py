@@ -0,0 +1,164 @@
+"""
+Tests the sharded database
+"""
+
+# pylint: disable=invalid-name,R0801
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from datetime import datetime, timedelta, timezone
+from typing import List
+from unittest import mock
+
+import video_factory
+
+from vids_db.db_sqlite_video import DbSqliteVideo
+from vids_db.models import Video
+from vids_db.sharded_database import ShardedDatabase, shard_index
+
+DATE = datetime(2022, 5, 4, tzinfo=timezone.utc)
+
+
+def make_video(channel_name: str, url: str, minutes: int) -> Video:
+    """Construct a default video object."""
+    return video_factory.make_video(
+        url, DATE + timedelta(minutes=minutes), channel_name=channel_name
+    )
+
+
+class ShardedDatabaseTester(unittest.TestCase):
+    """Tests the sharded database"""
+
+    def setUp(self) -> None:
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tempdir, ignore_errors=True)
+
+    def test_merge_across_shards(self) -> None:
+        """Tests that global queries are merged in timestamp order."""
+        db = ShardedDatabase(self.tempdir, num_shards=4)
+        vids = [
+            make_video(f"channel{i % 7}", f"http://example.com/{i}", i)
+            for i in range(50)
+        ]
+        db.update_many(vids)
+        self.assertGreater(
+            len({shard_index(v.channel_name, 4) for v in vids}), 1
+        )
+        out = db.get_video_list(DATE, DATE + timedelta(hours=1), limit=10)
+        expected = [f"http://example.com/{i}" for i in range(49, 39, -1)]
+        self.assertEqual(expected, [v.url for v in out])
+        out = db.get_video_list(
+            DATE, DATE + timedelta(hours=1), channel_name="channel3"
+        )
+        self.assertEqual(7, len(out))
+        self.assertEqual(
+            2,
+            len(
+                db.get_by_urls(["http://example.com/1", "http://example.com/2"])
+            ),
+        )
+        db.remove_by_channel_name("channel3")
+        self.assertEqual(6, len(db.get_channel_names()))
+        with self.assertRaises(ValueError):
+            db.get_trending(10, window=timedelta(days=8))
+        db.close()
+
+    def test_channel_move(self) -> None:
+        """Tests that a video renamed to another shard has one copy."""
+        db = ShardedDatabase(self.tempdir, num_shards=4)
+        url = "http://example.com/0"
+        names = [f"channel{i}" for i in range(6)]
+        self.assertGreater(len({shard_index(n, 4) for n in names}), 1)
+        for name in names:
+            db.update_many([make_video(name, url, 0)])
+        out = db.get_video_list(DATE, DATE + timedelta(hours=1))
+        self.assertEqual(["channel5"], [v.channel_name for v in out])
+        self.assertEqual(1, len(db.get_by_urls([url])))
+        db.update_fields({url: {"channel_name": "channel2"}})
+        out = db.get_by_urls([url])
+        self.assertEqual(["channel2"], [v.channel_name for v in out])
+        self.assertEqual(["channel2"], db.get_channel_names())
+        # New videos of a known channel are not looked up in other shards.
+        with mock.patch.object(
+            DbSqliteVideo, "existing_urls", side_effect=AssertionError
+        ):
+            db.update_many([make_video("channel2", "http://example.com/1", 1)])
+        self.assertEqual(2, len(db.get_video_list(DATE, DATE + timedelta(1))))
+        db.close()
+
+    @mock.patch.dict(os.environ, {"FULL_TEXT_SEARCH_ENABLED": "1"})
+    def test_concurrent_writers(self) -> None:
+        """Tests that writers of two instances queue up on the locks."""
+        dbs = [ShardedDatabase(self.tempdir, num_shards=2) for _ in range(2)]
+        errors: List[BaseException] = []
+
+        def write(n: int) -> None:
+            try:
+                for i in range(5):
+                    vids = [
+                        make_video(
+                            f"channel{j % 3}",
+                            f"http://example.com/{n}/{i}/{j}",
+                            j,
+                        )
+                        for j in range(10)
+                    ]
+                    dbs[n % 2].update_many(vids)
+            except BaseException as err:  # pylint: disable=broad-except
+                errors.append(err)
+
+        threads = [threading.Thread(target=write, args=(n,)) for n in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([], errors)
+        found = dbs[0].query_video_list("Vid0", limit=1000)
+        self.assertEqual(200, len(found))
+        locks = [db.full_text_lock for db in dbs]
+        self.assertEqual(
+            20, sum(lock.metrics().acquisitions for lock in locks if lock)
+        )
+        for db in dbs:
+            db.close()
+
+    def test_shards_lock_separately(self) -> None:
+        """Tests that a writer only waits for the shards it writes."""
+        db = ShardedDatabase(self.tempdir, num_shards=2)
+        other = ShardedDatabase(
+            self.tempdir, num_shards=2, write_lock_timeout=0.1
+        )
+        names = {shard_index(f"channel{i}", 2): f"channel{i}" for i in range(9)}
+        with db.shard_locks[0]:
+            other.update_many([make_video(names[1], "http://example.com/1", 0)])
+            with self.assertRaises(TimeoutError):
+                other.update_many(
+                    [make_video(names[0], "http://example.com/0", 0)]
+                )
+            # Moving a video out of the locked shard waits for it too.
+            with self.assertRaises(TimeoutError):
+                other.update_fields(
+                    {"http://example.com/1": {"channel_name": names[0]}}
+                )
+        other.update_fields(
+            {"http://example.com/1": {"channel_name": names[0]}}
+        )
+        self.assertEqual([names[0]], db.get_channel_names())
+        self.assertEqual(0, len(db.shards[1].get_channel_names()))
+        for database in (db, other):
+            database.close()
+
+    def test_shard_count_is_pinned(self) -> None:
+        """Tests that reopening with another shard count is rejected."""
+        ShardedDatabase(self.tempdir, num_shards=2).close()
+        with self.assertRaises(ValueError):
+            ShardedDatabase(self.tempdir, num_shards=3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+"""
+Tests read only databases and published snapshots
+"""
+
+# pylint: disable=invalid-name,R0801
+
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+from video_factory import make_video
+
+from vids_db.database import Database
+from vids_db.snapshot import current_snapshot, list_snapshots
+
+
+@mock.patch.dict(os.environ, {"FULL_TEXT_SEARCH_ENABLED": "1"})
+class SnapshotTester(unittest.TestCase):
+    """Tests read_only mode and snapshot.py"""
+
+    def setUp(self) -> None:
+        # pylint: disable=consider-using-with
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_dir = os.path.join(self.tmp_dir.name, "db")
+        self.snapshot_root = os.path.join(self.tmp_dir.name, "snapshots")
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def test_read_only(self) -> None:
+        """Tests that a read only database sees writes but never writes."""
+        writer = Database(self.db_dir)
+        writer.update(make_video("http://example.com/0"))
+        reader = Database(self.db_dir, read_only=True, mmap_size=1 << 20)
+        self.assertEqual(1, len(reader.get_by_urls(["http://example.com/0"])))
+        writer.update(make_video("http://example.com/1"))
+        self.assertEqual(1, len(reader.get_by_urls(["http://example.com/1"])))
+        with self.assertRaises(OSError):
+            reader.update(make_video("http://example.com/2"))
+        self.assertEqual(1, len(reader.query_video_list("vid0")[:1]))
+        reader.close()
+        with self.assertRaises(OSError):
+            Database(os.path.join(self.tmp_dir.name, "missing"), read_only=True)
+
+    def test_read_only_needs_current_schema(self) -> None:
+        """Tests that read only mode does not migrate old files."""
+        os.makedirs(self.db_dir)
+        conn = sqlite3.connect(os.path.join(self.db_dir, "videos.sqlite"))
+        conn.execute(
+            "CREATE TABLE videos (url TEXT PRIMARY KEY UNIQUE NOT NULL,"
+            " channel_name TEXT, timestamp_published INT, data TEXT);"
+        )
+        conn.close()
+        with self.assertRaises(OSError):
+            Database(self.db_dir, read_only=True)
+
+    def test_publish_and_swap(self) -> None:
+        """Tests that readers follow CURRENT to complete snapshots."""
+        writer = Database(self.db_dir)
+        writer.update(make_video("http://example.com/0"))
+        first = writer.publish_snapshot(self.snapshot_root)
+        self.assertEqual(first, current_snapshot(self.snapshot_root))
+        reader = Database.open_snapshot(self.snapshot_root)
+        writer.update(make_video("http://example.com/1"))
+        # The published snapshot does not change under the reader.
+        self.assertEqual(0, len(reader.get_by_urls(["http://example.com/1"])))
+        second = writer.publish_snapshot(self.snapshot_root)
+        self.assertNotEqual(first, second)
+        swapped = Database.open_snapshot(self.snapshot_root)
+        urls = ["http://example.com/0", "http://example.com/1"]
+        self.assertEqual(2, len(swapped.get_by_urls(urls)))
+        self.assertEqual(2, len(swapped.query_video_list("vid0")))
+        reader.close()
+        swapped.close()
+        writer.publish_snapshot(self.snapshot_root)
+        self.assertEqual(2, len(list_snapshots(self.snapshot_root)))
+        self.assertFalse(os.path.exists(first))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+"""
+Tests the trending score index
+"""
+
+# pylint: disable=invalid-name,R0801
+
+import shutil
+import tempfile
+import unittest
+from datetime import timedelta
+
+import video_factory
+
+from vids_db.database import Database
+from vids_db.date import now_local
+from vids_db.models import Video
+from vids_db.trending import trending_score
+
+
+def make_video(
+    url: str, channel_name: str, hours_ago: int, views: int
+) -> Video:
+    """Construct a default video object published hours_ago."""
+    return video_factory.make_video(
+        url,
+        now_local() - timedelta(hours=hours_ago),
+        channel_name=channel_name,
+        views=views,
+    )
+
+
+class TrendingTester(unittest.TestCase):
+    """Tests the trending score index"""
+
+    def setUp(self) -> None:
+        self.tempdir = tempfile.mkdtemp()
+        self.db = Database(db_path=self.tempdir)
+        self.db.update_many(
+            [
+                make_video("http://example.com/new", "chan_a", 1, 1000),
+                make_video("http://example.com/old", "chan_a", 40, 5000),
+                make_video("http://example.com/other", "chan_b", 2, 100),
+                make_video(
+                    "http://example.com/ancient", "chan_b", 24 * 30, 10**9
+                ),
+            ]
+        )
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tempdir, ignore_errors=True)
+
+    def test_score(self) -> None:
+        """Tests the decay of the score with age."""
+        self.assertGreater(trending_score(100, 0, 3600), trending_score(100, 0, 7200))  # type: ignore
+        self.assertIsNone(trending_score(100, 0, 3600 * 24 * 30))
+
+    def test_get_trending(self) -> None:
+        """Tests the order, the channel filter and the window."""
+        vids = self.db.get_trending(10)
+        self.assertEqual(
+            [
+                "http://example.com/new",
+                "http://example.com/old",
+                "http://example.com/other",
+            ],
+            [v.url for v in vids],
+        )
+        vids = self.db.get_trending(10, channel_name="chan_b")
+        self.assertEqual(["http://example.com/other"], [v.url for v in vids])
+        vids = self.db.get_trending(10, window=timedelta(hours=12))
+        self.assertEqual(2, len(vids))
+        with self.assertRaises(ValueError):
+            self.db.get_trending(10, window=timedelta(days=8))
+
+    def test_incremental_update(self) -> None:
+        """Tests that a views update rescores the video."""
+        self.db.update(
+            make_video("http://example.com/other", "chan_b", 2, 10**6)
+        )
+        self.assertEqual(
+            "http://example.com/other", self.db.get_trending(1)[0].url
+        )
+
+    def test_refresh_trending(self) -> None:
+        """Tests that the batch job rescores the window."""
+        self.assertEqual(3, self.db.refresh_trending())
+        self.assertEqual(3, len(self.db.get_trending(10)))
+
+
+if __name__ == "__main__":
+    unittest.main()
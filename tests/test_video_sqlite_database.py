@@ -5,13 +5,14 @@ Tests the sqlite video database
 # pylint: disable=invalid-name
 
 import os
+import sqlite3
 import tempfile
 import unittest
 from datetime import datetime, timedelta
 from typing import List
 
 from vids_db.db_sqlite_video import DbSqliteVideo
-from vids_db.models import Video
+from vids_db.models import Video, VideoSummary
 
 
 def make_video_info(url: str = "http://example.com/vid_url0.html") -> Video:
@@ -158,6 +159,56 @@ class DbSqliteVideoTester(unittest.TestCase):
         channel_names = db.get_channel_names()
         self.assertEqual(0, len(channel_names))
 
+    def test_find_videos_summary(self) -> None:
+        """Tests that summaries are returned without the cold fields."""
+        db_path = self.create_tempfile_path()
+        db = DbSqliteVideo(db_path)
+        video_in: Video = make_video_info()
+        video_in.description = "A long description"
+        db.insert_or_update([video_in])
+        date_start: datetime = video_in.date_published
+        date_end: datetime = date_start + timedelta(seconds=1)
+        summaries = db.find_videos(date_start, date_end, summary=True)
+        self.assertEqual(1, len(summaries))
+        self.assertIsInstance(summaries[0], VideoSummary)
+        self.assertFalse(hasattr(summaries[0], "description"))
+        self.assertEqual(video_in.views, summaries[0].views)
+        summaries = db.find_videos_by_urls([video_in.url], summary=True)
+        self.assertIsInstance(summaries[0], VideoSummary)
+        # The full video is still loaded on demand.
+        vid = db.find_video_by_url(summaries[0].url)
+        assert vid is not None
+        self.assertEqual("A long description", vid.description)
+
+    def test_legacy_rows(self) -> None:
+        """Tests that rows from before the hot/cold split still read."""
+        db_path = self.create_tempfile_path()
+        video_in: Video = make_video_info()
+        conn = sqlite3.connect(db_path)
+        conn.executescript(
+            "CREATE TABLE videos (url TEXT PRIMARY KEY UNIQUE NOT NULL,"
+            " channel_name TEXT, timestamp_published INT, data TEXT);"
+        )
+        conn.execute(
+            "INSERT INTO videos VALUES (?, ?, ?, ?)",
+            (
+                video_in.url,
+                video_in.channel_name,
+                int(video_in.date_published.timestamp()),
+                video_in.to_json_str(),
+            ),
+        )
+        conn.commit()
+        conn.close()
+        db = DbSqliteVideo(db_path)
+        self.assertEqual(video_in, db.find_video_by_url(video_in.url))
+        summaries = db.find_videos_by_urls([video_in.url], summary=True)
+        self.assertEqual(video_in.title, summaries[0].title)
+        # New columns are backfilled from the payload.
+        self.assertEqual([913], list(db.get_columns(["views"])["views"]))
+        db.compact()
+        self.assertEqual(video_in, db.find_video_by_url(video_in.url))
+
 
 if __name__ == "__main__":
     unittest.main()
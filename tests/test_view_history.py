@@ -0,0 +1,122 @@
+"""
+Tests the views history
+"""
+
+# pylint: disable=invalid-name,R0801
+
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+import video_factory
+
+from vids_db.database import Database
+from vids_db.db_sqlite_video import DbSqliteVideo
+from vids_db.models import Video
+
+HOUR = 3600
+NOW = datetime(2021, 3, 1).astimezone()
+
+
+def make_video(i: int, views: int) -> Video:
+    """Construct a default video object."""
+    return video_factory.make_video(
+        f"http://example.com/{i}", title=f"Vid{i}", views=views
+    )
+
+
+class ViewHistoryTester(unittest.TestCase):
+    """Tests views_history=True"""
+
+    def setUp(self) -> None:
+        # pylint: disable=consider-using-with
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db = DbSqliteVideo(
+            os.path.join(self.tmp_dir.name, "videos.sqlite"),
+            views_history=True,
+        )
+
+    def tearDown(self) -> None:
+        self.db.close()
+        self.tmp_dir.cleanup()
+
+    def scrape(self, hours_ago: float, views0: int, views1: int) -> None:
+        """Writes both videos as of hours_ago."""
+        timestamp = NOW.timestamp() - hours_ago * HOUR
+        with mock.patch(
+            "vids_db.db_sqlite_video.now_timestamp", return_value=timestamp
+        ):
+            self.db.insert_or_update(
+                [make_video(0, views0), make_video(1, views1)]
+            )
+
+    def test_history_and_velocity(self) -> None:
+        """Tests the samples and the velocity over a window."""
+        self.scrape(48, 100, 5)
+        self.scrape(24, 200, 5)
+        self.scrape(12, 800, 5)  # Unchanged views of video 1 are skipped.
+        self.scrape(0, 1400, 5)
+        history = self.db.get_view_history("http://example.com/0")
+        self.assertEqual([100, 200, 800, 1400], list(history.views))
+        self.assertEqual(4, len(history.timestamps))
+        self.assertEqual(
+            1, len(self.db.get_view_history("http://example.com/1").views)
+        )
+        velocity = self.db.get_view_velocity(
+            [f"http://example.com/{i}" for i in range(3)],
+            timedelta(hours=24),
+            now_time=NOW,
+        )
+        # 1200 views in 24 hours from the sample at the window start.
+        self.assertAlmostEqual(50.0, velocity["http://example.com/0"])
+        self.assertEqual(0.0, velocity["http://example.com/1"])
+        self.assertNotIn("http://example.com/2", velocity)
+        # Only the last 12 hours.
+        velocity = self.db.get_view_velocity(
+            ["http://example.com/0"], timedelta(hours=6), now_time=NOW
+        )
+        self.assertAlmostEqual(50.0, velocity["http://example.com/0"])
+
+    def test_downsample_and_delete(self) -> None:
+        """Tests that old samples are thinned and deletes drop them."""
+        for hours_ago in range(96, -1, -6):
+            self.scrape(hours_ago, 1000 - hours_ago, 5)
+        before = len(self.db.get_view_history("http://example.com/0").views)
+        self.assertEqual(17, before)
+        dropped = self.db.downsample_view_history(
+            older_than=timedelta(days=2),
+            interval=timedelta(days=1),
+            now_time=NOW,
+        )
+        self.assertGreater(dropped, 0)
+        history = self.db.get_view_history("http://example.com/0")
+        self.assertEqual(before - dropped, len(history.views))
+        # The newest sample always survives.
+        self.assertEqual(1000, history.views[-1])
+        self.db.remove_by_urls(["http://example.com/0"])
+        self.assertEqual(
+            0, len(self.db.get_view_history("http://example.com/0").views)
+        )
+
+    @mock.patch.dict(os.environ, {"FULL_TEXT_SEARCH_ENABLED": "0"})
+    def test_database(self) -> None:
+        """Tests the Database api."""
+        db = Database(os.path.join(self.tmp_dir.name, "db"), views_history=True)
+        hour_ago = datetime.now().timestamp() - HOUR
+        with mock.patch(
+            "vids_db.db_sqlite_video.now_timestamp", return_value=hour_ago
+        ):
+            db.update(make_video(0, 10))
+        db.update(make_video(0, 20))
+        self.assertEqual(
+            [10, 20], list(db.get_view_history("http://example.com/0").views)
+        )
+        velocity = db.get_view_velocity(["http://example.com/0"])
+        self.assertAlmostEqual(10.0, velocity["http://example.com/0"], 1)
+        db.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
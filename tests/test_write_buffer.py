@@ -0,0 +1,155 @@
+"""
+Tests the write-behind buffer of Database
+"""
+
+# pylint: disable=invalid-name,R0801
+
+import os
+import tempfile
+import time
+import unittest
+from datetime import datetime, timedelta
+from typing import List
+from unittest import mock
+
+from video_factory import make_video
+
+from vids_db.database import Database
+from vids_db.models import Video
+from vids_db.write_buffer import WriteBuffer
+
+
+@mock.patch.dict(os.environ, {"FULL_TEXT_SEARCH_ENABLED": "0"})
+class WriteBufferTester(unittest.TestCase):
+    """Tests write_buffer.py and Database(write_buffer_size=...)"""
+
+    def setUp(self) -> None:
+        # pylint: disable=consider-using-with
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_dir = os.path.join(self.tmp_dir.name, "db")
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def test_dedup_and_size_flush(self) -> None:
+        """Tests last write wins and a flush once max_size are pending."""
+        batches: List[List[Video]] = []
+        buffer = WriteBuffer(batches.append, max_size=3, max_delay=60)
+        buffer.add([make_video("http://example.com/0", views=1)])
+        buffer.add([make_video("http://example.com/0", views=2)])
+        buffer.add([make_video("http://example.com/1")])
+        self.assertEqual([], batches)
+        self.assertEqual(2, buffer.pending()["http://example.com/0"].views)
+        buffer.add([make_video("http://example.com/2")])
+        self.assertEqual(1, len(batches))
+        self.assertEqual(3, len(batches[0]))
+        metrics = buffer.metrics()
+        self.assertEqual(0, metrics.depth)
+        self.assertEqual(4, metrics.added)
+        self.assertEqual(1, metrics.deduplicated)
+        self.assertEqual(1, metrics.flushes)
+        self.assertEqual(3, metrics.max_depth)
+        buffer.close()
+
+    def test_time_flush(self) -> None:
+        """Tests that the timer writes videos older than max_delay."""
+        batches: List[List[Video]] = []
+        buffer = WriteBuffer(batches.append, max_size=100, max_delay=0.05)
+        buffer.add([make_video("http://example.com/0")])
+        deadline = time.monotonic() + 5
+        while not batches and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(1, len(batches))
+        buffer.close()
+
+    def test_failed_flush_keeps_videos(self) -> None:
+        """Tests that a failed write leaves the videos pending."""
+
+        def fail(vids: List[Video]) -> None:
+            raise OSError(f"Can't write {len(vids)} videos")
+
+        buffer = WriteBuffer(fail, max_size=100, max_delay=60)
+        buffer.add([make_video("http://example.com/0")])
+        with self.assertRaises(OSError):
+            buffer.flush()
+        self.assertEqual(1, len(buffer))
+        self.assertEqual(1, buffer.metrics().errors)
+        buffer.flush_fn = lambda vids: None
+        buffer.close()
+        self.assertEqual(0, len(buffer))
+
+    def test_timer_flush_error(self) -> None:
+        """Tests that a failed write of the timer is raised by flush()."""
+        with self.assertRaises(ValueError):
+            WriteBuffer(lambda vids: None, max_delay=0)
+        batches: List[List[Video]] = []
+
+        def fail(vids: List[Video]) -> None:
+            buffer.flush_fn = batches.append
+            raise OSError(f"Can't write {len(vids)} videos")
+
+        buffer = WriteBuffer(fail, max_size=100, max_delay=0.05)
+        buffer.add([make_video("http://example.com/0")])
+        deadline = time.monotonic() + 5
+        while not batches and time.monotonic() < deadline:
+            time.sleep(0.01)
+        # The timer wrote the videos on its retry.
+        self.assertEqual(1, len(batches))
+        with self.assertRaises(OSError):
+            buffer.flush()
+        self.assertEqual(0, buffer.flush())
+        self.assertEqual(1, buffer.metrics().errors)
+        buffer.close()
+
+    def test_database_reads_see_buffer(self) -> None:
+        """Tests that reads overlay the pending videos."""
+        with Database(
+            self.db_dir, write_buffer_size=100, write_buffer_delay=60
+        ) as db:
+            db.update(make_video("http://example.com/0", views=1))
+            db.flush()
+            db.update(make_video("http://example.com/0", views=2))
+            db.update(make_video("http://example.com/1"))
+            # Only the first video is written.
+            urls = ["http://example.com/0", "http://example.com/1"]
+            stored = db.db_sqlite.find_videos_by_urls(urls)
+            self.assertEqual(1, len(stored))
+            vids = db.get_by_urls(urls)
+            self.assertEqual(2, len(vids))
+            views = {vid.url: vid.views for vid in vids}
+            self.assertEqual(2, views["http://example.com/0"])
+            now = datetime.now()
+            vid_list = db.get_video_list(
+                now - timedelta(days=365 * 20), now, summary=True
+            )
+            self.assertEqual(2, len(vid_list))
+            self.assertEqual(
+                {2, 913}, {vid.views for vid in vid_list}  # type: ignore
+            )
+            self.assertEqual(["XXchannel_name"], db.get_channel_names())
+            metrics = db.buffer_metrics()
+            assert metrics is not None
+            self.assertEqual(2, metrics.depth)
+        # Written on close.
+        db = Database(self.db_dir)
+        vids = db.get_by_urls(urls)
+        self.assertEqual({2, 913}, {vid.views for vid in vids})
+        db.close()
+
+    def test_remove_flushes_buffer(self) -> None:
+        """Tests that removes apply the pending writes first."""
+        with Database(
+            self.db_dir, write_buffer_size=100, write_buffer_delay=60
+        ) as db:
+            url = "http://example.com/0"
+            db.update(make_video(url, channel_name="new"))
+            db.flush()
+            # Moved back to the removed channel, only in the buffer.
+            db.update(make_video(url, channel_name="old"))
+            self.assertEqual(1, db.remove_by_channel_name("old"))
+            self.assertEqual([], db.get_by_urls([url]))
+            self.assertEqual(0, len(db.db_sqlite.find_videos_by_urls([url])))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,159 @@
+"""
+Tests cross process write coordination
+"""
+
+# pylint: disable=invalid-name,R0801
+
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import unittest
+from datetime import datetime, timedelta
+from typing import List, Tuple
+from unittest import mock
+
+import video_factory
+
+from vids_db.database import Database
+from vids_db.models import Video
+from vids_db.write_lock import WriteLock
+
+PROCESSES = 3
+BATCHES = 10
+BATCH_SIZE = 5
+
+
+def make_video(i: int) -> Video:
+    """Construct a default video object."""
+    return video_factory.make_video(
+        f"http://example.com/{i}",
+        datetime(2021, 2, 9).astimezone() + timedelta(minutes=i),
+        channel_name=f"channel{i % 4}",
+        title=f"Ingest test video number {i}",
+        views=i,
+    )
+
+
+def ingest(db_path: str, worker: int) -> Tuple[int, int]:
+    """Worker process, writes its own videos in small batches."""
+    db = Database(db_path)
+    for batch in range(BATCHES):
+        first = (worker * BATCHES + batch) * BATCH_SIZE
+        db.update_many([make_video(first + i) for i in range(BATCH_SIZE)])
+    metrics = db.lock_metrics()
+    db.close()
+    assert metrics is not None
+    return metrics.acquisitions, metrics.timeouts
+
+
+def hold_lock(path: str, seconds: float) -> None:
+    """Worker process, holds the lock for a while."""
+    lock = WriteLock(path)
+    with lock:
+        time.sleep(seconds)
+    lock.close()
+
+
+@mock.patch.dict(os.environ, {"FULL_TEXT_SEARCH_ENABLED": "1"})
+class WriteLockTester(unittest.TestCase):
+    """Tests write_lock.py and concurrent writers"""
+
+    def setUp(self) -> None:
+        # pylint: disable=consider-using-with
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_dir = os.path.join(self.tmp_dir.name, "db")
+        self.ctx = multiprocessing.get_context("spawn")
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def test_multi_process_ingest(self) -> None:
+        """Tests that concurrent writer processes lose no videos."""
+        Database(self.db_dir).close()  # Creates the schema and index.
+        with self.ctx.Pool(PROCESSES) as pool:
+            results = pool.starmap(
+                ingest, [(self.db_dir, w) for w in range(PROCESSES)]
+            )
+        # One more acquisition checks the full text index on open.
+        self.assertEqual([(BATCHES + 1, 0)] * PROCESSES, results)
+        total = PROCESSES * BATCHES * BATCH_SIZE
+        db = Database(self.db_dir)
+        urls = [f"http://example.com/{i}" for i in range(total)]
+        self.assertEqual(total, len(db.get_by_urls(urls)))
+        found = db.query_video_list("ingest", limit=total)
+        self.assertEqual(total, len(found))
+        db.close()
+
+    def test_wait_and_timeout(self) -> None:
+        """Tests waiting for another process and timing out."""
+        path = os.path.join(self.tmp_dir.name, "write.lock")
+        proc = self.ctx.Process(target=hold_lock, args=(path, 1.0))
+        proc.start()
+        lock = WriteLock(path, timeout=0.05)
+        # Wait for the other process to take the lock.
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            try:
+                lock.acquire()
+            except TimeoutError:
+                break
+            lock.release()
+            time.sleep(0.01)
+        self.assertEqual(1, lock.metrics().timeouts)
+        lock.acquire(timeout=30)
+        lock.release()
+        proc.join()
+        metrics = lock.metrics()
+        self.assertEqual(1, metrics.contended)
+        self.assertGreater(metrics.max_wait_seconds, 0.0)
+        lock.close()
+
+    def test_threads_and_reentrance(self) -> None:
+        """Tests that threads of one process exclude each other."""
+        lock = WriteLock(os.path.join(self.tmp_dir.name, "write.lock"))
+        active: List[int] = []
+        overlaps: List[int] = []
+
+        def work() -> None:
+            for _ in range(20):
+                with lock:
+                    with lock:  # Reentrant.
+                        active.append(1)
+                        if len(active) > 1:
+                            overlaps.append(1)
+                        time.sleep(0.001)
+                        active.pop()
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([], overlaps)
+        self.assertEqual(80, lock.metrics().acquisitions)
+        lock.close()
+
+    @unittest.skipUnless(os.path.isdir("/proc/self/fd"), "needs /proc")
+    def test_no_open_files(self) -> None:
+        """Tests that the lock file is only open while the lock is held."""
+
+        def open_files() -> int:
+            return len(os.listdir("/proc/self/fd"))
+
+        before = open_files()
+        path = os.path.join(self.tmp_dir.name, "write.lock")
+        locks = [WriteLock(path) for _ in range(3)]
+        self.assertEqual(before, open_files())
+        with locks[0]:
+            with locks[0]:
+                self.assertEqual(before + 1, open_files())
+        with self.assertRaises(TimeoutError):
+            with locks[1]:
+                locks[2].acquire(timeout=0.01)
+        self.assertEqual(before, open_files())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,34 @@
+"""
+Shared factory for the videos of the tests
+"""
+
+from datetime import datetime
+from typing import Any, Dict, Union
+
+from vids_db.models import Video
+
+DATE_PUBLISHED = "2021-02-09 15:22:46.162038-08:00"
+
+
+def make_video(
+    url: str = "http://example.com/vid_url0.html",
+    date_published: Union[str, datetime] = DATE_PUBLISHED,
+    **fields: Any,
+) -> Video:
+    """Construct a default video object, fields override the defaults."""
+    data: Dict[str, Any] = {
+        "channel_name": "XXchannel_name",
+        "title": "Vid0",
+        "date_published": date_published,
+        "date_lastupdated": date_published,
+        "channel_url": "https://chann_url0.html",
+        "source": "rumble.com",
+        "url": url,
+        "duration": "60",
+        "description": "",
+        "img_src": "http://img_src0.jpg",
+        "iframe_src": "http://example.com/iframe_url0.html",
+        "views": 913,
+    }
+    data.update(fields)
+    return Video(**data)
@@ -0,0 +1,237 @@
+"""
+In memory prefix index for suggest-as-you-type.
+
+Channel names and title words are kept in one sorted list of lower cased
+keys. A prefix lookup is a bisect to the first matching key followed by a
+scan of the matching range for the most frequent entries, answers are
+cached until the next update. Short prefixes, the first keystrokes, match
+too much of the list to scan, so their best entries are maintained
+incrementally instead. build_index() counts everything first, then sorts
+the keys and computes those best entries once.
+"""
+
+# pylint: disable=all
+
+import heapq
+import re
+from bisect import bisect_left, insort
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from vids_db.models import Video
+
+KIND_CHANNEL = "channel"
+KIND_TITLE = "title"
+
+MIN_TERM_LENGTH = 3
+# Prefixes up to this length match too many keys to scan, their best
+# TOP_SIZE entries are maintained as keys are added.
+SHORT_PREFIX_LENGTH = 3
+TOP_SIZE = 50
+# Past this many new keys one re-sort is cheaper than many inserts.
+_RESORT_THRESHOLD = 64
+# Past this many changed keys the short prefix tops are rebuilt.
+_REBUILD_THRESHOLD = 2000
+_CACHE_SIZE = 1024
+
+_WORD_RE = re.compile(r"\w+")
+
+
+# (-count, is not a channel, key, kind), sorts best first.
+_Rank = Tuple[int, bool, str, str]
+
+
+class Suggestion(NamedTuple):
+    text: str
+    kind: str
+    frequency: int
+
+
+def title_terms(title: str) -> List[str]:
+    """The lower cased words of a title that are worth suggesting."""
+    return [
+        word
+        for word in _WORD_RE.findall(title.lower())
+        if len(word) >= MIN_TERM_LENGTH and not word.isdigit()
+    ]
+
+
+class AutocompleteIndex:
+    """Prefix index of channel names and title words, see module docstring."""
+
+    def __init__(self) -> None:
+        # (kind, key) -> count, channel names display in their own case.
+        self.counts: Dict[Tuple[str, str], int] = {}
+        self.display: Dict[str, str] = {}
+        self.keys: List[Tuple[str, str]] = []  # Sorted (key, kind).
+        # Short prefix -> its TOP_SIZE best ranks, kept up to date.
+        self._top: Dict[str, List[_Rank]] = {}
+        self._cache: Dict[Tuple[str, int], List[Suggestion]] = {}
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def _rank(self, kind: str, key: str) -> _Rank:
+        # Most frequent first, channels before words on ties.
+        return (-self.counts[(kind, key)], kind != KIND_CHANNEL, key, kind)
+
+    def _rebuild_top(self) -> None:
+        candidates: Dict[str, List[_Rank]] = {}
+        for key, kind in self.keys:
+            rank = self._rank(kind, key)
+            for size in range(1, min(len(key), SHORT_PREFIX_LENGTH) + 1):
+                candidates.setdefault(key[:size], []).append(rank)
+        self._top = {
+            prefix: heapq.nsmallest(TOP_SIZE, ranks)
+            for prefix, ranks in candidates.items()
+        }
+
+    def _update_top(self, kind: str, key: str) -> None:
+        rank = self._rank(kind, key)
+        for size in range(1, min(len(key), SHORT_PREFIX_LENGTH) + 1):
+            prefix = key[:size]
+            # Copied, not changed in place, for concurrent readers.
+            top = [r for r in self._top.get(prefix, []) if r[2:] != rank[2:]]
+            if len(top) < TOP_SIZE or rank < top[-1]:
+                insort(top, rank)
+                del top[TOP_SIZE:]
+            self._top[prefix] = top
+
+    def _add(self, entries: Iterable[Tuple[str, str, int]]) -> None:
+        new_keys = []
+        touched = []
+        for kind, key, count in entries:
+            if (kind, key) not in self.counts:
+                self.counts[(kind, key)] = 0
+                new_keys.append((key, kind))
+            self.counts[(kind, key)] += count
+            touched.append((kind, key))
+        if len(new_keys) > _RESORT_THRESHOLD:
+            # Swapped in whole so concurrent readers never see a half
+            # sorted list.
+            self.keys = sorted(self.keys + new_keys)
+        else:
+            for entry in new_keys:
+                insort(self.keys, entry)
+        if len(touched) > _REBUILD_THRESHOLD:
+            self._rebuild_top()
+        else:
+            for kind, key in touched:
+                self._update_top(kind, key)
+        self._cache.clear()
+
+    def add_channels(self, channel_counts: Dict[str, int]) -> None:
+        entries = []
+        for channel_name, count in channel_counts.items():
+            key = channel_name.lower()
+            self.display[key] = channel_name
+            entries.append((KIND_CHANNEL, key, count))
+        self._add(entries)
+
+    def add_titles(self, titles: Iterable[str]) -> None:
+        term_counts: Dict[str, int] = {}
+        for title in titles:
+            for term in title_terms(title):
+                term_counts[term] = term_counts.get(term, 0) + 1
+        self._add(
+            (KIND_TITLE, term, count) for term, count in term_counts.items()
+        )
+
+    def load(
+        self,
+        channel_counts: Dict[str, int],
+        title_batches: Iterable[List[str]],
+    ) -> None:
+        """Bulk add_channels() and add_titles(), see build_index()."""
+        counts = dict(self.counts)
+        for channel_name, count in channel_counts.items():
+            key = channel_name.lower()
+            self.display[key] = channel_name
+            counts[(KIND_CHANNEL, key)] = (
+                counts.get((KIND_CHANNEL, key), 0) + count
+            )
+        for titles in title_batches:
+            for title in titles:
+                for term in title_terms(title):
+                    counts[(KIND_TITLE, term)] = (
+                        counts.get((KIND_TITLE, term), 0) + 1
+                    )
+        self.counts = counts
+        self.keys = sorted((key, kind) for kind, key in counts)
+        self._rebuild_top()
+        self._cache.clear()
+
+    def add_videos(self, vids: List[Video]) -> None:
+        """Counts videos that are not in the index yet."""
+        by_url = {vid.url: vid for vid in vids}
+        channel_counts: Dict[str, int] = {}
+        for vid in by_url.values():
+            channel_counts[vid.channel_name] = (
+                channel_counts.get(vid.channel_name, 0) + 1
+            )
+        self.add_channels(channel_counts)
+        self.add_titles(vid.title for vid in by_url.values())
+
+    def remove_channel(self, channel_name: str) -> None:
+        """Drops a channel, the words of its titles are left in place."""
+        key = channel_name.lower()
+        if self.counts.pop((KIND_CHANNEL, key), None) is None:
+            return
+        idx = bisect_left(self.keys, (key, KIND_CHANNEL))
+        self.keys = self.keys[:idx] + self.keys[idx + 1 :]
+        self.display.pop(key, None)
+        for size in range(1, min(len(key), SHORT_PREFIX_LENGTH) + 1):
+            # Something else may move up into the top, so rescan.
+            prefix = key[:size]
+            self._top[prefix] = self._scan(prefix, TOP_SIZE)
+        self._cache.clear()
+
+    def _scan(self, prefix: str, limit: int) -> List[_Rank]:
+        keys = self.keys
+        start = bisect_left(keys, (prefix, ""))
+        ranks = []
+        for idx in range(start, len(keys)):
+            key, kind = keys[idx]
+            if not key.startswith(prefix):
+                break
+            if (kind, key) in self.counts:  # Not removed since keys was read.
+                ranks.append(self._rank(kind, key))
+        return heapq.nsmallest(limit, ranks)
+
+    def suggest(self, prefix: str, limit: int = 10) -> List[Suggestion]:
+        """The `limit` most frequent entries starting with prefix."""
+        prefix = prefix.strip().lower()
+        if not prefix or limit <= 0:
+            return []
+        if len(prefix) <= SHORT_PREFIX_LENGTH and limit <= TOP_SIZE:
+            ranks = self._top.get(prefix, [])[:limit]
+        else:
+            cache_key = (prefix, limit)
+            cached = self._cache.get(cache_key)
+            if cached is not None:
+                return cached
+            ranks = self._scan(prefix, limit)
+        out = [
+            Suggestion(
+                self.display.get(key, key) if kind == KIND_CHANNEL else key,
+                kind,
+                -neg_count,
+            )
+            for neg_count, _, key, kind in ranks
+        ]
+        if len(prefix) > SHORT_PREFIX_LENGTH or limit > TOP_SIZE:
+            if len(self._cache) >= _CACHE_SIZE:
+                self._cache.clear()
+            self._cache[cache_key] = out
+        return out
+
+
+def build_index(
+    channel_counts: Dict[str, int],
+    title_batches: Iterable[List[str]],
+    index: Optional[AutocompleteIndex] = None,
+) -> AutocompleteIndex:
+    """Builds an index from DbSqliteVideo.get_channel_counts/iter_titles."""
+    if index is None:
+        index = AutocompleteIndex()
+    index.load(channel_counts, title_batches)
+    return index
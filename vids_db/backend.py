@@ -0,0 +1,179 @@
+"""
+The storage backend protocol of Database.
+
+Database only talks to its video store through VideoStore, so any engine
+implementing these methods can be plugged in with Database(store=...):
+
+    DbSqliteVideo             one sqlite file, the default.
+    DbSqlitePartitionedVideo  one sqlite file per month.
+    DbMemoryVideo             sorted arrays in memory, optionally
+                              snapshotted to disk.
+
+Dates are filtered inclusively unless a method says otherwise and video
+lists come newest first. Methods that delete or rewrite videos return the
+affected urls or videos so the full text index can follow them.
+"""
+
+# pylint: disable=all
+
+from datetime import datetime, timedelta
+from typing import (
+    Any,
+    Dict,
+    Iterator,
+    List,
+    Literal,
+    Optional,
+    Protocol,
+    Sequence,
+    overload,
+)
+
+from vids_db.columnar import DEFAULT_FIELDS, VideoColumns
+from vids_db.facets import FACETS, FacetCounts
+from vids_db.models import Video, VideoSummary
+from vids_db.near_duplicates import MAX_DISTANCE
+from vids_db.trending import DEFAULT_WINDOW
+
+
+class VideoStore(Protocol):
+    def insert_or_update(self, vids: List[Video]) -> None:
+        ...
+
+    def clear(self) -> None:
+        ...
+
+    def close(self) -> None:
+        ...
+
+    def compact(self, train: bool = True) -> int:
+        ...
+
+    def existing_urls(self, urls: List[str]) -> List[str]:
+        ...
+
+    def get_channel_names(self) -> List[str]:
+        ...
+
+    def get_channel_counts(self) -> Dict[str, int]:
+        ...
+
+    def iter_titles(self, batch_size: int = 5000) -> Iterator[List[str]]:
+        ...
+
+    def iter_videos(self, batch_size: int = 1000) -> Iterator[List[Video]]:
+        ...
+
+    # Overloaded like DbSqliteVideo, summary=True gives VideoSummary lists.
+    @overload
+    def find_videos_by_urls(
+        self, urls: List[str], summary: Literal[False] = ...
+    ) -> List[Video]:
+        ...
+
+    @overload
+    def find_videos_by_urls(
+        self, urls: List[str], summary: Literal[True]
+    ) -> List[VideoSummary]:
+        ...
+
+    @overload
+    def find_videos_by_urls(
+        self, urls: List[str], summary: bool
+    ) -> List[Any]:
+        ...
+
+    @overload
+    def find_videos(
+        self,
+        date_start: datetime,
+        date_end: datetime,
+        channel_name: Optional[str] = None,
+        limit_count: Optional[int] = None,
+        summary: Literal[False] = ...,
+    ) -> List[Video]:
+        ...
+
+    @overload
+    def find_videos(
+        self,
+        date_start: datetime,
+        date_end: datetime,
+        channel_name: Optional[str] = None,
+        limit_count: Optional[int] = None,
+        *,
+        summary: Literal[True],
+    ) -> List[VideoSummary]:
+        ...
+
+    @overload
+    def find_videos(
+        self,
+        date_start: datetime,
+        date_end: datetime,
+        channel_name: Optional[str] = None,
+        limit_count: Optional[int] = None,
+        *,
+        summary: bool,
+    ) -> List[Any]:
+        ...
+
+    def find_near_duplicates(
+        self, vid: Video, max_distance: int = MAX_DISTANCE
+    ) -> List[Video]:
+        ...
+
+    def find_trending(
+        self,
+        limit: int,
+        channel_name: Optional[str] = None,
+        window: timedelta = DEFAULT_WINDOW,
+        now_time: Optional[datetime] = None,
+    ) -> List[Video]:
+        ...
+
+    def refresh_trending(self, now_time: Optional[datetime] = None) -> int:
+        ...
+
+    def remove_by_channel_name(self, channel_name: str) -> List[str]:
+        ...
+
+    def remove_by_urls(self, urls: List[str]) -> List[str]:
+        ...
+
+    def remove_where(
+        self,
+        date_start: Optional[datetime] = None,
+        date_end: Optional[datetime] = None,
+        channel_name: Optional[str] = None,
+        max_views: Optional[int] = None,
+    ) -> List[str]:
+        """Deletes in [date_start, date_end), with at most max_views."""
+        ...
+
+    def update_fields(
+        self, patches: Dict[str, Dict[str, Any]]
+    ) -> List[Video]:
+        ...
+
+    def incremental_vacuum(self, pages_per_step: int = 1000) -> int:
+        ...
+
+    def get_columns(
+        self,
+        fields: Sequence[str] = DEFAULT_FIELDS,
+        date_start: Optional[datetime] = None,
+        date_end: Optional[datetime] = None,
+        channel_name: Optional[str] = None,
+    ) -> VideoColumns:
+        ...
+
+    def get_facets(
+        self,
+        date_start: datetime,
+        date_end: datetime,
+        facets: Sequence[str] = FACETS,
+        limit: Optional[int] = None,
+        urls: Optional[List[str]] = None,
+    ) -> FacetCounts:
+        ...
@@ -0,0 +1,244 @@
+"""
+Streaming bulk export and import of videos.
+
+Two formats are supported:
+
+    ndjson  one Video.to_json() object per line.
+    binary  a magic header, then length prefixed frames. The first frame
+            is the json list of field names, every following frame is a
+            video as a compact json list of values in that order, so keys
+            are not repeated per record.
+
+Either can be wrapped in gzip, bz2 or xz. Files are read and written a
+record at a time, so memory stays constant whatever the corpus size.
+
+Imports can checkpoint the stream offset after each committed batch and
+resume from it after a crash. Rows are written with insert_or_update so
+replaying the batch in flight when the crash happened is harmless.
+"""
+
+# pylint: disable=all
+
+import bz2
+import gzip
+import json
+import lzma
+import os
+import struct
+from typing import (
+    IO,
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
+
+from vids_db.models import Video
+
+FORMAT_NDJSON = "ndjson"
+FORMAT_BINARY = "binary"
+FORMATS = (FORMAT_NDJSON, FORMAT_BINARY)
+
+BINARY_MAGIC = b"VIDSDB\x00\x01"
+_FRAME_HEADER = struct.Struct(">I")
+
+_OPENERS: Dict[str, Callable[..., IO[bytes]]] = {
+    "gzip": gzip.open,  # type: ignore
+    "bz2": bz2.open,  # type: ignore
+    "xz": lzma.open,  # type: ignore
+}
+_COMPRESSION_SUFFIXES = {".gz": "gzip", ".bz2": "bz2", ".xz": "xz"}
+_BINARY_SUFFIXES = (".vdb", ".bin")
+
+
+def detect_format(path: str) -> Tuple[str, Optional[str]]:
+    """Guesses (format, compression) from a path like videos.ndjson.gz"""
+    root, ext = os.path.splitext(path)
+    compression = _COMPRESSION_SUFFIXES.get(ext)
+    if compression is not None:
+        ext = os.path.splitext(root)[1]
+    fmt = FORMAT_BINARY if ext in _BINARY_SUFFIXES else FORMAT_NDJSON
+    return fmt, compression
+
+
+def _open(path: str, mode: str, compression: Optional[str]) -> IO[bytes]:
+    if compression is None:
+        return open(path, mode=mode)  # type: ignore
+    if compression not in _OPENERS:
+        raise ValueError(f"Unknown compression: {compression}")
+    return _OPENERS[compression](path, mode)
+
+
+def _resolve(
+    path: str, fmt: Optional[str], compression: Optional[str]
+) -> Tuple[str, Optional[str]]:
+    detected_fmt, detected_compression = detect_format(path)
+    fmt = fmt or detected_fmt
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format: {fmt}")
+    return fmt, compression or detected_compression
+
+
+def _write_frame(out: IO[bytes], payload: bytes) -> None:
+    out.write(_FRAME_HEADER.pack(len(payload)))
+    out.write(payload)
+
+
+def _read_frame(src: IO[bytes]) -> Optional[bytes]:
+    header = src.read(_FRAME_HEADER.size)
+    if not header:
+        return None
+    if len(header) < _FRAME_HEADER.size:
+        raise ValueError("Truncated frame header")
+    (size,) = _FRAME_HEADER.unpack(header)
+    payload = src.read(size)
+    if len(payload) < size:
+        raise ValueError("Truncated frame")
+    return payload
+
+
+def export_videos(
+    batches: Iterable[List[Video]],
+    path: str,
+    fmt: Optional[str] = None,
+    compression: Optional[str] = None,
+) -> int:
+    """
+    Writes the videos of batches (ie DbSqliteVideo.iter_videos()) to path,
+    returns the number of videos written.
+    """
+    fmt, compression = _resolve(path, fmt, compression)
+    count = 0
+    fields: Optional[List[str]] = None
+    with _open(path, "wb", compression) as out:
+        if fmt == FORMAT_BINARY:
+            out.write(BINARY_MAGIC)
+        for vids in batches:
+            for vid in vids:
+                data = vid.to_json()
+                if fmt == FORMAT_NDJSON:
+                    line = json.dumps(data, ensure_ascii=False)
+                    out.write(line.encode("utf-8") + b"\n")
+                else:
+                    if fields is None:
+                        fields = list(data)
+                        _write_frame(out, json.dumps(fields).encode("utf-8"))
+                    values = [data[field] for field in fields]
+                    payload = json.dumps(
+                        values, ensure_ascii=False, separators=(",", ":")
+                    )
+                    _write_frame(out, payload.encode("utf-8"))
+                count += 1
+    return count
+
+
+def _iter_ndjson(src: IO[bytes]) -> Iterator[Tuple[Dict[str, Any], int]]:
+    offset = src.tell()
+    for line in iter(src.readline, b""):
+        offset += len(line)
+        if line.strip():
+            yield json.loads(line), offset
+
+
+def _iter_binary(
+    src: IO[bytes], offset: int
+) -> Iterator[Tuple[Dict[str, Any], int]]:
+    # The field names frame is needed even when resuming mid stream.
+    if src.read(len(BINARY_MAGIC)) != BINARY_MAGIC:
+        raise ValueError("Not a vids_db binary export")
+    fields_frame = _read_frame(src)
+    if fields_frame is None:
+        return
+    fields = json.loads(fields_frame)
+    if offset > src.tell():
+        src.seek(offset)
+    while True:
+        payload = _read_frame(src)
+        if payload is None:
+            return
+        yield dict(zip(fields, json.loads(payload))), src.tell()
+
+
+def iter_records(
+    path: str,
+    fmt: Optional[str] = None,
+    compression: Optional[str] = None,
+    offset: int = 0,
+) -> Iterator[Tuple[Dict[str, Any], int]]:
+    """
+    Yields (video json, offset) for each record of an export, where offset
+    is the position in the uncompressed stream just after the record.
+    """
+    fmt, compression = _resolve(path, fmt, compression)
+    with _open(path, "rb", compression) as src:
+        if fmt == FORMAT_BINARY:
+            yield from _iter_binary(src, offset)
+            return
+        if offset:
+            # Compressed streams seek forward by decompressing.
+            src.seek(offset)
+        yield from _iter_ndjson(src)
+
+
+def _read_checkpoint(checkpoint_path: str, path: str) -> int:
+    if not os.path.exists(checkpoint_path):
+        return 0
+    with open(checkpoint_path, encoding="utf-8", mode="r") as f:
+        checkpoint = json.load(f)
+    if checkpoint["path"] != os.path.abspath(path):
+        raise ValueError(
+            f"Checkpoint {checkpoint_path} belongs to {checkpoint['path']}"
+        )
+    return checkpoint["offset"]
+
+
+def _write_checkpoint(checkpoint_path: str, path: str, offset: int) -> None:
+    tmp_path = checkpoint_path + ".tmp"
+    with open(tmp_path, encoding="utf-8", mode="w") as f:
+        json.dump({"path": os.path.abspath(path), "offset": offset}, f)
+    os.replace(tmp_path, checkpoint_path)
+
+
+def import_videos(
+    insert: Callable[[List[Video]], None],
+    path: str,
+    fmt: Optional[str] = None,
+    compression: Optional[str] = None,
+    batch_size: int = 1000,
+    checkpoint_path: Optional[str] = None,
+) -> int:
+    """
+    Reads an export and passes the videos to insert (ie
+    Database.update_many) batch_size at a time. Returns the number of
+    videos inserted by this call.
+
+    With a checkpoint_path the import resumes where a previous call left
+    off, the checkpoint is removed once the whole file is imported.
+    Invalid records are skipped, like Video.parse_json does.
+    """
+    offset = 0
+    if checkpoint_path is not None:
+        offset = _read_checkpoint(checkpoint_path, path)
+    count = 0
+    batch: List[Video] = []
+    for data, end_offset in iter_records(path, fmt, compression, offset):
+        try:
+            batch.append(Video(**data))
+        except Exception as err:
+            print(f"{__file__}: Skipping {data.get('url')} because {err}")
+        if len(batch) >= batch_size:
+            insert(batch)
+            count += len(batch)
+            batch = []
+            if checkpoint_path is not None:
+                _write_checkpoint(checkpoint_path, path, end_offset)
+    if batch:
+        insert(batch)
+        count += len(batch)
+    if checkpoint_path is not None and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    return count
@@ -0,0 +1,137 @@
+"""
+Memory compact column oriented result sets for analytics over videos.
+
+Numeric columns are typed array.array buffers (8 bytes per value) and
+string columns are lists of interned strings, so millions of rows cost a
+fraction of the equivalent Video objects. NumPy is optional, when it is
+installed to_numpy() exposes the arrays without copying them.
+"""
+
+# pylint: disable=all
+
+import sys
+from array import array
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Union
+
+from vids_db.trending import now_timestamp
+
+try:
+    import numpy as np  # type: ignore
+except ImportError:  # pragma: no cover
+    np = None  # type: ignore
+
+# Column name -> array typecode, or None for interned string columns.
+COLUMN_TYPES: Dict[str, Optional[str]] = {
+    "timestamp_published": "q",
+    "views": "q",
+    "duration": "d",
+    "channel_name": None,
+    "url": None,
+}
+
+DEFAULT_FIELDS = (
+    "timestamp_published",
+    "views",
+    "duration",
+    "channel_name",
+    "url",
+)
+
+Column = Union[array, List[str]]
+
+
+class VideoColumns:
+    """Column store of a video query, see the module docstring."""
+
+    def __init__(self, fields: Sequence[str] = DEFAULT_FIELDS) -> None:
+        for field in fields:
+            if field not in COLUMN_TYPES:
+                raise ValueError(f"Unknown column: {field}")
+        self.fields = list(fields)
+        self.columns: Dict[str, Column] = {}
+        for field in self.fields:
+            typecode = COLUMN_TYPES[field]
+            self.columns[field] = array(typecode) if typecode else []
+
+    def __len__(self) -> int:
+        if not self.fields:
+            return 0
+        return len(self.columns[self.fields[0]])
+
+    def __getitem__(self, field: str) -> Column:
+        return self.columns[field]
+
+    def numeric(self, field: str) -> array:
+        """Returns a numeric column as a typed array."""
+        column = self.columns[field]
+        if not isinstance(column, array):
+            raise ValueError(f"{field} is not a numeric column")
+        return column
+
+    def append_rows(self, rows: Iterable[Sequence[Any]]) -> None:
+        """
+        Appends rows whose values are ordered like self.fields. NULLs must
+        already be replaced (see DbSqliteVideo.get_columns).
+        """
+        appenders = [
+            (self.columns[field].append, COLUMN_TYPES[field] is None)
+            for field in self.fields
+        ]
+        intern = sys.intern
+        for row in rows:
+            for (append, is_str), val in zip(appenders, row):
+                # Channel names repeat a lot, interning shares one str each.
+                append(intern(val) if is_str else val)
+
+    def extend(self, other: "VideoColumns") -> None:
+        """Appends the rows of another result with the same fields."""
+        if other.fields != self.fields:
+            raise ValueError("Can not extend columns with different fields")
+        for field in self.fields:
+            self.columns[field].extend(other.columns[field])  # type: ignore
+
+    def to_numpy(self) -> Dict[str, Any]:
+        """Returns numpy arrays, the numeric ones share the same memory."""
+        if np is None:
+            raise ImportError("numpy is required for VideoColumns.to_numpy()")
+        out: Dict[str, Any] = {}
+        for field in self.fields:
+            column = self.columns[field]
+            if isinstance(column, array):
+                out[field] = np.frombuffer(column, dtype=column.typecode)
+            else:
+                out[field] = np.array(column, dtype=object)
+        return out
+
+    def age_seconds(self, now_time: Optional[datetime] = None) -> array:
+        """Seconds since publication for every row, vectorized."""
+        now = now_timestamp(now_time)
+        published = self.numeric("timestamp_published")
+        if np is not None:
+            ages = now - np.frombuffer(published, dtype="q")
+            return array("d", ages.tobytes())
+        return array("d", [now - ts for ts in published])
+
+    def view_rate(
+        self, now_time: Optional[datetime] = None, min_age_seconds: float = 3600
+    ) -> array:
+        """
+        Views per hour since publication for every row. Ages are clamped to
+        min_age_seconds so brand new videos do not divide by ~zero.
+        """
+        now = now_timestamp(now_time)
+        published = self.numeric("timestamp_published")
+        views = self.numeric("views")
+        if np is not None:
+            ages = now - np.frombuffer(published, dtype="q")
+            ages = np.maximum(ages, min_age_seconds)
+            rates = np.frombuffer(views, dtype="q") * 3600.0 / ages
+            return array("d", rates.tobytes())
+        return array(
+            "d",
+            [
+                v * 3600.0 / max(now - ts, min_age_seconds)
+                for v, ts in zip(views, published)
+            ],
+        )
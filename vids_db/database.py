@@ -1,100 +1,968 @@
 # pylint: disable=all
+import atexit
 import os
-from datetime import datetime
-from typing import List, Optional
+import threading
+from datetime import datetime, timedelta
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Literal,
+    Optional,
+    Sequence,
+    TypeVar,
+    overload,
+)
 
-from vids_db.db_full_text_search import DbFullTextSearch
-from vids_db.db_sqlite_video import DbSqliteVideo  # type: ignore
-from vids_db.models import Video
+from vids_db import bulk_io, integrity
+from vids_db.autocomplete import AutocompleteIndex, Suggestion, build_index
+from vids_db.columnar import DEFAULT_FIELDS, VideoColumns
+from vids_db.backend import VideoStore
+from vids_db.db_full_text_search import (
+    SORT_RELEVANCE,
+    DbFullTextSearch,
+    SearchFilter,
+)
+from vids_db.db_memory_video import DbMemoryVideo
+from vids_db.db_sqlite_partitioned import DbSqlitePartitionedVideo
+from vids_db.db_sqlite_video import (  # type: ignore
+    Change,
+    DbSqliteVideo,
+    ViewHistory,
+)
+from vids_db.facets import (
+    DEFAULT_CACHE_SIZE as DEFAULT_FACET_CACHE_SIZE,
+    FACETS,
+    FacetCache,
+    FacetCounts,
+    check_facets,
+)
+from vids_db.hot_cache import DEFAULT_MAX_SIZE as DEFAULT_HOT_CACHE_SIZE
+from vids_db.hot_cache import HotCache, HotCacheMetrics
+from vids_db.integrity import IntegrityReport, IntegrityStatus
+from vids_db.models import Video, VideoSummary
+from vids_db.near_duplicates import MAX_DISTANCE, collapse_fetch
+from vids_db.snapshot import current_snapshot, publish_snapshot
+from vids_db.trending import DEFAULT_WINDOW
+from vids_db.write_buffer import BufferMetrics, WriteBuffer
+from vids_db.write_lock import DEFAULT_TIMEOUT, LockMetrics, WriteLock
 
 HERE = os.path.dirname(os.path.abspath(__file__))
 PROJECT_ROOT = os.path.dirname(HERE)
 DB_PATH_DIR = os.path.join(PROJECT_ROOT, "data")
 
+SQLITE_FILE = "videos.sqlite"
+WRITE_LOCK_FILE = "write.lock"
+# Search results counted by get_facets(query_string=...).
+FACET_SEARCH_LIMIT = 10000
+FULL_TEXT_SEARCH_DIR = "full_text_seach"
+
+T = TypeVar("T")
+
 FULL_TEXT_SEARCH_ENABLED = (
     os.environ.get("FULL_TEXT_SEARCH_ENABLED", "0") == "1"
 )
 
 
 class Database:
-    def __init__(self, db_path: Optional[str] = None) -> None:
+    def __init__(
+        self,
+        db_path: Optional[str] = None,
+        partitioned: bool = False,
+        compression: Optional[str] = None,
+        read_only: bool = False,
+        immutable: bool = False,
+        mmap_size: Optional[int] = None,
+        decode_workers: Optional[int] = None,
+        write_buffer_size: Optional[int] = None,
+        write_buffer_delay: float = 1.0,
+        write_lock_timeout: Optional[float] = DEFAULT_TIMEOUT,
+        repair_index: bool = True,
+        views_history: bool = False,
+        search_schema_version: Optional[int] = None,
+        facet_cache_size: int = DEFAULT_FACET_CACHE_SIZE,
+        store: Optional[VideoStore] = None,
+        hot_cache_window: Optional[timedelta] = None,
+        hot_cache_size: int = DEFAULT_HOT_CACHE_SIZE,
+    ) -> None:
+        """
+        read_only never writes to db_path, see DbSqliteVideo for immutable,
+        mmap_size and decode_workers. Query nodes usually use
+        open_snapshot() instead.
+
+        write_buffer_size turns on write-behind: update() and update_many()
+        collect videos in memory, last write per url wins, and write them
+        in one batch once write_buffer_size are pending or the oldest has
+        waited write_buffer_delay seconds. Reads see the pending videos.
+        Use flush(), close() or the instance as a context manager to write
+        them out, pending videos are also written at interpreter exit.
+
+        Writes from every process sharing db_path are serialized by a
+        WriteLock (see write_lock.py) that waits up to write_lock_timeout
+        seconds, None waits forever.
+
+        On open the full text index is checked against sqlite (see
+        integrity.py), with repair_index a diverged index is repaired.
+        search_schema_version picks the full text index schema, 2 is the
+        lean one (see db_full_text_search.py). An index of another version
+        is rebuilt from sqlite on open, None keeps the existing index.
+
+        get_facets() keeps the counts of facet_cache_size windows until the
+        next write, 0 turns the cache off.
+
+        views_history records the views of every write over time, see
+        get_view_velocity().
+
+        store replaces the sqlite files with another storage backend (see
+        backend.py), ie DbMemoryVideo(). db_path then only holds the full
+        text index and the write lock.
+
+        hot_cache_window keeps the videos published within it decoded in
+        memory, at most hot_cache_size of them, and answers get_video_list()
+        windows inside it from there, see hot_cache.py. It is filled on
+        open, ie timedelta(hours=72). Writes of other processes show up in
+        it within a second.
+
+        """
         db_path = db_path or DB_PATH_DIR
-        os.makedirs(db_path, exist_ok=True)
+        read_only = read_only or immutable
+        if read_only and partitioned:
+            raise ValueError("read_only is not supported with partitioned=True")
+        if store is not None and (read_only or partitioned):
+            raise ValueError(
+                "store is not supported with read_only or partitioned"
+            )
+        if read_only and write_buffer_size is not None:
+            raise ValueError(
+                "write_buffer_size is not supported with read_only"
+            )
+        if not read_only:
+            os.makedirs(db_path, exist_ok=True)
         self.db_path = db_path
-        db_path_sqlite = os.path.join(db_path, "videos.sqlite")
+        self.read_only = read_only
+        db_path_sqlite = os.path.join(db_path, SQLITE_FILE)
         # Old database.
-        if os.path.exists(os.path.join(db_path, "videos2.sqlite")):
+        if not read_only and os.path.exists(
+            os.path.join(db_path, "videos2.sqlite")
+        ):
             os.remove(os.path.join(db_path, "videos2.sqlite"))
         self.db_full_text_search = None
         full_text_enabled = (
             os.environ.get("FULL_TEXT_SEARCH_ENABLED", "0") == "1"
         )
-        if full_text_enabled:
-            db_path_fts = os.path.join(db_path, "full_text_seach")
-            self.db_full_text_search = DbFullTextSearch(db_path_fts)
-        self.db_sqlite = DbSqliteVideo(db_path_sqlite)
+        db_path_fts = os.path.join(db_path, FULL_TEXT_SEARCH_DIR)
+        if full_text_enabled and read_only:
+            # Snapshots published without an index have no full text search.
+            if os.path.isdir(db_path_fts):
+                self.db_full_text_search = DbFullTextSearch(
+                    db_path_fts, read_only=True
+                )
+        elif full_text_enabled:
+            self.db_full_text_search = DbFullTextSearch(
+                db_path_fts, schema_version=search_schema_version
+            )
+        self.autocomplete: Optional[AutocompleteIndex] = None
+        self._autocomplete_lock = threading.Lock()
+        self.db_sqlite: VideoStore
+        if store is not None:
+            self.db_sqlite = store
+        elif read_only:
+            self.db_sqlite = DbSqliteVideo(
+                db_path_sqlite,
+                compression=compression,
+                read_only=True,
+                immutable=immutable,
+                mmap_size=mmap_size,
+                decode_workers=decode_workers,
+            )
+        elif partitioned:
+            # One sqlite file per month, see db_sqlite_partitioned.py
+            db_path_partitions = os.path.join(db_path, "partitions")
+            self.db_sqlite = DbSqlitePartitionedVideo(
+                db_path_partitions, compression=compression
+            )
+        else:
+            self.db_sqlite = DbSqliteVideo(
+                db_path_sqlite,
+                compression=compression,
+                mmap_size=mmap_size,
+                decode_workers=decode_workers,
+                views_history=views_history,
+            )
+        self.facet_cache = FacetCache(facet_cache_size)
+        self.write_lock: Optional[WriteLock] = None
+        if not read_only:
+            self.write_lock = WriteLock(
+                os.path.join(db_path, WRITE_LOCK_FILE),
+                timeout=write_lock_timeout,
+            )
+        self.write_buffer: Optional[WriteBuffer] = None
+        if write_buffer_size is not None:
+            self.write_buffer = WriteBuffer(
+                self._write_many,
+                max_size=write_buffer_size,
+                max_delay=write_buffer_delay,
+            )
+            atexit.register(self.write_buffer.close)
+        self.hot_cache: Optional[HotCache] = None
+        if not read_only and self.db_full_text_search:
+            # Under the lock, another process may be between its sqlite and
+            # index writes.
+            self._write(lambda: self._check_on_open(db_path, repair_index))
+        if hot_cache_window is not None:
+            self.hot_cache = HotCache(hot_cache_window, hot_cache_size)
+            seq = None
+            if isinstance(self.db_sqlite, DbSqliteVideo):
+                # Commits after this are caught up.
+                self.hot_cache.changed(self.db_sqlite)
+                seq = self.db_sqlite.current_change_seq()
+            self.hot_cache.load(self.db_sqlite, seq)
+
+    def __enter__(self) -> "Database":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    @classmethod
+    def open_snapshot(
+        cls,
+        snapshot_root: str,
+        mmap_size: Optional[int] = None,
+        decode_workers: Optional[int] = None,
+    ) -> "Database":
+        """
+        Opens the CURRENT snapshot of snapshot_root read only and immutable.
+        Query nodes poll current_snapshot() and open the new one when it
+        changes, then close() the old instance.
+        """
+        path = current_snapshot(snapshot_root)
+        if path is None:
+            raise OSError(f"No snapshot published in {snapshot_root}")
+        return cls(
+            path,
+            immutable=True,
+            mmap_size=mmap_size,
+            decode_workers=decode_workers,
+        )
+
+    def publish_snapshot(self, snapshot_root: str, keep: int = 2) -> str:
+        """
+        Publishes a consistent copy of the database (and full text index)
+        under snapshot_root, see snapshot.py. Returns the snapshot path.
+        """
+        db_sqlite = self._require_single_file("Snapshots")
+        self.flush()
+        db_full_text_search = self.db_full_text_search
+
+        def build(path: str) -> None:
+            db_sqlite.backup_to(os.path.join(path, SQLITE_FILE))
+            if db_full_text_search:
+                db_full_text_search.copy_to(
+                    os.path.join(path, FULL_TEXT_SEARCH_DIR)
+                )
+
+        return publish_snapshot(snapshot_root, build, keep=keep)
+
+    def flush(self) -> int:
+        """Writes the buffered videos, returns how many were written."""
+        if self.write_buffer is None:
+            return 0
+        return self.write_buffer.flush()
+
+    def buffer_metrics(self) -> Optional[BufferMetrics]:
+        """Depth and flush latency of the write buffer, None without one."""
+        if self.write_buffer is None:
+            return None
+        return self.write_buffer.metrics()
+
+    def _flush_for_read(self) -> None:
+        # Reads that can't overlay the buffer on their results.
+        if self.write_buffer is not None and len(self.write_buffer):
+            self.write_buffer.flush()
+
+    def close(self) -> None:
+        if self.write_buffer is not None:
+            self.write_buffer.close()
+            atexit.unregister(self.write_buffer.close)
+        self.db_sqlite.close()
+        if self.hot_cache is not None:
+            self.hot_cache.close()
+        if self.write_lock is not None:
+            self.write_lock.close()
+
+    def _write(self, fn: Callable[[], T]) -> T:
+        if self.write_lock is None:
+            return fn()  # Read only, fn raises.
+        return self.write_lock.run(lambda: self._write_locked(fn))
+
+    def _write_locked(self, fn: Callable[[], T]) -> T:
+        # Other processes can't write until fn returns, so once caught up
+        # the only new changes are the ones fn applied to the hot cache.
+        self._catch_up_hot_cache()
+        out = fn()
+        self._catch_up_hot_cache(own_writes=True)
+        return out
+
+    def _catch_up_hot_cache(self, own_writes: bool = False) -> None:
+        if self.hot_cache is not None and isinstance(
+            self.db_sqlite, DbSqliteVideo
+        ):
+            self.hot_cache.catch_up(self.db_sqlite, own_writes)
+
+    def hot_cache_metrics(self) -> Optional[HotCacheMetrics]:
+        """Size and hit counts of the hot cache, None without one."""
+        if self.hot_cache is None:
+            return None
+        return self.hot_cache.metrics()
+
+    def lock_metrics(self) -> Optional[LockMetrics]:
+        """Wait times of the cross process write lock, None if read only."""
+        if self.write_lock is None:
+            return None
+        return self.write_lock.metrics()
 
     def clear(self) -> None:
+        if self.write_buffer is not None:
+            self.write_buffer.discard(lambda vid: True)
+        self._write(self._clear)
+        self.autocomplete = None
+
+    def _clear(self) -> None:
         self.db_sqlite.clear()
+        if self.hot_cache is not None:
+            self.hot_cache.clear()
         if self.db_full_text_search:
             self.db_full_text_search.clear()
+            self._mark_index_generation()
+
+    def compact(self, train: bool = True) -> int:
+        """Rewrites stored rows in the configured payload compression."""
+        self._flush_for_read()
+        return self._write(lambda: self.db_sqlite.compact(train=train))
 
     def update_many(self, vids: List[Video]) -> None:  # type: ignore
+        if self.write_buffer is not None:
+            self.write_buffer.add(vids)
+        else:
+            self._write_many(vids)
+
+    def _write_many(self, vids: List[Video]) -> None:
+        self._write(lambda: self._insert_many(vids))
+
+    def _insert_many(self, vids: List[Video]) -> None:
+        autocomplete = self.autocomplete
+        new_vids: List[Video] = []
+        if autocomplete is not None:
+            # Re-scraped videos are already counted.
+            urls = [vid.url for vid in vids]
+            existing = set(self.db_sqlite.existing_urls(urls))
+            new_vids = [vid for vid in vids if vid.url not in existing]
         self.db_sqlite.insert_or_update(vids)
+        if self.hot_cache is not None:
+            self.hot_cache.add(vids)
         if self.db_full_text_search:
             self.db_full_text_search.add_videos(vids)
+            self._mark_index_generation()
+        if autocomplete is not None:
+            autocomplete.add_videos(new_vids)
 
     def update(self, vid: Video) -> None:
         self.update_many([vid])
 
     def get_channel_names(self) -> List[str]:
-        return self.db_sqlite.get_channel_names()
+        names = self.db_sqlite.get_channel_names()
+        if self.write_buffer is not None:
+            known = set(names)
+            for vid in self.write_buffer.pending().values():
+                if vid.channel_name not in known:
+                    known.add(vid.channel_name)
+                    names.append(vid.channel_name)
+        return names
 
-    def get_by_urls(self, urls: List[str]) -> List[Video]:
-        return self.db_sqlite.find_videos_by_urls(urls)
+    @overload
+    def get_by_urls(
+        self, urls: List[str], summary: Literal[False] = ...
+    ) -> List[Video]:
+        ...
+
+    @overload
+    def get_by_urls(
+        self, urls: List[str], summary: Literal[True]
+    ) -> List[VideoSummary]:
+        ...
+
+    @overload
+    def get_by_urls(self, urls: List[str], summary: bool) -> List[Any]:
+        ...
+
+    def get_by_urls(self, urls: List[str], summary: bool = False) -> List[Any]:
+        pending = self._pending()
+        if not pending:
+            return self.db_sqlite.find_videos_by_urls(urls, summary=summary)
+        out: List[Any] = self.db_sqlite.find_videos_by_urls(
+            [url for url in urls if url not in pending], summary=summary
+        )
+        buffered = [
+            pending[url] for url in dict.fromkeys(urls) if url in pending
+        ]
+        out.extend(VideoSummary.from_videos(buffered) if summary else buffered)
+        return out
+
+    def _pending(self) -> Dict[str, Video]:
+        if self.write_buffer is None:
+            return {}
+        return self.write_buffer.pending()
+
+    def remove_by_channel_name(
+        self, channel_name: str, vacuum: bool = True
+    ) -> int:
+        """Deletes every video of the channel, returns how many."""
+        self._flush_for_read()
+        count = self._remove(
+            lambda: self.db_sqlite.remove_by_channel_name(channel_name), vacuum
+        )
+        if self.autocomplete is not None:
+            self.autocomplete.remove_channel(channel_name)
+        return count
+
+    def remove_by_urls(self, urls: List[str], vacuum: bool = True) -> int:
+        """Deletes the videos (takedowns), returns how many were stored."""
+        self._flush_for_read()
+        count = self._remove(
+            lambda: self.db_sqlite.remove_by_urls(urls), vacuum
+        )
+        self._reset_autocomplete(count)
+        return count
+
+    def remove_older_than(
+        self,
+        date: datetime,
+        channel_name: Optional[str] = None,
+        vacuum: bool = True,
+    ) -> int:
+        """Deletes the videos published before date, returns how many."""
+        return self.remove_where(
+            date_end=date, channel_name=channel_name, vacuum=vacuum
+        )
+
+    def remove_where(
+        self,
+        date_start: Optional[datetime] = None,
+        date_end: Optional[datetime] = None,
+        channel_name: Optional[str] = None,
+        max_views: Optional[int] = None,
+        vacuum: bool = True,
+    ) -> int:
+        """
+        Deletes the videos matching every given filter, published in
+        [date_start, date_end), of the channel, with at most max_views
+        views. Returns how many were deleted.
+        """
+        self._flush_for_read()
+        count = self._remove(
+            lambda: self.db_sqlite.remove_where(
+                date_start, date_end, channel_name, max_views
+            ),
+            vacuum,
+        )
+        self._reset_autocomplete(count)
+        return count
+
+    def _remove(self, remove: Callable[[], List[str]], vacuum: bool) -> int:
+        """
+        Runs a chunked sqlite delete and removes the deleted urls from the
+        full text index, then returns the free pages with vacuum.
+        """
+
+        def run() -> List[str]:
+            urls = remove()
+            if self.hot_cache is not None:
+                self.hot_cache.remove(urls)
+            if self.db_full_text_search and urls:
+                self.db_full_text_search.remove_videos(urls)
+                self._mark_index_generation()
+            return urls
+
+        urls = self._write(run)
+        if vacuum and urls:
+            self.incremental_vacuum()
+        return len(urls)
+
+    def _reset_autocomplete(self, count: int) -> None:
+        # Word counts can not be taken back, rebuilt on the next suggest().
+        if count:
+            self.autocomplete = None
 
-    def remove_by_channel_name(self, channel_name: str) -> None:
-        self.db_sqlite.remove_by_channel_name(channel_name)
+    def update_fields(self, patches: Dict[str, Dict[str, Any]]) -> int:
+        """
+        Sets fields of many stored videos at once, {url: {field: value}},
+        ie {url: {"views": 10}}. Returns how many videos were updated.
+        """
+        self._flush_for_read()
+
+        def run() -> List[Video]:
+            vids = self.db_sqlite.update_fields(patches)
+            if self.hot_cache is not None:
+                self.hot_cache.add(vids)
+            if self.db_full_text_search and vids:
+                self.db_full_text_search.add_videos(vids)
+                self._mark_index_generation()
+            return vids
+
+        vids = self._write(run)
+        if any(
+            "title" in patch or "channel_name" in patch
+            for patch in patches.values()
+        ):
+            self._reset_autocomplete(len(vids))
+        return len(vids)
+
+    def incremental_vacuum(self, pages_per_step: int = 1000) -> int:
+        """
+        Returns the pages freed by deletes to the file system in short
+        steps, without the long lock of a full VACUUM. Returns the number
+        of pages freed.
+        """
+        return self._write(
+            lambda: self.db_sqlite.incremental_vacuum(pages_per_step)
+        )
 
+    def suggest(self, prefix: str, limit: int = 10) -> List[Suggestion]:
+        """
+        Channel names and title words starting with prefix, most frequent
+        first, for suggest-as-you-type. The in memory index is built on the
+        first call and kept up to date by update_many().
+        """
+        with self._autocomplete_lock:
+            if self.autocomplete is None:
+                self._flush_for_read()
+                self.autocomplete = build_index(
+                    self.db_sqlite.get_channel_counts(),
+                    self.db_sqlite.iter_titles(),
+                )
+            autocomplete = self.autocomplete
+        return autocomplete.suggest(prefix, limit)
+
+    def apply_retention(
+        self, keep_months: int, archive: bool = True
+    ) -> List[str]:
+        """Archives or drops month partitions older than keep_months."""
+        if not isinstance(self.db_sqlite, DbSqlitePartitionedVideo):
+            raise ValueError("Retention requires Database(partitioned=True)")
+        db_sqlite = self.db_sqlite
+        return self._write(
+            lambda: db_sqlite.apply_retention(keep_months, archive=archive)
+        )
+
+    @overload
     def get_video_list(
         self,
         date_start: datetime,
         date_end: datetime,
         channel_name: Optional[str] = None,
         limit: Optional[int] = None,
+        summary: Literal[False] = ...,
+        collapse_duplicates: bool = False,
     ) -> List[Video]:
-        vid_list: List[Video] = self.db_sqlite.find_videos(
-            date_start, date_end, channel_name=channel_name, limit_count=limit
+        ...
+
+    @overload
+    def get_video_list(
+        self,
+        date_start: datetime,
+        date_end: datetime,
+        channel_name: Optional[str] = None,
+        limit: Optional[int] = None,
+        *,
+        summary: Literal[True],
+        collapse_duplicates: bool = False,
+    ) -> List[VideoSummary]:
+        ...
+
+    @overload
+    def get_video_list(
+        self,
+        date_start: datetime,
+        date_end: datetime,
+        channel_name: Optional[str] = None,
+        limit: Optional[int] = None,
+        *,
+        summary: bool,
+        collapse_duplicates: bool = False,
+    ) -> List[Any]:
+        ...
+
+    def get_video_list(
+        self,
+        date_start: datetime,
+        date_end: datetime,
+        channel_name: Optional[str] = None,
+        limit: Optional[int] = None,
+        summary: bool = False,
+        collapse_duplicates: bool = False,
+    ) -> List[Any]:
+        """
+        Videos published in the date range, newest first. summary=True
+        returns VideoSummary objects which skip the description and
+        iframe_src fields, use get_by_urls to load the full videos.
+        collapse_duplicates=True only keeps the newest of every group of
+        near duplicates (re-uploads), see near_duplicates.py.
+        """
+        if collapse_duplicates:
+            return collapse_fetch(
+                lambda count: self._get_video_list(
+                    date_start, date_end, channel_name, count, summary
+                ),
+                limit,
+            )
+        return self._get_video_list(
+            date_start, date_end, channel_name, limit, summary
+        )
+
+    def _get_video_list(
+        self,
+        date_start: datetime,
+        date_end: datetime,
+        channel_name: Optional[str],
+        limit: Optional[int],
+        summary: bool,
+    ) -> List[Any]:
+        pending = self._pending()
+        # Buffered updates may replace some of the stored rows.
+        limit_count = None if limit is None else limit + len(pending)
+        vid_list: Optional[List[Any]] = None
+        if self.hot_cache is not None:
+            if isinstance(self.db_sqlite, DbSqliteVideo):
+                # Writes of other processes.
+                self.hot_cache.poll(self.db_sqlite)
+            vid_list = self.hot_cache.find_videos(
+                date_start, date_end, channel_name, limit_count, summary
+            )
+        if vid_list is None:
+            vid_list = self.db_sqlite.find_videos(
+                date_start,
+                date_end,
+                channel_name=channel_name,
+                limit_count=limit_count,
+                summary=summary,
+            )
+        if not pending:
+            return vid_list
+        from_time = int(date_start.timestamp())
+        to_time = int(date_end.timestamp())
+        buffered = [
+            vid
+            for vid in pending.values()
+            if from_time <= int(vid.date_published.timestamp()) <= to_time
+            and (channel_name is None or vid.channel_name == channel_name)
+        ]
+        vid_list = [vid for vid in vid_list if vid.url not in pending]
+        vid_list.extend(VideoSummary.from_videos(buffered) if summary else buffered)
+        vid_list.sort(key=lambda vid: vid.date_published, reverse=True)
+        return vid_list[:limit] if limit is not None else vid_list
+
+    def get_facets(
+        self,
+        date_start: datetime,
+        date_end: datetime,
+        facets: Sequence[str] = FACETS,
+        limit: Optional[int] = None,
+        query_string: Optional[str] = None,
+    ) -> FacetCounts:
+        """
+        Video counts per source, duration bucket and channel_name in the
+        date range, {facet: {value: count}} with the limit highest counts
+        per facet, see facets.py. With query_string only the full text
+        search results in the range are counted. Cached until the next
+        write.
+        """
+        check_facets(facets)
+        self._flush_for_read()
+        key = (
+            int(date_start.timestamp()),
+            int(date_end.timestamp()),
+            tuple(facets),
+            limit,
+            query_string,
+        )
+        # Partitioned databases have no generation to cache on.
+        generation = self.write_generation()
+        if generation is not None:
+            cached = self.facet_cache.get(key, generation)
+            if cached is not None:
+                return cached
+        urls: Optional[List[str]] = None
+        if query_string is not None:
+            if not self.db_full_text_search:
+                return {facet: {} for facet in facets}
+            found = self.db_full_text_search.search(
+                query_string,
+                FACET_SEARCH_LIMIT,
+                search_filter=SearchFilter(date_start, date_end),
+            )
+            urls = [v["url"] for v in found]
+        counts = self.db_sqlite.get_facets(
+            date_start, date_end, facets, limit, urls
+        )
+        if generation is not None:
+            self.facet_cache.put(key, generation, counts)
+        return counts
+
+    def find_near_duplicates(
+        self, vid: Video, max_distance: int = MAX_DISTANCE
+    ) -> List[Video]:
+        """
+        Stored videos that look like re-uploads of vid: a similar title,
+        at most max_distance signature bits apart, and the same duration.
+        """
+        self._flush_for_read()
+        return self.db_sqlite.find_near_duplicates(vid, max_distance)
+
+    def get_view_history(self, url: str) -> ViewHistory:
+        """(timestamp, views) samples of a video as int64 arrays."""
+        self._flush_for_read()
+        db_sqlite = self._require_single_file("Views history")
+        return db_sqlite.get_view_history(url)
+
+    def get_view_velocity(
+        self, urls: List[str], window: timedelta = timedelta(hours=24)
+    ) -> Dict[str, float]:
+        """Views gained per hour over the window, by url."""
+        self._flush_for_read()
+        db_sqlite = self._require_single_file("Views history")
+        return db_sqlite.get_view_velocity(urls, window)
+
+    def downsample_view_history(
+        self,
+        older_than: timedelta = timedelta(days=7),
+        interval: timedelta = timedelta(days=1),
+    ) -> int:
+        """
+        Keeps one sample per video and interval for samples older than
+        older_than, run periodically. Returns the samples dropped.
+        """
+        db_sqlite = self._require_single_file("Views history")
+        return self._write(
+            lambda: db_sqlite.downsample_view_history(older_than, interval)
+        )
+
+    def get_trending(
+        self,
+        limit: int,
+        channel_name: Optional[str] = None,
+        window: timedelta = DEFAULT_WINDOW,
+    ) -> List[Video]:
+        """
+        Top videos by trending score (see trending.py) within window, at
+        most TRENDING_MAX_WINDOW.
+        """
+        self._flush_for_read()
+        return self.db_sqlite.find_trending(
+            limit, channel_name=channel_name, window=window
+        )
+
+    def refresh_trending(self) -> int:
+        """Time decay batch job for the trending scores, run periodically."""
+        self._flush_for_read()
+        return self._write(self.db_sqlite.refresh_trending)
+
+    def export_videos(
+        self,
+        path: str,
+        fmt: Optional[str] = None,
+        compression: Optional[str] = None,
+    ) -> int:
+        """
+        Streams every video to an ndjson or binary file, optionally
+        compressed, see bulk_io.py. Format and compression default to the
+        file extension, ie videos.ndjson.gz
+        """
+        self._flush_for_read()
+        return bulk_io.export_videos(
+            self.db_sqlite.iter_videos(), path, fmt, compression
+        )
+
+    def import_videos(
+        self,
+        path: str,
+        fmt: Optional[str] = None,
+        compression: Optional[str] = None,
+        batch_size: int = 1000,
+        checkpoint_path: Optional[str] = None,
+    ) -> int:
+        """Loads an export_videos() file, resumable with a checkpoint_path."""
+
+        def insert(vids: List[Video]) -> None:
+            self.update_many(vids)
+            # The checkpoint written next must only cover stored batches.
+            if self.write_buffer is not None:
+                self.write_buffer.flush()
+
+        return bulk_io.import_videos(
+            insert,
+            path,
+            fmt,
+            compression,
+            batch_size=batch_size,
+            checkpoint_path=checkpoint_path,
+        )
+
+    def _require_single_file(self, feature: str) -> DbSqliteVideo:
+        if not isinstance(self.db_sqlite, DbSqliteVideo):
+            raise ValueError(
+                f"{feature} is only supported by the single file sqlite store"
+            )
+        return self.db_sqlite
+
+    def _check_on_open(self, db_path: str, repair_index: bool) -> None:
+        db_full_text_search = self.db_full_text_search
+        if db_full_text_search and db_full_text_search.migrated:
+            # Recreated empty with the new schema, every video is indexed.
+            for vids in self.db_sqlite.iter_videos(integrity.BATCH_SIZE):
+                db_full_text_search.add_videos(vids)
+            self._mark_index_generation()
+            db_full_text_search.migrated = False
+            return
+        status = self.check_integrity()
+        if status is None or status.in_sync:
+            return
+        print(
+            f"{db_path}: full text index is at generation"
+            f" {status.index_generation}, sqlite at"
+            f" {status.sqlite_generation}"
+        )
+        if repair_index:
+            self.repair()
+
+    def _mark_index_generation(self) -> None:
+        # Partitioned databases have no change sequence to compare with.
+        if self.db_full_text_search and isinstance(
+            self.db_sqlite, DbSqliteVideo
+        ):
+            self.db_full_text_search.set_generation(
+                self.db_sqlite.current_change_seq()
+            )
+
+    def check_integrity(self) -> Optional[IntegrityStatus]:
+        """
+        O(1) check of the full text index against sqlite, None without an
+        index or with partitioned=True.
+        """
+        if not self.db_full_text_search or not isinstance(
+            self.db_sqlite, DbSqliteVideo
+        ):
+            return None
+        return integrity.check(self.db_sqlite, self.db_full_text_search)
+
+    def repair(self, full: bool = False) -> int:
+        """
+        Re-indexes only what changed since the index generation, or
+        everything that differs with full=True. Returns the number of urls
+        re-indexed or removed.
+        """
+        db_sqlite = self._require_single_file("Index repair")
+        db_full_text_search = self.db_full_text_search
+        if not db_full_text_search:
+            return 0
+        self._flush_for_read()
+        return self._write(
+            lambda: integrity.repair(db_sqlite, db_full_text_search, full=full)
+        )
+
+    def verify(self) -> IntegrityReport:
+        """Streams both stores and reports every difference."""
+        db_sqlite = self._require_single_file("Index verification")
+        if not self.db_full_text_search:
+            return IntegrityReport([], [], [])
+        self._flush_for_read()
+        return integrity.verify(db_sqlite, self.db_full_text_search)
+
+    def write_generation(self) -> Optional[str]:
+        """
+        Changes whenever a write becomes visible to reads, from any
+        process, None with partitioned=True. Used for http ETags.
+        """
+        if not isinstance(self.db_sqlite, (DbSqliteVideo, DbMemoryVideo)):
+            return None
+        seq = self.db_sqlite.current_change_seq()
+        if (
+            self.hot_cache is not None
+            and isinstance(self.db_sqlite, DbSqliteVideo)
+            and seq != self.hot_cache.seq
+        ):
+            # Reads answered from the cache must be as new as the generation,
+            # not up to poll_interval older.
+            self.hot_cache.catch_up(self.db_sqlite, force=True)
+        generation = str(seq)
+        if self.write_buffer is not None:
+            generation += f"-{self.write_buffer.metrics().added}"
+        return generation
+
+    def current_change_seq(self) -> int:
+        """Sequence number of the latest change, the starting cursor."""
+        self._flush_for_read()
+        return self._require_single_file("Change feed").current_change_seq()
+
+    def changes_since(self, seq: int, limit: int = 1000) -> List[Change]:
+        """
+        Changes (updates and deletion tombstones) after the cursor `seq`,
+        in order. Replicas store the seq of the last change they applied.
+        """
+        db_sqlite = self._require_single_file("Change feed")
+        self._flush_for_read()
+        return db_sqlite.changes_since(seq, limit)
+
+    def iter_changes_since(
+        self, seq: int, batch_size: int = 1000
+    ) -> Iterator[List[Change]]:
+        db_sqlite = self._require_single_file("Change feed")
+        self._flush_for_read()
+        return db_sqlite.iter_changes_since(seq, batch_size)
+
+    def get_columns(
+        self,
+        fields: Sequence[str] = DEFAULT_FIELDS,
+        date_start: Optional[datetime] = None,
+        date_end: Optional[datetime] = None,
+        channel_name: Optional[str] = None,
+    ) -> VideoColumns:
+        """Column oriented export for analytics, see vids_db.columnar."""
+        self._flush_for_read()
+        return self.db_sqlite.get_columns(
+            fields, date_start, date_end, channel_name=channel_name
         )
-        return vid_list
 
     def query_video_list(
         self,
         query_string: str,
         limit: Optional[int] = None,
+        date_start: Optional[datetime] = None,
+        date_end: Optional[datetime] = None,
+        min_views: Optional[int] = None,
+        channel_name: Optional[str] = None,
+        sort: str = SORT_RELEVANCE,
     ) -> List[Video]:
+        """
+        Full text search of channel names and titles. The filters are
+        applied inside the index, sort is one of "relevance", "newest" or
+        "most_viewed".
+        """
         if not self.db_full_text_search:
             return []
-        options = {}
-        if limit is not None:
-            options["limit"] = limit
-        vids0: List[dict] = self.db_full_text_search.channel_search(
-            query_string, **options
-        )
-        vids1: List[dict] = self.db_full_text_search.title_search(
-            query_string, **options
-        )
-        vid_list = vids0 + vids1
-        found_urls = set()
-        filtered_vids = []
-        for vid in vid_list:
-            if vid["url"] in found_urls:
-                continue
-            found_urls.add(vid["url"])
-            filtered_vids.append(vid)
-        if limit is not None:
-            filtered_vids = filtered_vids[:limit]
-
-        urls = [v["url"] for v in filtered_vids]
-        vids = self.db_sqlite.find_videos_by_urls(urls)
+        # The index only knows about written videos.
+        self._flush_for_read()
+        search_filter = SearchFilter(
+            date_start, date_end, min_views, channel_name
+        )
+        found = self.db_full_text_search.search(
+            query_string, limit, search_filter=search_filter, sort=sort
+        )
+        urls = [v["url"] for v in found]
+        vids = self.get_by_urls(urls)
+        # Back in search order.
+        order = {url: i for i, url in enumerate(urls)}
+        vids.sort(key=lambda vid: order[vid.url])
         return vids
@@ -3,16 +3,29 @@
 """
 
 import os
+import shutil
 from datetime import datetime
-from typing import List
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional
 
 import pytz  # type: ignore
 from whoosh import fields  # type: ignore
-from whoosh.analysis import FancyAnalyzer  # type: ignore
+from whoosh.analysis import (  # type: ignore
+    FancyAnalyzer,
+    LowercaseFilter,
+    RegexTokenizer,
+)
 from whoosh.compat import u  # type: ignore
 from whoosh.filedb.filestore import FileStorage  # type: ignore
 from whoosh.qparser import QueryParser  # type: ignore
 from whoosh.qparser.dateparse import DateParserPlugin  # type: ignore
+from whoosh.query import (  # type: ignore
+    And,
+    DateRange,
+    NumericRange,
+    Prefix,
+    Query,
+    Term,
+)
 
 from vids_db.models import Video
 
@@ -29,6 +42,116 @@ SCHEMA = fields.Schema(
     views=fields.NUMERIC(stored=True, sortable=True, bits=64),
 )
 
+# Lean schema: only the url is stored, the videos are loaded from sqlite
+# anyway. Titles are indexed as plain lower case words with positions
+# instead of ngrams, search terms match as word prefixes and quoted
+# phrases match in order. channel is the exact name for filtering.
+SCHEMA_V2 = fields.Schema(
+    url=fields.ID(stored=True, unique=True),
+    channel_name=fields.TEXT(analyzer=FancyAnalyzer()),
+    channel=fields.ID(),
+    date=fields.DATETIME(sortable=True),
+    title=fields.TEXT(
+        analyzer=RegexTokenizer() | LowercaseFilter(), phrase=True
+    ),
+    views=fields.NUMERIC(sortable=True, bits=64),
+)
+
+SCHEMAS = {1: SCHEMA, 2: SCHEMA_V2}
+DEFAULT_SCHEMA_VERSION = 1
+LATEST_SCHEMA_VERSION = max(SCHEMAS)
+# Schema version of the index, missing for indexes from before SCHEMA_V2.
+SCHEMA_VERSION_FILE = "SCHEMA_VERSION"
+
+# Change sequence number of the sqlite database the index is in sync
+# with, see integrity.py.
+GENERATION_FILE = "GENERATION"
+
+SORT_RELEVANCE = "relevance"
+SORT_NEWEST = "newest"
+SORT_MOST_VIEWED = "most_viewed"
+SORTS = (SORT_RELEVANCE, SORT_NEWEST, SORT_MOST_VIEWED)
+# Sortable schema columns behind each sort.
+SORT_FIELDS = {SORT_NEWEST: "date", SORT_MOST_VIEWED: "views"}
+
+
+def _to_utc(date: Optional[datetime]) -> Optional[datetime]:
+    if date is None or date.tzinfo is None:
+        return date
+    return date.astimezone(pytz.utc)
+
+
+class SearchFilter(NamedTuple):
+    """Restricts a search to matching videos, all fields are optional."""
+
+    date_start: Optional[datetime] = None
+    date_end: Optional[datetime] = None
+    min_views: Optional[int] = None
+    channel_name: Optional[str] = None
+
+    def to_query(self, schema_version: int = 1) -> Optional[Query]:
+        """The filter as a whoosh query, None when it filters nothing."""
+        terms = []
+        if self.date_start is not None or self.date_end is not None:
+            terms.append(
+                DateRange(
+                    "date", _to_utc(self.date_start), _to_utc(self.date_end)
+                )
+            )
+        if self.min_views is not None:
+            terms.append(NumericRange("views", self.min_views, None))
+        if self.channel_name is not None and schema_version > 1:
+            terms.append(Term("channel", self.channel_name))
+        elif self.channel_name is not None:
+            # channel_name is analyzed, every word of the name must match
+            # and the exact name is checked on the results.
+            analyzer = SCHEMA["channel_name"].analyzer
+            for token in analyzer(self.channel_name):
+                terms.append(Term("channel_name", token.text))
+        if not terms:
+            return None
+        return terms[0] if len(terms) == 1 else And(terms)
+
+
+def _search_options(
+    search_filter: Optional[SearchFilter], sort: str, schema_version: int
+) -> Dict[str, Any]:
+    if sort not in SORTS:
+        raise ValueError(f"Unknown sort: {sort}")
+    options: Dict[str, Any] = {}
+    if search_filter is not None:
+        options["filter"] = search_filter.to_query(schema_version)
+    if sort != SORT_RELEVANCE:
+        options["sortedby"] = SORT_FIELDS[sort]
+        options["reverse"] = True
+    return options
+
+
+def _result_to_dict(result: Any) -> dict:
+    return {
+        "url": result["url"],
+        "channel_name": result["channel_name"],
+        "date": result["date"],
+        "title": result["title"],
+        "views": result["views"],
+    }
+
+
+def _lean_result_to_dict(result: Any, sort_column: Any) -> dict:
+    """The url, and the value of the sort field for merging results."""
+    out = {"url": result["url"]}
+    if sort_column is not None:
+        field_name, column = sort_column
+        out[field_name] = column[result.docnum]
+    return out
+
+
+def _to_prefix(qry: Query) -> Query:
+    """Word prefix matching for the lean schema, phrases stay exact."""
+    if isinstance(qry, Term) and qry.fieldname in ("title", "channel_name"):
+        return Prefix(qry.fieldname, qry.text, boost=qry.boost)
+    return qry
+
 
 def _filter_out_duplicate_videos(videos: List[Video]) -> List[Video]:
     found_urls = set()
@@ -48,22 +171,73 @@ def _filter_out_duplicate_videos(videos: List[Video]) -> List[Video]:
 class DbFullTextSearch:
     """Impelmentation of a full text search database."""
 
-    def __init__(self, index_path) -> None:
-        """Initialize the database."""
-        self.storage = FileStorage(index_path)
+    def __init__(
+        self,
+        index_path,
+        read_only: bool = False,
+        schema_version: Optional[int] = None,
+    ) -> None:
+        """
+        Initialize the database. schema_version picks SCHEMA or SCHEMA_V2
+        for a new index, None keeps the version of an existing index. An
+        existing index of another version is recreated empty and migrated
+        is set, the caller re-indexes it from sqlite.
+        """
+        if schema_version is not None and schema_version not in SCHEMAS:
+            raise ValueError(f"Unknown schema version: {schema_version}")
+        self.index_path = index_path
+        self.read_only = read_only
+        self.migrated = False
+        self.storage = FileStorage(index_path, readonly=read_only)
         if self.storage.index_exists():
-            self.index = self.storage.open_index()
+            self.schema_version = self._read_schema_version()
+            if read_only or schema_version in (None, self.schema_version):
+                self.index = self.storage.open_index()
+                return
+            print(
+                f"{index_path}: migrating the full text index from schema"
+                f" version {self.schema_version} to {schema_version}"
+            )
+            for filename in list(self.storage):
+                self.storage.delete_file(filename)
+            self.migrated = True
+        elif read_only:
+            raise OSError(f"No full text index in {index_path}")
         else:
             os.makedirs(index_path, exist_ok=True)
-            self.index = self.storage.create_index(SCHEMA)
+        self.schema_version = schema_version or DEFAULT_SCHEMA_VERSION
+        self.index = self.storage.create_index(SCHEMAS[self.schema_version])
+        self._write_file(SCHEMA_VERSION_FILE, str(self.schema_version))
+
+    @property
+    def stores_fields(self) -> bool:
+        """False for the lean schema, which only stores the url."""
+        return self.schema_version == 1
+
+    def _read_schema_version(self) -> int:
+        path = os.path.join(self.index_path, SCHEMA_VERSION_FILE)
+        try:
+            with open(path, encoding="utf-8", mode="r") as f:
+                return int(f.read().strip() or 1)
+        except FileNotFoundError:
+            return 1
+
+    def _write_file(self, name: str, value: str) -> None:
+        path = os.path.join(self.index_path, name)
+        with open(path + ".tmp", encoding="utf-8", mode="w") as f:
+            f.write(value)
+        os.replace(path + ".tmp", path)
 
     def clear(self) -> None:
-        """Clear the database."""
-        # TODO: Implement this.  # pylint: disable=W0511
-        return
+        """Clear the database, recreating the index empty."""
+        if self.read_only:
+            raise OSError(f"{self.index_path} is opened read only")
+        self.index = self.storage.create_index(SCHEMAS[self.schema_version])
 
     def add_videos(self, videos: List[Video]) -> None:
         """Add videos to the database."""
+        if self.read_only:
+            raise OSError(f"{self.index_path} is opened read only")
         videos = _filter_out_duplicate_videos(videos)
         with self.index.writer() as writer:
             with writer.group():
@@ -71,37 +245,116 @@ class DbFullTextSearch:
                     published: datetime = vid.date_published
                     # Change published datetime to utc timezone.
                     published_utc = published.astimezone(pytz.utc)
-                    writer.update_document(
-                        url=vid.url,
-                        channel_name=u(vid.channel_name),
-                        date=published_utc,
-                        title=u(vid.title),
-                        views=vid.views,
-                    )
-
-    def _field_search(
-        self, field_name: str, query_string: str, limit: int = 40
+                    doc = {
+                        "url": vid.url,
+                        "channel_name": u(vid.channel_name),
+                        "date": published_utc,
+                        "title": u(vid.title),
+                        "views": vid.views,
+                    }
+                    if self.schema_version > 1:
+                        doc["channel"] = u(vid.channel_name)
+                    writer.update_document(**doc)
+
+    def remove_videos(self, urls: List[str]) -> None:
+        """Removes the videos from the index."""
+        if self.read_only:
+            raise OSError(f"{self.index_path} is opened read only")
+        if not urls:
+            return
+        with self.index.writer() as writer:
+            for url in urls:
+                writer.delete_by_term("url", url)
+
+    def generation(self) -> int:
+        """The sqlite change sequence number the index is in sync with."""
+        path = os.path.join(self.index_path, GENERATION_FILE)
+        try:
+            with open(path, encoding="utf-8", mode="r") as f:
+                return int(f.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def set_generation(self, generation: int) -> None:
+        """Records the generation after the index commits."""
+        if self.read_only:
+            raise OSError(f"{self.index_path} is opened read only")
+        self._write_file(GENERATION_FILE, str(generation))
+
+    def iter_documents(self) -> Iterator[Dict[str, Any]]:
+        """Streams the stored fields of every indexed video."""
+        with self.index.searcher() as searcher:
+            yield from searcher.reader().all_stored_fields()
+
+    def copy_to(self, dest_path: str) -> None:
+        """Copies the index files, holding the write lock so no commit
+        lands halfway through the copy."""
+        lock = self.index.lock("WRITELOCK")
+        lock.acquire(blocking=True)
+        try:
+            shutil.copytree(
+                self.index_path,
+                dest_path,
+                ignore=shutil.ignore_patterns("*WRITELOCK"),
+            )
+        finally:
+            lock.release()
+
+    def _field_search(  # pylint: disable=too-many-arguments
+        self,
+        field_name: str,
+        query_string: str,
+        limit: int = 40,
+        search_filter: Optional[SearchFilter] = None,
+        sort: str = SORT_RELEVANCE,
     ) -> List[dict]:
         """Searcher for videos by one of the fields."""
-        qparser = QueryParser(field_name, schema=SCHEMA)
-        qparser.add_plugin(DateParserPlugin(free=False))
-        qry = qparser.parse(query_string)
+        qry = self._parse(field_name, query_string)
+        options = _search_options(search_filter, sort, self.schema_version)
+        channel_name = search_filter.channel_name if search_filter else None
+        if not self.stores_fields:
+            channel_name = None  # Filtered exactly by the index.
         with self.index.searcher() as searcher:
+            sort_column = None
+            if not self.stores_fields and sort != SORT_RELEVANCE:
+                # For merging the fields, values come from the column.
+                sort_column = (
+                    SORT_FIELDS[sort],
+                    searcher.reader().column_reader(SORT_FIELDS[sort]),
+                )
             # matcher = query.matcher(searcher)  # useful for debugging
-            results = searcher.search(qry, mask=None, limit=limit, terms=True)
-            # Convert the results to dicts.
-            results_dicts = []
-            for result in results:
-                results_dicts.append(
-                    {
-                        "url": result["url"],
-                        "channel_name": result["channel_name"],
-                        "date": result["date"],
-                        "title": result["title"],
-                        "views": result["views"],
-                    }
+            page_limit = limit
+            while True:
+                results = searcher.search(
+                    qry, mask=None, limit=page_limit, terms=True, **options
                 )
-            return results_dicts
+                # Convert the results to dicts.
+                results_dicts = []
+                for result in results:
+                    # The index filters channels by word, not by name.
+                    if channel_name is not None and (
+                        channel_name != result["channel_name"]
+                    ):
+                        continue
+                    if self.stores_fields:
+                        results_dicts.append(_result_to_dict(result))
+                    else:
+                        results_dicts.append(
+                            _lean_result_to_dict(result, sort_column)
+                        )
+                if len(results_dicts) >= limit:
+                    return results_dicts[:limit]
+                if results.scored_length() < page_limit:
+                    return results_dicts  # No more results.
+                page_limit *= 2
+
+    def _parse(self, field_name: str, query_string: str) -> Query:
+        qparser = QueryParser(field_name, schema=self.index.schema)
+        qparser.add_plugin(DateParserPlugin(free=False))
+        qry = qparser.parse(query_string)
+        if not self.stores_fields:
+            qry = qry.accept(_to_prefix)
+        return qry
 
     def title_search(self, query_string: str, limit: int = 40) -> List[dict]:
         """Searcher for videos by title."""
@@ -110,3 +363,34 @@ class DbFullTextSearch:
     def channel_search(self, query_string: str, limit: int = 40) -> List[dict]:
         """Searcher for videos by title."""
         return self._field_search("channel_name", query_string, limit)
+
+    def search(
+        self,
+        query_string: str,
+        limit: Optional[int] = None,
+        search_filter: Optional[SearchFilter] = None,
+        sort: str = SORT_RELEVANCE,
+    ) -> List[dict]:
+        """
+        Searches channel names then titles, without duplicates. The filter
+        is applied inside the index, so limit counts matching videos only.
+        Without a limit each field returns its default of 40 results.
+        """
+        field_limit = 40 if limit is None else limit
+        vids = self._field_search(
+            "channel_name", query_string, field_limit, search_filter, sort
+        ) + self._field_search(
+            "title", query_string, field_limit, search_filter, sort
+        )
+        found_urls = set()
+        out = []
+        for vid in vids:
+            if vid["url"] in found_urls:
+                continue
+            found_urls.add(vid["url"])
+            out.append(vid)
+        if sort != SORT_RELEVANCE:
+            out.sort(key=lambda vid: vid[SORT_FIELDS[sort]], reverse=True)
+        if limit is not None:
+            out = out[:limit]
+        return out
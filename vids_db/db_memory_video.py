@@ -0,0 +1,504 @@
+"""
+In memory video storage, a VideoStore (see backend.py) without sqlite.
+
+Videos are kept decoded in a dict by url. Time windows are answered from
+TimeIndex, parallel sorted arrays of (timestamp_published, url) searched
+with bisect, one over every video and one per channel. Near duplicate
+buckets are a dict of url sets and trending scores are computed live at
+query time, so refresh_trending() has nothing to do.
+
+Nothing survives the process unless a snapshot_path is given: the store
+is then loaded from it on open and written to it (a bulk_io export, the
+format follows the extension, ie videos.vdb.gz) by save() and close().
+"""
+
+# pylint: disable=all
+
+import heapq
+import os
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Set
+
+from vids_db import bulk_io
+from vids_db.columnar import COLUMN_TYPES, DEFAULT_FIELDS, VideoColumns
+from vids_db.facets import (
+    FACET_DURATION,
+    FACETS,
+    FacetCounts,
+    check_facets,
+    duration_bucket,
+    top,
+)
+from vids_db.models import Video, VideoSummary
+from vids_db.near_duplicates import (
+    MAX_DISTANCE,
+    band_keys,
+    is_near_duplicate,
+    normalize_title,
+    title_signature,
+    titles_match,
+)
+from vids_db.trending import (
+    DEFAULT_WINDOW,
+    TRENDING_MAX_WINDOW,
+    check_window,
+    now_timestamp,
+    trending_score,
+)
+
+# Batches smaller than this are inserted one by one, larger ones merged.
+MERGE_THRESHOLD = 64
+
+
+def _timestamp(vid: Video) -> int:
+    return int(vid.date_published.timestamp())
+
+
+def _to_timestamp(date: Optional[datetime]) -> Optional[int]:
+    return None if date is None else int(date.timestamp())
+
+
+class TimeIndex:
+    """Urls sorted by timestamp, ties in insertion order."""
+
+    def __init__(self) -> None:
+        self.timestamps = array("q")
+        self.urls: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self.urls)
+
+    def add(self, items: List[Any]) -> None:
+        """Inserts (timestamp, url) pairs."""
+        if len(items) < MERGE_THRESHOLD:
+            for ts, url in items:
+                pos = bisect_right(self.timestamps, ts)
+                self.timestamps.insert(pos, ts)
+                self.urls.insert(pos, url)
+            return
+        # Timsort merges the two sorted runs in linear time.
+        pairs = list(zip(self.timestamps, self.urls))
+        pairs.extend(sorted(items, key=lambda item: item[0]))
+        pairs.sort(key=lambda item: item[0])
+        self.timestamps = array("q", [ts for ts, _ in pairs])
+        self.urls = [url for _, url in pairs]
+
+    def remove(self, ts: int, url: str) -> None:
+        lo = bisect_left(self.timestamps, ts)
+        hi = bisect_right(self.timestamps, ts)
+        pos = self.urls.index(url, lo, hi)
+        del self.timestamps[pos]
+        del self.urls[pos]
+
+    def remove_many(self, urls: Set[str]) -> None:
+        keep = [i for i, url in enumerate(self.urls) if url not in urls]
+        self.timestamps = array("q", [self.timestamps[i] for i in keep])
+        self.urls = [self.urls[i] for i in keep]
+
+    def newest(
+        self,
+        from_time: Optional[int] = None,
+        to_time: Optional[int] = None,
+        limit: Optional[int] = None,
+    ) -> List[str]:
+        """Urls published in [from_time, to_time], newest first."""
+        lo = 0 if from_time is None else bisect_left(self.timestamps, from_time)
+        hi = len(self.urls)
+        if to_time is not None:
+            hi = bisect_right(self.timestamps, to_time)
+        if limit is not None:
+            lo = max(lo, hi - limit)
+        return self.urls[lo:hi][::-1]
+
+
+class DbMemoryVideo:
+    """Video storage in memory, see the module docstring."""
+
+    def __init__(self, snapshot_path: Optional[str] = None) -> None:
+        self.snapshot_path = snapshot_path
+        self._lock = threading.RLock()
+        self._change_seq = 0
+        self._init_indexes()
+        if snapshot_path is not None and os.path.exists(snapshot_path):
+            bulk_io.import_videos(self.insert_or_update, snapshot_path)
+
+    def _init_indexes(self) -> None:
+        self._by_url: Dict[str, Video] = {}
+        self._by_time = TimeIndex()
+        self._by_channel: Dict[str, TimeIndex] = {}
+        self._signatures: Dict[str, int] = {}
+        self._near_dup_buckets: Dict[int, Set[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._by_url)
+
+    def save(self, path: Optional[str] = None) -> int:
+        """
+        Writes every video to path (default snapshot_path) through a
+        temporary file, so a crash never leaves a partial snapshot.
+        Returns the number of videos written.
+        """
+        path = path or self.snapshot_path
+        if path is None:
+            raise ValueError("save() needs a path or a snapshot_path")
+        fmt, compression = bulk_io.detect_format(path)
+        tmp_path = path + ".tmp"
+        with self._lock:
+            count = bulk_io.export_videos(
+                [list(self._by_url.values())], tmp_path, fmt, compression
+            )
+        os.replace(tmp_path, path)
+        return count
+
+    def close(self) -> None:
+        if self.snapshot_path is not None:
+            self.save()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._change_seq += len(self._by_url)
+            self._init_indexes()
+
+    def current_change_seq(self) -> int:
+        """Counts every write and delete, like DbSqliteVideo."""
+        return self._change_seq
+
+    def _channel_index(self, channel_name: str) -> TimeIndex:
+        index = self._by_channel.get(channel_name)
+        if index is None:
+            index = self._by_channel[channel_name] = TimeIndex()
+        return index
+
+    def _forget_signature(self, url: str) -> None:
+        signature = self._signatures.pop(url)
+        for key in band_keys(signature):
+            bucket = self._near_dup_buckets[key]
+            bucket.discard(url)
+            if not bucket:
+                del self._near_dup_buckets[key]
+
+    def insert_or_update(self, vids: List[Video]) -> None:
+        # Last write per url wins, like the sqlite upsert.
+        latest = {vid.url: vid for vid in vids}
+        if not latest:
+            return
+        with self._lock:
+            replaced = [url for url in latest if url in self._by_url]
+            self._remove_urls(replaced)
+            by_channel: Dict[str, List[Any]] = {}
+            pairs = []
+            for url, vid in latest.items():
+                ts = _timestamp(vid)
+                self._by_url[url] = vid
+                pairs.append((ts, url))
+                by_channel.setdefault(vid.channel_name, []).append((ts, url))
+                signature = title_signature(vid.title)
+                self._signatures[url] = signature
+                for key in band_keys(signature):
+                    self._near_dup_buckets.setdefault(key, set()).add(url)
+            self._by_time.add(pairs)
+            for channel_name, channel_pairs in by_channel.items():
+                self._channel_index(channel_name).add(channel_pairs)
+            self._change_seq += len(latest)
+
+    def _remove_urls(self, urls: List[str]) -> List[str]:
+        """Drops the urls from every index, returns the removed ones."""
+        removed = [self._by_url.pop(url) for url in urls if url in self._by_url]
+        if not removed:
+            return []
+        by_channel: Dict[str, List[Video]] = {}
+        for vid in removed:
+            by_channel.setdefault(vid.channel_name, []).append(vid)
+            self._forget_signature(vid.url)
+        if len(removed) < MERGE_THRESHOLD:
+            for vid in removed:
+                self._by_time.remove(_timestamp(vid), vid.url)
+        else:
+            self._by_time.remove_many({vid.url for vid in removed})
+        for channel_name, channel_vids in by_channel.items():
+            index = self._by_channel[channel_name]
+            if len(channel_vids) == len(index):
+                del self._by_channel[channel_name]
+            elif len(channel_vids) < MERGE_THRESHOLD:
+                for vid in channel_vids:
+                    index.remove(_timestamp(vid), vid.url)
+            else:
+                index.remove_many({vid.url for vid in channel_vids})
+        self._change_seq += len(removed)
+        return [vid.url for vid in removed]
+
+    def evict_oldest(self, count: int) -> Optional[int]:
+        """
+        Removes the count oldest videos and the rest of the last second
+        they were published in, so every video after it stays stored.
+        Returns that timestamp, None when nothing was removed.
+        """
+        with self._lock:
+            timestamps = self._by_time.timestamps
+            if count <= 0 or not timestamps:
+                return None
+            ts = timestamps[min(count, len(timestamps)) - 1]
+            end = bisect_right(timestamps, ts)
+            self._remove_urls(self._by_time.urls[:end])
+            return ts
+
+    def get_channel_names(self) -> List[str]:
+        with self._lock:
+            return list(self._by_channel)
+
+    def existing_urls(self, urls: List[str]) -> List[str]:
+        with self._lock:
+            return [url for url in dict.fromkeys(urls) if url in self._by_url]
+
+    def get_channel_counts(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                channel_name: len(index)
+                for channel_name, index in self._by_channel.items()
+            }
+
+    def iter_titles(self, batch_size: int = 5000) -> Iterator[List[str]]:
+        for vids in self.iter_videos(batch_size):
+            yield [vid.title for vid in vids]
+
+    def iter_videos(self, batch_size: int = 1000) -> Iterator[List[Video]]:
+        """Yields every video in insertion order, batch_size at a time."""
+        with self._lock:
+            vids = list(self._by_url.values())
+        for i in range(0, len(vids), batch_size):
+            yield vids[i : i + batch_size]
+
+    def get_all_videos(self) -> List[Video]:
+        with self._lock:
+            return list(self._by_url.values())
+
+    def _lookup(self, urls: List[str], summary: bool) -> List[Any]:
+        with self._lock:
+            vids = [self._by_url[url] for url in urls if url in self._by_url]
+        return VideoSummary.from_videos(vids) if summary else vids
+
+    def find_videos_by_urls(
+        self, urls: List[str], summary: bool = False
+    ) -> List[Any]:
+        return self._lookup(list(dict.fromkeys(urls)), summary)
+
+    def find_video_by_url(self, url: str) -> Optional[Video]:
+        with self._lock:
+            return self._by_url.get(url)
+
+    def find_videos_by_channel_name(
+        self, channel_name: str, summary: bool = False
+    ) -> List[Any]:
+        with self._lock:
+            index = self._by_channel.get(channel_name)
+            urls = index.newest() if index is not None else []
+        return self._lookup(urls, summary)
+
+    def _window(
+        self,
+        from_time: Optional[int],
+        to_time: Optional[int],
+        channel_name: Optional[str],
+        limit: Optional[int] = None,
+    ) -> List[str]:
+        """Urls in the inclusive range, newest first. Hold the lock."""
+        index: Optional[TimeIndex] = self._by_time
+        if channel_name is not None:
+            index = self._by_channel.get(channel_name)
+        if index is None:
+            return []
+        return index.newest(from_time, to_time, limit)
+
+    def find_videos(
+        self,
+        date_start: datetime,
+        date_end: datetime,
+        channel_name: Optional[str] = None,
+        limit_count: Optional[int] = None,
+        summary: bool = False,
+    ) -> List[Any]:
+        """Videos published in the date range, newest first."""
+        with self._lock:
+            urls = self._window(
+                _to_timestamp(date_start),
+                _to_timestamp(date_end),
+                channel_name,
+                limit_count,
+            )
+        return self._lookup(urls, summary)
+
+    def find_near_duplicates(
+        self, vid: Video, max_distance: int = MAX_DISTANCE
+    ) -> List[Video]:
+        if max_distance > MAX_DISTANCE:
+            raise ValueError(f"max_distance can be at most {MAX_DISTANCE}")
+        if not normalize_title(vid.title):
+            return []
+        signature = title_signature(vid.title)
+        with self._lock:
+            candidates: Set[str] = set()
+            for key in band_keys(signature):
+                candidates.update(self._near_dup_buckets.get(key, ()))
+            candidates.discard(vid.url)
+            return [
+                self._by_url[url]
+                for url in candidates
+                if is_near_duplicate(
+                    signature,
+                    vid.duration,
+                    self._signatures[url],
+                    self._by_url[url].duration,
+                    max_distance,
+                )
+                and titles_match(vid.title, self._by_url[url].title)
+            ]
+
+    def find_trending(
+        self,
+        limit: int,
+        channel_name: Optional[str] = None,
+        window: timedelta = DEFAULT_WINDOW,
+        now_time: Optional[datetime] = None,
+    ) -> List[Video]:
+        """Videos published within window by their current trending_score."""
+        check_window(window)
+        now = now_timestamp(now_time)
+        from_time = int(now - window.total_seconds())
+        with self._lock:
+            urls = self._window(from_time, None, channel_name)
+            vids = [self._by_url[url] for url in urls]
+        scored = []
+        for i, vid in enumerate(vids):
+            score = trending_score(vid.views, _timestamp(vid), now)
+            if score is not None:  # Older than TRENDING_MAX_WINDOW.
+                scored.append((score, -i, vid))
+        return [vid for _, _, vid in heapq.nlargest(limit, scored)]
+
+    def refresh_trending(self, now_time: Optional[datetime] = None) -> int:
+        """Scores are live, returns the number of videos that have one."""
+        now = now_timestamp(now_time)
+        from_time = int(now - TRENDING_MAX_WINDOW.total_seconds())
+        with self._lock:
+            return len(self._by_time.newest(from_time))
+
+    def remove_by_channel_name(self, channel_name: str) -> List[str]:
+        with self._lock:
+            index = self._by_channel.get(channel_name)
+            if index is None:
+                return []
+            return self._remove_urls(list(index.urls))
+
+    def remove_by_urls(self, urls: List[str]) -> List[str]:
+        """Deletes the videos, returns the urls that were stored."""
+        with self._lock:
+            return self._remove_urls(list(dict.fromkeys(urls)))
+
+    def remove_older_than(
+        self, date: datetime, channel_name: Optional[str] = None
+    ) -> List[str]:
+        return self.remove_where(date_end=date, channel_name=channel_name)
+
+    def remove_where(
+        self,
+        date_start: Optional[datetime] = None,
+        date_end: Optional[datetime] = None,
+        channel_name: Optional[str] = None,
+        max_views: Optional[int] = None,
+    ) -> List[str]:
+        """
+        Deletes the videos matching every given filter: published in
+        [date_start, date_end), of the channel, with at most max_views
+        views. At least one filter is required, see clear().
+        """
+        if (date_start, date_end, channel_name, max_views) == (None,) * 4:
+            raise ValueError("remove_where needs at least one filter")
+        with self._lock:
+            # The window is inclusive, date_end is excluded below.
+            end = _to_timestamp(date_end)
+            urls = self._window(_to_timestamp(date_start), end, channel_name)
+            matches = [
+                url
+                for url in urls
+                if (end is None or _timestamp(self._by_url[url]) < end)
+                and (max_views is None or self._by_url[url].views <= max_views)
+            ]
+            return self._remove_urls(matches)
+
+    def update_fields(self, patches: Dict[str, Dict[str, Any]]) -> List[Video]:
+        """
+        Sets fields of many videos, {url: {field: value}}. The patched
+        videos are validated like new ones and returned, urls that are not
+        stored are skipped.
+        """
+        with self._lock:
+            patched = [
+                Video(**{**vid.model_dump(), **patches[vid.url]})
+                for vid in self._lookup(list(patches), summary=False)
+            ]
+            self.insert_or_update(patched)
+        return patched
+
+    def incremental_vacuum(self, pages_per_step: int = 1000) -> int:
+        return 0  # Deleted videos are freed right away.
+
+    def compact(self, train: bool = True) -> int:
+        return 0  # Nothing is encoded.
+
+    def get_columns(
+        self,
+        fields: Sequence[str] = DEFAULT_FIELDS,
+        date_start: Optional[datetime] = None,
+        date_end: Optional[datetime] = None,
+        channel_name: Optional[str] = None,
+    ) -> VideoColumns:
+        """The given columns of the videos in the range, newest first."""
+        out = VideoColumns(fields)
+        with self._lock:
+            urls = self._window(
+                _to_timestamp(date_start), _to_timestamp(date_end), channel_name
+            )
+            vids = [self._by_url[url] for url in urls]
+        getters = {
+            "timestamp_published": _timestamp,
+            "views": lambda vid: vid.views,
+            "duration": lambda vid: vid.duration,
+            "channel_name": lambda vid: vid.channel_name,
+            "url": lambda vid: vid.url,
+        }
+        assert set(getters) == set(COLUMN_TYPES)
+        row_getters = [getters[field] for field in out.fields]
+        out.append_rows([getter(vid) for getter in row_getters] for vid in vids)
+        return out
+
+    def get_facets(
+        self,
+        date_start: datetime,
+        date_end: datetime,
+        facets: Sequence[str] = FACETS,
+        limit: Optional[int] = None,
+        urls: Optional[List[str]] = None,
+    ) -> FacetCounts:
+        """Video counts per value of each facet in the date range."""
+        check_facets(facets)
+        with self._lock:
+            window = self._window(
+                _to_timestamp(date_start), _to_timestamp(date_end), None
+            )
+            if urls is not None:
+                wanted = set(urls)
+                window = [url for url in window if url in wanted]
+            vids = [self._by_url[url] for url in window]
+        out: FacetCounts = {}
+        for facet in facets:
+            counts: Dict[str, int] = {}
+            for vid in vids:
+                if facet == FACET_DURATION:
+                    value = duration_bucket(vid.duration)
+                else:
+                    value = getattr(vid, facet) or ""
+                counts[value] = counts.get(value, 0) + 1
+            out[facet] = top(counts, limit)
+        return out
@@ -0,0 +1,801 @@
+"""
+Month partitioned sqlite storage for videos.
+
+Each calendar month (UTC, by date_published) lives in its own
+DbSqliteVideo file so that the hot recent months stay small and old
+months can be dropped or archived as whole files.
+
+Archives are read-only. A video of an archived month that is written
+again goes to the active partition of its month, and the archived copy
+is left in place but shadowed: reads skip archived copies of videos
+that the url directory places in another month or that the active
+partition of the same month holds.
+"""
+
+# pylint: disable=all
+
+import os
+import shutil
+import sqlite3
+import stat
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+)
+
+from vids_db.columnar import DEFAULT_FIELDS, VideoColumns
+from vids_db.db_sqlite_video import DbSqliteVideo
+from vids_db.facets import FACETS, FacetCounts, merge
+from vids_db.models import Video
+from vids_db.near_duplicates import MAX_DISTANCE
+from vids_db.payload import COMPRESSION_NONE
+from vids_db.trending import (
+    DEFAULT_WINDOW,
+    TRENDING_MAX_WINDOW,
+    check_window,
+    now_timestamp,
+    trending_score,
+)
+
+DIRECTORY_FILE = "partitions.sqlite"
+PARTITION_PREFIX = "videos_"
+PARTITION_SUFFIX = ".sqlite"
+# Max number of sqlite host parameters per statement on older builds.
+_CHUNK_SIZE = 900
+
+DIRECTORY_CREATE_STMT: str = "\n".join(
+    [
+        "CREATE TABLE IF NOT EXISTS url_partitions (",
+        "   url TEXT PRIMARY KEY UNIQUE NOT NULL,",
+        "   partition TEXT NOT NULL);",
+        "CREATE INDEX IF NOT EXISTS idx_partition ON url_partitions(partition);",
+    ]
+)
+
+
+def partition_name(timestamp: int) -> str:
+    """Returns the partition name (YYYY_MM) for a unix timestamp."""
+    date = datetime.fromtimestamp(timestamp, tz=timezone.utc)
+    return f"{date.year:04d}_{date.month:02d}"
+
+
+def partition_names_between(
+    date_start: datetime, date_end: datetime
+) -> List[str]:
+    """Returns the partition names overlapping the range, newest first."""
+    start = partition_name(int(date_start.timestamp()))
+    end = partition_name(int(date_end.timestamp()))
+    if start > end:
+        return []
+    year, month = (int(v) for v in end.split("_"))
+    out: List[str] = []
+    while True:
+        name = f"{year:04d}_{month:02d}"
+        out.append(name)
+        if name <= start:
+            break
+        month -= 1
+        if month == 0:
+            year, month = year - 1, 12
+    return out
+
+
+def _chunks(items: List[Any], size: int = _CHUNK_SIZE) -> Iterator[List[Any]]:
+    for i in range(0, len(items), size):
+        yield items[i : i + size]
+
+
+class DbSqlitePartitionedVideo:
+    """Video storage split into one sqlite file per month."""
+
+    def __init__(
+        self,
+        db_dir: str,
+        archive_dir: Optional[str] = None,
+        compression: Optional[str] = COMPRESSION_NONE,
+    ) -> None:
+        self.db_dir = db_dir
+        self.compression = compression
+        self.archive_dir = archive_dir or os.path.join(db_dir, "archive")
+        os.makedirs(self.db_dir, exist_ok=True)
+        os.makedirs(self.archive_dir, exist_ok=True)
+        self.directory_path = os.path.join(self.db_dir, DIRECTORY_FILE)
+        self._partitions: Dict[Tuple[str, bool], DbSqliteVideo] = {}
+        with self.open_directory() as conn:
+            conn.executescript(DIRECTORY_CREATE_STMT)
+            conn.commit()
+
+    @contextmanager
+    def open_directory(self):
+        try:
+            conn = sqlite3.connect(
+                self.directory_path, check_same_thread=False, timeout=10
+            )
+        except sqlite3.OperationalError as e:
+            raise OSError(
+                "Error while opening %s\nOriginal Error: %s"
+                % (self.directory_path, e)
+            )
+        try:
+            yield conn
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def close(self) -> None:
+        for db in self._partitions.values():
+            db.close()
+        self._partitions.clear()
+
+    def _partition_path(self, name: str, archived: bool) -> str:
+        folder = self.archive_dir if archived else self.db_dir
+        return os.path.join(
+            folder, f"{PARTITION_PREFIX}{name}{PARTITION_SUFFIX}"
+        )
+
+    def _list_partitions(self, archived: bool) -> List[str]:
+        folder = self.archive_dir if archived else self.db_dir
+        out: List[str] = []
+        for file in os.listdir(folder):
+            if file.startswith(PARTITION_PREFIX) and file.endswith(
+                PARTITION_SUFFIX
+            ):
+                out.append(file[len(PARTITION_PREFIX) : -len(PARTITION_SUFFIX)])
+        return sorted(out, reverse=True)
+
+    def partitions(self) -> List[str]:
+        """Returns the writable partition names, newest first."""
+        return self._list_partitions(archived=False)
+
+    def archived_partitions(self) -> List[str]:
+        """Returns the read-only archived partition names, newest first."""
+        return self._list_partitions(archived=True)
+
+    def _get_partition(
+        self, name: str, archived: bool = False, create: bool = False
+    ) -> Optional[DbSqliteVideo]:
+        key = (name, archived)
+        db = self._partitions.get(key)
+        if db is not None and os.path.exists(db.db_path):
+            return db
+        path = self._partition_path(name, archived)
+        if not create and not os.path.exists(path):
+            self._partitions.pop(key, None)
+            return None
+        if archived:
+            db = self._open_archived(path)
+        else:
+            db = DbSqliteVideo(path, compression=self.compression)
+        self._partitions[key] = db
+        return db
+
+    def _open_archived(self, path: str) -> DbSqliteVideo:
+        """Archives are chmod 0400, so they are opened read-only."""
+        try:
+            return DbSqliteVideo(
+                path, compression=self.compression, read_only=True
+            )
+        except OSError:
+            # Archived by an older version, the schema is migrated once.
+            os.chmod(path, stat.S_IREAD | stat.S_IWRITE)
+            try:
+                DbSqliteVideo(path, compression=self.compression).close()
+            finally:
+                os.chmod(path, stat.S_IREAD)
+            return DbSqliteVideo(
+                path, compression=self.compression, read_only=True
+            )
+
+    def _readable_partitions(self, name: str) -> List[DbSqliteVideo]:
+        """The active and archived files for one month, if they exist."""
+        out: List[DbSqliteVideo] = []
+        for archived in (False, True):
+            db = self._get_partition(name, archived=archived)
+            if db is not None:
+                out.append(db)
+        return out
+
+    def _all_partition_names(self) -> List[str]:
+        return sorted(
+            set(self.partitions()) | set(self.archived_partitions()),
+            reverse=True,
+        )
+
+    def _shadowed(
+        self, name: str, urls: List[str], active: Optional[DbSqliteVideo]
+    ) -> Set[str]:
+        """The urls of the archived month that were written since."""
+        if not urls:
+            return set()
+        rewritten = set(active.existing_urls(urls)) if active else set()
+        current = self._lookup_partitions(urls)
+        return {
+            url
+            for url in urls
+            if url in rewritten or current.get(url, name) != name
+        }
+
+    def _unshadowed(
+        self, name: str, vids: List[Any], active: Optional[DbSqliteVideo]
+    ) -> List[Any]:
+        """The videos of the archived month that were not written since."""
+        shadowed = self._shadowed(name, [vid.url for vid in vids], active)
+        return [vid for vid in vids if vid.url not in shadowed]
+
+    def _archive_of(
+        self, name: str, active: Optional[DbSqliteVideo]
+    ) -> Tuple[Optional[DbSqliteVideo], Set[str]]:
+        """The archived file of a month, if any, and its shadowed urls."""
+        archived = self._get_partition(name, archived=True)
+        if archived is None:
+            return None, set()
+        urls = archived.get_columns(["url"]).columns["url"]
+        return archived, self._shadowed(name, list(urls), active)
+
+    def _find_in_month(
+        self,
+        name: str,
+        fetch: Callable[[DbSqliteVideo, Optional[int]], List[Any]],
+        limit: Optional[int] = None,
+    ) -> List[Any]:
+        """fetch(db, limit) over the active and archived files of a month."""
+        out: List[Any] = []
+        active = self._get_partition(name)
+        if active is not None:
+            out.extend(fetch(active, limit))
+        archived = self._get_partition(name, archived=True)
+        if archived is not None:
+            fetch_limit = limit
+            while True:
+                vids = fetch(archived, fetch_limit)
+                kept = self._unshadowed(name, vids, active)
+                if (
+                    limit is None
+                    or fetch_limit is None
+                    or len(kept) >= limit
+                    or len(vids) < fetch_limit
+                ):
+                    break
+                # Shadowed copies took up some of the limit.
+                fetch_limit = limit + len(vids) - len(kept)
+            out.extend(kept)
+        return out
+
+    def _month_columns(
+        self,
+        name: str,
+        fields: Sequence[str],
+        date_start: Optional[datetime] = None,
+        date_end: Optional[datetime] = None,
+        channel_name: Optional[str] = None,
+    ) -> VideoColumns:
+        """get_columns over the active and archived files of a month."""
+        out = VideoColumns(fields)
+        active = self._get_partition(name)
+        if active is not None:
+            out.extend(
+                active.get_columns(fields, date_start, date_end, channel_name)
+            )
+        archived, shadowed = self._archive_of(name, active)
+        if archived is not None:
+            out.extend(
+                self._archived_columns(
+                    archived,
+                    shadowed,
+                    fields,
+                    date_start,
+                    date_end,
+                    channel_name,
+                )
+            )
+        return out
+
+    def _archived_columns(
+        self,
+        archived: DbSqliteVideo,
+        shadowed: Set[str],
+        fields: Sequence[str],
+        date_start: Optional[datetime] = None,
+        date_end: Optional[datetime] = None,
+        channel_name: Optional[str] = None,
+    ) -> VideoColumns:
+        """get_columns of an archived file without the shadowed rows."""
+        if not shadowed:
+            return archived.get_columns(
+                fields, date_start, date_end, channel_name
+            )
+        with_url = list(fields) if "url" in fields else [*fields, "url"]
+        columns = archived.get_columns(
+            with_url, date_start, date_end, channel_name
+        )
+        out = VideoColumns(fields)
+        rows = zip(*(columns.columns[field] for field in out.fields))
+        out.append_rows(
+            row
+            for row, url in zip(rows, columns.columns["url"])
+            if url not in shadowed
+        )
+        return out
+
+    def _lookup_partitions(self, urls: List[str]) -> Dict[str, str]:
+        out: Dict[str, str] = {}
+        with self.open_directory() as conn:
+            for chunk in _chunks(urls):
+                select_stmt = (
+                    "SELECT url, partition FROM url_partitions WHERE url IN"
+                    f" ({','.join(['?'] * len(chunk))});"
+                )
+                for url, name in conn.execute(select_stmt, chunk):
+                    out[url] = name
+        return out
+
+    def insert_or_update(self, vids: List[Video]) -> None:
+        by_partition: Dict[str, List[Video]] = {}
+        for vid in vids:
+            name = partition_name(int(vid.date_published.timestamp()))
+            by_partition.setdefault(name, []).append(vid)
+        previous = self._lookup_partitions([vid.url for vid in vids])
+        # A rescrape can move a video to a different month, in which case
+        # the stale copy in the old partition is removed.
+        moved: Dict[str, List[str]] = {}
+        for name, part_vids in by_partition.items():
+            for vid in part_vids:
+                old_name = previous.get(vid.url)
+                if old_name is not None and old_name != name:
+                    moved.setdefault(old_name, []).append(vid.url)
+        for old_name, urls in moved.items():
+            old_db = self._get_partition(old_name)
+            if old_db is not None:
+                old_db.remove_by_urls(urls)
+        for name, part_vids in by_partition.items():
+            db = self._get_partition(name, create=True)
+            assert db is not None
+            db.insert_or_update(part_vids)
+        with self.open_directory() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO url_partitions (url, partition)"
+                " VALUES (?, ?)",
+                [
+                    (vid.url, name)
+                    for name, part_vids in by_partition.items()
+                    for vid in part_vids
+                ],
+            )
+            conn.commit()
+
+    def clear(self) -> None:
+        for name in self.partitions():
+            self._drop_file(self._partition_path(name, archived=False))
+        for name in self.archived_partitions():
+            self._drop_file(self._partition_path(name, archived=True))
+        self._partitions.clear()
+        with self.open_directory() as conn:
+            conn.execute("DELETE FROM url_partitions")
+            conn.commit()
+
+    def get_channel_names(self) -> List[str]:
+        return list(self.get_channel_counts())
+
+    def existing_urls(self, urls: List[str]) -> List[str]:
+        return list(self._lookup_partitions(urls))
+
+    def get_channel_counts(self) -> Dict[str, int]:
+        output: Dict[str, int] = {}
+        for name in self._all_partition_names():
+            active = self._get_partition(name)
+            parts = [active.get_channel_counts()] if active else []
+            archived, shadowed = self._archive_of(name, active)
+            if archived is not None and not shadowed:
+                parts.append(archived.get_channel_counts())
+            elif archived is not None:
+                counts: Dict[str, int] = {}
+                columns = self._archived_columns(
+                    archived, shadowed, ["channel_name"]
+                )
+                for channel_name in columns.columns["channel_name"]:
+                    counts[channel_name] = counts.get(channel_name, 0) + 1
+                parts.append(counts)
+            for part in parts:
+                for channel_name, count in part.items():
+                    output[channel_name] = output.get(channel_name, 0) + count
+        return output
+
+    def iter_titles(self, batch_size: int = 5000) -> Iterator[List[str]]:
+        for name in self._all_partition_names():
+            active = self._get_partition(name)
+            if active is not None:
+                yield from active.iter_titles(batch_size)
+            archived, shadowed = self._archive_of(name, active)
+            if archived is None:
+                continue
+            # The titles of the shadowed copies are skipped once each.
+            skip: Dict[str, int] = {}
+            for vid in archived.find_videos_by_urls(
+                list(shadowed), summary=True
+            ):
+                skip[vid.title] = skip.get(vid.title, 0) + 1
+            for titles in archived.iter_titles(batch_size):
+                kept = []
+                for title in titles:
+                    if skip.get(title):
+                        skip[title] -= 1
+                    else:
+                        kept.append(title)
+                if kept:
+                    yield kept
+
+    def remove_by_channel_name(self, channel_name: str) -> List[str]:
+        """Removes the channel from the writable partitions.
+
+        Archived partitions are read-only and are left untouched.
+        """
+        return self.remove_where(channel_name=channel_name)
+
+    def remove_by_urls(self, urls: List[str]) -> List[str]:
+        """Removes the videos from the writable partitions."""
+        by_partition: Dict[str, List[str]] = {}
+        for url, name in self._lookup_partitions(urls).items():
+            by_partition.setdefault(name, []).append(url)
+        out: List[str] = []
+        for name, part_urls in by_partition.items():
+            db = self._get_partition(name)
+            if db is not None:
+                out.extend(db.remove_by_urls(part_urls))
+        self._forget_urls(out)
+        return out
+
+    def remove_older_than(
+        self, date: datetime, channel_name: Optional[str] = None
+    ) -> List[str]:
+        return self.remove_where(date_end=date, channel_name=channel_name)
+
+    def remove_where(
+        self,
+        date_start: Optional[datetime] = None,
+        date_end: Optional[datetime] = None,
+        channel_name: Optional[str] = None,
+        max_views: Optional[int] = None,
+    ) -> List[str]:
+        """See DbSqliteVideo.remove_where, archives are left untouched."""
+        out: List[str] = []
+        for name in self.partitions():
+            db = self._get_partition(name)
+            if db is None:
+                continue
+            urls = db.remove_where(
+                date_start, date_end, channel_name, max_views
+            )
+            self._forget_urls(urls)
+            out.extend(urls)
+        return out
+
+    def update_fields(self, patches: Dict[str, Dict[str, Any]]) -> List[Video]:
+        """See DbSqliteVideo.update_fields."""
+        out: List[Video] = []
+        urls = list(patches)
+        for chunk in _chunks(urls):
+            patched = [
+                Video(**{**vid.model_dump(), **patches[vid.url]})
+                for vid in self.find_videos_by_urls(chunk)
+            ]
+            # Handles videos whose new date moves them to another month.
+            self.insert_or_update(patched)
+            out.extend(patched)
+        return out
+
+    def incremental_vacuum(self, pages_per_step: int = 1000) -> int:
+        freed = 0
+        for name in self.partitions():
+            db = self._get_partition(name)
+            if db is not None:
+                freed += db.incremental_vacuum(pages_per_step)
+        return freed
+
+    def find_near_duplicates(
+        self, vid: Video, max_distance: int = MAX_DISTANCE
+    ) -> List[Video]:
+        output: List[Video] = []
+        for name in self._all_partition_names():
+            output.extend(
+                self._find_in_month(
+                    name,
+                    lambda db, _: db.find_near_duplicates(vid, max_distance),
+                )
+            )
+        return output
+
+    def _forget_urls(self, urls: List[str]) -> None:
+        with self.open_directory() as conn:
+            for chunk in _chunks(urls):
+                conn.execute(
+                    "DELETE FROM url_partitions WHERE url IN"
+                    f" ({','.join(['?'] * len(chunk))});",
+                    chunk,
+                )
+            conn.commit()
+
+    def find_videos_by_channel_name(
+        self, channel_name: str, summary: bool = False
+    ) -> List[Any]:
+        output: List[Any] = []
+        for name in self._all_partition_names():
+            output.extend(
+                self._find_in_month(
+                    name,
+                    lambda db, _: db.find_videos_by_channel_name(
+                        channel_name, summary=summary
+                    ),
+                )
+            )
+        return output
+
+    def find_videos_by_urls(
+        self, urls: List[str], summary: bool = False
+    ) -> List[Any]:
+        urls = [str(url) for url in urls]
+        by_partition: Dict[str, List[str]] = {}
+        for url, name in self._lookup_partitions(urls).items():
+            by_partition.setdefault(name, []).append(url)
+        outlist: List[Any] = []
+        found = set()
+        for name in sorted(by_partition, reverse=True):
+            for db in self._readable_partitions(name):
+                for vid in db.find_videos_by_urls(
+                    by_partition[name], summary=summary
+                ):
+                    if vid.url not in found:
+                        found.add(vid.url)
+                        outlist.append(vid)
+        return outlist
+
+    def find_video_by_url(self, url: str) -> Optional[Video]:
+        vids = self.find_videos_by_urls([url])
+        return vids[0] if vids else None
+
+    def find_videos(
+        self,
+        date_start: datetime,
+        date_end: datetime,
+        channel_name: Optional[str] = None,
+        limit_count: Optional[int] = None,
+        summary: bool = False,
+    ) -> List[Any]:
+        """Finds videos in the date range, pruning non-overlapping months.
+
+        Partitions are time disjoint, so visiting them newest first keeps
+        the output sorted and lets the limit stop the scan early.
+        """
+        output: List[Any] = []
+        for name in partition_names_between(date_start, date_end):
+            remaining = None
+            if limit_count is not None:
+                remaining = limit_count - len(output)
+                if remaining <= 0:
+                    break
+            month = self._find_in_month(
+                name,
+                lambda db, limit: db.find_videos(
+                    date_start,
+                    date_end,
+                    channel_name=channel_name,
+                    limit_count=limit,
+                    summary=summary,
+                ),
+                remaining,
+            )
+            month.sort(key=lambda v: v.date_published, reverse=True)
+            if remaining is not None:
+                month = month[:remaining]
+            output.extend(month)
+        return output
+
+    def get_facets(
+        self,
+        date_start: datetime,
+        date_end: datetime,
+        facets: Sequence[str] = FACETS,
+        limit: Optional[int] = None,
+        urls: Optional[List[str]] = None,
+    ) -> FacetCounts:
+        """Sums the counts of the partitions overlapping the range."""
+        parts: List[FacetCounts] = []
+        for name in partition_names_between(date_start, date_end):
+            active = self._get_partition(name)
+            if active is not None:
+                parts.append(
+                    active.get_facets(date_start, date_end, facets, urls=urls)
+                )
+            archived, shadowed = self._archive_of(name, active)
+            if archived is None:
+                continue
+            parts.append(
+                archived.get_facets(date_start, date_end, facets, urls=urls)
+            )
+            if urls is not None:
+                shadowed &= set(urls)
+            if shadowed:
+                # Takes the counts of the shadowed copies back out.
+                counts = archived.get_facets(
+                    date_start, date_end, facets, urls=list(shadowed)
+                )
+                parts.append(
+                    {
+                        facet: {value: -count for value, count in part.items()}
+                        for facet, part in counts.items()
+                    }
+                )
+        return merge(parts, facets, limit)
+
+    def get_all_videos(self) -> List[Video]:
+        return [vid for vids in self.iter_videos() for vid in vids]
+
+    def iter_videos(self, batch_size: int = 1000) -> Iterator[List[Video]]:
+        for name in self._all_partition_names():
+            active = self._get_partition(name)
+            if active is not None:
+                yield from active.iter_videos(batch_size)
+            archived = self._get_partition(name, archived=True)
+            if archived is not None:
+                for vids in archived.iter_videos(batch_size):
+                    kept = self._unshadowed(name, vids, active)
+                    if kept:
+                        yield kept
+
+    def find_trending(
+        self,
+        limit: int,
+        channel_name: Optional[str] = None,
+        window: timedelta = DEFAULT_WINDOW,
+        now_time: Optional[datetime] = None,
+    ) -> List[Video]:
+        check_window(window)
+        now = now_timestamp(now_time)
+        date_end = datetime.fromtimestamp(now, tz=timezone.utc)
+        output: List[Video] = []
+        for name in partition_names_between(date_end - window, date_end):
+            output.extend(
+                self._find_in_month(
+                    name,
+                    lambda db, count: db.find_trending(
+                        limit if count is None else count,
+                        channel_name,
+                        window,
+                        now_time,
+                    ),
+                    limit,
+                )
+            )
+
+        def score(vid: Video) -> float:
+            ts = int(vid.date_published.timestamp())
+            return trending_score(vid.views, ts, now) or 0.0
+
+        output.sort(key=score, reverse=True)
+        return output[:limit]
+
+    def refresh_trending(self, now_time: Optional[datetime] = None) -> int:
+        now = now_timestamp(now_time)
+        count = 0
+        # Partitions out of the window can still hold scores from before
+        # they aged out, the extra month clears those.
+        window = TRENDING_MAX_WINDOW + timedelta(days=31)
+        for name in partition_names_between(
+            datetime.fromtimestamp(now, tz=timezone.utc) - window,
+            datetime.fromtimestamp(now, tz=timezone.utc),
+        ):
+            db = self._get_partition(name)
+            if db is not None:
+                count += db.refresh_trending(now_time)
+        return count
+
+    def get_columns(
+        self,
+        fields: Sequence[str] = DEFAULT_FIELDS,
+        date_start: Optional[datetime] = None,
+        date_end: Optional[datetime] = None,
+        channel_name: Optional[str] = None,
+    ) -> VideoColumns:
+        out = VideoColumns(fields)
+        if date_start is not None and date_end is not None:
+            names = partition_names_between(date_start, date_end)
+        else:
+            names = self._all_partition_names()
+        for name in names:
+            out.extend(
+                self._month_columns(
+                    name, fields, date_start, date_end, channel_name
+                )
+            )
+        return out
+
+    def to_data(self) -> List[Any]:
+        out: List[Any] = []
+        for name in self._all_partition_names():
+            active = self._get_partition(name)
+            if active is not None:
+                out.extend(active.to_data())
+            archived, shadowed = self._archive_of(name, active)
+            if archived is not None:
+                # The url is the first column.
+                out.extend(
+                    row for row in archived.to_data() if row[0] not in shadowed
+                )
+        return out
+
+    def compact(self, train: bool = True) -> int:
+        """Compacts the writable partitions, see DbSqliteVideo.compact."""
+        count = 0
+        for name in self.partitions():
+            db = self._get_partition(name)
+            if db is not None:
+                count += db.compact(train=train)
+        return count
+
+    def _drop_file(self, path: str) -> None:
+        if os.path.exists(path):
+            os.chmod(path, stat.S_IREAD | stat.S_IWRITE)
+            os.remove(path)
+        for suffix in ("-journal", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+    def apply_retention(
+        self,
+        keep_months: int,
+        archive: bool = True,
+        now: Optional[datetime] = None,
+    ) -> List[str]:
+        """
+        Retires every partition older than the newest `keep_months` months.
+
+        With archive=True the partition file is moved into the archive
+        directory and made read-only, otherwise it is deleted along with
+        its directory entries. Returns the names of the retired partitions.
+        """
+        if keep_months < 1:
+            raise ValueError("keep_months must be at least 1")
+        now = now or datetime.now(timezone.utc)
+        year, month = now.year, now.month - (keep_months - 1)
+        while month < 1:
+            year, month = year - 1, month + 12
+        cutoff = f"{year:04d}_{month:02d}"
+        retired: List[str] = []
+        for name in self.partitions():
+            if name >= cutoff:
+                continue
+            src = self._partition_path(name, archived=False)
+            self._partitions.pop((name, False), None)
+            if archive:
+                dst = self._partition_path(name, archived=True)
+                if os.path.exists(dst):
+                    # Month was already archived once, fold in the new rows.
+                    os.chmod(dst, stat.S_IREAD | stat.S_IWRITE)
+                    archived_db = DbSqliteVideo(dst, self.compression)
+                    archived_db.insert_or_update(
+                        DbSqliteVideo(src, self.compression).get_all_videos()
+                    )
+                    self._drop_file(src)
+                else:
+                    shutil.move(src, dst)
+                os.chmod(dst, stat.S_IREAD)
+            else:
+                self._drop_file(src)
+                with self.open_directory() as conn:
+                    conn.execute(
+                        "DELETE FROM url_partitions WHERE partition=(?)",
+                        (name,),
+                    )
+                    conn.commit()
+            retired.append(name)
+        return retired
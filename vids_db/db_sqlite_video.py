@@ -1,19 +1,73 @@
 # pylint: disable=all
 
 import json
+from array import array
 import os
 import sqlite3
+import threading
 from contextlib import contextmanager
-from datetime import datetime
-from typing import Any, Dict, List, Optional
+from datetime import datetime, timedelta
+from typing import (
+    Any,
+    Dict,
+    Iterator,
+    List,
+    Literal,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+    overload,
+)
+from urllib.request import pathname2url
 
-from vids_db.models import Video
+from vids_db.columnar import COLUMN_TYPES, DEFAULT_FIELDS, VideoColumns
+from vids_db.facets import (
+    FACETS,
+    FacetCounts,
+    check_facets,
+    facet_sql,
+    top,
+)
+from vids_db.models import COLD_FIELDS, Video, VideoSummary
+from vids_db.near_duplicates import (
+    MAX_DISTANCE,
+    band_keys,
+    is_near_duplicate,
+    normalize_title,
+    title_signature,
+    titles_match,
+    to_signed,
+)
+from vids_db.trending import (
+    DEFAULT_WINDOW,
+    TRENDING_MAX_WINDOW,
+    check_window,
+    now_timestamp,
+    trending_score,
+)
+from vids_db.parallel import PARALLEL_THRESHOLD, ParallelMap
+from vids_db.payload import (
+    COMPRESSION_NONE,
+    PayloadCodec,
+    train_dictionary,
+)
 
 TABLE_NAME = "videos"
+# Rows per write transaction of the bulk deletes and updates.
+CHUNK_SIZE = 500
+DICT_TABLE_NAME = "payload_dicts"
+TOMBSTONES_TABLE_NAME = "tombstones"
+META_TABLE_NAME = "meta"
+NEAR_DUP_TABLE_NAME = "near_dup_buckets"
+VIEW_HISTORY_TABLE_NAME = "view_history"
 
 CREATE_STMT: str = "\n".join(
     [
         "PRAGMA journal_mode=wal2;",
+        # Lets incremental_vacuum() return deleted pages, only takes effect
+        # before the first table is created.
+        "PRAGMA auto_vacuum=INCREMENTAL;",
         f"CREATE TABLE {TABLE_NAME} (",
         "   url TEXT PRIMARY KEY UNIQUE NOT NULL,",
         "   channel_name TEXT,",
@@ -24,58 +78,478 @@ CREATE_STMT: str = "\n".join(
     ]
 )
 
+# Columns added after the initial schema, added on open when missing:
+# (name, declaration, video json key to backfill existing rows from).
+EXTRA_COLUMNS: List[Tuple[str, str, Optional[str]]] = [
+    ("data_cold", "TEXT", None),  # COLD_FIELDS payload, NULL for old rows.
+    ("views", "INT", "views"),
+    ("duration", "REAL", "duration"),
+    ("trending_score", "REAL", None),  # See trending.py, NULL until scored.
+    ("change_seq", "INT", None),  # See changes_since().
+    ("simhash", "INT", None),  # See near_duplicates.py.
+    ("source", "TEXT", "source"),  # See facets.py.
+]
+
+# Tables added after the initial schema, created on open when missing.
+MIGRATE_TABLES: List[str] = [
+    DICT_TABLE_NAME,
+    TOMBSTONES_TABLE_NAME,
+    META_TABLE_NAME,
+    NEAR_DUP_TABLE_NAME,
+    VIEW_HISTORY_TABLE_NAME,
+]
+MIGRATE_STMT: str = "\n".join(
+    [
+        f"CREATE TABLE IF NOT EXISTS {DICT_TABLE_NAME} (",
+        "   id INTEGER PRIMARY KEY,",
+        "   data BLOB NOT NULL);",
+        f"CREATE TABLE IF NOT EXISTS {TOMBSTONES_TABLE_NAME} (",
+        "   url TEXT PRIMARY KEY UNIQUE NOT NULL,",
+        "   change_seq INT NOT NULL);",
+        "CREATE INDEX IF NOT EXISTS idx_tombstones_change_seq"
+        f" ON {TOMBSTONES_TABLE_NAME}(change_seq);",
+        f"CREATE TABLE IF NOT EXISTS {META_TABLE_NAME} (",
+        "   key TEXT PRIMARY KEY UNIQUE NOT NULL,",
+        "   value INT NOT NULL);",
+        f"INSERT OR IGNORE INTO {META_TABLE_NAME} VALUES ('change_seq', 0);",
+        # One row per band of every signature, see near_duplicates.py.
+        f"CREATE TABLE IF NOT EXISTS {NEAR_DUP_TABLE_NAME} (",
+        "   bucket INT NOT NULL,",
+        "   url TEXT NOT NULL,",
+        "   PRIMARY KEY (bucket, url)) WITHOUT ROWID;",
+        "CREATE INDEX IF NOT EXISTS idx_near_dup_url"
+        f" ON {NEAR_DUP_TABLE_NAME}(url);",
+        # Clustered by url then time, a video's samples share pages.
+        f"CREATE TABLE IF NOT EXISTS {VIEW_HISTORY_TABLE_NAME} (",
+        "   url TEXT NOT NULL,",
+        "   timestamp INT NOT NULL,",
+        "   views INT NOT NULL,",
+        "   PRIMARY KEY (url, timestamp)) WITHOUT ROWID;",
+        "CREATE INDEX IF NOT EXISTS idx_change_seq"
+        f" ON {TABLE_NAME}(change_seq);",
+        "CREATE INDEX IF NOT EXISTS idx_trending_score"
+        f" ON {TABLE_NAME}(trending_score);",
+        "CREATE INDEX IF NOT EXISTS idx_channel_name_trending_score"
+        f" ON {TABLE_NAME}(channel_name, trending_score);",
+        # Covers the facet counts of a date window, see facets.py.
+        "CREATE INDEX IF NOT EXISTS idx_facets ON"
+        f" {TABLE_NAME}(timestamp_published, source, duration, channel_name);",
+    ]
+)
+
 INSERT_STMT = "\n".join(
     [
         f"INSERT OR REPLACE INTO {TABLE_NAME} (",
         "    url,",
         "    channel_name,",
         "    timestamp_published,",
-        "    data",
-        ") VALUES (?, ?, ?, ?)",
+        "    data,",
+        "    data_cold,",
+        "    views,",
+        "    duration,",
+        "    trending_score,",
+        "    simhash,",
+        "    source,",
+        "    change_seq",
+        ") VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
     ]
 )
 
+# Only kept when the views changed since the latest sample.
+INSERT_VIEW_SAMPLE_STMT = (
+    f"INSERT OR REPLACE INTO {VIEW_HISTORY_TABLE_NAME} (url, timestamp, views)"
+    " SELECT ?1, ?2, ?3 WHERE ?3 IS NOT ("
+    f"SELECT views FROM {VIEW_HISTORY_TABLE_NAME} WHERE url=?1"
+    " ORDER BY timestamp DESC LIMIT 1)"
+)
+
+
+def split_cold_fields(data: Dict[str, Any]) -> Tuple[Dict, Dict]:
+    """Splits a video json dict into its hot and cold (COLD_FIELDS) parts."""
+    hot = {k: v for k, v in data.items() if k not in COLD_FIELDS}
+    cold = {k: data[k] for k in COLD_FIELDS if k in data}
+    return hot, cold
+
+
+class ViewHistory(NamedTuple):
+    """Samples of one video, oldest first, as int64 arrays."""
+
+    timestamps: array
+    views: array
+
+
+class Change(NamedTuple):
+    """One entry of the change feed, video is None for a deletion."""
+
+    seq: int
+    url: str
+    video: Optional[Video]
+
+
+def _last_write_wins(vids: List[Video]) -> List[Video]:
+    # A url may only take one change_seq per batch.
+    by_url: Dict[str, Video] = {}
+    for vid in vids:
+        by_url.pop(vid.url, None)
+        by_url[vid.url] = vid
+    return list(by_url.values())
+
+
+def _decode_json(
+    codec: PayloadCodec, data: Any, data_cold: Any
+) -> Dict[str, Any]:
+    out = codec.decode(data)
+    if data_cold is not None:
+        out.update(codec.decode(data_cold))
+    return out
+
+
+def _decode_rows(
+    codec: PayloadCodec, rows: Sequence[Any], summary: bool
+) -> List[Any]:
+    # Summary rows only select the hot data column.
+    if summary:
+        return [VideoSummary(**codec.decode(row[0])) for row in rows]
+    return [Video(**_decode_json(codec, row[0], row[1])) for row in rows]
+
+
+def _decode_chunk(
+    rows: Sequence[Any], summary: bool, dictionaries: Dict[int, bytes]
+) -> List[Tuple]:
+    """
+    Runs in the ParallelMap workers. Returns the validated field values as
+    tuples, pickling them is much cheaper than pickling pydantic models.
+    """
+    codec = PayloadCodec()
+    codec.dictionaries.update(dictionaries)
+    fields = list((VideoSummary if summary else Video).model_fields)
+    return [
+        tuple(getattr(vid, field) for field in fields)
+        for vid in _decode_rows(codec, rows, summary)
+    ]
+
+
+def _where_clauses(
+    date_start: Optional[datetime],
+    date_end: Optional[datetime],
+    channel_name: Optional[str],
+    max_views: Optional[int],
+) -> Tuple[List[str], List[Any]]:
+    clauses: List[str] = []
+    values: List[Any] = []
+    if date_start is not None:
+        clauses.append("timestamp_published >= ?")
+        values.append(int(date_start.timestamp()))
+    if date_end is not None:
+        clauses.append("timestamp_published < ?")
+        values.append(int(date_end.timestamp()))
+    if channel_name is not None:
+        clauses.append("channel_name=(?)")
+        values.append(channel_name)
+    if max_views is not None:
+        clauses.append("views <= ?")
+        values.append(max_views)
+    return clauses, values
+
+
+def _columns(summary: bool) -> str:
+    return "data" if summary else "data, data_cold"
+
 
 class DbSqliteVideo:
     """SQLite3 context manager"""
 
-    def __init__(self, db_path: str) -> None:
+    def __init__(
+        self,
+        db_path: str,
+        compression: Optional[str] = COMPRESSION_NONE,
+        read_only: bool = False,
+        immutable: bool = False,
+        mmap_size: Optional[int] = None,
+        shared_cache: bool = True,
+        decode_workers: Optional[int] = None,
+        parallel_threshold: int = PARALLEL_THRESHOLD,
+        views_history: bool = False,
+    ) -> None:
+        """
+        read_only opens the file with a mode=ro uri and never writes, not
+        even the schema. Read connections are then kept open per thread and
+        with shared_cache they share one page cache. immutable additionally
+        tells sqlite the file can not change (no locking), only use it for
+        files nobody writes to, like published snapshots. mmap_size sets
+        PRAGMA mmap_size on every connection.
+
+        decode_workers opts in to decoding results of parallel_threshold
+        rows or more on that many worker processes, see parallel.py.
+
+        views_history records a (timestamp, views) sample whenever a write
+        changes the views of a video, see get_view_velocity().
+        """
         self.db_path = db_path
-        folder_path = os.path.dirname(self.db_path)
-        os.makedirs(folder_path, exist_ok=True)
+        self.views_history = views_history
+        self.read_only = read_only or immutable
+        self.immutable = immutable
+        self.mmap_size = mmap_size
+        self.shared_cache = shared_cache
+        self.codec = PayloadCodec(compression, self._load_dictionary)
+        self.parallel: Optional[ParallelMap] = None
+        if decode_workers and decode_workers > 1:
+            self.parallel = ParallelMap(decode_workers, parallel_threshold)
+        self._local = threading.local()
+        self._read_conns: List[sqlite3.Connection] = []
+        self._read_conns_lock = threading.Lock()
         if self.db_path == "" or self.db_path == ":memory:":
             raise ValueError("Can not use in memory database for DbSqliteVideo")
+        if self.read_only:
+            if not os.path.exists(self.db_path):
+                raise OSError(f"{self.db_path} does not exist")
+        else:
+            folder_path = os.path.dirname(self.db_path)
+            os.makedirs(folder_path, exist_ok=True)
         self.create_table()
+        self._load_latest_dictionary()
 
     def create_table(self) -> None:
         with self.open_db_for_read() as conn:
             # Check to see if it's exists first of all.
-            check_table_stmt = f"SELECT name FROM sqlite_master WHERE type='table' AND name='{TABLE_NAME}';"
+            check_table_stmt = "SELECT name FROM sqlite_master WHERE type='table';"
             cursor = conn.execute(check_table_stmt)
-            has_table = cursor.fetchall()
-            if has_table:
-                return
+            tables = {row[0] for row in cursor.fetchall()}
+            cursor = conn.execute(f"PRAGMA table_info({TABLE_NAME});")
+            columns = {row[1] for row in cursor.fetchall()}
+        missing_columns = [c for c in EXTRA_COLUMNS if c[0] not in columns]
+        missing_tables = [t for t in MIGRATE_TABLES if t not in tables]
+        if TABLE_NAME in tables and not missing_columns and not missing_tables:
+            return
+        if self.read_only:
+            raise OSError(
+                f"{self.db_path} needs a schema migration, open it writable once"
+            )
         with self.open_db_for_write() as conn:
-            try:
-                conn.executescript(CREATE_STMT)
-            except sqlite3.ProgrammingError:
-                pass  # Table already created
+            if TABLE_NAME not in tables:
+                try:
+                    conn.executescript(CREATE_STMT)
+                except sqlite3.ProgrammingError:
+                    pass  # Table already created
+            for name, decl, _ in missing_columns:
+                conn.execute(f"ALTER TABLE {TABLE_NAME} ADD COLUMN {name} {decl};")
+            conn.executescript(MIGRATE_STMT)
+            backfill = [(c[0], c[2]) for c in missing_columns if c[2]]
+            if backfill and TABLE_NAME in tables:
+                self._backfill_columns(conn, backfill)
+            if "change_seq" in {c[0] for c in missing_columns}:
+                # Existing rows enter the change feed in insertion order.
+                conn.execute(f"UPDATE {TABLE_NAME} SET change_seq=rowid;")
+                conn.execute(
+                    f"UPDATE {META_TABLE_NAME} SET value=("
+                    f"SELECT COALESCE(MAX(change_seq), 0) FROM {TABLE_NAME})"
+                    " WHERE key='change_seq';"
+                )
+            if TABLE_NAME in tables and (
+                "simhash" in {c[0] for c in missing_columns}
+                or NEAR_DUP_TABLE_NAME in missing_tables
+            ):
+                self._backfill_near_dups(conn)
+            conn.commit()
+
+    def _backfill_near_dups(self, conn: sqlite3.Connection) -> None:
+        """Signs the existing rows, see near_duplicates.py."""
+        conn.execute(f"DELETE FROM {NEAR_DUP_TABLE_NAME};")
+        last_rowid = -1
+        while True:
+            rows = conn.execute(
+                f"SELECT rowid, url, data FROM {TABLE_NAME}"
+                " WHERE rowid > ? ORDER BY rowid LIMIT 1000",
+                (last_rowid,),
+            ).fetchall()
+            if not rows:
+                break
+            last_rowid = rows[-1][0]
+            signatures = [
+                (url, title_signature(self.codec.decode(data).get("title", "")))
+                for _, url, data in rows
+            ]
+            conn.executemany(
+                f"UPDATE {TABLE_NAME} SET simhash=(?) WHERE url=(?)",
+                [(to_signed(sig), url) for url, sig in signatures],
+            )
+            self._insert_near_dup_buckets(conn, signatures)
+
+    def _insert_near_dup_buckets(
+        self, conn: sqlite3.Connection, signatures: List[Tuple[str, int]]
+    ) -> None:
+        conn.executemany(
+            f"INSERT OR IGNORE INTO {NEAR_DUP_TABLE_NAME} (bucket, url)"
+            " VALUES (?, ?)",
+            [(key, url) for url, sig in signatures for key in band_keys(sig)],
+        )
+
+    def _backfill_columns(
+        self, conn: sqlite3.Connection, columns: List[Tuple[str, Any]]
+    ) -> None:
+        """Fills newly added columns of existing rows from the payload."""
+        set_clause = ", ".join(f"{name}=(?)" for name, _ in columns)
+        update_stmt = f"UPDATE {TABLE_NAME} SET {set_clause} WHERE rowid=(?)"
+        last_rowid = -1
+        while True:
+            rows = conn.execute(
+                f"SELECT rowid, data, data_cold FROM {TABLE_NAME}"
+                " WHERE rowid > ? ORDER BY rowid LIMIT 1000",
+                (last_rowid,),
+            ).fetchall()
+            if not rows:
+                break
+            last_rowid = rows[-1][0]
+            updates = []
+            for rowid, data, data_cold in rows:
+                values = self._decode_json(data, data_cold)
+                updates.append(
+                    tuple(values.get(key) for _, key in columns) + (rowid,)
+                )
+            conn.executemany(update_stmt, updates)
+
+    def _load_dictionary(self, dictionary_id: int) -> bytes:
+        with self.open_db_for_read() as conn:
+            cursor = conn.execute(
+                f"SELECT data FROM {DICT_TABLE_NAME} WHERE id=(?)",
+                (dictionary_id,),
+            )
+            row = cursor.fetchone()
+        if row is None:
+            raise ValueError(f"Missing payload dictionary {dictionary_id}")
+        return row[0]
+
+    def _load_latest_dictionary(self) -> None:
+        with self.open_db_for_read() as conn:
+            cursor = conn.execute(
+                f"SELECT id, data FROM {DICT_TABLE_NAME} ORDER BY id DESC LIMIT 1"
+            )
+            row = cursor.fetchone()
+        if row is not None:
+            self.codec.set_dictionary(row[0], row[1])
+
+    def _decode_json(self, data: Any, data_cold: Any) -> Dict[str, Any]:
+        return _decode_json(self.codec, data, data_cold)
+
+    def _decode(self, data: Any, data_cold: Any) -> Video:
+        return Video(**self._decode_json(data, data_cold))
+
+    def _decode_rows(self, rows: List[Any], summary: bool) -> List[Any]:
+        if self.parallel is not None and len(rows) >= self.parallel.threshold:
+            # Workers have no connection to load dictionaries from.
+            payloads = [payload for row in rows for payload in row[:2]]
+            dictionaries = self.codec.dictionaries_for(payloads)
+            values = self.parallel.map_chunks(
+                _decode_chunk, rows, summary, dictionaries
+            )
+            # Already validated by the worker.
+            model = VideoSummary if summary else Video
+            fields = list(model.model_fields)
+            return [
+                model.model_construct(**dict(zip(fields, vals)))
+                for vals in values
+            ]
+        return _decode_rows(self.codec, rows, summary)
+
+    def _encode(self, data: Dict[str, Any]) -> Tuple[Any, Any]:
+        hot, cold = split_cold_fields(data)
+        return (
+            self.codec.encode(json.dumps(hot, ensure_ascii=False)),
+            self.codec.encode(json.dumps(cold, ensure_ascii=False)),
+        )
 
     def clear(self) -> None:
         with self.open_db_for_write() as conn:
-            conn.execute(f"DELETE FROM {TABLE_NAME}")
+            self._delete_where(conn, "1=1", ())
             conn.commit()
 
-    @contextmanager
-    def open_db_for_write(self):
+    def _next_change_seq(self, conn: sqlite3.Connection, count: int) -> int:
+        """
+        Reserves `count` change sequence numbers inside the caller's write
+        transaction and returns the first one.
+        """
+        conn.execute(
+            f"UPDATE {META_TABLE_NAME} SET value=value+(?) WHERE key='change_seq'",
+            (count,),
+        )
+        cursor = conn.execute(
+            f"SELECT value FROM {META_TABLE_NAME} WHERE key='change_seq'"
+        )
+        return cursor.fetchone()[0] - count + 1
+
+    def _delete_where(
+        self, conn: sqlite3.Connection, where: str, values: Sequence[Any]
+    ) -> List[str]:
+        """
+        Deletes the matching rows inside the caller's write transaction,
+        leaving a tombstone per url for the change feed. Returns the urls.
+        """
+        cursor = conn.execute(f"SELECT url FROM {TABLE_NAME} WHERE {where}", values)
+        urls = [row[0] for row in cursor.fetchall()]
+        if not urls:
+            return urls
+        first_seq = self._next_change_seq(conn, len(urls))
+        conn.executemany(
+            f"INSERT OR REPLACE INTO {TOMBSTONES_TABLE_NAME} (url, change_seq)"
+            " VALUES (?, ?)",
+            [(url, first_seq + i) for i, url in enumerate(urls)],
+        )
+        conn.executemany(
+            f"DELETE FROM {TABLE_NAME} WHERE url=(?)", [(url,) for url in urls]
+        )
+        conn.executemany(
+            f"DELETE FROM {NEAR_DUP_TABLE_NAME} WHERE url=(?)",
+            [(url,) for url in urls],
+        )
+        conn.executemany(
+            f"DELETE FROM {VIEW_HISTORY_TABLE_NAME} WHERE url=(?)",
+            [(url,) for url in urls],
+        )
+        return urls
+
+    def _connect(self) -> sqlite3.Connection:
         try:
-            conn = sqlite3.connect(
-                self.db_path, check_same_thread=False, timeout=10
-            )
+            if self.read_only:
+                uri = "file:%s?mode=ro" % pathname2url(
+                    os.path.abspath(self.db_path)
+                )
+                if self.immutable:
+                    uri += "&immutable=1"
+                if self.shared_cache:
+                    uri += "&cache=shared"
+                conn = sqlite3.connect(
+                    uri, check_same_thread=False, timeout=10, uri=True
+                )
+            else:
+                conn = sqlite3.connect(
+                    self.db_path, check_same_thread=False, timeout=10
+                )
+            if self.mmap_size is not None:
+                conn.execute(f"PRAGMA mmap_size={int(self.mmap_size)};")
         except sqlite3.OperationalError as e:
             raise OSError(
                 "Error while opening %s\nOriginal Error: %s" % (self.db_path, e)
             )
+        return conn
+
+    def close(self) -> None:
+        """
+        Closes the read connections kept open in read_only mode and the
+        decode workers.
+        """
+        if self.parallel is not None:
+            self.parallel.close()
+        with self._read_conns_lock:
+            for conn in self._read_conns:
+                conn.close()
+            self._read_conns = []
+        self._local = threading.local()
+
+    @contextmanager
+    def open_db_for_write(self):
+        if self.read_only:
+            raise OSError(f"{self.db_path} is opened read only")
+        conn = self._connect()
         try:
             yield conn
         except Exception:
@@ -86,34 +560,82 @@ class DbSqliteVideo:
 
     @contextmanager
     def open_db_for_read(self):
-        try:
-            conn = sqlite3.connect(
-                self.db_path, check_same_thread=False, timeout=10
-            )
-        except sqlite3.OperationalError as e:
-            raise OSError(
-                "Error while opening %s\nOriginal Error: %s" % (self.db_path, e)
-            )
+        if self.read_only:
+            # Nothing writes through this object, so one connection per
+            # thread is reused and keeps its page cache warm.
+            conn = getattr(self._local, "conn", None)
+            if conn is None:
+                conn = self._connect()
+                self._local.conn = conn
+                with self._read_conns_lock:
+                    self._read_conns.append(conn)
+            yield conn
+            return
+        conn = self._connect()
         try:
             yield conn
         finally:
             conn.close()
 
+    def backup_to(self, dest_path: str) -> None:
+        """
+        Copies the database to dest_path with the sqlite backup api, the
+        copy is a consistent view even while writers are active.
+        """
+        dest = sqlite3.connect(dest_path)
+        try:
+            with self.open_db_for_read() as conn:
+                conn.backup(dest)
+        finally:
+            dest.close()
+
     def insert_or_update(self, vids: List[Video]) -> None:
         records = []
+        signatures = []
+        now = now_timestamp()
+        vids = _last_write_wins(vids)
         for vid in vids:
             # Convert datetime to unix timestamp
             timestamp_published = int(vid.date_published.timestamp())
-            json_data = vid.to_json_str()
+            json_data, json_data_cold = self._encode(vid.to_json())
+            signature = title_signature(vid.title)
+            signatures.append((vid.url, signature))
             record = (
                 vid.url,
                 vid.channel_name,
                 timestamp_published,
                 json_data,
+                json_data_cold,
+                vid.views,
+                vid.duration,
+                trending_score(vid.views, timestamp_published, now),
+                to_signed(signature),
+                vid.source,
             )
             records.append(record)
+        if not records:
+            return
         with self.open_db_for_write() as conn:
-            conn.executemany(INSERT_STMT, records)
+            first_seq = self._next_change_seq(conn, len(records))
+            conn.executemany(
+                INSERT_STMT,
+                [record + (first_seq + i,) for i, record in enumerate(records)],
+            )
+            conn.executemany(
+                f"DELETE FROM {TOMBSTONES_TABLE_NAME} WHERE url=(?)",
+                [(record[0],) for record in records],
+            )
+            # A changed title moves the video to other buckets.
+            conn.executemany(
+                f"DELETE FROM {NEAR_DUP_TABLE_NAME} WHERE url=(?)",
+                [(record[0],) for record in records],
+            )
+            self._insert_near_dup_buckets(conn, signatures)
+            if self.views_history:
+                conn.executemany(
+                    INSERT_VIEW_SAMPLE_STMT,
+                    [(vid.url, int(now), vid.views) for vid in vids],
+                )
             conn.commit()
 
     def get_channel_names(self) -> List[str]:
@@ -125,48 +647,509 @@ class DbSqliteVideo:
                 output.append(row[0])
         return output
 
-    def remove_by_channel_name(self, channel_name: str) -> None:
+    def existing_urls(self, urls: List[str]) -> List[str]:
+        """The urls that are stored."""
+        out: List[str] = []
+        with self.open_db_for_read() as conn:
+            for i in range(0, len(urls), 500):
+                chunk = urls[i : i + 500]
+                select_stmt = (
+                    f"SELECT url FROM {TABLE_NAME} WHERE url IN"
+                    f" ({','.join(['?'] * len(chunk))});"
+                )
+                out.extend(row[0] for row in conn.execute(select_stmt, chunk))
+        return out
+
+    def existing_channel_names(self, names: List[str]) -> List[str]:
+        """The channel names that have videos stored."""
+        out: List[str] = []
+        with self.open_db_for_read() as conn:
+            for i in range(0, len(names), 500):
+                chunk = names[i : i + 500]
+                select_stmt = (
+                    f"SELECT DISTINCT channel_name FROM {TABLE_NAME} WHERE"
+                    f" channel_name IN ({','.join(['?'] * len(chunk))});"
+                )
+                out.extend(row[0] for row in conn.execute(select_stmt, chunk))
+        return out
+
+    def get_channel_counts(self) -> Dict[str, int]:
+        """Number of videos of every channel."""
+        select_stmt = (
+            f"SELECT channel_name, COUNT(*) FROM {TABLE_NAME}"
+            " GROUP BY channel_name"
+        )
+        with self.open_db_for_read() as conn:
+            return dict(conn.execute(select_stmt).fetchall())
+
+    def get_facets(
+        self,
+        date_start: datetime,
+        date_end: datetime,
+        facets: Sequence[str] = FACETS,
+        limit: Optional[int] = None,
+        urls: Optional[List[str]] = None,
+    ) -> FacetCounts:
+        """
+        Video counts per value of each facet (see facets.py) in the date
+        range, the limit highest per facet. urls restricts the counts to
+        those videos, ie search results.
+        """
+        check_facets(facets)
+        from_time = int(date_start.timestamp())
+        to_time = int(date_end.timestamp())
+        out: FacetCounts = {}
+        with self.open_db_for_read() as conn:
+            for facet in facets:
+                stmt = (
+                    f"SELECT {facet_sql(facet)} AS value, COUNT(*)"
+                    f" FROM {TABLE_NAME}"
+                    " WHERE timestamp_published BETWEEN ? AND ?"
+                )
+                if urls is None:
+                    cursor = conn.execute(
+                        f"{stmt} GROUP BY value", (from_time, to_time)
+                    )
+                    out[facet] = top(dict(cursor.fetchall()), limit)
+                    continue
+                counts: Dict[str, int] = {}
+                for i in range(0, len(urls), CHUNK_SIZE):
+                    chunk = urls[i : i + CHUNK_SIZE]
+                    placeholders = ",".join("?" * len(chunk))
+                    cursor = conn.execute(
+                        f"{stmt} AND url IN ({placeholders}) GROUP BY value",
+                        [from_time, to_time, *chunk],
+                    )
+                    for value, count in cursor:
+                        counts[value] = counts.get(value, 0) + count
+                out[facet] = top(counts, limit)
+        return out
+
+    def iter_titles(self, batch_size: int = 5000) -> Iterator[List[str]]:
+        """
+        Yields every title, batch_size at a time. Only the hot payload is
+        read and it is not validated, which is much cheaper than a Video.
+        """
+        last_rowid = -1
+        while True:
+            with self.open_db_for_read() as conn:
+                rows = conn.execute(
+                    f"SELECT rowid, data FROM {TABLE_NAME}"
+                    " WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                    (last_rowid, batch_size),
+                ).fetchall()
+            if not rows:
+                return
+            last_rowid = rows[-1][0]
+            yield [self.codec.decode(row[1]).get("title", "") for row in rows]
+
+    def _delete_chunked(
+        self, where: str, values: Sequence[Any], chunk_size: int = CHUNK_SIZE
+    ) -> List[str]:
+        """
+        Deletes the matching rows chunk_size at a time, each chunk in its
+        own transaction so readers and writers are only blocked briefly.
+        Returns the deleted urls.
+        """
+        out: List[str] = []
+        while True:
+            with self.open_db_for_write() as conn:
+                urls = self._delete_where(
+                    conn,
+                    f"rowid IN (SELECT rowid FROM {TABLE_NAME}"
+                    f" WHERE {where} LIMIT {int(chunk_size)})",
+                    values,
+                )
+                conn.commit()
+            out.extend(urls)
+            if len(urls) < chunk_size:
+                return out
+
+    def remove_by_channel_name(self, channel_name: str) -> List[str]:
+        return self._delete_chunked("channel_name=(?)", (channel_name,))
+
+    def remove_by_urls(self, urls: List[str]) -> List[str]:
+        """Deletes the videos, returns the urls that were stored."""
+        urls = [str(url) for url in urls]
+        out: List[str] = []
+        for i in range(0, len(urls), CHUNK_SIZE):
+            chunk = urls[i : i + CHUNK_SIZE]
+            with self.open_db_for_write() as conn:
+                where = f"url IN ({','.join(['?'] * len(chunk))})"
+                out.extend(self._delete_where(conn, where, chunk))
+                conn.commit()
+        return out
+
+    def remove_older_than(
+        self, date: datetime, channel_name: Optional[str] = None
+    ) -> List[str]:
+        """Deletes the videos published before date, returns their urls."""
+        return self.remove_where(date_end=date, channel_name=channel_name)
+
+    def remove_where(
+        self,
+        date_start: Optional[datetime] = None,
+        date_end: Optional[datetime] = None,
+        channel_name: Optional[str] = None,
+        max_views: Optional[int] = None,
+    ) -> List[str]:
+        """
+        Deletes the videos matching every given filter: published in
+        [date_start, date_end), of the channel, with at most max_views
+        views. At least one filter is required, see clear().
+        """
+        clauses, values = _where_clauses(
+            date_start, date_end, channel_name, max_views
+        )
+        if not clauses:
+            raise ValueError("remove_where needs at least one filter")
+        return self._delete_chunked(" AND ".join(clauses), values)
+
+    def update_fields(self, patches: Dict[str, Dict[str, Any]]) -> List[Video]:
+        """
+        Sets fields of many videos, {url: {field: value}}, in chunked
+        transactions. The patched videos are validated like new ones and
+        returned, urls that are not stored are skipped.
+        """
+        out: List[Video] = []
+        urls = list(patches)
+        for i in range(0, len(urls), CHUNK_SIZE):
+            vids = self.find_videos_by_urls(urls[i : i + CHUNK_SIZE])
+            patched = [
+                Video(**{**vid.model_dump(), **patches[vid.url]})
+                for vid in vids
+            ]
+            self.insert_or_update(patched)
+            out.extend(patched)
+        return out
+
+    def incremental_vacuum(self, pages_per_step: int = 1000) -> int:
+        """
+        Returns free pages to the file system pages_per_step at a time, each
+        step a short write instead of one long VACUUM. Needs auto_vacuum
+        INCREMENTAL, see enable_incremental_vacuum(). Returns the number of
+        pages freed.
+        """
+        freed = 0
+        while True:
+            with self.open_db_for_write() as conn:
+                before = conn.execute("PRAGMA freelist_count;").fetchone()[0]
+                if not before:
+                    return freed
+                conn.execute(f"PRAGMA incremental_vacuum({int(pages_per_step)});")
+                conn.commit()
+                after = conn.execute("PRAGMA freelist_count;").fetchone()[0]
+            if after >= before:
+                return freed  # auto_vacuum is not INCREMENTAL.
+            freed += before - after
+
+    def enable_incremental_vacuum(self) -> bool:
+        """
+        Switches a database created before auto_vacuum=INCREMENTAL over,
+        which takes one full VACUUM. Returns False if it already was.
+        """
+        with self.open_db_for_write() as conn:
+            mode = conn.execute("PRAGMA auto_vacuum;").fetchone()[0]
+            if mode == 2:
+                return False
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL;")
+            conn.execute("VACUUM")
+        return True
+
+    def get_view_history(self, url: str) -> ViewHistory:
+        """The views samples of a video, empty arrays if there are none."""
+        timestamps = array("q")
+        views = array("q")
+        with self.open_db_for_read() as conn:
+            cursor = conn.execute(
+                f"SELECT timestamp, views FROM {VIEW_HISTORY_TABLE_NAME}"
+                " WHERE url=(?) ORDER BY timestamp",
+                (url,),
+            )
+            for timestamp, view_count in cursor:
+                timestamps.append(timestamp)
+                views.append(view_count)
+        return ViewHistory(timestamps, views)
+
+    def get_view_velocity(
+        self,
+        urls: List[str],
+        window: timedelta = timedelta(hours=24),
+        now_time: Optional[datetime] = None,
+    ) -> Dict[str, float]:
+        """
+        Views gained per hour over the window, computed by sqlite. The
+        baseline is the latest sample at the window start, or the first
+        one inside it. Samples are only taken when the views change, so
+        a video without samples in the window gained nothing. Urls without
+        samples, or with only one inside the window, are left out.
+        """
+        now = now_timestamp(now_time)
+        start = int(now - window.total_seconds())
+        out: Dict[str, float] = {}
+        with self.open_db_for_read() as conn:
+            for i in range(0, len(urls), CHUNK_SIZE):
+                chunk = urls[i : i + CHUNK_SIZE]
+                select_stmt = (
+                    "WITH bounds AS ("
+                    " SELECT url,"
+                    "  COALESCE(MAX(CASE WHEN timestamp <= ? THEN timestamp END),"
+                    "   MIN(timestamp)) AS t0,"
+                    "  MAX(timestamp) AS t1"
+                    f" FROM {VIEW_HISTORY_TABLE_NAME}"
+                    f" WHERE url IN ({','.join(['?'] * len(chunk))})"
+                    "  AND timestamp <= ?"
+                    " GROUP BY url)"
+                    " SELECT b.url, CASE WHEN b.t1 > b.t0"
+                    "  THEN (h1.views - h0.views) * 3600.0 / (b.t1 - b.t0)"
+                    "  ELSE 0.0 END"
+                    " FROM bounds b"
+                    f" JOIN {VIEW_HISTORY_TABLE_NAME} h0"
+                    "  ON h0.url=b.url AND h0.timestamp=b.t0"
+                    f" JOIN {VIEW_HISTORY_TABLE_NAME} h1"
+                    "  ON h1.url=b.url AND h1.timestamp=b.t1"
+                    # No sample in the window means no views gained.
+                    " WHERE b.t1 > b.t0 OR b.t1 <= ?;"
+                )
+                values = [start, *chunk, int(now), start]
+                out.update(conn.execute(select_stmt, values).fetchall())
+        return out
+
+    def downsample_view_history(
+        self,
+        older_than: timedelta = timedelta(days=7),
+        interval: timedelta = timedelta(days=1),
+        now_time: Optional[datetime] = None,
+    ) -> int:
+        """
+        Keeps only the latest sample per video and interval for samples
+        older than older_than. Returns the number of samples dropped.
+        """
+        cutoff = int(now_timestamp(now_time) - older_than.total_seconds())
+        seconds = max(int(interval.total_seconds()), 1)
+        with self.open_db_for_write() as conn:
+            cursor = conn.execute(
+                f"DELETE FROM {VIEW_HISTORY_TABLE_NAME}"
+                " WHERE timestamp < ? AND (url, timestamp) NOT IN ("
+                f" SELECT url, MAX(timestamp) FROM {VIEW_HISTORY_TABLE_NAME}"
+                " WHERE timestamp < ? GROUP BY url, timestamp / ?);",
+                (cutoff, cutoff, seconds),
+            )
+            conn.commit()
+            return cursor.rowcount
+
+    def current_change_seq(self) -> int:
+        """The sequence number of the latest change."""
+        with self.open_db_for_read() as conn:
+            cursor = conn.execute(
+                f"SELECT value FROM {META_TABLE_NAME} WHERE key='change_seq'"
+            )
+            return cursor.fetchone()[0]
+
+    def changes_since(self, seq: int, limit: int = 1000) -> List[Change]:
+        """
+        Returns up to `limit` changes with a sequence number above `seq`,
+        in sequence order. Deleted videos come back as tombstones with
+        video=None. Only the latest change of a url is kept, so replicas
+        that apply the changes in order converge on the current state.
+        """
+        select_stmt = (
+            f"SELECT change_seq, url, data, data_cold FROM {TABLE_NAME}"
+            " WHERE change_seq > ?"
+            " UNION ALL"
+            f" SELECT change_seq, url, NULL, NULL FROM {TOMBSTONES_TABLE_NAME}"
+            " WHERE change_seq > ?"
+            " ORDER BY change_seq LIMIT ?;"
+        )
+        with self.open_db_for_read() as conn:
+            rows = conn.execute(select_stmt, (seq, seq, limit)).fetchall()
+        out: List[Change] = []
+        for change_seq, url, data, data_cold in rows:
+            video = self._decode(data, data_cold) if data is not None else None
+            out.append(Change(change_seq, url, video))
+        return out
+
+    def iter_changes_since(
+        self, seq: int, batch_size: int = 1000
+    ) -> Iterator[List[Change]]:
+        """Streams every change after `seq` in batches."""
+        while True:
+            changes = self.changes_since(seq, batch_size)
+            if not changes:
+                return
+            yield changes
+            seq = changes[-1].seq
+
+    def prune_tombstones(self, max_seq: int) -> int:
+        """Drops tombstones every replica has synced past `max_seq`."""
         with self.open_db_for_write() as conn:
+            cursor = conn.execute(
+                f"DELETE FROM {TOMBSTONES_TABLE_NAME} WHERE change_seq <= ?",
+                (max_seq,),
+            )
+            # Consumers behind this point can not see every deletion.
             conn.execute(
-                f"DELETE FROM {TABLE_NAME} WHERE channel_name=(?)",
-                (channel_name,),
+                f"INSERT INTO {META_TABLE_NAME} VALUES ('tombstones_pruned', ?)"
+                " ON CONFLICT(key) DO UPDATE SET value=MAX(value, excluded.value);",
+                (max_seq,),
             )
             conn.commit()
+            return cursor.rowcount
 
-    def find_videos_by_channel_name(self, channel_name: str) -> List[Video]:
-        select_stmt = f"SELECT data FROM {TABLE_NAME} WHERE channel_name=(?)"
-        output: List[str] = []
+    def tombstones_pruned_seq(self) -> int:
+        """The highest max_seq passed to prune_tombstones, 0 if none."""
+        with self.open_db_for_read() as conn:
+            cursor = conn.execute(
+                f"SELECT value FROM {META_TABLE_NAME} WHERE key='tombstones_pruned'"
+            )
+            row = cursor.fetchone()
+        return row[0] if row is not None else 0
+
+    @overload
+    def find_videos_by_channel_name(
+        self, channel_name: str, summary: Literal[False] = ...
+    ) -> List[Video]:
+        ...
+
+    @overload
+    def find_videos_by_channel_name(
+        self, channel_name: str, summary: Literal[True]
+    ) -> List[VideoSummary]:
+        ...
+
+    @overload
+    def find_videos_by_channel_name(
+        self, channel_name: str, summary: bool
+    ) -> List[Any]:
+        ...
+
+    def find_videos_by_channel_name(
+        self, channel_name: str, summary: bool = False
+    ) -> List[Any]:
+        select_stmt = f"SELECT {_columns(summary)} FROM {TABLE_NAME} WHERE channel_name=(?)"
+        output: List[Any] = []
         with self.open_db_for_read() as conn:
             cursor = conn.execute(select_stmt, (channel_name,))
             for row in cursor:
-                output.append(row[0])
-        return [Video(**json.loads(s)) for s in output]
+                output.append(row)
+        return self._decode_rows(output, summary)
+
+    @overload
+    def find_videos_by_urls(
+        self, urls: List[str], summary: Literal[False] = ...
+    ) -> List[Video]:
+        ...
+
+    @overload
+    def find_videos_by_urls(
+        self, urls: List[str], summary: Literal[True]
+    ) -> List[VideoSummary]:
+        ...
 
-    def find_videos_by_urls(self, urls: List[str]) -> List[Video]:
-        outlist: List[Video] = []
+    @overload
+    def find_videos_by_urls(
+        self, urls: List[str], summary: bool
+    ) -> List[Any]:
+        ...
+
+    def find_videos_by_urls(
+        self, urls: List[str], summary: bool = False
+    ) -> List[Any]:
         urls = [str(url) for url in urls]
-        select_stmt = f"""SELECT data FROM {TABLE_NAME} WHERE url IN ({",".join(["?"] * len(urls))});"""
+        select_stmt = f"""SELECT {_columns(summary)} FROM {TABLE_NAME} WHERE url IN ({",".join(["?"] * len(urls))});"""
         with self.open_db_for_read() as conn:
             cursor = conn.execute(select_stmt, urls)
             vals = cursor.fetchall()
-        for row in vals:
-            data: Dict = json.loads(row[0])
-            out: Video = Video(**data)
-            outlist.append(out)
-        return outlist
+        return self._decode_rows(vals, summary)
+
+    def find_near_duplicates(
+        self, vid: Video, max_distance: int = MAX_DISTANCE
+    ) -> List[Video]:
+        """
+        Stored videos that look like re-uploads of vid, not vid itself.
+        Only the videos sharing a signature band are read and compared.
+        """
+        if max_distance > MAX_DISTANCE:
+            raise ValueError(f"max_distance can be at most {MAX_DISTANCE}")
+        if not normalize_title(vid.title):
+            return []
+        signature = title_signature(vid.title)
+        keys = band_keys(signature)
+        select_stmt = (
+            f"SELECT DISTINCT v.url, v.simhash, v.duration, v.data, v.data_cold"
+            f" FROM {NEAR_DUP_TABLE_NAME} b JOIN {TABLE_NAME} v ON v.url=b.url"
+            f" WHERE b.bucket IN ({','.join(['?'] * len(keys))});"
+        )
+        with self.open_db_for_read() as conn:
+            rows = conn.execute(select_stmt, keys).fetchall()
+        matches = [
+            row[3:]
+            for row in rows
+            if row[0] != vid.url
+            and row[1] is not None
+            and is_near_duplicate(
+                signature, vid.duration, row[1], row[2] or 0, max_distance
+            )
+        ]
+        return [
+            match
+            for match in self._decode_rows(matches, summary=False)
+            if titles_match(vid.title, match.title)
+        ]
 
     def find_video_by_url(self, url: str) -> Optional[Video]:
         vids = self.find_videos_by_urls([url])
         return vids[0] if vids else None
 
+    @overload
     def find_videos(
         self,
         date_start: datetime,
         date_end: datetime,
         channel_name: Optional[str] = None,
         limit_count: Optional[int] = None,
+        summary: Literal[False] = ...,
     ) -> List[Video]:
-        output: List[Video] = []
+        ...
+
+    @overload
+    def find_videos(
+        self,
+        date_start: datetime,
+        date_end: datetime,
+        channel_name: Optional[str] = None,
+        limit_count: Optional[int] = None,
+        *,
+        summary: Literal[True],
+    ) -> List[VideoSummary]:
+        ...
+
+    @overload
+    def find_videos(
+        self,
+        date_start: datetime,
+        date_end: datetime,
+        channel_name: Optional[str] = None,
+        limit_count: Optional[int] = None,
+        *,
+        summary: bool,
+    ) -> List[Any]:
+        ...
+
+    def find_videos(
+        self,
+        date_start: datetime,
+        date_end: datetime,
+        channel_name: Optional[str] = None,
+        limit_count: Optional[int] = None,
+        summary: bool = False,
+    ) -> List[Any]:
+        """
+        Finds videos published in the date range, newest first. With
+        summary=True VideoSummary objects are returned and the cold fields
+        are never read.
+        """
+        columns = _columns(summary)
         from_time = int(date_start.timestamp())
         to_time = int(date_end.timestamp())
         if limit_count is not None:
@@ -175,35 +1158,155 @@ class DbSqliteVideo:
             limit_clause = ""
         if channel_name is None:
             select_stmt = (
-                f"SELECT data FROM {TABLE_NAME} WHERE timestamp_published BETWEEN ? AND ?"
+                f"SELECT {columns} FROM {TABLE_NAME} WHERE timestamp_published BETWEEN ? AND ?"
                 f" ORDER BY timestamp_published DESC {limit_clause};"
             )
             values = (from_time, to_time)  # type: ignore
         else:
             select_stmt = (
-                f"SELECT data FROM {TABLE_NAME} WHERE channel_name=(?) and"
+                f"SELECT {columns} FROM {TABLE_NAME} WHERE channel_name=(?) and"
                 " timestamp_published BETWEEN ? AND ?"
                 f" ORDER BY timestamp_published DESC {limit_clause};"
             )
             values = (channel_name, from_time, to_time)  # type: ignore
-        with self.open_db_for_read() as conn:  # TODO: have a read-mode.
+        with self.open_db_for_read() as conn:
             cursor = conn.execute(select_stmt, values)
             all_rows = cursor.fetchall()
-        for row in all_rows:
-            json_data = row[0]
-            data = json.loads(json_data)
-            vid = Video(**data)
-            output.append(vid)
-        return output
+        return self._decode_rows(all_rows, summary)
 
     def get_all_videos(self) -> List[Video]:
-        select_stmt = f"SELECT data FROM {TABLE_NAME}"
-        output: List[str] = []
+        select_stmt = f"SELECT data, data_cold FROM {TABLE_NAME}"
+        output: List[Any] = []
         with self.open_db_for_read() as conn:
             cursor = conn.execute(select_stmt)
             for row in cursor:
-                output.append(row[0])
-        return [Video(**json.loads(s)) for s in output]
+                output.append(row)
+        return self._decode_rows(output, summary=False)
+
+    def iter_videos(self, batch_size: int = 1000) -> Iterator[List[Video]]:
+        """
+        Yields every video in rowid order, batch_size at a time. Each batch
+        is a fresh read so memory stays constant on large tables.
+        """
+        last_rowid = -1
+        while True:
+            with self.open_db_for_read() as conn:
+                rows = conn.execute(
+                    f"SELECT rowid, data, data_cold FROM {TABLE_NAME}"
+                    " WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                    (last_rowid, batch_size),
+                ).fetchall()
+            if not rows:
+                return
+            last_rowid = rows[-1][0]
+            yield [self._decode(row[1], row[2]) for row in rows]
+
+    def find_trending(
+        self,
+        limit: int,
+        channel_name: Optional[str] = None,
+        window: timedelta = DEFAULT_WINDOW,
+        now_time: Optional[datetime] = None,
+    ) -> List[Video]:
+        """
+        Videos published within `window` ordered by trending_score, served
+        from the score index. Scores are as fresh as the last write or
+        refresh_trending() call. Raises ValueError for a window longer than
+        TRENDING_MAX_WINDOW.
+        """
+        check_window(window)
+        from_time = int(now_timestamp(now_time) - window.total_seconds())
+        where = "trending_score IS NOT NULL AND timestamp_published >= ?"
+        values: List[Any] = [from_time]
+        if channel_name is not None:
+            where = f"channel_name=(?) AND {where}"
+            values.insert(0, channel_name)
+        select_stmt = (
+            f"SELECT data, data_cold FROM {TABLE_NAME} WHERE {where}"
+            " ORDER BY trending_score DESC LIMIT ?;"
+        )
+        values.append(limit)
+        with self.open_db_for_read() as conn:
+            rows = conn.execute(select_stmt, values).fetchall()
+        return self._decode_rows(rows, summary=False)
+
+    def refresh_trending(
+        self, now_time: Optional[datetime] = None, batch_size: int = 5000
+    ) -> int:
+        """
+        Periodic batch job applying time decay: rescores every video in the
+        trending window at a common `now` and clears the score of videos
+        that aged out of it. Returns the number of rows rescored.
+        """
+        now = now_timestamp(now_time)
+        from_time = int(now - TRENDING_MAX_WINDOW.total_seconds())
+        with self.open_db_for_write() as conn:
+            conn.execute(
+                f"UPDATE {TABLE_NAME} SET trending_score=NULL"
+                " WHERE trending_score IS NOT NULL AND timestamp_published < ?",
+                (from_time,),
+            )
+            conn.commit()
+        with self.open_db_for_read() as conn:
+            rows = conn.execute(
+                f"SELECT rowid, views, timestamp_published FROM {TABLE_NAME}"
+                " WHERE timestamp_published >= ?",
+                (from_time,),
+            ).fetchall()
+        for i in range(0, len(rows), batch_size):
+            with self.open_db_for_write() as conn:
+                conn.executemany(
+                    f"UPDATE {TABLE_NAME} SET trending_score=(?) WHERE rowid=(?)",
+                    [
+                        (trending_score(views, ts, now), rowid)
+                        for rowid, views, ts in rows[i : i + batch_size]
+                    ],
+                )
+                conn.commit()
+        return len(rows)
+
+    def get_columns(
+        self,
+        fields: Sequence[str] = DEFAULT_FIELDS,
+        date_start: Optional[datetime] = None,
+        date_end: Optional[datetime] = None,
+        channel_name: Optional[str] = None,
+        batch_size: int = 10000,
+    ) -> VideoColumns:
+        """
+        Streams the given columns into a VideoColumns result without
+        decoding any payload or building Video objects. The date range is
+        optional, newest videos come first.
+        """
+        out = VideoColumns(fields)
+        selects = []
+        for field in out.fields:
+            null_value = "''" if COLUMN_TYPES[field] is None else "0"
+            selects.append(f"COALESCE({field}, {null_value})")
+        where = []
+        values: List[Any] = []
+        if date_start is not None:
+            where.append("timestamp_published >= ?")
+            values.append(int(date_start.timestamp()))
+        if date_end is not None:
+            where.append("timestamp_published <= ?")
+            values.append(int(date_end.timestamp()))
+        if channel_name is not None:
+            where.append("channel_name=(?)")
+            values.append(channel_name)
+        where_clause = f" WHERE {' AND '.join(where)}" if where else ""
+        select_stmt = (
+            f"SELECT {', '.join(selects)} FROM {TABLE_NAME}{where_clause}"
+            " ORDER BY timestamp_published DESC;"
+        )
+        with self.open_db_for_read() as conn:
+            cursor = conn.execute(select_stmt, values)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                out.append_rows(rows)
+        return out
 
     def to_data(self) -> List[Any]:
         out = []
@@ -214,3 +1317,66 @@ class DbSqliteVideo:
                 values = list(row)  # Copy
                 out.append(values)
         return out
+
+    def train_payload_dictionary(self, sample_size: int = 2000) -> int:
+        """
+        Trains a compression dictionary from a sample of the stored rows,
+        stores it in the db and makes it current. Returns its id.
+        """
+        select_stmt = (
+            f"SELECT data FROM {TABLE_NAME} ORDER BY timestamp_published DESC"
+            " LIMIT ?"
+        )
+        with self.open_db_for_read() as conn:
+            rows = conn.execute(select_stmt, (sample_size,)).fetchall()
+        samples = [self.codec.decode(row[0]) for row in rows]
+        zdict = train_dictionary(samples)
+        with self.open_db_for_write() as conn:
+            cursor = conn.execute(
+                f"INSERT INTO {DICT_TABLE_NAME} (data) VALUES (?)", (zdict,)
+            )
+            dictionary_id = cursor.lastrowid
+            conn.commit()
+        assert dictionary_id is not None
+        self.codec.set_dictionary(dictionary_id, zdict)
+        return dictionary_id
+
+    def compact(
+        self, train: bool = True, batch_size: int = 500, vacuum: bool = True
+    ) -> int:
+        """
+        Rewrites every row in the current payload format, training a new
+        compression dictionary first when compression is enabled. Rows from
+        before the hot/cold split are split as well. Runs in small
+        transactions so readers are only blocked briefly. Returns the number
+        of rows rewritten.
+        """
+        if train and self.codec.compression is not COMPRESSION_NONE:
+            self.train_payload_dictionary()
+        count = 0
+        last_rowid = -1
+        while True:
+            with self.open_db_for_write() as conn:
+                rows = conn.execute(
+                    f"SELECT rowid, data, data_cold FROM {TABLE_NAME}"
+                    " WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                    (last_rowid, batch_size),
+                ).fetchall()
+                if not rows:
+                    break
+                updates = [
+                    (*self._encode(self._decode_json(data, data_cold)), rowid)
+                    for rowid, data, data_cold in rows
+                ]
+                conn.executemany(
+                    f"UPDATE {TABLE_NAME} SET data=(?), data_cold=(?)"
+                    " WHERE rowid=(?)",
+                    updates,
+                )
+                conn.commit()
+            count += len(rows)
+            last_rowid = rows[-1][0]
+        if vacuum:
+            with self.open_db_for_write() as conn:
+                conn.execute("VACUUM")
+        return count
@@ -0,0 +1,118 @@
+"""
+Parsing of scraped video durations into seconds.
+
+Scraped pages repeat a small set of duration strings ("0:57", "12:34",
+"1:02:03"), so parsed strings are cached. The common HH:MM:SS shapes are
+matched by one precompiled regex, anything else takes the general path.
+"""
+
+# pylint: disable=all
+
+import re
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List
+
+# [[hours:]minutes:]seconds[.fraction], ascii digits only.
+_DURATION_RE = re.compile(r"(?:(?:(\d+):)?(\d+):)?(\d+(?:\.\d+)?)", re.ASCII)
+_EMPTY_DURATIONS = frozenset(["", "?", "Live"])
+CACHE_SIZE = 4096
+
+
+def _invalid(duration: Any) -> ValueError:
+    return ValueError(f"Invalid duration: {duration}")
+
+
+def _parse_general(duration: Any) -> float:
+    """Handles every format accepted by parse_duration, the slow way."""
+    try:
+        valf = float(duration)
+        if valf >= 0.0:
+            return valf
+    except ValueError:
+        pass
+    if duration in _EMPTY_DURATIONS:
+        return 0
+    # Simple case
+    if ":" not in duration and "." not in duration:
+        try:
+            tmp = float(duration)
+        except ValueError:
+            raise _invalid(duration)
+        if tmp < 0:
+            raise _invalid(duration)
+        return tmp
+    units = duration.split(":")
+    if len(units) > 3:
+        raise _invalid(duration)
+    units.reverse()
+    total: float = 0.0
+    limit_multiplier = [
+        (60, 1),
+        (60, 60),
+        (24, 60 * 60),
+    ]
+    for i, unit in enumerate(units):
+        try:
+            # Only the seconds may have a fraction.
+            val = float(unit) if i == 0 else int(unit)
+        except ValueError:
+            raise _invalid(duration)
+        limit, multiplier = limit_multiplier[i]
+        if not 0 <= val < limit:
+            raise _invalid(duration)
+        total += val * multiplier
+    return total
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _parse_str(duration: str) -> float:
+    match = _DURATION_RE.fullmatch(duration)
+    if match is None:
+        return _parse_general(duration)
+    hours, minutes, seconds = match.groups()
+    if minutes is None:
+        # Without a colon the seconds can be any value.
+        return float(seconds)
+    secs = float(seconds)
+    mins = int(minutes)
+    hrs = int(hours) if hours is not None else 0
+    if secs >= 60 or mins >= 60 or hrs >= 24:
+        raise _invalid(duration)
+    return hrs * 3600 + mins * 60 + secs
+
+
+def parse_duration(duration: str) -> float:
+    """
+    Checks that the duration is in the format HH:MM:SS.
+    Other acceptable formats include SS.
+    Ok:
+      ""
+      "?"
+      06
+      6
+      60
+      61
+      23:24
+      23:24:01.34
+    Not Ok:
+      -7
+      61  # above 60 seconds
+      61:01 # above 60 minutes
+      25:24:01.34 # above 24 hours
+    """
+    if isinstance(duration, str):
+        return _parse_str(duration)
+    return _parse_general(duration)
+
+
+def parse_durations(durations: Iterable[str]) -> List[float]:
+    """Parses many durations, each distinct value is parsed once."""
+    seen: Dict[Any, float] = {}
+    out: List[float] = []
+    for duration in durations:
+        val = seen.get(duration)
+        if val is None:
+            val = parse_duration(duration)
+            seen[duration] = val
+        out.append(val)
+    return out
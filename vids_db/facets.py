@@ -0,0 +1,124 @@
+"""
+Faceted counts for browse pages: the number of videos per source,
+duration bucket and channel in a date window.
+
+The counts are GROUP BY queries inside sqlite over the covering index
+idx_facets (timestamp_published, source, duration, channel_name), so no
+video is decoded. FacetCache keeps the counts of hot windows until the
+next write.
+"""
+
+# pylint: disable=all
+
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional, Sequence, Tuple
+
+FACET_SOURCE = "source"
+FACET_DURATION = "duration"
+FACET_CHANNEL = "channel_name"
+FACETS = (FACET_SOURCE, FACET_DURATION, FACET_CHANNEL)
+
+UNKNOWN_DURATION = "unknown"  # Duration 0, the scraper did not find it.
+# (label, upper bound in seconds, exclusive), the last has no bound.
+DURATION_BUCKETS: List[Tuple[str, Optional[int]]] = [
+    ("short", 4 * 60),
+    ("medium", 20 * 60),
+    ("long", None),
+]
+
+DEFAULT_CACHE_SIZE = 64
+
+# {facet: {value: count}}, values by count, highest first.
+FacetCounts = Dict[str, Dict[str, int]]
+
+
+def check_facets(facets: Sequence[str]) -> None:
+    unknown = [facet for facet in facets if facet not in FACETS]
+    if unknown:
+        raise ValueError(f"Unknown facets {unknown}, expected some of {FACETS}")
+
+
+def duration_bucket(seconds: float) -> str:
+    if not seconds:
+        return UNKNOWN_DURATION
+    for label, bound in DURATION_BUCKETS:
+        if bound is None or seconds < bound:
+            return label
+    raise AssertionError("The last bucket has no bound")
+
+
+def duration_bucket_sql(column: str = "duration") -> str:
+    """duration_bucket() as a sqlite CASE expression."""
+    cases = [f"WHEN COALESCE({column}, 0) = 0 THEN '{UNKNOWN_DURATION}'"]
+    for label, bound in DURATION_BUCKETS:
+        if bound is None:
+            cases.append(f"ELSE '{label}'")
+        else:
+            cases.append(f"WHEN {column} < {bound} THEN '{label}'")
+    return f"CASE {' '.join(cases)} END"
+
+
+def facet_sql(facet: str) -> str:
+    """The grouped expression of a facet."""
+    if facet == FACET_DURATION:
+        return duration_bucket_sql()
+    return f"COALESCE({facet}, '')"
+
+
+def top(counts: Dict[str, int], limit: Optional[int]) -> Dict[str, int]:
+    """The limit highest counts, highest first, ties by value."""
+    ranked = sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+    return dict(ranked if limit is None else ranked[:limit])
+
+
+def merge(
+    parts: Sequence[FacetCounts], facets: Sequence[str], limit: Optional[int]
+) -> FacetCounts:
+    """
+    Sums the unlimited counts of several stores. A part can take counts
+    back out with negative ones, values that sum to 0 are dropped.
+    """
+    out: FacetCounts = {}
+    for facet in facets:
+        total: Dict[str, int] = {}
+        for part in parts:
+            for value, count in part.get(facet, {}).items():
+                total[value] = total.get(value, 0) + count
+        out[facet] = top(
+            {value: count for value, count in total.items() if count}, limit
+        )
+    return out
+
+
+class FacetCache:
+    """LRU of facet counts, every entry is dropped once the store changed."""
+
+    def __init__(self, max_size: int = DEFAULT_CACHE_SIZE) -> None:
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._generation: Optional[str] = None
+        self._entries: "OrderedDict[Hashable, FacetCounts]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, generation: str) -> Optional[FacetCounts]:
+        with self._lock:
+            if generation != self._generation:
+                self._entries.clear()
+                self._generation = generation
+            counts = self._entries.get(key)
+            if counts is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return counts
+
+    def put(self, key: Hashable, generation: str, counts: FacetCounts) -> None:
+        with self._lock:
+            if generation != self._generation or self.max_size <= 0:
+                return  # Written meanwhile, the counts may be stale.
+            self._entries[key] = counts
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
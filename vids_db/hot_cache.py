@@ -0,0 +1,272 @@
+"""
+Hot tier of recent videos in front of the video store.
+
+Most reads are get_video_list() over the last few days. HotCache keeps
+the videos published in the last `window` decoded in a DbMemoryVideo
+(sorted timestamps with a per channel index), so those windows are
+answered without touching sqlite.
+
+Every stored video published at or after `cutoff` is cached, a window
+starting at or after it is a hit. The cache is filled at startup by a
+streaming read: the (timestamp, url) columns of the window first, which
+decode nothing, then the videos in batches of LOAD_BATCH_SIZE. Writes of
+this process are applied as they happen. Writes of other processes are
+caught up through the change feed of a DbSqliteVideo store, a reload is
+only needed once the tombstones the cache missed were pruned. Reads
+don't open connections: at most every poll_interval seconds they check
+PRAGMA data_version on one long-lived connection, which only changes
+when another connection committed, so writes of other processes show up
+at most that late.
+
+At most max_size videos are kept. Beyond that the oldest are evicted and
+cutoff moves forward, as it does when videos age out of the window. They
+are kept EXPIRY_SLACK longer than the window, so queries for exactly the
+last `window` keep hitting.
+"""
+
+# pylint: disable=all
+
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from datetime import datetime, timedelta, timezone
+from typing import Any, List, NamedTuple, Optional
+from urllib.request import pathname2url
+
+from vids_db.backend import VideoStore
+from vids_db.db_memory_video import DbMemoryVideo
+from vids_db.db_sqlite_video import Change, DbSqliteVideo
+from vids_db.models import Video
+from vids_db.trending import now_timestamp
+
+DEFAULT_WINDOW = timedelta(hours=72)
+DEFAULT_MAX_SIZE = 200000
+LOAD_BATCH_SIZE = 500
+EXPIRY_SLACK = timedelta(hours=1)
+DEFAULT_POLL_INTERVAL = 1.0  # Seconds.
+
+
+class HotCacheMetrics(NamedTuple):
+    size: int  # Videos cached.
+    max_size: int
+    cutoff: Optional[datetime]  # None until loaded.
+    hits: int  # Windows answered from memory.
+    misses: int
+    evicted: int  # Videos dropped for the size budget.
+
+
+def _timestamp(vid: Video) -> int:
+    return int(vid.date_published.timestamp())
+
+
+class HotCache:
+    """Recent videos in memory, see the module docstring."""
+
+    def __init__(
+        self,
+        window: timedelta = DEFAULT_WINDOW,
+        max_size: int = DEFAULT_MAX_SIZE,
+        poll_interval: float = DEFAULT_POLL_INTERVAL,
+    ) -> None:
+        self.window = window
+        self.max_size = max_size
+        self.poll_interval = poll_interval
+        self.cutoff: Optional[int] = None
+        # Change sequence of the store the cache is in sync with.
+        self.seq: Optional[int] = None
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self.store = DbMemoryVideo()
+        self._lock = threading.RLock()
+        # Long-lived connection for PRAGMA data_version.
+        self._conn: Optional[sqlite3.Connection] = None
+        self._data_version: Optional[int] = None
+        self._polled_at = 0.0
+
+    def __len__(self) -> int:
+        return len(self.store)
+
+    def _expiry(self, now_time: Optional[datetime]) -> int:
+        retained = self.window + EXPIRY_SLACK
+        return int(now_timestamp(now_time) - retained.total_seconds())
+
+    def load(
+        self,
+        store: VideoStore,
+        seq: Optional[int] = None,
+        now_time: Optional[datetime] = None,
+    ) -> int:
+        """
+        Reads the window from store, seq is its change sequence from
+        before the read. Returns the number of videos cached.
+        """
+        cutoff = self._expiry(now_time)
+        columns = store.get_columns(
+            ["timestamp_published", "url"],
+            date_start=datetime.fromtimestamp(cutoff, tz=timezone.utc),
+        )
+        # Newest first.
+        timestamps: array = columns.columns["timestamp_published"]  # type: ignore
+        urls: List[str] = columns.columns["url"]  # type: ignore
+        count = len(urls)
+        if count > self.max_size:
+            # Whole seconds only, so every video after cutoff is cached.
+            cutoff = timestamps[self.max_size] + 1
+            count = self.max_size
+            while count and timestamps[count - 1] < cutoff:
+                count -= 1
+        with self._lock:
+            self.store.clear()
+            self.cutoff = cutoff
+            self.seq = seq
+            for i in range(0, count, LOAD_BATCH_SIZE):
+                batch = store.find_videos_by_urls(urls[i : i + LOAD_BATCH_SIZE])
+                # Rewritten since the columns were read.
+                self.add(batch)
+            return len(self.store)
+
+    def add(
+        self, vids: List[Video], now_time: Optional[datetime] = None
+    ) -> None:
+        """Applies written videos, those published before cutoff leave."""
+        with self._lock:
+            if self.cutoff is None:
+                return
+            cutoff = self.cutoff
+            self.store.remove_by_urls(
+                [vid.url for vid in vids if _timestamp(vid) < cutoff]
+            )
+            self.store.insert_or_update(
+                [vid for vid in vids if _timestamp(vid) >= cutoff]
+            )
+            self._evict(now_time)
+
+    def remove(self, urls: List[str]) -> None:
+        with self._lock:
+            self.store.remove_by_urls(urls)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.store.clear()
+
+    def _evict(self, now_time: Optional[datetime]) -> None:
+        assert self.cutoff is not None
+        expired = self._expiry(now_time)
+        if expired > self.cutoff:
+            self.store.remove_where(
+                date_end=datetime.fromtimestamp(expired, tz=timezone.utc)
+            )
+            self.cutoff = expired
+        overflow = len(self.store) - self.max_size
+        if overflow > 0:
+            size = len(self.store)
+            ts = self.store.evict_oldest(overflow)
+            assert ts is not None
+            self.cutoff = max(self.cutoff, ts + 1)
+            self.evicted += size - len(self.store)
+
+    def apply_changes(self, changes: List[Change]) -> None:
+        with self._lock:
+            self.remove([c.url for c in changes if c.video is None])
+            self.add([c.video for c in changes if c.video is not None])
+            if changes:
+                self.seq = max(self.seq or 0, changes[-1].seq)
+
+    def changed(self, db_sqlite: DbSqliteVideo) -> bool:
+        """Whether another connection committed since the last call."""
+        with self._lock:
+            if self._conn is None:
+                uri = "file:%s?mode=ro" % pathname2url(
+                    os.path.abspath(db_sqlite.db_path)
+                )
+                self._conn = sqlite3.connect(
+                    uri, check_same_thread=False, uri=True
+                )
+            version = self._conn.execute("PRAGMA data_version;").fetchone()[0]
+            self._polled_at = time.monotonic()
+            if version == self._data_version:
+                return False
+            self._data_version = version
+            return True
+
+    def poll(self, db_sqlite: DbSqliteVideo) -> None:
+        """catch_up(), at most every poll_interval seconds."""
+        with self._lock:
+            if time.monotonic() - self._polled_at >= self.poll_interval:
+                self.catch_up(db_sqlite)
+
+    def catch_up(
+        self,
+        db_sqlite: DbSqliteVideo,
+        own_writes: bool = False,
+        force: bool = False,
+    ) -> None:
+        """
+        Applies the changes other processes made since self.seq. With
+        own_writes the changes were made by this process and are already
+        applied, only the sequence moves. force skips the data_version
+        check.
+        """
+        with self._lock:
+            if self.cutoff is None:
+                return
+            if not self.changed(db_sqlite) and not force:
+                return
+            seq = db_sqlite.current_change_seq()
+            if seq == self.seq:
+                return
+            if own_writes or self.seq is None:
+                self.seq = seq
+            elif self.seq < db_sqlite.tombstones_pruned_seq():
+                # Some deletions can not be seen anymore.
+                self.load(db_sqlite, seq)
+            else:
+                for changes in db_sqlite.iter_changes_since(self.seq):
+                    self.apply_changes(changes)
+                self.seq = max(self.seq, seq)
+
+    def find_videos(
+        self,
+        date_start: datetime,
+        date_end: datetime,
+        channel_name: Optional[str] = None,
+        limit_count: Optional[int] = None,
+        summary: bool = False,
+    ) -> Optional[List[Any]]:
+        """Like DbSqliteVideo.find_videos, None when date_start is too old."""
+        with self._lock:
+            if self.cutoff is None or int(date_start.timestamp()) < self.cutoff:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return self.store.find_videos(
+                date_start,
+                date_end,
+                channel_name=channel_name,
+                limit_count=limit_count,
+                summary=summary,
+            )
+
+    def metrics(self) -> HotCacheMetrics:
+        with self._lock:
+            cutoff = None
+            if self.cutoff is not None:
+                cutoff = datetime.fromtimestamp(self.cutoff, tz=timezone.utc)
+            return HotCacheMetrics(
+                size=len(self.store),
+                max_size=self.max_size,
+                cutoff=cutoff,
+                hits=self.hits,
+                misses=self.misses,
+                evicted=self.evicted,
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+                self._data_version = None
@@ -0,0 +1,648 @@
+"""
+Optional asyncio http server for a Database, standard library only.
+
+    python -m vids_db.http_server /path/to/data --port 8080
+
+Endpoints, all answering json:
+    GET  /videos?date_start=&date_end=&channel_name=&limit=&summary=1
+    GET  /videos/by_urls?url=&url=&summary=1
+    POST /videos/by_urls with a json list of urls
+    GET  /search?q=&limit=&sort=&date_start=&date_end=&min_views=
+    POST /videos with a json list of videos, or {"content": [...]}
+    GET  /health
+
+Video lists are streamed as a chunked json array, encoded chunk by chunk,
+and gzip compressed when the client accepts it. GET responses carry a weak
+ETag built from Database.write_generation(): a request with a matching
+If-None-Match gets 304 Not Modified, and small responses are kept in an
+LRU cache that is dropped on the next write. A /videos window without
+date_end ends now and moves with the clock, it gets neither. Connections
+are kept alive (HTTP/1.1) until they are idle for keep_alive seconds.
+
+Database calls and json encoding run in a thread pool so slow queries do
+not block the event loop.
+"""
+
+# pylint: disable=all
+
+import argparse
+import asyncio
+import json
+import threading
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+    TypeVar,
+)
+from urllib.parse import parse_qs, urlsplit
+
+from vids_db.database import Database
+from vids_db.date import now_local, parse_datetime
+from vids_db.db_full_text_search import SORT_RELEVANCE
+from vids_db.models import Video
+
+T = TypeVar("T")
+
+DEFAULT_PORT = 8080
+DEFAULT_CACHE_SIZE = 256
+CACHE_MAX_BYTES = 1024 * 1024  # Larger responses are streamed, not cached.
+CHUNK_SIZE = 500  # Videos encoded per streamed chunk.
+KEEP_ALIVE = 15.0
+MAX_HEADERS = 100
+MAX_BODY = 64 * 1024 * 1024
+GZIP_MIN_BYTES = 1024
+DEFAULT_DAYS = 7
+
+_REASONS = {
+    200: "OK",
+    304: "Not Modified",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    411: "Length Required",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+}
+
+
+class HttpError(Exception):
+    def __init__(self, status: int, message: str) -> None:
+        super().__init__(message)
+        self.status = status
+
+
+class Request(NamedTuple):
+    method: str
+    path: str
+    query: Dict[str, List[str]]
+    target: str
+    headers: Dict[str, str]  # Lower case names.
+    body: bytes
+    keep_alive: bool
+
+    def arg(self, name: str, default: Optional[str] = None) -> Optional[str]:
+        values = self.query.get(name)
+        return values[-1] if values else default
+
+    def accepts_gzip(self) -> bool:
+        encodings = self.headers.get("accept-encoding", "").lower()
+        for part in encodings.split(","):
+            name, _, params = part.partition(";")
+            if name.strip() not in ("gzip", "*"):
+                continue
+            params = params.replace(" ", "")
+            try:
+                return not params.startswith("q=") or float(params[2:]) > 0
+            except ValueError:
+                return False
+        return False
+
+
+def _int_arg(request: Request, name: str) -> Optional[int]:
+    value = request.arg(name)
+    if value is None or value == "":
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise HttpError(400, f"{name} must be an integer")
+
+
+def _bool_arg(request: Request, name: str) -> bool:
+    return (request.arg(name) or "").lower() in ("1", "true", "yes")
+
+
+def _date_arg(request: Request, name: str) -> Optional[datetime]:
+    value = request.arg(name)
+    if not value:
+        return None
+    try:
+        return parse_datetime(value, tzinfo="UTC")
+    except (ValueError, OverflowError):
+        raise HttpError(400, f"{name} is not a date: {value}")
+
+
+def _ends_now(request: Request) -> bool:
+    """Whether the response depends on the clock, not only on writes."""
+    return request.path == "/videos" and not request.arg("date_end")
+
+
+def _if_none_match(request: Request) -> List[str]:
+    value = request.headers.get("if-none-match", "")
+    return [etag.strip() for etag in value.split(",")]
+
+
+def _json_body(request: Request) -> Any:
+    try:
+        return json.loads(request.body)
+    except ValueError as err:
+        raise HttpError(400, f"Invalid json body: {err}")
+
+
+def json_array_parts(vids: List[Any], chunk_size: int) -> Iterator[bytes]:
+    """The json array of vids in pieces of chunk_size videos."""
+    if not vids:
+        yield b"[]"
+        return
+    for i in range(0, len(vids), chunk_size):
+        chunk = vids[i : i + chunk_size]
+        data = type(chunk[0]).dump_many_json(chunk)
+        yield (b"[" if i == 0 else b", ") + data[1:-1]
+    yield b"]"
+
+
+class _Payload(NamedTuple):
+    """A handler result, either a complete body or a list of videos."""
+
+    status: int
+    body: Optional[bytes] = None
+    vids: Optional[List[Any]] = None
+    cacheable: bool = True
+
+
+_CacheEntry = Tuple[str, Dict[str, str], bytes]
+
+
+class VidsHttpServer:
+    """See the module docstring."""
+
+    def __init__(
+        self,
+        db: Database,
+        host: str = "127.0.0.1",
+        port: int = DEFAULT_PORT,
+        cache_size: int = DEFAULT_CACHE_SIZE,
+        keep_alive: float = KEEP_ALIVE,
+        chunk_size: int = CHUNK_SIZE,
+        workers: int = 4,
+    ) -> None:
+        self.db = db
+        self.host = host
+        self.port = port
+        self.cache_size = cache_size
+        self.keep_alive = keep_alive
+        self.chunk_size = chunk_size
+        self.executor = ThreadPoolExecutor(
+            workers, thread_name_prefix="vids_db-http"
+        )
+        # (target, gzip) -> (generation, headers, body)
+        self._cache: "OrderedDict[Tuple[str, bool], _CacheEntry]" = (
+            OrderedDict()
+        )
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._connections: Set["asyncio.Task[None]"] = set()
+        self.cache_hits = 0
+        self.not_modified = 0
+        self._routes: Dict[Tuple[str, str], Callable[[Request], _Payload]] = {
+            ("GET", "/videos"): self._get_video_list,
+            ("POST", "/videos"): self._update_many,
+            ("GET", "/videos/by_urls"): self._get_by_urls,
+            ("POST", "/videos/by_urls"): self._get_by_urls,
+            ("GET", "/search"): self._query_video_list,
+            ("GET", "/health"): self._health,
+        }
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(
+            self._handle_connection, self.host, self.port
+        )
+        # The bound port when port=0 asked for any free one.
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self) -> None:
+        if self._server is None:
+            await self.start()
+        assert self._server is not None
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        # Idle keep-alive connections would otherwise outlive the loop.
+        for task in list(self._connections):
+            task.cancel()
+        await asyncio.gather(*self._connections, return_exceptions=True)
+        self.executor.shutdown(wait=False)
+
+    async def _run(self, fn: Callable[[], T]) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, fn)
+
+    # Handlers, called in the thread pool.
+
+    def _get_video_list(self, request: Request) -> _Payload:
+        date_end = _date_arg(request, "date_end") or now_local()
+        date_start = _date_arg(request, "date_start") or (
+            date_end - timedelta(days=DEFAULT_DAYS)
+        )
+        vids = self.db.get_video_list(
+            date_start,
+            date_end,
+            channel_name=request.arg("channel_name"),
+            limit=_int_arg(request, "limit"),
+            summary=_bool_arg(request, "summary"),
+            collapse_duplicates=_bool_arg(request, "collapse_duplicates"),
+        )
+        return _Payload(200, vids=vids)
+
+    def _get_by_urls(self, request: Request) -> _Payload:
+        if request.method == "POST":
+            urls = _json_body(request)
+            if not isinstance(urls, list) or not all(
+                isinstance(url, str) for url in urls
+            ):
+                raise HttpError(400, "Expected a json list of urls")
+        else:
+            urls = request.query.get("url", [])
+        vids = self.db.get_by_urls(urls, summary=_bool_arg(request, "summary"))
+        return _Payload(200, vids=vids)
+
+    def _query_video_list(self, request: Request) -> _Payload:
+        query_string = request.arg("q")
+        if not query_string:
+            raise HttpError(400, "Missing q")
+        vids = self.db.query_video_list(
+            query_string,
+            limit=_int_arg(request, "limit"),
+            date_start=_date_arg(request, "date_start"),
+            date_end=_date_arg(request, "date_end"),
+            min_views=_int_arg(request, "min_views"),
+            channel_name=request.arg("channel_name"),
+            sort=request.arg("sort", SORT_RELEVANCE) or SORT_RELEVANCE,
+        )
+        return _Payload(200, vids=vids)
+
+    def _update_many(self, request: Request) -> _Payload:
+        data = _json_body(request)
+        if isinstance(data, dict):
+            data = data.get("content")
+        if not isinstance(data, list):
+            raise HttpError(400, 'Expected a json list or {"content": [...]}')
+        try:
+            vids = [Video(**item) for item in data]
+        except (TypeError, ValueError) as err:
+            raise HttpError(400, f"Invalid video: {err}")
+        self.db.update_many(vids)
+        body = json.dumps({"updated": len(vids)}).encode("utf-8")
+        return _Payload(200, body=body, cacheable=False)
+
+    def _health(self, request: Request) -> _Payload:
+        body = json.dumps(
+            {"ok": True, "generation": self.db.write_generation()}
+        ).encode("utf-8")
+        return _Payload(200, body=body, cacheable=False)
+
+    # Connection handling.
+
+    async def _handle_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        task = asyncio.current_task()
+        assert task is not None
+        self._connections.add(task)
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(
+                        self._read_request(reader), self.keep_alive
+                    )
+                except asyncio.TimeoutError:
+                    break
+                except HttpError as err:
+                    await self._send_error(writer, err, keep_alive=False)
+                    break
+                if request is None:
+                    break
+                try:
+                    await self._respond(request, writer)
+                except HttpError as err:
+                    await self._send_error(writer, err, request.keep_alive)
+                except ValueError as err:
+                    await self._send_error(
+                        writer, HttpError(400, str(err)), request.keep_alive
+                    )
+                except Exception as err:
+                    print(f"{__file__}: {request.target} failed because {err}")
+                    await self._send_error(
+                        writer, HttpError(500, str(err)), keep_alive=False
+                    )
+                    break
+                if not request.keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._connections.discard(task)
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def _read_request(
+        self, reader: asyncio.StreamReader
+    ) -> Optional[Request]:
+        line = await reader.readline()
+        if not line.strip():
+            return None
+        try:
+            method, target, version = line.decode("latin-1").split()
+        except ValueError:
+            raise HttpError(400, "Malformed request line")
+        headers: Dict[str, str] = {}
+        for _ in range(MAX_HEADERS):
+            header = await reader.readline()
+            if header in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = header.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        else:
+            raise HttpError(400, "Too many headers")
+        body = b""
+        if method == "POST":
+            if "content-length" not in headers:
+                raise HttpError(411, "Content-Length is required")
+            value = headers["content-length"]
+            # int() also takes signs, spaces, underscores and non-ascii
+            # digits, a negative length would fail in readexactly().
+            if not (value.isascii() and value.isdigit()):
+                raise HttpError(400, "Invalid Content-Length")
+            length = int(value)
+            if length > MAX_BODY:
+                raise HttpError(413, "Request body is too large")
+            body = await reader.readexactly(length)
+        connection = headers.get("connection", "").lower()
+        if version == "HTTP/1.0":
+            keep_alive = connection == "keep-alive"
+        else:
+            keep_alive = connection != "close"
+        split = urlsplit(target)
+        return Request(
+            method=method.upper(),
+            path=split.path.rstrip("/") or "/",
+            query=parse_qs(split.query),
+            target=target,
+            headers=headers,
+            body=body,
+            keep_alive=keep_alive,
+        )
+
+    async def _respond(
+        self, request: Request, writer: asyncio.StreamWriter
+    ) -> None:
+        handler = self._routes.get((request.method, request.path))
+        if handler is None:
+            if any(path == request.path for _, path in self._routes):
+                raise HttpError(405, f"{request.method} is not allowed")
+            raise HttpError(404, f"Not found: {request.path}")
+        use_gzip = request.accepts_gzip()
+        generation: Optional[str] = None
+        if request.method == "GET" and not _ends_now(request):
+            generation = await self._run(self.db.write_generation)
+        etag = None if generation is None else f'W/"{generation}"'
+        if generation is not None and etag is not None:
+            if etag in _if_none_match(request):
+                self.not_modified += 1
+                await self._send(
+                    writer, 304, {"ETag": etag}, b"", request.keep_alive
+                )
+                return
+            cached = self._cache_get((request.target, use_gzip), generation)
+            if cached is not None:
+                self.cache_hits += 1
+                await self._send(
+                    writer, 200, cached[0], cached[1], request.keep_alive
+                )
+                return
+        payload = await self._run(lambda: handler(request))
+        headers = {"Content-Type": "application/json"}
+        if etag is not None:
+            headers["ETag"] = etag
+        if use_gzip:
+            headers["Vary"] = "Accept-Encoding"
+        body: Optional[bytes]
+        if payload.vids is None:
+            body = await self._send_body(
+                writer, payload, headers, use_gzip, request.keep_alive
+            )
+        else:
+            body = await self._stream(
+                writer, payload, headers, use_gzip, request.keep_alive
+            )
+        if (
+            generation is not None
+            and payload.cacheable
+            and body is not None
+            and self.cache_size > 0
+        ):
+            self._cache_put(
+                (request.target, use_gzip), generation, headers, body
+            )
+
+    def _cache_get(
+        self, key: Tuple[str, bool], generation: str
+    ) -> Optional[Tuple[Dict[str, str], bytes]]:
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        if entry[0] != generation:
+            # Written since, every entry is stale.
+            self._cache.clear()
+            return None
+        self._cache.move_to_end(key)
+        return entry[1], entry[2]
+
+    def _cache_put(
+        self,
+        key: Tuple[str, bool],
+        generation: str,
+        headers: Dict[str, str],
+        body: bytes,
+    ) -> None:
+        self._cache[key] = (generation, headers, body)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def _send_body(
+        self,
+        writer: asyncio.StreamWriter,
+        payload: _Payload,
+        headers: Dict[str, str],
+        use_gzip: bool,
+        keep_alive: bool,
+    ) -> bytes:
+        body = payload.body or b""
+        if use_gzip and len(body) >= GZIP_MIN_BYTES:
+            body = await self._run(lambda: zlib.compress(body, wbits=31))
+            headers["Content-Encoding"] = "gzip"
+        await self._send(writer, payload.status, headers, body, keep_alive)
+        return body
+
+    async def _stream(
+        self,
+        writer: asyncio.StreamWriter,
+        payload: _Payload,
+        headers: Dict[str, str],
+        use_gzip: bool,
+        keep_alive: bool,
+    ) -> Optional[bytes]:
+        """
+        Writes the videos as a chunked json array, returns the whole body
+        when it is small enough to cache.
+        """
+        assert payload.vids is not None
+        if use_gzip:
+            headers["Content-Encoding"] = "gzip"
+        headers["Transfer-Encoding"] = "chunked"
+        self._write_head(writer, payload.status, headers, keep_alive)
+        compressor = zlib.compressobj(wbits=31) if use_gzip else None
+        parts = json_array_parts(payload.vids, self.chunk_size)
+        done = False
+
+        def next_piece() -> Optional[bytes]:
+            nonlocal done
+            if done:
+                return None
+            part = next(parts, None)
+            if compressor is None:
+                return part
+            if part is None:
+                done = True
+                return compressor.flush()
+            return compressor.compress(part)
+
+        kept: Optional[List[bytes]] = []
+        kept_size = 0
+        while True:
+            try:
+                piece = await self._run(next_piece)
+            except Exception as err:
+                # The status line is out, all that is left is to hang up.
+                raise ConnectionError(f"Encoding failed because {err}")
+            if piece is None:
+                break
+            if piece:
+                writer.write(b"%x\r\n%s\r\n" % (len(piece), piece))
+                await writer.drain()
+            if kept is not None:
+                kept.append(piece)
+                kept_size += len(piece)
+                if kept_size > CACHE_MAX_BYTES:
+                    kept = None
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+        return None if kept is None else b"".join(kept)
+
+    def _write_head(
+        self,
+        writer: asyncio.StreamWriter,
+        status: int,
+        headers: Dict[str, str],
+        keep_alive: bool,
+    ) -> None:
+        lines = [f"HTTP/1.1 {status} {_REASONS.get(status, '')}"]
+        lines.extend(f"{name}: {value}" for name, value in headers.items())
+        lines.append(f"Connection: {'keep-alive' if keep_alive else 'close'}")
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+
+    async def _send(
+        self,
+        writer: asyncio.StreamWriter,
+        status: int,
+        headers: Dict[str, str],
+        body: bytes,
+        keep_alive: bool,
+    ) -> None:
+        headers = dict(headers)
+        headers.pop("Transfer-Encoding", None)
+        if status != 304:
+            headers["Content-Length"] = str(len(body))
+        self._write_head(writer, status, headers, keep_alive)
+        if body:
+            writer.write(body)
+        await writer.drain()
+
+    async def _send_error(
+        self, writer: asyncio.StreamWriter, err: HttpError, keep_alive: bool
+    ) -> None:
+        body = json.dumps({"error": str(err)}).encode("utf-8")
+        headers = {"Content-Type": "application/json"}
+        await self._send(writer, err.status, headers, body, keep_alive)
+
+
+class BackgroundServer:
+    """A VidsHttpServer running its own event loop in a daemon thread."""
+
+    def __init__(self, server: VidsHttpServer) -> None:
+        self.server = server
+        self.loop = asyncio.new_event_loop()
+        started = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, args=(started,), daemon=True
+        )
+        self._thread.start()
+        started.wait()
+
+    def _run(self, started: threading.Event) -> None:
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_until_complete(self.server.start())
+        started.set()
+        self.loop.run_forever()
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.server.host}:{self.server.port}"
+
+    def close(self) -> None:
+        asyncio.run_coroutine_threadsafe(
+            self.server.close(), self.loop
+        ).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
+
+
+def serve_in_background(
+    db: Database, host: str = "127.0.0.1", port: int = 0, **kwargs: Any
+) -> BackgroundServer:
+    """Starts a server on a free port unless one is given, for tests."""
+    return BackgroundServer(VidsHttpServer(db, host, port, **kwargs))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serves a vids_db database")
+    parser.add_argument("db_path", help="Data directory of the database")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--cache-size", type=int, default=DEFAULT_CACHE_SIZE)
+    args = parser.parse_args()
+    db = Database(args.db_path)
+    server = VidsHttpServer(
+        db, args.host, args.port, cache_size=args.cache_size
+    )
+    print(f"Serving {args.db_path} on http://{args.host}:{args.port}")
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
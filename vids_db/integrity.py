@@ -0,0 +1,129 @@
+"""
+Consistency between videos.sqlite and the full text index.
+
+Every sqlite write bumps the change sequence number in its meta table (see
+DbSqliteVideo.changes_since) and the full text index records the sequence
+number it is in sync with in its GENERATION file after each commit. A
+crash between the two writes leaves the index generation behind, which
+check() detects in O(1) when the database is opened.
+
+repair() then replays only the change feed after the index generation:
+updated videos are re-indexed and deleted ones removed. When the
+tombstones it would need have been pruned, or when full=True, it falls
+back to verify(), which streams both stores and fixes every difference.
+"""
+
+# pylint: disable=all
+
+from typing import Dict, List, NamedTuple, Tuple
+
+from vids_db.db_full_text_search import DbFullTextSearch
+from vids_db.db_sqlite_video import DbSqliteVideo
+
+BATCH_SIZE = 1000
+
+
+class IntegrityStatus(NamedTuple):
+    sqlite_generation: int
+    index_generation: int
+
+    @property
+    def in_sync(self) -> bool:
+        return self.sqlite_generation == self.index_generation
+
+
+class IntegrityReport(NamedTuple):
+    missing: List[str]  # Urls stored in sqlite but not indexed.
+    extra: List[str]  # Urls indexed but not stored.
+    stale: List[str]  # Urls indexed with outdated fields.
+
+    @property
+    def ok(self) -> bool:
+        return not (self.missing or self.extra or self.stale)
+
+
+def check(
+    db_sqlite: DbSqliteVideo, db_full_text_search: DbFullTextSearch
+) -> IntegrityStatus:
+    return IntegrityStatus(
+        db_sqlite.current_change_seq(), db_full_text_search.generation()
+    )
+
+
+def verify(
+    db_sqlite: DbSqliteVideo,
+    db_full_text_search: DbFullTextSearch,
+    batch_size: int = BATCH_SIZE,
+) -> IntegrityReport:
+    """
+    Compares every video of both stores, sqlite is streamed in batches.
+    Stale videos are only found when the index stores the fields.
+    """
+    compare = db_full_text_search.stores_fields
+    indexed: Dict[str, Tuple] = {
+        doc["url"]: (
+            doc.get("channel_name"),
+            doc.get("title"),
+            doc.get("views"),
+        )
+        for doc in db_full_text_search.iter_documents()
+    }
+    missing: List[str] = []
+    stale: List[str] = []
+    for vids in db_sqlite.iter_videos(batch_size):
+        for vid in vids:
+            fields = indexed.pop(vid.url, None)
+            if fields is None:
+                missing.append(vid.url)
+            elif compare and fields != (vid.channel_name, vid.title, vid.views):
+                stale.append(vid.url)
+    return IntegrityReport(missing, sorted(indexed), stale)
+
+
+def _repair_full(
+    db_sqlite: DbSqliteVideo,
+    db_full_text_search: DbFullTextSearch,
+    batch_size: int,
+) -> int:
+    generation = db_sqlite.current_change_seq()
+    report = verify(db_sqlite, db_full_text_search, batch_size)
+    urls = report.missing + report.stale
+    for i in range(0, len(urls), batch_size):
+        db_full_text_search.add_videos(
+            db_sqlite.find_videos_by_urls(urls[i : i + batch_size])
+        )
+    db_full_text_search.remove_videos(report.extra)
+    db_full_text_search.set_generation(generation)
+    return len(urls) + len(report.extra)
+
+
+def repair(
+    db_sqlite: DbSqliteVideo,
+    db_full_text_search: DbFullTextSearch,
+    full: bool = False,
+    batch_size: int = BATCH_SIZE,
+) -> int:
+    """
+    Brings the index in sync with sqlite, returns the number of urls that
+    were re-indexed or removed. The caller holds the write lock.
+    """
+    generation = db_full_text_search.generation()
+    if (
+        full
+        or generation < db_sqlite.tombstones_pruned_seq()
+        # Ahead, ie sqlite was restored from an older backup.
+        or generation > db_sqlite.current_change_seq()
+    ):
+        return _repair_full(db_sqlite, db_full_text_search, batch_size)
+    count = 0
+    for changes in db_sqlite.iter_changes_since(generation, batch_size):
+        vids = [change.video for change in changes if change.video is not None]
+        if vids:
+            db_full_text_search.add_videos(vids)
+        db_full_text_search.remove_videos(
+            [change.url for change in changes if change.video is None]
+        )
+        db_full_text_search.set_generation(changes[-1].seq)
+        count += len(changes)
+    db_full_text_search.set_generation(db_sqlite.current_change_seq())
+    return count
@@ -4,105 +4,175 @@
 from __future__ import annotations
 
 import json
+import math
+import operator
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Union
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
 
 from pydantic import (
-    AnyUrl,
     BaseModel,
     NonNegativeFloat,
     NonNegativeInt,
     constr,
+    field_serializer,
     field_validator,
 )
 
 from vids_db.date import iso_fmt, parse_datetime
+from vids_db.duration import parse_duration
 
 
-def parse_duration(duration: str) -> float:
+def _check_date(v):
+    data = parse_datetime(f"{v}")
+    assert data.tzinfo, f"data {v} is time zone naive."
+    return iso_fmt(v)
+
+
+def _check_views(v):
+    if v == "" or v == "?":
+        return 0
+    if isinstance(v, str):
+        # Remove any non-digit characters (like commas)
+        v = ''.join(filter(str.isdigit, v))
+    try:
+        return int(v)
+    except ValueError:
+        return 0
+
+
+# The string writer of json.dumps(ensure_ascii=False).
+_encode_str = json.encoder.encode_basestring
+
+
+def _encode_date(v: datetime) -> str:
+    # Same as _VideoBase.serialize_date.
+    return _encode_str(v.isoformat())
+
+
+def _encode_float(v: float) -> str:
+    # json.dumps writes NaN and Infinity where repr() writes nan and inf.
+    if math.isfinite(v):
+        return float.__repr__(v)
+    return json.dumps(v)
+
+
+_FIELD_ENCODERS: Dict[type, Callable] = {
+    str: _encode_str,
+    datetime: _encode_date,
+    float: _encode_float,
+    int: int.__repr__,
+}
+_JsonLayout = Tuple[str, Callable, Sequence[Callable]]
+_JSON_LAYOUTS: Dict[type, Optional[_JsonLayout]] = {}
+
+
+def _json_layout(cls: type) -> Optional[_JsonLayout]:
     """
-    Checks that the duration is in the format HH:MM:SS.
-    Other acceptable formats include SS.
-    Ok:
-      ""
-      "?"
-      06
-      6
-      60
-      61
-      23:24
-      23:24:01.34
-    Not Ok:
-      -7
-      61  # above 60 seconds
-      61:01 # above 60 minutes
-      25:24:01.34 # above 24 hours
+    The json.dumps() text of a model as a %-format string with one slot
+    per field, the getter of the field values and the encoder of each value.
+    None when a field has a type without an encoder.
     """
+    if cls not in _JSON_LAYOUTS:
+        fields = cls.model_fields  # type: ignore
+        encoders = [
+            _FIELD_ENCODERS[f.annotation]
+            for f in fields.values()
+            if f.annotation in _FIELD_ENCODERS
+        ]
+        layout: Optional[_JsonLayout] = None
+        if len(encoders) == len(fields):
+            keys = [_encode_str(name).replace("%", "%%") for name in fields]
+            layout = (
+                "{" + ", ".join(f"{key}: %s" for key in keys) + "}",
+                operator.attrgetter(*fields),
+                encoders,
+            )
+        _JSON_LAYOUTS[cls] = layout
+    return _JSON_LAYOUTS[cls]
 
-    def _raise() -> None:
-        raise ValueError(f"Invalid duration: {duration}")
 
-    def _is_non_neg_int(s: str) -> bool:
-        try:
-            return int(s) >= 0
-        except ValueError:
-            return False
+# Fields of Video that list views never show. They are stored apart from the
+# rest of the row so they can be skipped on read, see VideoSummary.
+COLD_FIELDS = ("description", "iframe_src")
 
-    def _is_non_neg_float(s: str) -> bool:
-        try:
-            return float(s) >= 0.0
-        except ValueError:
-            return False
 
-    try:
-        valf = float(duration)
-        if valf >= 0.0:
-            return valf
-        else:
-            _raise()
-    except ValueError:
-        pass
+class _VideoBase(BaseModel):
+    """
+    Validation and serialization shared by Video and VideoSummary. The
+    fields are declared by each class: inherited fields would come first
+    and change the key order of Video's json.
+    """
 
-    if "" == duration or "?" == duration or "Live" == duration:
-        return 0
-    # Simple case
-    no_column = ":" not in duration
-    no_period = "." not in duration
-    if no_column and no_period:
-        try:
-            tmp = float(duration)
-            if tmp < 0:
-                _raise()
-            return tmp
-        except ValueError:
-            _raise()
-    new_duration = duration
-    units = new_duration.split(":")
-    if len(units) > 3 or len(units) < 1:
-        _raise()
-    units.reverse()
-    total: float = 0.0
-    limit_multiplier = [
-        (60, 1),
-        (60, 60),
-        (24, 60 * 60),
-    ]
-    for i, unit in enumerate(units):
-        if i == 0:
-            is_valid_number = _is_non_neg_float(unit)
-        else:
-            is_valid_number = _is_non_neg_int(unit)
-        if not is_valid_number:
-            _raise()
-        limit, multipler = limit_multiplier[i]
-        val = float(unit)
-        if val >= limit:
-            _raise()
-        total += val * multipler
-    return total
-
-
-class Video(BaseModel):
+    @field_validator("duration", mode="before", check_fields=False)
+    @classmethod
+    def check_duration(cls, v):
+        return parse_duration(v)
+
+    @field_validator("date_published", mode="before", check_fields=False)
+    @classmethod
+    def check_date_published(cls, v):
+        return _check_date(v)
+
+    @field_validator("date_lastupdated", mode="before", check_fields=False)
+    @classmethod
+    def check_date_lastupdated(cls, v):
+        return _check_date(v)
+
+    @field_validator("views", mode="before", check_fields=False)
+    @classmethod
+    def check_views(cls, v):
+        return _check_views(v)
+
+    @field_serializer(
+        "date_published", "date_lastupdated", when_used="json", check_fields=False
+    )
+    def serialize_date(self, v: datetime) -> str:
+        # pydantic would write "Z" for utc, keep the isoformat() offsets.
+        return v.isoformat()
+
+    def to_json(self) -> dict:
+        """
+        Returns a json representation of the video object.
+        """
+        return self.model_dump(mode="json")
+
+    def to_json_str(self) -> str:
+        """
+        Returns a json string representation of the video object.
+        """
+        # Writes the fields straight into the json.dumps() layout, which
+        # saves the dict of model_dump() and the walk of the encoder over
+        # it. Values of an unexpected type, only possible through
+        # model_construct(), take the model_dump() path.
+        layout = _json_layout(type(self))
+        if layout is not None:
+            template, getter, encoders = layout
+            try:
+                return template % tuple(
+                    [enc(v) for enc, v in zip(encoders, getter(self))]
+                )
+            except (AttributeError, TypeError):
+                pass
+        return json.dumps(self.to_json(), ensure_ascii=False)
+
+    def to_json_bytes(self) -> bytes:
+        """
+        Returns to_json_str() encoded to utf-8.
+        """
+        return self.to_json_str().encode("utf-8")
+
+    @classmethod
+    def dump_many_json(cls, items: Sequence[_VideoBase]) -> bytes:
+        """
+        Utf-8 json array of the to_json_str() of each item, for api
+        responses. Same bytes as json.dumps() of the list.
+        """
+        # Joined as bytes: one wide character would widen a joined str.
+        parts = [item.to_json_str().encode("utf-8") for item in items]
+        return b"[" + b", ".join(parts) + b"]"
+
+
+class Video(_VideoBase):
     """Represents a video object."""
 
     channel_name: constr(min_length=2)  # type: ignore
@@ -119,38 +189,6 @@ class Video(BaseModel):
     views: NonNegativeInt
     # rank: Optional[float] = None  # optional stdev rank.
 
-    @field_validator("duration", mode="before")
-    @classmethod
-    def check_duration(cls, v):
-        return parse_duration(v)
-
-    @field_validator("date_published", mode="before")
-    @classmethod
-    def check_date_published(cls, v):
-        data = parse_datetime(f"{v}")
-        assert data.tzinfo, f"data {v} is time zone naive."
-        return iso_fmt(v)
-
-    @field_validator("date_lastupdated", mode="before")
-    @classmethod
-    def check_date_lastupdated(cls, v):
-        data = parse_datetime(f"{v}")
-        assert data.tzinfo, f"data {v} is time zone naive."
-        return iso_fmt(v)
-
-    @field_validator("views", mode="before")
-    @classmethod
-    def check_views(cls, v):
-        if v == "" or v == "?":
-            return 0
-        if isinstance(v, str):
-            # Remove any non-digit characters (like commas)
-            v = ''.join(filter(str.isdigit, v))
-        try:
-            return int(v)
-        except ValueError:
-            return 0
-
     @classmethod
     def from_list_of_dicts(cls, data: List[Dict]) -> List[Video]:
         out: List[Video] = []
@@ -198,28 +236,27 @@ class Video(BaseModel):
         diff: timedelta = now_time - parse_datetime(self.date_published)
         return diff.total_seconds()
 
-    def to_json(self) -> dict:
-        """
-        Returns a json representation of the video object.
-        """
-        # data = self.model_dump()
-        # data["date_published"] = self.date_published.isoformat()
-        # data["date_lastupdated"] = self.date_lastupdated.isoformat()
-        # data["url"] = str(self.url)
-        # data["img_src"] = str(self.img_src)
-        data = {}
-        items = self.model_dump().items()
-        for key, val in items:
-            if isinstance(val, datetime):
-                data[key] = val.isoformat()
-            elif isinstance(val, AnyUrl):
-                data[key] = str(val)
-            else:
-                data[key] = val
-        return data
 
-    def to_json_str(self) -> str:
-        """
-        Returns a json string representation of the video object.
-        """
-        return json.dumps(self.to_json(), ensure_ascii=False)
+class VideoSummary(_VideoBase):
+    """Lightweight Video without the cold fields (see COLD_FIELDS)."""
+
+    channel_name: constr(min_length=2)  # type: ignore
+    title: constr(min_length=2)  # type: ignore
+    date_published: datetime
+    date_lastupdated: datetime
+    channel_url: str
+    source: constr(min_length=4)  # type: ignore
+    url: str
+    duration: NonNegativeFloat
+    img_src: str
+    views: NonNegativeInt
+
+    @classmethod
+    def from_videos(cls, vids: List[Video]) -> List[VideoSummary]:
+        """Drops the cold fields of already validated videos."""
+        # Plain attribute reads, much cheaper than model_dump().
+        fields = list(cls.model_fields)
+        return [
+            cls.model_construct(**{name: getattr(vid, name) for name in fields})
+            for vid in vids
+        ]
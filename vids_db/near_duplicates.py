@@ -0,0 +1,208 @@
+"""
+Near duplicate detection for re-uploaded videos.
+
+A video's signature is a 64 bit SimHash over character shingles of its
+normalized title, re-uploads with a changed case, punctuation or a
+"(reupload)" tag land within a few bits of each other. Two videos are
+near duplicates when their signatures are at most max_distance bits apart,
+their durations agree (an unknown duration of 0 agrees with nothing) and
+their titles have the same numbers, so "Part 5" and "Part 6" of a series
+stay apart. Titles that are empty once normalized are never duplicates.
+
+For lookups the signature is cut into BANDS bands of 16 bits. Signatures
+at most BANDS - 1 bits apart share at least one band exactly, so only the
+videos in the same band buckets have to be compared, which keeps lookups
+independent of the corpus size.
+"""
+
+# pylint: disable=all
+
+import hashlib
+import re
+from functools import lru_cache
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    TypeVar,
+)
+
+BITS = 64
+BANDS = 4
+BAND_BITS = BITS // BANDS
+MAX_DISTANCE = BANDS - 1
+SHINGLE_SIZE = 4
+# Durations within this many seconds, or this fraction, agree.
+DURATION_TOLERANCE = 2.0
+DURATION_TOLERANCE_RATIO = 0.02
+
+_MASK = (1 << BITS) - 1
+_BAND_MASK = (1 << BAND_BITS) - 1
+_NON_WORD_RE = re.compile(r"[\W_]+")
+_DIGITS_RE = re.compile(r"\d+")
+# Tags that uploaders add to copies of a video.
+_NOISE_WORDS = frozenset(
+    [
+        "reupload",
+        "re",
+        "upload",
+        "uploaded",
+        "mirror",
+        "mirrored",
+        "official",
+        "full",
+        "video",
+        "hd",
+        "new",
+    ]
+)
+
+T = TypeVar("T")
+
+
+def normalize_title(title: str) -> str:
+    """Lower case words without punctuation or re-upload tags."""
+    words = _NON_WORD_RE.sub(" ", title.lower()).split()
+    return " ".join(word for word in words if word not in _NOISE_WORDS)
+
+
+@lru_cache(maxsize=16384)
+def title_numbers(title: str) -> Tuple[str, ...]:
+    """The digit runs of the normalized title, ie part or episode numbers."""
+    return tuple(_DIGITS_RE.findall(normalize_title(title)))
+
+
+def titles_match(title_a: str, title_b: str) -> bool:
+    """The checks on top of the signatures, see the module docstring."""
+    if not normalize_title(title_a) or not normalize_title(title_b):
+        return False
+    return title_numbers(title_a) == title_numbers(title_b)
+
+
+def _feature_bits(feature: str) -> str:
+    digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+    return format(int.from_bytes(digest, "big"), "064b")
+
+
+@lru_cache(maxsize=16384)
+def title_signature(title: str) -> int:
+    """Unsigned 64 bit SimHash of the normalized title."""
+    text = normalize_title(title)
+    features = [
+        text[i : i + SHINGLE_SIZE]
+        for i in range(max(1, len(text) - SHINGLE_SIZE + 1))
+    ]
+    # Bit strings so the per bit votes are counted by str.count.
+    bits = [_feature_bits(feature) for feature in features]
+    half = len(bits) / 2
+    return int(
+        "".join("1" if col.count("1") > half else "0" for col in zip(*bits)),
+        2,
+    )
+
+
+def to_signed(signature: int) -> int:
+    """sqlite INTEGER is signed 64 bit."""
+    return signature - (1 << BITS) if signature >> (BITS - 1) else signature
+
+
+def to_unsigned(signature: int) -> int:
+    return signature & _MASK
+
+
+def band_keys(signature: int) -> List[int]:
+    """One bucket key per band, the band number is in the high bits."""
+    signature = to_unsigned(signature)
+    return [
+        (band << BAND_BITS) | (signature >> (band * BAND_BITS) & _BAND_MASK)
+        for band in range(BANDS)
+    ]
+
+
+def distance(a: int, b: int) -> int:
+    """Number of differing bits."""
+    return bin(to_unsigned(a) ^ to_unsigned(b)).count("1")
+
+
+def durations_match(a: float, b: float) -> bool:
+    if not a or not b:
+        return False
+    tolerance = max(DURATION_TOLERANCE, DURATION_TOLERANCE_RATIO * max(a, b))
+    return abs(a - b) <= tolerance
+
+
+def is_near_duplicate(
+    signature_a: int,
+    duration_a: float,
+    signature_b: int,
+    duration_b: float,
+    max_distance: int = MAX_DISTANCE,
+) -> bool:
+    return distance(
+        signature_a, signature_b
+    ) <= max_distance and durations_match(duration_a, duration_b)
+
+
+def collapse(vids: Sequence[T], max_distance: int = MAX_DISTANCE) -> List[T]:
+    """
+    Keeps the first video of every group of near duplicates, in order.
+    Works on anything with title and duration, ie Video or VideoSummary.
+    """
+    if max_distance > MAX_DISTANCE:
+        raise ValueError(f"max_distance can be at most {MAX_DISTANCE}")
+    buckets: Dict[int, List[int]] = {}
+    kept: List[T] = []
+    signatures: List[int] = []
+    for vid in vids:
+        title: str = vid.title  # type: ignore
+        if not normalize_title(title):
+            kept.append(vid)
+            signatures.append(0)
+            continue
+        signature = title_signature(title)
+        duration = vid.duration  # type: ignore
+        keys = band_keys(signature)
+        candidates: Iterable[int] = {
+            idx for key in keys for idx in buckets.get(key, [])
+        }
+        if any(
+            is_near_duplicate(
+                signature,
+                duration,
+                signatures[idx],
+                kept[idx].duration,  # type: ignore
+                max_distance,
+            )
+            and titles_match(title, kept[idx].title)  # type: ignore
+            for idx in candidates
+        ):
+            continue
+        for key in keys:
+            buckets.setdefault(key, []).append(len(kept))
+        kept.append(vid)
+        signatures.append(signature)
+    return kept
+
+
+def collapse_fetch(
+    fetch: Callable[[Optional[int]], List[T]],
+    limit: Optional[int],
+    max_distance: int = MAX_DISTANCE,
+) -> List[T]:
+    """
+    collapse() over fetch(limit_count), fetching more while collapsing
+    leaves fewer than limit videos.
+    """
+    if limit is None:
+        return collapse(fetch(None), max_distance)
+    fetch_size = limit * 2
+    while True:
+        vids = fetch(fetch_size)
+        out = collapse(vids, max_distance)
+        if len(out) >= limit or len(vids) < fetch_size:
+            return out[:limit]
+        fetch_size *= 4
@@ -0,0 +1,85 @@
+"""
+Opt-in parallel execution of CPU bound work, used to decode large query
+results (json.loads plus pydantic validation) on more than one core.
+
+On a free-threaded interpreter (python 3.13t with the GIL disabled) a
+thread pool is used. Otherwise work goes to a process pool, which costs
+pickling the inputs and outputs, so inputs smaller than the threshold are
+processed inline.
+"""
+
+# pylint: disable=all
+
+import multiprocessing
+import os
+import sys
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Optional, Sequence
+
+PARALLEL_THRESHOLD = 5000
+MIN_CHUNK_SIZE = 500
+
+
+def gil_disabled() -> bool:
+    is_gil_enabled = getattr(sys, "_is_gil_enabled", None)
+    return is_gil_enabled is not None and not is_gil_enabled()
+
+
+class ParallelMap:
+    """
+    Maps a function over chunks of a sequence on a lazily started pool.
+    Results come back in input order.
+    """
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        threshold: int = PARALLEL_THRESHOLD,
+    ) -> None:
+        self.workers = workers or os.cpu_count() or 1
+        self.threshold = threshold
+        self._executor: Optional[Executor] = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> Executor:
+        with self._lock:
+            if self._executor is None:
+                if gil_disabled():
+                    self._executor = ThreadPoolExecutor(self.workers)
+                else:
+                    # spawn, forking a process that holds sqlite connections
+                    # and threads is not safe.
+                    self._executor = ProcessPoolExecutor(
+                        self.workers,
+                        mp_context=multiprocessing.get_context("spawn"),
+                    )
+            return self._executor
+
+    def map_chunks(
+        self, func: Callable[..., List[Any]], items: Sequence[Any], *args: Any
+    ) -> List[Any]:
+        """
+        Returns the concatenation of func(chunk, *args) over chunks of items.
+        func must be a module level function when a process pool is used.
+        """
+        if self.workers < 2 or len(items) < self.threshold:
+            return func(items, *args)
+        # A few chunks per worker evens out uneven chunks.
+        chunk_size = max(MIN_CHUNK_SIZE, -(-len(items) // (self.workers * 4)))
+        chunks = [
+            items[i : i + chunk_size] for i in range(0, len(items), chunk_size)
+        ]
+        executor = self._get_executor()
+        futures = [executor.submit(func, chunk, *args) for chunk in chunks]
+        out: List[Any] = []
+        for future in futures:
+            out.extend(future.result())
+        return out
+
+    def close(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
@@ -0,0 +1,131 @@
+"""
+Encoding of the json payload stored in the data column of the videos table.
+
+Rows written before compression existed hold the plain json text. Every
+other row is a blob whose first byte is the payload format version, so
+old and new rows can live side by side in the same table.
+"""
+
+# pylint: disable=all
+
+import json
+import struct
+import zlib
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Union
+
+PAYLOAD_ZLIB = 1
+PAYLOAD_ZLIB_DICT = 2
+
+COMPRESSION_NONE = None
+COMPRESSION_ZLIB = "zlib"
+COMPRESSIONS = (COMPRESSION_NONE, COMPRESSION_ZLIB)
+
+ZLIB_LEVEL = 6
+# zlib only looks back 32kb, a bigger preset dictionary is wasted.
+MAX_DICT_SIZE = 32 * 1024
+
+_DICT_HEADER = struct.Struct(">BI")  # version, dictionary id
+
+Payload = Union[str, bytes]
+
+
+def train_dictionary(
+    samples: List[Dict[str, Any]], size: int = MAX_DICT_SIZE
+) -> bytes:
+    """
+    Builds a zlib preset dictionary from sample payloads.
+
+    The dictionary is made of the json key fragments and the most common
+    url prefixes and values. zlib favours matches that are close to the
+    data, so the most frequent fragments are placed at the end.
+    """
+    counts: Counter = Counter()
+    for sample in samples:
+        for key, val in sample.items():
+            counts[f'"{key}": '] += 1
+            if not isinstance(val, str):
+                continue
+            if "/" in val:
+                # Repeated url prefixes, ie https://www.youtube.com/embed/
+                counts[json.dumps(val.rsplit("/", 1)[0] + "/")[:-1]] += 1
+            elif len(val) < 64:
+                counts[json.dumps(val, ensure_ascii=False)] += 1
+    out = b""
+    for fragment, count in sorted(
+        counts.items(), key=lambda kv: (kv[1], kv[0])
+    ):
+        if count < 2 and len(counts) > 1:
+            continue
+        out += fragment.encode("utf-8")
+    return out[-size:]
+
+
+class PayloadCodec:
+    """Encodes/decodes row payloads, see the module docstring."""
+
+    def __init__(
+        self,
+        compression: Optional[str] = COMPRESSION_NONE,
+        load_dictionary: Optional[Callable[[int], bytes]] = None,
+    ) -> None:
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Unknown compression: {compression}")
+        self.compression = compression
+        self.load_dictionary = load_dictionary
+        self.dictionaries: Dict[int, bytes] = {}
+        self.dictionary_id: Optional[int] = None
+
+    def set_dictionary(self, dictionary_id: int, data: bytes) -> None:
+        """Sets the dictionary that new rows are compressed with."""
+        self.dictionaries[dictionary_id] = data
+        self.dictionary_id = dictionary_id
+
+    def _get_dictionary(self, dictionary_id: int) -> bytes:
+        data = self.dictionaries.get(dictionary_id)
+        if data is None:
+            if self.load_dictionary is None:
+                raise ValueError(f"Unknown payload dictionary {dictionary_id}")
+            data = self.load_dictionary(dictionary_id)
+            self.dictionaries[dictionary_id] = data
+        return data
+
+    def dictionaries_for(self, payloads: List[Any]) -> Dict[int, bytes]:
+        """The dictionaries needed to decode payloads, loading any missing."""
+        out: Dict[int, bytes] = {}
+        for payload in payloads:
+            if isinstance(payload, bytes) and payload[0] == PAYLOAD_ZLIB_DICT:
+                _, dictionary_id = _DICT_HEADER.unpack_from(payload)
+                if dictionary_id not in out:
+                    out[dictionary_id] = self._get_dictionary(dictionary_id)
+        return out
+
+    def encode(self, json_str: str) -> Payload:
+        if self.compression is COMPRESSION_NONE:
+            return json_str
+        raw = json_str.encode("utf-8")
+        if self.dictionary_id is None:
+            return bytes([PAYLOAD_ZLIB]) + zlib.compress(raw, ZLIB_LEVEL)
+        zdict = self.dictionaries[self.dictionary_id]
+        compressor = zlib.compressobj(ZLIB_LEVEL, zdict=zdict)
+        body = compressor.compress(raw) + compressor.flush()
+        return _DICT_HEADER.pack(PAYLOAD_ZLIB_DICT, self.dictionary_id) + body
+
+    def decode_str(self, payload: Payload) -> str:
+        if isinstance(payload, str):
+            return payload
+        version = payload[0]
+        if version == PAYLOAD_ZLIB:
+            return zlib.decompress(payload[1:]).decode("utf-8")
+        if version == PAYLOAD_ZLIB_DICT:
+            _, dictionary_id = _DICT_HEADER.unpack_from(payload)
+            zdict = self._get_dictionary(dictionary_id)
+            decompressor = zlib.decompressobj(zdict=zdict)
+            body = payload[_DICT_HEADER.size :]
+            return (
+                decompressor.decompress(body) + decompressor.flush()
+            ).decode("utf-8")
+        raise ValueError(f"Unknown payload version: {version}")
+
+    def decode(self, payload: Payload) -> Dict[str, Any]:
+        return json.loads(self.decode_str(payload))
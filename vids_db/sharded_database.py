@@ -0,0 +1,500 @@
+"""
+Database variant that hash partitions videos by channel across several
+sqlite files, so a batch is written to the shards in parallel. Every shard
+has its own WriteLock (see write_lock.py), so writers of different shards
+don't wait on each other. The full text index has a single writer and its
+own lock, taken after the shard locks.
+
+A video whose channel_name changed moves to another shard, the write then
+holds the locks of both shards. update_many only looks for such copies
+when a channel is new to its shard (a rename is a new channel name),
+update_fields looks in every shard.
+"""
+
+# pylint: disable=all
+
+import heapq
+import json
+import os
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from datetime import datetime, timedelta
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    TypeVar,
+)
+
+from vids_db.columnar import DEFAULT_FIELDS, VideoColumns
+from vids_db.database import DB_PATH_DIR
+from vids_db.db_full_text_search import (
+    SORT_RELEVANCE,
+    DbFullTextSearch,
+    SearchFilter,
+)
+from vids_db.db_sqlite_video import DbSqliteVideo
+from vids_db.facets import FACETS, FacetCounts, check_facets, merge
+from vids_db.models import Video
+from vids_db.near_duplicates import MAX_DISTANCE, collapse_fetch
+from vids_db.trending import (
+    DEFAULT_WINDOW,
+    check_window,
+    now_timestamp,
+    trending_score,
+)
+from vids_db.write_lock import DEFAULT_TIMEOUT, WriteLock
+
+SHARDS_FILE = "shards.json"
+FULL_TEXT_LOCK_FILE = "full_text_search.write.lock"
+
+T = TypeVar("T")
+
+
+def shard_index(channel_name: str, num_shards: int) -> int:
+    """Stable (process independent) shard index for a channel."""
+    return zlib.crc32(channel_name.encode("utf-8")) % num_shards
+
+
+class ShardedDatabase:
+    """Same api as Database, with the sqlite store split into shards."""
+
+    def __init__(
+        self,
+        db_path: Optional[str] = None,
+        num_shards: int = 4,
+        write_lock_timeout: Optional[float] = DEFAULT_TIMEOUT,
+    ) -> None:
+        if num_shards < 1:
+            raise ValueError("num_shards must be at least 1")
+        db_path = db_path or DB_PATH_DIR
+        os.makedirs(db_path, exist_ok=True)
+        self.db_path = db_path
+        self.num_shards = self._check_num_shards(num_shards)
+        self.shards: List[DbSqliteVideo] = [
+            DbSqliteVideo(os.path.join(db_path, f"videos_shard{i}.sqlite"))
+            for i in range(self.num_shards)
+        ]
+        self.shard_locks: List[WriteLock] = [
+            WriteLock(
+                os.path.join(db_path, f"videos_shard{i}.write.lock"),
+                timeout=write_lock_timeout,
+            )
+            for i in range(self.num_shards)
+        ]
+        self.executor = ThreadPoolExecutor(max_workers=self.num_shards)
+        self.db_full_text_search = None
+        self.full_text_lock: Optional[WriteLock] = None
+        full_text_enabled = (
+            os.environ.get("FULL_TEXT_SEARCH_ENABLED", "0") == "1"
+        )
+        if full_text_enabled:
+            db_path_fts = os.path.join(db_path, "full_text_seach")
+            self.db_full_text_search = DbFullTextSearch(db_path_fts)
+            self.full_text_lock = WriteLock(
+                os.path.join(db_path, FULL_TEXT_LOCK_FILE),
+                timeout=write_lock_timeout,
+            )
+
+    def _check_num_shards(self, num_shards: int) -> int:
+        # Changing the shard count would misroute every channel, so the
+        # count is pinned by the first open.
+        path = os.path.join(self.db_path, SHARDS_FILE)
+        if os.path.exists(path):
+            with open(path, encoding="utf-8", mode="r") as f:
+                stored = json.load(f)["num_shards"]
+            if stored != num_shards:
+                raise ValueError(
+                    f"{self.db_path} has {stored} shards, not {num_shards}"
+                )
+            return stored
+        with open(path, encoding="utf-8", mode="w") as f:
+            json.dump({"num_shards": num_shards}, f)
+        return num_shards
+
+    def shard_for(self, channel_name: str) -> DbSqliteVideo:
+        return self.shards[shard_index(channel_name, self.num_shards)]
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=True)
+        for shard in self.shards:
+            shard.close()
+        for lock in self.shard_locks:
+            lock.close()
+        if self.full_text_lock is not None:
+            self.full_text_lock.close()
+
+    def _write(self, shards: Iterable[int], fn: Callable[[], T]) -> T:
+        """
+        Calls fn holding the locks of shards. They are taken in index
+        order, so writers of overlapping shards can't deadlock.
+        """
+        with ExitStack() as stack:
+            for idx in sorted(set(shards)):
+                stack.enter_context(self.shard_locks[idx])
+            return fn()
+
+    def _write_index(self, fn: Callable[[DbFullTextSearch], None]) -> None:
+        """Calls fn with the full text index, after the shard locks."""
+        if self.db_full_text_search is None:
+            return
+        assert self.full_text_lock is not None
+        fts = self.db_full_text_search
+        self.full_text_lock.run(lambda: fn(fts))
+
+    def clear(self) -> None:
+        def run() -> None:
+            list(self.executor.map(lambda shard: shard.clear(), self.shards))
+            self._write_index(lambda fts: fts.clear())
+
+        self._write(range(self.num_shards), run)
+
+    def update_many(self, vids: List[Video]) -> None:  # type: ignore
+        self._write_many(vids)
+
+    def _route(self, vids: List[Video]) -> Dict[int, List[Video]]:
+        by_shard: Dict[int, List[Video]] = {}
+        for vid in vids:
+            idx = shard_index(vid.channel_name, self.num_shards)
+            by_shard.setdefault(idx, []).append(vid)
+        return by_shard
+
+    def _stale_copies(
+        self, by_shard: Dict[int, List[Video]], check_all: bool = False
+    ) -> Dict[int, List[str]]:
+        """
+        The urls stored in another shard than the one of their channel,
+        by shard. Unless check_all only the videos of channels new to
+        their shard are looked up.
+        """
+        targets: Dict[str, int] = {}
+        for idx, shard_vids in by_shard.items():
+            names = list({vid.channel_name for vid in shard_vids})
+            if not check_all:
+                known = set(self.shards[idx].existing_channel_names(names))
+                names = [name for name in names if name not in known]
+            moved = set(names)
+            for vid in shard_vids:
+                if vid.channel_name in moved:
+                    targets[vid.url] = idx
+        stale: Dict[int, List[str]] = {}
+        if not targets or self.num_shards == 1:
+            return stale
+        urls = list(targets)
+        for idx, found in enumerate(
+            self.executor.map(
+                lambda shard: shard.existing_urls(urls), self.shards
+            )
+        ):
+            for url in found:
+                if targets[url] != idx:
+                    stale.setdefault(idx, []).append(url)
+        return stale
+
+    def _write_many(self, vids: List[Video]) -> None:
+        by_shard = self._route(vids)
+        held: Set[int] = set(by_shard)
+        while True:
+            # The copies are looked up holding the locks, a move needs the
+            # lock of the old shard too, so then the locks are taken again.
+            stale = self._write(
+                held,
+                lambda: self._write_locked(vids, by_shard, held),
+            )
+            if stale is None:
+                return
+            held |= set(stale)
+
+    def _write_locked(
+        self,
+        vids: List[Video],
+        by_shard: Dict[int, List[Video]],
+        held: Set[int],
+        check_all: bool = False,
+    ) -> Optional[Dict[int, List[str]]]:
+        """None once written, else the stale copies in shards not held."""
+        stale = self._stale_copies(by_shard, check_all)
+        if not set(stale) <= held:
+            return stale
+        list(
+            self.executor.map(
+                lambda item: self.shards[item[0]].remove_by_urls(item[1]),
+                stale.items(),
+            )
+        )
+        futures = [
+            self.executor.submit(self.shards[idx].insert_or_update, shard_vids)
+            for idx, shard_vids in by_shard.items()
+        ]
+        for future in futures:
+            future.result()
+        self._write_index(lambda fts: fts.add_videos(vids))
+        return None
+
+    def update(self, vid: Video) -> None:
+        self.update_many([vid])
+
+    def get_channel_names(self) -> List[str]:
+        out: List[str] = []
+        for names in self.executor.map(
+            lambda shard: shard.get_channel_names(), self.shards
+        ):
+            out.extend(names)
+        return out
+
+    def get_by_urls(self, urls: List[str], summary: bool = False) -> List[Any]:
+        out: List[Any] = []
+        for vids in self.executor.map(
+            lambda shard: shard.find_videos_by_urls(urls, summary=summary),
+            self.shards,
+        ):
+            out.extend(vids)
+        return out
+
+    def _removed(self, urls: List[str]) -> int:
+        if urls:
+            self._write_index(lambda fts: fts.remove_videos(urls))
+        return len(urls)
+
+    def _remove_each(self, fn: Callable[[DbSqliteVideo], List[str]]) -> int:
+        # One shard at a time, only holding the lock of that shard.
+        out: List[str] = []
+        for idx, shard in enumerate(self.shards):
+            out.extend(self._write([idx], lambda: fn(shard)))
+        return self._removed(out)
+
+    def remove_by_channel_name(self, channel_name: str) -> int:
+        idx = shard_index(channel_name, self.num_shards)
+        return self._write(
+            [idx],
+            lambda: self._removed(
+                self.shards[idx].remove_by_channel_name(channel_name)
+            ),
+        )
+
+    def remove_by_urls(self, urls: List[str]) -> int:
+        return self._remove_each(lambda shard: shard.remove_by_urls(urls))
+
+    def remove_older_than(
+        self, date: datetime, channel_name: Optional[str] = None
+    ) -> int:
+        return self.remove_where(date_end=date, channel_name=channel_name)
+
+    def remove_where(
+        self,
+        date_start: Optional[datetime] = None,
+        date_end: Optional[datetime] = None,
+        channel_name: Optional[str] = None,
+        max_views: Optional[int] = None,
+    ) -> int:
+        if channel_name is not None:
+            idx = shard_index(channel_name, self.num_shards)
+            return self._write(
+                [idx],
+                lambda: self._removed(
+                    self.shards[idx].remove_where(
+                        date_start, date_end, channel_name, max_views
+                    )
+                ),
+            )
+        return self._remove_each(
+            lambda shard: shard.remove_where(
+                date_start, date_end, channel_name, max_views
+            )
+        )
+
+    def update_fields(self, patches: Dict[str, Dict[str, Any]]) -> int:
+        """See Database.update_fields, a patched channel_name moves shards."""
+        held: Set[int] = set()
+        while True:
+            count = self._write(
+                held, lambda: self._update_fields_locked(patches, held)
+            )
+            if count is not None:
+                return count
+
+    def _update_fields_locked(
+        self, patches: Dict[str, Dict[str, Any]], held: Set[int]
+    ) -> Optional[int]:
+        """
+        None when the videos are stored in, or move to, shards not held.
+        Those are added to held.
+        """
+        urls = list(patches)
+        needed: Set[int] = set()
+        vids: List[Video] = []
+        for idx, found in enumerate(
+            self.executor.map(
+                lambda shard: shard.find_videos_by_urls(urls), self.shards
+            )
+        ):
+            for vid in found:
+                needed.add(idx)
+                vids.append(Video(**{**vid.model_dump(), **patches[vid.url]}))
+        by_shard = self._route(vids)
+        needed |= set(by_shard)
+        if not needed <= held:
+            held |= needed
+            return None
+        stale = self._write_locked(vids, by_shard, held, check_all=True)
+        if stale is not None:
+            held |= set(stale)
+            return None
+        return len(vids)
+
+    def get_video_list(
+        self,
+        date_start: datetime,
+        date_end: datetime,
+        channel_name: Optional[str] = None,
+        limit: Optional[int] = None,
+        summary: bool = False,
+        collapse_duplicates: bool = False,
+    ) -> List[Any]:
+        if collapse_duplicates:
+            return collapse_fetch(
+                lambda count: self.get_video_list(
+                    date_start, date_end, channel_name, count, summary
+                ),
+                limit,
+            )
+        if channel_name is not None:
+            return self.shard_for(channel_name).find_videos(
+                date_start,
+                date_end,
+                channel_name=channel_name,
+                limit_count=limit,
+                summary=summary,
+            )
+        # Scatter to every shard then k-way merge the sorted results.
+        results = list(
+            self.executor.map(
+                lambda shard: shard.find_videos(
+                    date_start, date_end, limit_count=limit, summary=summary
+                ),
+                self.shards,
+            )
+        )
+        merged = heapq.merge(
+            *results, key=lambda vid: vid.date_published, reverse=True
+        )
+        out: List[Any] = []
+        for vid in merged:
+            if limit is not None and len(out) >= limit:
+                break
+            out.append(vid)
+        return out
+
+    def get_facets(
+        self,
+        date_start: datetime,
+        date_end: datetime,
+        facets: Sequence[str] = FACETS,
+        limit: Optional[int] = None,
+    ) -> FacetCounts:
+        """Video counts per facet value in the range, see facets.py."""
+        check_facets(facets)
+        parts = list(
+            self.executor.map(
+                lambda shard: shard.get_facets(date_start, date_end, facets),
+                self.shards,
+            )
+        )
+        return merge(parts, facets, limit)
+
+    def find_near_duplicates(
+        self, vid: Video, max_distance: int = MAX_DISTANCE
+    ) -> List[Video]:
+        out: List[Video] = []
+        for vids in self.executor.map(
+            lambda shard: shard.find_near_duplicates(vid, max_distance),
+            self.shards,
+        ):
+            out.extend(vids)
+        return out
+
+    def get_trending(
+        self,
+        limit: int,
+        channel_name: Optional[str] = None,
+        window: timedelta = DEFAULT_WINDOW,
+    ) -> List[Video]:
+        check_window(window)
+        if channel_name is not None:
+            return self.shard_for(channel_name).find_trending(
+                limit, channel_name=channel_name, window=window
+            )
+        now = now_timestamp()
+        results = self.executor.map(
+            lambda shard: shard.find_trending(limit, window=window),
+            self.shards,
+        )
+        vids = [vid for result in results for vid in result]
+
+        def score(vid: Video) -> float:
+            ts = int(vid.date_published.timestamp())
+            return trending_score(vid.views, ts, now) or 0.0
+
+        vids.sort(key=score, reverse=True)
+        return vids[:limit]
+
+    def refresh_trending(self) -> int:
+        return sum(
+            self._write([idx], shard.refresh_trending)
+            for idx, shard in enumerate(self.shards)
+        )
+
+    def get_columns(
+        self,
+        fields: Sequence[str] = DEFAULT_FIELDS,
+        date_start: Optional[datetime] = None,
+        date_end: Optional[datetime] = None,
+        channel_name: Optional[str] = None,
+    ) -> VideoColumns:
+        if channel_name is not None:
+            return self.shard_for(channel_name).get_columns(
+                fields, date_start, date_end, channel_name
+            )
+        out = VideoColumns(fields)
+        for columns in self.executor.map(
+            lambda shard: shard.get_columns(fields, date_start, date_end),
+            self.shards,
+        ):
+            out.extend(columns)
+        return out
+
+    def query_video_list(
+        self,
+        query_string: str,
+        limit: Optional[int] = None,
+        date_start: Optional[datetime] = None,
+        date_end: Optional[datetime] = None,
+        min_views: Optional[int] = None,
+        channel_name: Optional[str] = None,
+        sort: str = SORT_RELEVANCE,
+    ) -> List[Video]:
+        """
+        Full text search of channel names and titles. The filters are
+        applied inside the index, sort is one of "relevance", "newest" or
+        "most_viewed".
+        """
+        if not self.db_full_text_search:
+            return []
+        search_filter = SearchFilter(
+            date_start, date_end, min_views, channel_name
+        )
+        found = self.db_full_text_search.search(
+            query_string, limit, search_filter=search_filter, sort=sort
+        )
+        urls = [v["url"] for v in found]
+        vids = self.get_by_urls(urls)
+        # Back in search order.
+        order = {url: i for i, url in enumerate(urls)}
+        vids.sort(key=lambda vid: order[vid.url])
+        return vids
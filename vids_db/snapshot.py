@@ -0,0 +1,84 @@
+"""
+Published snapshots of a database for read only query nodes.
+
+A snapshot root holds one directory per snapshot plus a CURRENT file with
+the name of the latest one:
+
+    snapshots/
+        CURRENT                 -> "snapshot-000002"
+        snapshot-000001/
+        snapshot-000002/
+            videos.sqlite
+            full_text_seach/
+
+A writer builds each snapshot in a temporary directory and renames it in
+place before CURRENT is replaced, so a reader following CURRENT only ever
+sees complete snapshots. Snapshots never change once published, which is
+what lets readers open them immutable.
+"""
+
+# pylint: disable=all
+
+import os
+import shutil
+import tempfile
+from typing import Callable, List, Optional
+
+CURRENT_FILE = "CURRENT"
+SNAPSHOT_PREFIX = "snapshot-"
+
+
+def list_snapshots(root: str) -> List[str]:
+    """Names of the published snapshots, oldest first."""
+    if not os.path.isdir(root):
+        return []
+    return sorted(
+        name
+        for name in os.listdir(root)
+        if name.startswith(SNAPSHOT_PREFIX)
+        and os.path.isdir(os.path.join(root, name))
+    )
+
+
+def current_snapshot(root: str) -> Optional[str]:
+    """Path of the latest published snapshot, None if there is none."""
+    try:
+        with open(
+            os.path.join(root, CURRENT_FILE), encoding="utf-8", mode="r"
+        ) as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return None
+    return os.path.join(root, name)
+
+
+def publish_snapshot(
+    root: str, build: Callable[[str], None], keep: int = 2
+) -> str:
+    """
+    Calls build(path) to fill a new snapshot directory, then publishes it
+    as the CURRENT snapshot and removes all but the `keep` newest ones.
+    Returns the path of the new snapshot.
+    """
+    if keep < 1:
+        raise ValueError("keep must be at least 1")
+    os.makedirs(root, exist_ok=True)
+    existing = list_snapshots(root)
+    number = int(existing[-1][len(SNAPSHOT_PREFIX) :]) + 1 if existing else 1
+    name = f"{SNAPSHOT_PREFIX}{number:06d}"
+    tmp_dir = tempfile.mkdtemp(prefix=".tmp-", dir=root)
+    try:
+        build(tmp_dir)
+        os.rename(tmp_dir, os.path.join(root, name))
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    tmp_current = os.path.join(root, CURRENT_FILE + ".tmp")
+    with open(tmp_current, encoding="utf-8", mode="w") as f:
+        f.write(name)
+    os.replace(tmp_current, os.path.join(root, CURRENT_FILE))
+    # Readers that still have an old snapshot open keep their file handles,
+    # keep > 1 leaves a grace period for the ones about to open it.
+    for old in list_snapshots(root)[:-keep]:
+        shutil.rmtree(os.path.join(root, old), ignore_errors=True)
+    return os.path.join(root, name)
@@ -0,0 +1,42 @@
+"""
+Trending score of a video: views relative to age.
+
+    score = views / (age_hours + 2) ** GRAVITY
+
+The score is stored in the trending_score column and indexed, so trending
+queries are answered straight from the index. It is computed when a row is
+written and refreshed in batch by refresh_trending() so that older videos
+decay over time.
+"""
+
+# pylint: disable=all
+
+from datetime import datetime, timedelta
+from typing import Optional
+
+GRAVITY = 1.5
+# Rows older than this are not scored, their trending_score is NULL.
+TRENDING_MAX_WINDOW = timedelta(days=7)
+DEFAULT_WINDOW = timedelta(days=3)
+
+
+def trending_score(
+    views: int, timestamp_published: int, now: float
+) -> Optional[float]:
+    """Score of a video at unix time `now`, None when outside the window."""
+    age_seconds = max(now - timestamp_published, 0)
+    if age_seconds > TRENDING_MAX_WINDOW.total_seconds():
+        return None
+    return (views or 0) / ((age_seconds / 3600.0 + 2) ** GRAVITY)
+
+
+def check_window(window: timedelta) -> None:
+    """Only videos within TRENDING_MAX_WINDOW have a score to rank by."""
+    if window > TRENDING_MAX_WINDOW:
+        raise ValueError(
+            f"Trending window {window} is longer than {TRENDING_MAX_WINDOW}"
+        )
+
+
+def now_timestamp(now_time: Optional[datetime] = None) -> float:
+    return (now_time or datetime.now().astimezone()).timestamp()
@@ -0,0 +1,186 @@
+"""
+Write-behind buffer that turns many small updates into batched writes.
+
+Videos are kept by url (last write wins) until the buffer holds max_size
+of them or the oldest has waited max_delay seconds, then they are written
+with one call of the flush function. A video stays visible through
+pending() until its batch is written, so readers can overlay the buffer
+on what is stored. A failed write of the timer is raised by the next
+flush().
+"""
+
+# pylint: disable=all
+
+import threading
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from vids_db.models import Video
+
+
+class BufferMetrics(NamedTuple):
+    depth: int  # Videos waiting to be written.
+    max_depth: int
+    added: int  # Videos passed to add().
+    deduplicated: int  # Added videos that replaced a pending one.
+    flushes: int
+    flushed: int  # Videos written.
+    last_flush_seconds: float
+    max_flush_seconds: float
+    total_flush_seconds: float
+    errors: int
+
+
+class WriteBuffer:
+    """Deduplicating write-behind buffer, see the module docstring."""
+
+    def __init__(
+        self,
+        flush_fn: Callable[[List[Video]], None],
+        max_size: int = 1000,
+        max_delay: float = 1.0,
+    ) -> None:
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        if max_delay <= 0:
+            raise ValueError("max_delay must be positive")
+        self.flush_fn = flush_fn
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self._pending: Dict[str, Video] = {}
+        self._inflight: Dict[str, Video] = {}
+        self._oldest: Optional[float] = None
+        self._lock = threading.Lock()
+        # One flush at a time keeps batches in order.
+        self._flush_lock = threading.Lock()
+        self._added = 0
+        self._deduplicated = 0
+        self._max_depth = 0
+        self._flushes = 0
+        self._flushed = 0
+        self._last_flush = 0.0
+        self._max_flush = 0.0
+        self._total_flush = 0.0
+        self._errors = 0
+        self._error: Optional[Exception] = None  # Of the timer's last flush.
+        self._closed = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="vids_db-write-buffer", daemon=True
+        )
+        self._thread.start()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._pending) + len(self._inflight)
+
+    def add(self, vids: List[Video]) -> None:
+        if self._closed.is_set():
+            raise ValueError("WriteBuffer is closed")
+        with self._lock:
+            for vid in vids:
+                if vid.url in self._pending:
+                    self._deduplicated += 1
+                self._pending[vid.url] = vid
+            self._added += len(vids)
+            if self._oldest is None and self._pending:
+                self._oldest = time.monotonic()
+            depth = len(self._pending)
+            self._max_depth = max(self._max_depth, depth)
+        if depth >= self.max_size:
+            self.flush()
+
+    def pending(self) -> Dict[str, Video]:
+        """Videos not written yet by url, including the batch in flight."""
+        with self._lock:
+            out = dict(self._inflight)
+            out.update(self._pending)
+            return out
+
+    def discard(self, predicate: Callable[[Video], bool]) -> int:
+        """Drops the pending videos for which predicate is true."""
+        with self._flush_lock, self._lock:
+            urls = [url for url, vid in self._pending.items() if predicate(vid)]
+            for url in urls:
+                del self._pending[url]
+            return len(urls)
+
+    def flush(self) -> int:
+        """
+        Writes everything pending, returns the number of videos. If a flush
+        of the timer failed since the last call, raises its error instead
+        and the videos stay pending.
+        """
+        with self._lock:
+            err, self._error = self._error, None
+        if err is not None:
+            raise err
+        return self._flush()
+
+    def _flush(self) -> int:
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                self._inflight = self._pending
+                self._pending = {}
+                self._oldest = None
+            vids = list(self._inflight.values())
+            start = time.perf_counter()
+            try:
+                self.flush_fn(vids)
+            except BaseException:
+                with self._lock:
+                    # Put the batch back behind anything newer.
+                    self._inflight.update(self._pending)
+                    self._pending = self._inflight
+                    self._inflight = {}
+                    self._oldest = self._oldest or time.monotonic()
+                    self._errors += 1
+                raise
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self._inflight = {}
+                self._flushes += 1
+                self._flushed += len(vids)
+                self._last_flush = elapsed
+                self._max_flush = max(self._max_flush, elapsed)
+                self._total_flush += elapsed
+            return len(vids)
+
+    def metrics(self) -> BufferMetrics:
+        with self._lock:
+            return BufferMetrics(
+                depth=len(self._pending) + len(self._inflight),
+                max_depth=self._max_depth,
+                added=self._added,
+                deduplicated=self._deduplicated,
+                flushes=self._flushes,
+                flushed=self._flushed,
+                last_flush_seconds=self._last_flush,
+                max_flush_seconds=self._max_flush,
+                total_flush_seconds=self._total_flush,
+                errors=self._errors,
+            )
+
+    def _run(self) -> None:
+        interval = min(self.max_delay, 1.0) / 2
+        while not self._closed.wait(interval):
+            with self._lock:
+                oldest = self._oldest
+            if oldest is None or time.monotonic() - oldest < self.max_delay:
+                continue
+            try:
+                self._flush()
+            except Exception as err:
+                # Kept pending, retried on the next tick.
+                with self._lock:
+                    self._error = err
+
+    def close(self) -> None:
+        """Stops the timer and writes everything still pending."""
+        self._closed.set()
+        self._thread.join()
+        with self._lock:
+            # The last flush retries the videos, raising its own error.
+            self._error = None
+        self._flush()
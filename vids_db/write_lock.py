@@ -0,0 +1,230 @@
+"""
+Cross process writer lock for a data directory shared by several scraper
+processes.
+
+Writers take an exclusive lock on a lock file (flock, or msvcrt on
+windows) before writing sqlite or the full text index, so they queue up
+instead of failing with "database is locked" or a Whoosh LockError. The
+kernel drops the lock of a process that dies.
+
+Fairness: a waiter first takes a turnstile lock and holds it while it
+waits for the write lock. A writer that releases the write lock and wants
+it again has to pass the turnstile too, so it can not barge in ahead of a
+process that is already waiting.
+
+Waiting polls with exponential backoff and jitter so a timeout can be
+enforced, TimeoutError is raised when it runs out.
+
+The lock files are only open while the lock is held, so an idle WriteLock
+holds no file descriptors.
+"""
+
+# pylint: disable=all
+
+import os
+import random
+import sqlite3
+import threading
+import time
+from typing import Callable, NamedTuple, Optional, Tuple, TypeVar
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None  # type: ignore
+    import msvcrt
+
+T = TypeVar("T")
+
+DEFAULT_TIMEOUT = 60.0
+MIN_BACKOFF = 0.001
+MAX_BACKOFF = 0.1
+LOCKED_RETRIES = 5
+
+
+class LockMetrics(NamedTuple):
+    acquisitions: int
+    contended: int  # Acquisitions that had to wait.
+    timeouts: int
+    locked_retries: int  # "database is locked" errors retried.
+    last_wait_seconds: float
+    max_wait_seconds: float
+    total_wait_seconds: float
+
+
+def _open(path: str) -> int:
+    return os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+
+
+def _try_lock(fd: int) -> bool:
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            os.lseek(fd, 0, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)  # type: ignore
+    except OSError:
+        return False
+    return True
+
+
+def _unlock(fd: int) -> None:
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    else:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)  # type: ignore
+
+
+class WriteLock:
+    """
+    Cross process and cross thread writer lock, see the module docstring.
+    Reentrant within a thread.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        timeout: Optional[float] = DEFAULT_TIMEOUT,
+        min_backoff: float = MIN_BACKOFF,
+        max_backoff: float = MAX_BACKOFF,
+    ) -> None:
+        self.path = path
+        self.timeout = timeout
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._fd = -1  # Of the lock file, open while held.
+        # File locks are per process, threads queue up here first.
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._metrics_lock = threading.Lock()
+        self._acquisitions = 0
+        self._contended = 0
+        self._timeouts = 0
+        self._locked_retries = 0
+        self._last_wait = 0.0
+        self._max_wait = 0.0
+        self._total_wait = 0.0
+
+    def _backoff(self, attempt: int) -> float:
+        delay = min(self.max_backoff, self.min_backoff * (2**attempt))
+        return delay * random.uniform(0.5, 1.0)
+
+    def _poll(self, fd: int, deadline: Optional[float]) -> bool:
+        """Takes the file lock, False if it did not have to wait."""
+        attempt = 0
+        while not _try_lock(fd):
+            if deadline is not None and time.monotonic() >= deadline:
+                raise TimeoutError(f"Timed out waiting for {self.path}")
+            time.sleep(self._backoff(attempt))
+            attempt += 1
+        return attempt > 0
+
+    def _lock_files(self, deadline: Optional[float]) -> Tuple[int, bool]:
+        """
+        Opens and locks the lock file through the turnstile, returns its fd
+        and whether it had to wait.
+        """
+        turnstile_fd = _open(self.path + ".turnstile")
+        fd = -1
+        try:
+            fd = _open(self.path)
+            waited = self._poll(turnstile_fd, deadline)
+            try:
+                waited = self._poll(fd, deadline) or waited
+            finally:
+                _unlock(turnstile_fd)
+        except BaseException:
+            if fd >= 0:
+                os.close(fd)
+            raise
+        finally:
+            os.close(turnstile_fd)
+        return fd, waited
+
+    def acquire(self, timeout: Optional[float] = None) -> None:
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = None if timeout is None else start + timeout
+        waited = not self._thread_lock.acquire(blocking=False)
+        if waited and not self._thread_lock.acquire(
+            timeout=-1 if timeout is None else timeout
+        ):
+            self._record_timeout()
+            raise TimeoutError(f"Timed out waiting for {self.path}")
+        if self._depth:
+            self._depth += 1
+            return
+        try:
+            self._fd, polled = self._lock_files(deadline)
+        except BaseException as err:
+            self._thread_lock.release()
+            if isinstance(err, TimeoutError):
+                self._record_timeout()
+            raise
+        waited = polled or waited
+        self._depth = 1
+        wait = time.monotonic() - start
+        with self._metrics_lock:
+            self._acquisitions += 1
+            if waited:
+                self._contended += 1
+            self._last_wait = wait
+            self._max_wait = max(self._max_wait, wait)
+            self._total_wait += wait
+
+    def _record_timeout(self) -> None:
+        with self._metrics_lock:
+            self._timeouts += 1
+
+    def release(self) -> None:
+        if not self._depth:
+            raise RuntimeError("WriteLock released without being held")
+        self._depth -= 1
+        if not self._depth:
+            _unlock(self._fd)
+            os.close(self._fd)
+            self._fd = -1
+        self._thread_lock.release()
+
+    def __enter__(self) -> "WriteLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.release()
+
+    def run(self, fn: Callable[[], T], attempts: int = LOCKED_RETRIES) -> T:
+        """
+        Calls fn holding the lock. sqlite "database is locked" errors, from
+        writers that do not use this lock, are retried with backoff.
+        """
+        attempt = 0
+        while True:
+            with self:
+                try:
+                    return fn()
+                except sqlite3.OperationalError as err:
+                    if "locked" not in str(err) or attempt + 1 >= attempts:
+                        raise
+            with self._metrics_lock:
+                self._locked_retries += 1
+            # Backed off without the lock so the other writer can finish.
+            time.sleep(self._backoff(attempt + 4))
+            attempt += 1
+
+    def metrics(self) -> LockMetrics:
+        with self._metrics_lock:
+            return LockMetrics(
+                acquisitions=self._acquisitions,
+                contended=self._contended,
+                timeouts=self._timeouts,
+                locked_retries=self._locked_retries,
+                last_wait_seconds=self._last_wait,
+                max_wait_seconds=self._max_wait,
+                total_wait_seconds=self._total_wait,
+            )
+
+    def close(self) -> None:
+        """Nothing to close, the lock files are only open while held."""